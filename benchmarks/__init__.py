@@ -0,0 +1,7 @@
+"""AI NEXUS 性能基准测试
+
+运行方法（在项目根目录下）:
+    python -m benchmarks.bench_load
+    python -m benchmarks.bench_concurrency
+    python -m benchmarks.bench_hot_paths --check
+"""
@@ -0,0 +1,120 @@
+"""并发流容量基准：线程化 Flask 路径 vs 原生 asyncio（ASGI）路径
+
+启动一个本地模拟上游（benchmarks.mock_upstream），分别以两种方式运行本应用：
+
+- flask: Flask WSGI 应用运行在固定大小线程池的 WSGI 服务器上
+         （等价于 gunicorn --threads N），每个流占用一个线程
+- asgi:  asgi.app 运行在 uvicorn 上，每个流只占用一个协程
+
+然后同时发起 C 个 /api/chat 流式请求，统计总耗时、首字时间（TTFT）和
+有效并发数（C × 单流时长 / 总耗时）。
+
+运行方法（在项目根目录下）:
+    python -m benchmarks.bench_concurrency --concurrency 500 --threads 32
+    python -m benchmarks.bench_concurrency --modes asgi --concurrency 2000 --output result.json
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+import subprocess
+from typing import Any, Dict
+
+from benchmarks.harness import REPO_ROOT, app_server, free_port, one_stream, percentile, wait_for_port
+
+BENCH_MODEL_ID = "bench-upstream"
+
+
+def bench_models(upstream_url: str) -> list:
+    """指向模拟上游的基准模型"""
+    return [{
+        "id": BENCH_MODEL_ID,
+        "type": "requests_sse",
+        "url": upstream_url,
+        "model": "bench",
+        "api_key_name": "BENCH_API_KEY"
+    }]
+
+
+async def drive(port: int, concurrency: int) -> Dict[str, Any]:
+    """同时发起 concurrency 个流并汇总结果"""
+    import httpx
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=0)
+    url = f"http://127.0.0.1:{port}/api/chat"
+    async with httpx.AsyncClient(limits=limits, timeout=None) as client:
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one_stream(client, url, BENCH_MODEL_ID) for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+
+    ok = [r for r in results if r["ok"]]
+    ttfts = [r["ttft"] for r in ok if r.get("ttft") is not None]
+    totals = [r["total"] for r in ok]
+    return {
+        "concurrency": concurrency,
+        "completed": len(ok),
+        "failed": len(results) - len(ok),
+        "wall_time_s": round(wall, 3),
+        "ttft_p50_s": round(percentile(ttfts, 50), 3),
+        "ttft_p95_s": round(percentile(ttfts, 95), 3),
+        "total_p50_s": round(percentile(totals, 50), 3),
+        "total_p95_s": round(percentile(totals, 95), 3),
+        "streams_per_s": round(len(ok) / wall, 1) if wall else 0.0,
+        # 单流时长取最快流的耗时，有效并发 = 完成流数 × 单流时长 / 总耗时
+        "effective_concurrency": round(len(ok) * min(totals) / wall, 1) if totals else 0.0,
+        "mean_total_s": round(statistics.mean(totals), 3) if totals else 0.0
+    }
+
+
+def run_mode(mode: str, args: argparse.Namespace, upstream_url: str) -> Dict[str, Any]:
+    """启动一种服务器模式并压测"""
+    with app_server(mode, bench_models(upstream_url), args.threads, {"BENCH_API_KEY": "bench"}) as server:
+        asyncio.run(drive(server.port, min(args.concurrency, 10)))  # 预热
+        result = asyncio.run(drive(server.port, args.concurrency))
+    result["mode"] = mode
+    if mode == "flask":
+        result["threads"] = args.threads
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="并发流容量基准：Flask 线程 vs ASGI")
+    parser.add_argument("--modes", default="flask,asgi", help="逗号分隔：flask,asgi")
+    parser.add_argument("--concurrency", type=int, default=200, help="同时发起的流数量")
+    parser.add_argument("--threads", type=int, default=32, help="Flask 模式的工作线程数")
+    parser.add_argument("--ttft", type=float, default=0.2, help="模拟上游首字延迟（秒）")
+    parser.add_argument("--tokens", type=int, default=20, help="模拟上游片段数量")
+    parser.add_argument("--interval", type=float, default=0.05, help="模拟上游片段间隔（秒）")
+    parser.add_argument("--output", help="结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    upstream_port = free_port()
+    upstream = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.mock_upstream", "--port", str(upstream_port),
+         "--ttft", str(args.ttft), "--tokens", str(args.tokens), "--interval", str(args.interval)],
+        cwd=REPO_ROOT
+    )
+    try:
+        wait_for_port(upstream_port)
+        upstream_url = f"http://127.0.0.1:{upstream_port}/v1/chat/completions"
+        results = [run_mode(mode.strip(), args, upstream_url) for mode in args.modes.split(",")]
+    finally:
+        upstream.terminate()
+        upstream.wait(timeout=10)
+
+    print(f"{'mode':<8}{'streams':>9}{'failed':>8}{'wall(s)':>9}{'ttft p50':>10}"
+          f"{'ttft p95':>10}{'eff. conc.':>12}")
+    for r in results:
+        print(f"{r['mode']:<8}{r['completed']:>9}{r['failed']:>8}{r['wall_time_s']:>9}"
+              f"{r['ttft_p50_s']:>10}{r['ttft_p95_s']:>10}{r['effective_concurrency']:>12}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"timestamp": time.time(), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
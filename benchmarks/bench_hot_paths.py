@@ -0,0 +1,238 @@
+"""热路径微基准与性能回归门禁
+
+对每个请求都会经过的热路径计时（每次操作的耗时，取多轮中最快的一轮）：
+
+- validate_chat_payload：/api/chat 的消息校验，按上限构造（100 条消息 × 10000 字符）
+- load_configs_1k：LLMWrapper._load_configs，models.json 含 1000 个自定义模型
+- load_models_1k / save_models_1k：model_manager.load_models / save_models，1000 个模型
+- parse_sse_<录制文件>：LLMWrapper._parse_sse_stream 解析 benchmarks/fixtures/*.sse
+- config_cache_get：ConfigCache.get（缓存命中）
+
+基线保存在 benchmarks/baselines/hot_paths.json（随代码提交）。--check 模式下任何一项
+比基线慢超过容差即以非零状态退出，可以在 CI 或评审前运行。基线与机器相关，更换
+运行环境后应先用 --save-baseline 重新生成。
+
+运行方法（在项目根目录下）:
+    python -m benchmarks.bench_hot_paths
+    python -m benchmarks.bench_hot_paths --check --tolerance 0.3
+    python -m benchmarks.bench_hot_paths --save-baseline
+    python -m benchmarks.bench_hot_paths --only load_models_1k,save_models_1k --output hot.json
+"""
+
+import os
+import sys
+import json
+import time
+import glob
+import platform
+import argparse
+import tempfile
+from typing import Any, Callable, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(REPO_ROOT, "benchmarks", "fixtures")
+BASELINE_FILE = os.path.join(REPO_ROOT, "benchmarks", "baselines", "hot_paths.json")
+sys.path.insert(0, os.path.join(REPO_ROOT, "web_chat"))
+
+# 大规模模型配置的模型数量
+MODEL_COUNT = 1000
+
+Case = Callable[[], Any]
+
+
+def _bench_models(count: int) -> Dict[str, Any]:
+    """生成 models.json 内容（各 API 类型轮流出现）"""
+    templates = [
+        {"type": "openai", "base_url": "https://api.example.com/v1", "system": "You are a helpful assistant"},
+        {"type": "requests_sse", "url": "https://api.example.com/v1/chat/completions"},
+        {"type": "zhipu", "base_url": "https://open.example.com/api/paas/v4"},
+        {"type": "google"}
+    ]
+    models = []
+    for i in range(count):
+        model = {
+            "id": f"bench-{i}",
+            "name": f"Bench Model {i}",
+            "model": f"bench-model-{i}",
+            "api_key_name": f"BENCH_{i % 16}_API_KEY",
+            "context_length": 65536,
+            "icon": "default.svg",
+            "enabled": True
+        }
+        model.update(templates[i % len(templates)])
+        models.append(model)
+    return {"version": "1.0.0", "models": models, "api_types": {}}
+
+
+def build_cases(workdir: str) -> Dict[str, Case]:
+    """准备各热路径的输入并返回 名称 -> 无参函数
+
+    Args:
+        workdir: 临时目录（模型配置、API 密钥文件与 app.py 的日志都写在这里）
+    """
+    os.environ["FLASK_TESTING"] = "True"
+    cwd = os.getcwd()
+    os.chdir(workdir)  # app.py 导入时在当前目录创建 web_chat.log
+    try:
+        import app
+        import llm_wrapper
+        import model_manager
+    finally:
+        os.chdir(cwd)
+    import logging
+    logging.getLogger().setLevel(logging.WARNING)
+
+    from benchmarks.bench_sse_parser import _as_response, _event_chunks
+
+    models_file = os.path.join(workdir, "models.json")
+    with open(models_file, "w", encoding="utf-8") as f:
+        json.dump(_bench_models(MODEL_COUNT), f)
+    llm_wrapper.MODELS_FILE = models_file
+    model_manager.MODELS_FILE = os.path.join(workdir, "models_saved.json")
+    models_data = _bench_models(MODEL_COUNT)
+    assert model_manager.save_models(models_data)
+    assert len(model_manager.load_models()["models"]) == MODEL_COUNT
+
+    app.API_KEYS_FILE = os.path.join(workdir, "api_keys.json")
+    app.config_cache.set({f"BENCH_{i}_API_KEY": f"sk-{i:032d}" for i in range(16)})
+
+    payload = {
+        "model": "deepseek",
+        "messages": [
+            {"role": "user" if i % 2 == 0 else "assistant", "content": "x" * 10000}
+            for i in range(100)
+        ]
+    }
+    assert app.validate_chat_payload(payload) is None
+
+    wrapper = llm_wrapper.LLMWrapper()
+    assert len(wrapper._load_configs()) >= MODEL_COUNT
+
+    cases: Dict[str, Case] = {
+        "validate_chat_payload": lambda: app.validate_chat_payload(payload),
+        "load_configs_1k": wrapper._load_configs,
+        "save_models_1k": lambda: model_manager.save_models(models_data),
+        "load_models_1k": model_manager.load_models,
+        "config_cache_get": app.config_cache.get
+    }
+
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.sse"))):
+        with open(path, "rb") as f:
+            events = _event_chunks(f.read())
+        name = "parse_sse_" + os.path.splitext(os.path.basename(path))[0]
+        cases[name] = lambda events=events: list(wrapper._parse_sse_stream(_as_response(events)))
+    return cases
+
+
+def measure(case: Case, rounds: int, min_time: float) -> float:
+    """测量一次操作的耗时（秒）
+
+    先确定每轮的调用次数，使一轮不少于 min_time 秒，再运行 rounds 轮取最快一轮。
+    """
+    case()  # 预热
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            case()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed <= 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+    best = elapsed / number
+    for _ in range(rounds - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            case()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> List[str]:
+    """与基线比较，返回超过容差的回归项描述
+
+    Args:
+        results: 名称 -> 本次每次操作耗时（秒）
+        baseline: 名称 -> 基线耗时（秒）
+        tolerance: 容差（0.25 表示允许慢 25%）
+    """
+    regressions = []
+    for name, seconds in results.items():
+        expected = baseline.get(name)
+        if expected and seconds > expected * (1 + tolerance):
+            regressions.append(f"{name}: {_format(seconds)} vs baseline {_format(expected)} (+{seconds / expected - 1:.0%})")
+    return regressions
+
+
+def _format(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("µs", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f}{unit}"
+    return f"{seconds / 1e-9:.0f}ns"
+
+
+def _machine() -> Dict[str, str]:
+    return {"python": platform.python_version(), "platform": platform.platform(), "processor": platform.machine()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="热路径微基准与性能回归门禁")
+    parser.add_argument("--rounds", type=int, default=7, help="每项的轮数（取最快一轮）")
+    parser.add_argument("--min-time", type=float, default=0.1, help="每轮的最短时间（秒）")
+    parser.add_argument("--only", help="逗号分隔，只运行这些项")
+    parser.add_argument("--check", action="store_true", help="与基线比较，回归超过容差时以状态 1 退出")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="--check 的容差（默认 0.25，即慢 25%%）")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="基线文件路径")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果写为基线")
+    parser.add_argument("--output", help="结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    cases = build_cases(tempfile.mkdtemp())
+    if args.only:
+        names = [name.strip() for name in args.only.split(",")]
+        unknown = [name for name in names if name not in cases]
+        if unknown:
+            parser.error(f"unknown benchmarks: {', '.join(unknown)} (available: {', '.join(cases)})")
+        cases = {name: cases[name] for name in names}
+
+    baseline: Dict[str, float] = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+
+    results = {name: measure(case, args.rounds, args.min_time) for name, case in cases.items()}
+
+    print(f"{'benchmark':<32}{'per op':>12}{'baseline':>12}{'change':>9}")
+    for name, seconds in results.items():
+        expected = baseline.get(name)
+        change = f"{seconds / expected - 1:+.0%}" if expected else "-"
+        print(f"{name:<32}{_format(seconds):>12}{_format(expected) if expected else '-':>12}{change:>9}")
+
+    report = {"timestamp": time.time(), "machine": _machine(), "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        # 只运行部分项时保留其他项的基线
+        report["results"] = {**baseline, **results}
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+
+    if args.check:
+        if not baseline:
+            sys.exit(f"No baseline at {args.baseline}; run with --save-baseline first")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\nRegressions beyond {args.tolerance:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""端到端负载基准：每种提供商类型经由本应用的 /api/chat 的吞吐与延迟
+
+启动一组本地模拟上游（benchmarks.mock_upstream，每种提供商类型一个替身），
+以 Flask（线程池 WSGI 服务器）或 ASGI（uvicorn）方式运行本应用，模型注册表
+加载指向各替身的基准模型。然后对每种提供商以固定并发度持续发送请求（闭环：
+每个并发槽位完成一个请求后立即发起下一个），统计：
+
+- 吞吐：请求数/秒、输出字符数/秒
+- 首字时间（TTFT）与总耗时的 p50 / p95 / p99
+- 服务端进程的 CPU 占用（单核百分比）与常驻内存（读取 /proc，仅 Linux）
+
+结果写入 JSON 文件（默认 benchmarks/results/load-<时间>.json），附带 git 提交与
+运行参数，便于比较不同版本。
+
+运行方法（在项目根目录下）:
+    python -m benchmarks.bench_load
+    python -m benchmarks.bench_load --providers openai,zhipu --concurrency 64 --requests 1000 --mode asgi
+    python -m benchmarks.bench_load --ttft 0.5 --rate 80 --chunk-chars 24 --output run.json
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import subprocess
+from dataclasses import asdict
+from typing import Any, Dict, List
+
+from benchmarks.harness import (
+    REPO_ROOT,
+    ProcessSampler,
+    app_server,
+    free_port,
+    one_stream,
+    percentile,
+    wait_for_port
+)
+from benchmarks.mock_upstream import PROVIDERS, add_profile_arguments, profile_from_args
+
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+# 基准模型使用的 API 密钥（智谱需要 id.secret 格式才能签发 JWT）
+BENCH_KEYS = {"BENCH_API_KEY": "bench", "BENCH_ZHIPU_API_KEY": "bench.secret"}
+
+
+def farm_models(ports: Dict[str, int]) -> List[Dict[str, Any]]:
+    """指向各替身的基准模型（models.json 格式），模型 ID 为 bench-<提供商>"""
+    base = "http://127.0.0.1:{}"
+    templates = {
+        "openai": lambda url: {"type": "openai", "base_url": f"{url}/v1"},
+        "qwen": lambda url: {"type": "requests_sse", "url": f"{url}/v1/chat/completions"},
+        "spark": lambda url: {"type": "spark_requests", "url": f"{url}/v2/chat/completions"},
+        "zhipu": lambda url: {"type": "zhipu", "base_url": f"{url}/api/paas/v4", "api_key_name": "BENCH_ZHIPU_API_KEY"},
+        "gemini": lambda url: {"type": "google", "base_url": url}
+    }
+    models = []
+    for provider, port in ports.items():
+        model = {"id": f"bench-{provider}", "model": "bench", "api_key_name": "BENCH_API_KEY"}
+        model.update(templates[provider](base.format(port)))
+        models.append(model)
+    return models
+
+
+async def drive(port: int, model_id: str, concurrency: int, requests: int) -> Dict[str, Any]:
+    """以固定并发度发送 requests 个请求并汇总结果"""
+    import httpx
+
+    url = f"http://127.0.0.1:{port}/api/chat"
+    remaining = requests
+    results: List[Dict[str, Any]] = []
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            results.append(await one_stream(client, url, model_id))
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=None) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+
+    ok = [r for r in results if r["ok"]]
+    ttfts = [r["ttft"] for r in ok if r.get("ttft") is not None]
+    totals = [r["total"] for r in ok]
+    summary: Dict[str, Any] = {
+        "requests": len(results),
+        "completed": len(ok),
+        "failed": len(results) - len(ok),
+        "wall_time_s": round(wall, 3),
+        "throughput_rps": round(len(ok) / wall, 2) if wall else 0.0,
+        "output_chars_per_s": round(sum(r["chars"] for r in ok) / wall, 1) if wall else 0.0
+    }
+    for name, values in (("ttft", ttfts), ("total", totals)):
+        for pct in (50, 95, 99):
+            summary[f"{name}_p{pct}_s"] = round(percentile(values, pct), 4)
+    return summary
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="端到端负载基准（本地模拟上游，不消耗 API 配额）")
+    parser.add_argument("--providers", default=",".join(PROVIDERS), help=f"逗号分隔：{','.join(PROVIDERS)}")
+    parser.add_argument("--mode", choices=["flask", "asgi"], default="flask", help="本应用的运行方式")
+    parser.add_argument("--threads", type=int, default=32, help="Flask 模式的工作线程数")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发请求数")
+    parser.add_argument("--requests", type=int, default=200, help="每种提供商发送的请求数")
+    parser.add_argument("--warmup", type=int, default=10, help="每种提供商的预热请求数（不计入结果）")
+    parser.add_argument("--output", help="结果 JSON 文件（默认 benchmarks/results/load-<时间>.json）")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    providers = [p.strip() for p in args.providers.split(",") if p.strip()]
+    unknown = set(providers) - set(PROVIDERS)
+    if unknown:
+        parser.error(f"unknown providers: {', '.join(sorted(unknown))}")
+    profile = profile_from_args(args)
+
+    ports = {provider: free_port() for provider in providers}
+    farm_args = [
+        "--ports", ",".join(f"{p}={port}" for p, port in ports.items()),
+        "--ttft", str(profile.ttft), "--tokens", str(profile.tokens), "--interval", str(profile.interval)
+    ]
+    if args.chunk_chars:
+        farm_args += ["--chunk-chars", str(args.chunk_chars)]
+    farm = subprocess.Popen([sys.executable, "-m", "benchmarks.mock_upstream", *farm_args], cwd=REPO_ROOT)
+
+    results = []
+    try:
+        for port in ports.values():
+            wait_for_port(port)
+        with app_server(args.mode, farm_models(ports), args.threads, BENCH_KEYS) as server:
+            for provider in providers:
+                model_id = f"bench-{provider}"
+                if args.warmup:
+                    asyncio.run(drive(server.port, model_id, min(args.concurrency, args.warmup), args.warmup))
+                with ProcessSampler(server.pid) as sampler:
+                    result = asyncio.run(drive(server.port, model_id, args.concurrency, args.requests))
+                results.append({"provider": provider, **result, **sampler.summary()})
+    finally:
+        farm.terminate()
+        farm.wait(timeout=10)
+
+    print(f"{'provider':<9}{'ok':>6}{'fail':>6}{'req/s':>9}{'ttft p50':>10}{'ttft p99':>10}"
+          f"{'total p50':>11}{'total p99':>11}{'cpu%':>8}{'rss MB':>8}")
+    for r in results:
+        print(f"{r['provider']:<9}{r['completed']:>6}{r['failed']:>6}{r['throughput_rps']:>9}"
+              f"{r['ttft_p50_s']:>10}{r['ttft_p99_s']:>10}{r['total_p50_s']:>11}{r['total_p99_s']:>11}"
+              f"{str(r['server_cpu_percent']):>8}{str(r['server_rss_mb_peak']):>8}")
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"load-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "timestamp": time.time(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "params": {
+                "mode": args.mode,
+                "threads": args.threads if args.mode == "flask" else None,
+                "concurrency": args.concurrency,
+                "requests": args.requests,
+                "profile": asdict(profile)
+            },
+            "results": results
+        }, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
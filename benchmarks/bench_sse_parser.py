@@ -0,0 +1,163 @@
+"""SSE 解析器微基准：逐行解析（旧）vs 字节级增量解析（新）
+
+在 benchmarks/fixtures/*.sse 录制的上游流上比较：
+
+- legacy:        旧实现，response.iter_lines() + 每行 decode + json.loads
+- incremental:   sse_parser.iter_delta_content，按上游逐事件到达的字节块输入
+- incremental-64k: 同上，按 64KB 大块输入（iter_response_bytes 的 read1 在积压时的情况）
+- incremental-json: 同 incremental，但强制使用标准库 json（衡量 orjson 的贡献）
+
+输出每种实现的 events/sec（每秒处理的 SSE 事件数），并校验各实现输出文本一致。
+
+运行方法（在项目根目录下）:
+    python -m benchmarks.bench_sse_parser
+    python -m benchmarks.bench_sse_parser --repeat 50 --output sse.json
+"""
+
+import os
+import sys
+import json
+import time
+import glob
+import logging
+import argparse
+from typing import Callable, Dict, Iterator, List
+
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(REPO_ROOT, "benchmarks", "fixtures")
+sys.path.insert(0, os.path.join(REPO_ROOT, "web_chat"))
+
+import sse_parser  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+
+def legacy_parse(response: requests.Response) -> Iterator[str]:
+    """旧版 LLMWrapper._parse_sse_stream 的实现（原样保留用于对比）"""
+    for line in response.iter_lines():
+        if not line:
+            continue
+        line_str = line.decode('utf-8')
+        if line_str.startswith('data: '):
+            data_str = line_str[6:].strip()
+            if data_str == '[DONE]':
+                break
+            try:
+                data = json.loads(data_str)
+                content = data["choices"][0]["delta"].get("content", "")
+                if content:
+                    yield content
+            except (json.JSONDecodeError, KeyError, IndexError) as e:
+                logger.debug(f"Failed to parse SSE chunk: {e}")
+                continue
+
+
+class _RecordedRaw:
+    """按给定字节块回放的 urllib3 响应替身（requests 通过 stream() 读取）"""
+
+    def __init__(self, chunks: List[bytes]) -> None:
+        self.chunks = chunks
+
+    def stream(self, chunk_size: int, decode_content: bool = True) -> Iterator[bytes]:
+        return iter(self.chunks)
+
+
+def _as_response(chunks: List[bytes]) -> requests.Response:
+    """把录制的字节块包装成 requests 流式响应"""
+    response = requests.Response()
+    response.raw = _RecordedRaw(chunks)
+    response.status_code = 200
+    return response
+
+
+def _event_chunks(raw: bytes) -> List[bytes]:
+    """按事件切分字节（模拟上游每个事件单独 flush）"""
+    separator = b"\r\n\r\n" if b"\r\n" in raw else b"\n\n"
+    parts = raw.split(separator)
+    return [part + separator for part in parts if part]
+
+
+def _fixed_chunks(raw: bytes, size: int) -> List[bytes]:
+    return [raw[i:i + size] for i in range(0, len(raw), size)]
+
+
+def _incremental_stdlib(chunks: List[bytes]) -> Iterator[str]:
+    """强制使用标准库 json 的增量解析"""
+    saved = sse_parser._json_loads, sse_parser.JSON_DECODE_ERRORS
+    sse_parser._json_loads = json.loads
+    sse_parser.JSON_DECODE_ERRORS = (json.JSONDecodeError, UnicodeDecodeError)
+    try:
+        yield from sse_parser.iter_delta_content(chunks)
+    finally:
+        sse_parser._json_loads, sse_parser.JSON_DECODE_ERRORS = saved
+
+
+def _runners(raw: bytes) -> Dict[str, Callable[[], Iterator[str]]]:
+    events = _event_chunks(raw)
+    blocks = _fixed_chunks(raw, sse_parser.READ_CHUNK_SIZE)
+    return {
+        "legacy": lambda: legacy_parse(_as_response(events)),
+        "legacy-64k": lambda: legacy_parse(_as_response(blocks)),
+        "incremental": lambda: sse_parser.iter_delta_content(events),
+        "incremental-64k": lambda: sse_parser.iter_delta_content(blocks),
+        "incremental-json": lambda: _incremental_stdlib(events),
+    }
+
+
+def bench_fixture(path: str, repeat: int) -> Dict[str, object]:
+    """对一个录制文件运行所有实现，取最快一轮"""
+    with open(path, "rb") as f:
+        raw = f.read()
+    event_count = len(_event_chunks(raw))
+    runners = _runners(raw)
+
+    expected = "".join(runners["legacy"]())
+    results: Dict[str, float] = {}
+    for name, run in runners.items():
+        output = "".join(run())
+        if output != expected:
+            raise AssertionError(f"{name} output differs from legacy parser on {path}")
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _chunk in run():
+                pass
+            best = min(best, time.perf_counter() - start)
+        results[name] = round(event_count / best)
+
+    return {
+        "fixture": os.path.basename(path),
+        "bytes": len(raw),
+        "events": event_count,
+        "events_per_s": results,
+        "speedup": round(results["incremental"] / results["legacy"], 2),
+        "speedup_64k": round(results["incremental-64k"] / results["legacy-64k"], 2)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="SSE 解析器微基准")
+    parser.add_argument("--repeat", type=int, default=20, help="每种实现的重复次数（取最快一轮）")
+    parser.add_argument("--output", help="结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    fixtures = sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.sse")))
+    results = [bench_fixture(path, args.repeat) for path in fixtures]
+
+    names = list(results[0]["events_per_s"]) if results else []
+    print(f"{'fixture':<24}{'events':>8}" + "".join(f"{name:>18}" for name in names) + f"{'speedup':>9}")
+    for r in results:
+        print(f"{r['fixture']:<24}{r['events']:>8}"
+              + "".join(f"{r['events_per_s'][name]:>18}" for name in names)
+              + f"{r['speedup']:>8}x")
+    print(f"(events/sec, best of {args.repeat}; orjson {'enabled' if sse_parser.orjson else 'not installed'})")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"timestamp": time.time(), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
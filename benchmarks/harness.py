@@ -0,0 +1,264 @@
+"""基准测试的公共部分
+
+- 端口分配与等待、百分位数
+- 在子进程中运行本应用（Flask 线程池 WSGI 服务器或 uvicorn 上的 ASGI），
+  模型注册表从临时 models.json 加载指向模拟上游的基准模型
+- 发起一个 /api/chat 流式请求并记录首字时间与总耗时
+- 采样服务端进程的 CPU 与常驻内存（读取 /proc，仅 Linux）
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WEB_CHAT_DIR = os.path.join(REPO_ROOT, "web_chat")
+
+
+def free_port() -> int:
+    """获取一个空闲端口"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 20.0) -> None:
+    """等待端口可连接"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """计算百分位数（最近秩法）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+# ====================
+# 服务端（子进程）
+# ====================
+
+def _configure_models(models_file: str) -> None:
+    """让模型注册表从基准测试的 models.json 加载自定义模型"""
+    import llm_wrapper
+
+    llm_wrapper.model_registry.path = models_file
+    llm_wrapper.model_registry.invalidate()
+
+
+def _serve_flask(port: int, threads: int) -> None:
+    """在固定大小线程池的 WSGI 服务器上运行 Flask 应用"""
+    from werkzeug.serving import BaseWSGIServer
+    from app import app
+
+    class PooledWSGIServer(BaseWSGIServer):
+        """每个连接在线程池中处理，线程数即并发流上限"""
+        request_queue_size = 4096
+
+        def __init__(self, *args: Any, **kwargs: Any) -> None:
+            super().__init__(*args, **kwargs)
+            self.executor = ThreadPoolExecutor(max_workers=threads)
+
+        def process_request(self, request: Any, client_address: Any) -> None:
+            self.executor.submit(self._process, request, client_address)
+
+        def _process(self, request: Any, client_address: Any) -> None:
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    PooledWSGIServer("127.0.0.1", port, app).serve_forever()
+
+
+def _serve_asgi(port: int) -> None:
+    """在 uvicorn 上运行 ASGI 应用"""
+    import uvicorn
+    from asgi import app
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", backlog=4096)
+
+
+def serve(mode: str, port: int, models_file: str, threads: int) -> None:
+    """子进程入口：配置模型并启动对应的服务器"""
+    import logging
+
+    sys.path.insert(0, WEB_CHAT_DIR)
+    os.environ["FLASK_TESTING"] = "True"
+    _configure_models(models_file)
+    import app  # noqa: F401  (app.py 导入时配置日志)
+    # 基准测试只关心吞吐，关闭逐请求的 INFO 日志
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    if mode == "flask":
+        _serve_flask(port, threads)
+    else:
+        _serve_asgi(port)
+
+
+@contextmanager
+def app_server(
+    mode: str,
+    models: List[Dict[str, Any]],
+    threads: int = 32,
+    env: Optional[Dict[str, str]] = None
+) -> Iterator[subprocess.Popen]:
+    """在子进程中启动本应用，退出上下文时停止
+
+    Args:
+        mode: "flask" 或 "asgi"
+        models: models.json 中的模型列表
+        threads: Flask 模式的工作线程数
+        env: 额外的环境变量（如基准模型的 API 密钥）
+
+    Yields:
+        subprocess.Popen: 服务器进程，监听端口记录在 server.port
+    """
+    workdir = tempfile.mkdtemp()  # app.py 在当前目录写 web_chat.log
+    models_file = os.path.join(workdir, "models.json")
+    with open(models_file, "w", encoding="utf-8") as f:
+        json.dump({"models": models}, f)
+
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.harness", mode, str(port), models_file, str(threads)],
+        cwd=workdir,
+        env=dict(os.environ, PYTHONPATH=REPO_ROOT, **(env or {}))
+    )
+    server.port = port  # type: ignore[attr-defined]
+    try:
+        wait_for_port(port)
+        yield server
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+# ====================
+# 负载生成
+# ====================
+
+async def one_stream(client: Any, url: str, model_id: str) -> Dict[str, Any]:
+    """发起一个流式请求并记录 TTFT、总耗时与输出字符数"""
+    payload = {"model": model_id, "messages": [{"role": "user", "content": "hi"}]}
+    start = time.perf_counter()
+    ttft: Optional[float] = None
+    body = b""
+    try:
+        async with client.stream("POST", url, json=payload) as response:
+            if response.status_code != 200:
+                return {"ok": False, "status": response.status_code}
+            async for chunk in response.aiter_bytes():
+                if ttft is None and chunk:
+                    ttft = time.perf_counter() - start
+                body += chunk
+    except Exception as e:
+        return {"ok": False, "error": type(e).__name__}
+    # 适配器把上游错误作为 "Error: ..." 文本返回
+    ok = bool(body) and not body.startswith(b"Error")
+    return {
+        "ok": ok,
+        "ttft": ttft,
+        "total": time.perf_counter() - start,
+        "chars": len(body.decode("utf-8", errors="replace"))
+    }
+
+
+# ====================
+# 服务端资源采样
+# ====================
+
+class ProcessSampler:
+    """在后台线程中定期采样进程的 CPU 时间与常驻内存（读取 /proc，非 Linux 时不采样）"""
+
+    def __init__(self, pid: int, interval: float = 0.25) -> None:
+        self.pid = pid
+        self.interval = interval
+        self.rss_samples: List[int] = []
+        self._cpu_start: Optional[float] = None
+        self._cpu_end: Optional[float] = None
+        self._wall = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def available() -> bool:
+        return os.path.exists("/proc/self/stat")
+
+    def _cpu_seconds(self) -> Optional[float]:
+        """进程累计 CPU 时间（用户态 + 内核态，秒）"""
+        try:
+            with open(f"/proc/{self.pid}/stat", encoding="ascii") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            return None
+        # 去掉 "pid (comm)" 后，utime / stime 是第 12、13 个字段
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    def _rss_bytes(self) -> Optional[int]:
+        try:
+            with open(f"/proc/{self.pid}/statm", encoding="ascii") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:
+            return None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            rss = self._rss_bytes()
+            if rss is not None:
+                self.rss_samples.append(rss)
+
+    def __enter__(self) -> "ProcessSampler":
+        if self.available():
+            self._cpu_start = self._cpu_seconds()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        self._wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._wall = time.perf_counter() - self._wall
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._cpu_end = self._cpu_seconds()
+            rss = self._rss_bytes()
+            if rss is not None:
+                self.rss_samples.append(rss)
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        """CPU 占用（单核百分比）与常驻内存（MB）；无法采样时为 None"""
+        cpu = None
+        if self._cpu_start is not None and self._cpu_end is not None and self._wall > 0:
+            cpu = round((self._cpu_end - self._cpu_start) / self._wall * 100, 1)
+        rss = self.rss_samples
+        return {
+            "server_cpu_percent": cpu,
+            "server_rss_mb_mean": round(sum(rss) / len(rss) / 2**20, 1) if rss else None,
+            "server_rss_mb_peak": round(max(rss) / 2**20, 1) if rss else None
+        }
+
+
+if __name__ == "__main__":
+    # 子进程入口：python -m benchmarks.harness <mode> <port> <models.json> <threads>
+    serve(sys.argv[1], int(sys.argv[2]), sys.argv[3], int(sys.argv[4]))
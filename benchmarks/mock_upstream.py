@@ -0,0 +1,236 @@
+"""本地模拟上游 LLM 服务（各提供商类型的替身）
+
+基于 asyncio 的极简 HTTP/1.1 服务器（Keep-Alive + 分块传输），按各提供商的
+流式格式返回固定文本，可配置首字延迟、片段数量、片段间隔（或输出速率）和
+片段大小。单进程即可同时保持数千个流，用于在不消耗真实 API 配额的情况下
+压测本应用。LLMWrapper 支持的每种 API 类型都有对应的替身：
+
+- openai：OpenAI 兼容接口（DeepSeek、Moonshot 等，OpenAI SDK 访问 {base_url}/chat/completions）
+- qwen：SiliconFlow / Qwen 的 SSE（requests_sse 类型）
+- spark：讯飞星火的 SSE（行尾为 CRLF）
+- zhipu：智谱 AI 的 SSE（校验 Bearer JWT 的格式，格式错误返回 401）
+- gemini：Gemini 的 streamGenerateContent?alt=sse（google-genai SDK，base_url 指向替身）
+
+独立运行:
+    python -m benchmarks.mock_upstream --port 9000 --tokens 20 --interval 0.05
+    python -m benchmarks.mock_upstream --ports openai=9001,gemini=9002 --rate 50 --chunk-chars 12
+"""
+
+import json
+import asyncio
+import argparse
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+# 支持的提供商替身
+PROVIDERS = ("openai", "qwen", "spark", "zhipu", "gemini")
+
+
+@dataclass
+class StreamProfile:
+    """模拟流的参数
+
+    Attributes:
+        ttft: 首个片段前的等待时间（秒）
+        tokens: 片段数量
+        interval: 片段间隔（秒）
+        token_text: 每个片段的文本
+    """
+    ttft: float = 0.2
+    tokens: int = 20
+    interval: float = 0.05
+    token_text: str = "token "
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    """添加模拟流参数的命令行选项"""
+    parser.add_argument("--ttft", type=float, default=0.2, help="首字延迟（秒）")
+    parser.add_argument("--tokens", type=int, default=20, help="每个流的片段数量")
+    parser.add_argument("--interval", type=float, default=0.05, help="片段间隔（秒）")
+    parser.add_argument("--rate", type=float, help="输出速率（片段/秒），指定时覆盖 --interval")
+    parser.add_argument("--chunk-chars", type=int, help="每个片段的字符数（默认为 'token ' 的 6 个字符）")
+
+
+def profile_from_args(args: argparse.Namespace) -> StreamProfile:
+    """根据命令行选项构建 StreamProfile"""
+    profile = StreamProfile(ttft=args.ttft, tokens=args.tokens, interval=args.interval)
+    if args.rate:
+        profile.interval = 1 / args.rate
+    if args.chunk_chars:
+        text = profile.token_text
+        profile.token_text = (text * (args.chunk_chars // len(text) + 1))[:args.chunk_chars]
+    return profile
+
+
+# ====================
+# 各提供商的事件格式
+# ====================
+
+def _openai_event(text: Optional[str], model: str = "mock") -> Dict:
+    """OpenAI 兼容的 chat.completion.chunk（text 为 None 时为结束帧）"""
+    delta = {"content": text} if text is not None else {}
+    return {
+        "id": "chatcmpl-mock",
+        "object": "chat.completion.chunk",
+        "created": 0,
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": None if text is not None else "stop"}]
+    }
+
+
+def _sse(payload: Dict, newline: str = "\n") -> bytes:
+    return f"data: {json.dumps(payload, ensure_ascii=False)}{newline}{newline}".encode()
+
+
+def _openai_stream(newline: str = "\n") -> Tuple[Callable[[str], bytes], bytes]:
+    """OpenAI 兼容格式：(片段编码函数, 结束数据)"""
+    return (
+        lambda text: _sse(_openai_event(text), newline),
+        _sse(_openai_event(None), newline) + f"data: [DONE]{newline}{newline}".encode()
+    )
+
+
+def _gemini_stream() -> Tuple[Callable[[str], bytes], bytes]:
+    """Gemini 格式：每个事件是一个 GenerateContentResponse，没有 [DONE]"""
+    def encode(text: str) -> bytes:
+        return _sse({
+            "candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}]
+        }, "\r\n")
+    return encode, _sse({
+        "candidates": [{"content": {"parts": [{"text": ""}], "role": "model"}, "finishReason": "STOP", "index": 0}]
+    }, "\r\n")
+
+
+def _authorized(provider: str, headers: Dict[str, str]) -> bool:
+    """检查认证头（只检查格式，不校验签名）"""
+    if provider == "gemini":
+        return bool(headers.get("x-goog-api-key"))
+    auth = headers.get("authorization", "")
+    if not auth.startswith("Bearer "):
+        return False
+    if provider == "zhipu":
+        return auth[len("Bearer "):].count(".") == 2
+    return True
+
+
+# ====================
+# HTTP 服务
+# ====================
+
+async def _read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, Dict[str, str]]]:
+    """读取一个请求（请求头和请求体），返回 (请求行, 请求头)；连接关闭时返回 None"""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        return None
+    lines = head.decode("latin-1").split("\r\n")
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", 0))
+    try:
+        if length:
+            await reader.readexactly(length)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    return lines[0], headers
+
+
+def _chunk(data: bytes) -> bytes:
+    """编码一个 HTTP 分块"""
+    return f"{len(data):x}\r\n".encode() + data + b"\r\n"
+
+
+async def handle_connection(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    provider: str,
+    profile: StreamProfile
+) -> None:
+    """处理一个连接：每个请求按 profile 流式返回，连接保持复用直到客户端关闭"""
+    if provider == "gemini":
+        encode, finish = _gemini_stream()
+    else:
+        encode, finish = _openai_stream("\r\n" if provider == "spark" else "\n")
+    try:
+        while True:
+            request = await _read_request(reader)
+            if request is None:
+                return
+            _, headers = request
+            if not _authorized(provider, headers):
+                body = b'{"error": {"message": "invalid api key"}}'
+                writer.write(
+                    b"HTTP/1.1 401 Unauthorized\r\n"
+                    b"Content-Type: application/json\r\n"
+                    b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+                )
+                await writer.drain()
+                continue
+
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: text/event-stream\r\n"
+                b"Cache-Control: no-cache\r\n"
+                b"Transfer-Encoding: chunked\r\n\r\n"
+            )
+            await writer.drain()
+            await asyncio.sleep(profile.ttft)
+            for i in range(profile.tokens):
+                if i:
+                    await asyncio.sleep(profile.interval)
+                writer.write(_chunk(encode(profile.token_text)))
+                await writer.drain()
+            writer.write(_chunk(finish) + b"0\r\n\r\n")
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host: str, ports: Dict[str, int], profile: StreamProfile) -> None:
+    """为每个提供商启动一个模拟上游并一直运行
+
+    Args:
+        host: 监听地址
+        ports: 提供商 -> 端口
+        profile: 模拟流的参数
+    """
+    servers = []
+    for provider, port in ports.items():
+        servers.append(await asyncio.start_server(
+            lambda r, w, provider=provider: handle_connection(r, w, provider, profile),
+            host, port, backlog=4096
+        ))
+    await asyncio.gather(*(server.serve_forever() for server in servers))
+
+
+def parse_ports(spec: str) -> Dict[str, int]:
+    """解析 "openai=9001,gemini=9002" 格式的端口分配"""
+    ports = {}
+    for item in spec.split(","):
+        provider, port = item.split("=")
+        if provider not in PROVIDERS:
+            raise ValueError(f"Unknown provider: {provider}")
+        ports[provider] = int(port)
+    return ports
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="本地模拟上游 LLM 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000, help="单个替身的端口（与 --provider 一起使用）")
+    parser.add_argument("--provider", choices=PROVIDERS, default="openai", help="单个替身的提供商类型")
+    parser.add_argument("--ports", help="同时启动多个替身，如 openai=9001,zhipu=9002")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    ports = parse_ports(args.ports) if args.ports else {args.provider: args.port}
+    asyncio.run(serve(args.host, ports, profile_from_args(args)))
+
+
+if __name__ == "__main__":
+    main()
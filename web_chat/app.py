@@ -2,27 +2,51 @@ from flask import Flask, render_template, request, Response, stream_with_context
 from flask_wtf.csrf import CSRFProtect
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from llm_wrapper import LLMWrapper
-from model_manager import register_routes
+from llm_wrapper import (
+    LLMWrapper,
+    client_pool,
+    credential_cache,
+    hedger,
+    model_registry,
+    response_cache,
+    session_pool,
+    similarity_cache,
+    single_flight
+)
+from model_manager import register_routes, add_change_listener, set_status_provider, models_list_cache_stats
+from http_cache import PrecomputedJSON, http_cache_settings_from_env
+from static_assets import AssetManifest, static_assets_settings_from_env
+from metrics import metrics
+from request_timing import RequestTiming, SlowRequestLog, slow_log_settings_from_env
+from log_pipeline import configure_logging, log_settings_from_env
+from circuit_breaker import circuit_breakers, retry_budget
+from health_prober import HealthProber, HealthProbePolicy, health_probe_settings_from_env
+from token_limiter import RateLimitExceeded, Reservation, TokenLimitPolicy, TokenRateLimiter, token_limit_settings_from_env
+from fan_out import MAX_COMPARE_MODELS, encode_frames, fan_out
+from batch_jobs import BatchQueue, batch_settings_from_env, parse_jsonl
+from conversation_store import (
+    CONVERSATION_ID_RE,
+    MAX_MESSAGES,
+    ConversationConflictError,
+    ConversationLimitError,
+    ConversationStore,
+    ConversationTurn,
+    conversation_store_settings_from_env
+)
 import os
+import hmac
 import json
 import logging
 import threading
+from functools import partial
 from dotenv import load_dotenv
-from typing import Dict, List, Optional, Any, Tuple
+from typing import Callable, Dict, List, Optional, Any, Tuple
 
 # 加载环境变量
 load_dotenv()
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('web_chat.log', encoding='utf-8')
-    ]
-)
+# 配置日志（后台线程写入控制台和轮转的日志文件，请求线程只入队）
+log_pipeline = configure_logging(**log_settings_from_env())
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
@@ -53,31 +77,59 @@ else:
         app=app,
         default_limits=["200 per day", "50 per hour"],
         storage_uri="memory://",
-        strategy="fixed-window"
+        strategy="fixed-window",
+        headers_enabled=True
     )
 
 # 初始化 LLM Wrapper
 llm = LLMWrapper()
 
+# 服务端对话存储（增量请求只上传新消息）
+conversation_store = ConversationStore(**conversation_store_settings_from_env())
+
+# 按 token 计费的速率限制（SQLite 存储，同一台机器上的工作进程共享额度）
+token_limiter = TokenRateLimiter(TokenLimitPolicy(**token_limit_settings_from_env()))
+
+
+def chat_limit_exempt() -> bool:
+    """启用共享的 token 速率限制时，聊天接口不再使用每个进程各自计数的请求限制
+
+    Flask-Limiter 使用 memory:// 存储，每个工作进程单独计数；token 限制器的
+    额度保存在 SQLite 中由所有进程共享，并且已经包含每分钟请求数限制。
+    """
+    return token_limiter.enabled
+
+
+# 慢请求日志（超过阈值的请求连同耗时分解写入单独的文件）
+slow_request_log = SlowRequestLog(**slow_log_settings_from_env())
+
+# 预热 Provider 客户端池（测试环境跳过）
+if not app.config.get('TESTING'):
+    client_pool.warm(llm.configs)
+
 # 注册模型管理路由（传入 limiter 以启用速率限制）
 register_routes(app, limiter)
 
+# 模型管理接口保存 models.json 后立即使模型注册表失效
+add_change_listener(model_registry.invalidate)
+
 # 速率限制辅助函数（根据环境调整限制）
-def rate_limit(limit_string: str):
+def rate_limit(limit_string: str, exempt_when: Optional[Callable[[], bool]] = None):
     """根据环境返回速率限制装饰器
 
     Args:
         limit_string: 限制字符串，如 "10 per minute"
+        exempt_when: 返回 True 时本次请求不计入该限制
 
     Returns:
         装饰器函数
     """
     if app.config.get('TESTING'):
         # 测试环境：使用极高的限制
-        return limiter.limit("10000 per minute")
+        return limiter.limit("10000 per minute", exempt_when=exempt_when)
     else:
         # 生产环境：使用指定的限制
-        return limiter.limit(limit_string)
+        return limiter.limit(limit_string, exempt_when=exempt_when)
 
 # API 密钥本地存储文件路径
 API_KEYS_FILE = os.path.join(os.path.dirname(__file__), 'api_keys.json')
@@ -100,6 +152,8 @@ class ConfigCache:
         self._cache: Dict[str, str] = {}
         self._mtime: float = 0
         self._lock = threading.Lock()
+        # 缓存内容每次更新加 1（供 /api/config/load 判断是否需要重新序列化）
+        self.version = 0
 
     def _is_cache_valid(self) -> bool:
         """检查缓存是否有效
@@ -125,26 +179,42 @@ class ConfigCache:
             Dict[str, str]: API 密钥字典
         """
         with self._lock:
-            # 如果缓存有效且不强制重新加载，直接返回缓存
-            if not force_reload and self._is_cache_valid() and self._cache:
-                return self._cache.copy()
-
-            # 缓存失效或强制重新加载，从文件加载
-            if os.path.exists(API_KEYS_FILE):
-                try:
-                    with open(API_KEYS_FILE, 'r', encoding='utf-8') as f:
-                        self._cache = json.load(f)
-                        self._mtime = os.path.getmtime(API_KEYS_FILE)
-                        logger.debug(f'API keys loaded from file (cache updated)')
-                except (json.JSONDecodeError, IOError) as e:
-                    logger.warning(f'Failed to load API keys from file: {e}')
-                    self._cache = {}
-                    self._mtime = 0
-            else:
+            self._refresh(force_reload)
+            return self._cache.copy()
+
+    def get_with_version(self) -> Tuple[Dict[str, str], int]:
+        """获取配置及其版本号（两者一致，供预序列化响应使用）
+
+        Returns:
+            Tuple[Dict[str, str], int]: (API 密钥字典, 版本号)
+        """
+        with self._lock:
+            self._refresh()
+            return self._cache.copy(), self.version
+
+    def _refresh(self, force_reload: bool = False) -> None:
+        """缓存失效或强制重新加载时从文件加载（调用方持有锁）"""
+        # 如果缓存有效且不强制重新加载，直接使用缓存
+        if not force_reload and self._is_cache_valid() and self._cache:
+            return
+
+        # 缓存失效或强制重新加载，从文件加载
+        if os.path.exists(API_KEYS_FILE):
+            try:
+                with open(API_KEYS_FILE, 'r', encoding='utf-8') as f:
+                    self._cache = json.load(f)
+                    self._mtime = os.path.getmtime(API_KEYS_FILE)
+                    self.version += 1
+                    logger.debug(f'API keys loaded from file (cache updated)')
+            except (json.JSONDecodeError, IOError) as e:
+                logger.warning(f'Failed to load API keys from file: {e}')
                 self._cache = {}
                 self._mtime = 0
-
-            return self._cache.copy()
+                self.version += 1
+        elif self._cache or self._mtime:
+            self._cache = {}
+            self._mtime = 0
+            self.version += 1
 
     def set(self, api_keys: Dict[str, str]) -> bool:
         """设置配置并保存到文件
@@ -162,6 +232,7 @@ class ConfigCache:
                 # 更新缓存和修改时间
                 self._cache = api_keys.copy()
                 self._mtime = os.path.getmtime(API_KEYS_FILE)
+                self.version += 1
                 logger.info('API keys saved successfully (cache updated)')
                 return True
             except IOError as e:
@@ -182,6 +253,30 @@ class ConfigCache:
 # 创建全局配置缓存实例
 config_cache = ConfigCache()
 
+# 模型 ID 列表与 API 密钥配置的预序列化响应（内容含密钥，只允许浏览器私有缓存）
+model_ids_response = PrecomputedJSON('models', **http_cache_settings_from_env())
+config_load_response = PrecomputedJSON('config', cache_control='private, no-cache', **http_cache_settings_from_env())
+
+# 构建后的静态资源（python web_chat/static_assets.py 生成 static/dist/manifest.json；
+# 未构建或源文件已修改时页面直接加载源文件）
+asset_manifest = AssetManifest(app.static_folder, **static_assets_settings_from_env())
+asset_manifest.load()
+
+# 批量任务队列：使用本地保存的 API 密钥；启动时恢复上次中断的任务（测试环境跳过）
+batch_queue = BatchQueue(**batch_settings_from_env())
+batch_queue.bind(lambda: LLMWrapper(custom_api_keys=config_cache.get()))
+if not app.config.get('TESTING'):
+    batch_queue.start()
+
+# 后台健康探测（默认关闭，LLM_HEALTH_PROBE_ENABLED=true 启用）：使用本地保存的 API 密钥，
+# 结果通过 /api/models/list 的 health 字段返回
+health_prober = HealthProber(HealthProbePolicy(**health_probe_settings_from_env()))
+health_prober.bind(lambda: LLMWrapper(custom_api_keys=config_cache.get()))
+if health_prober.enabled:
+    set_status_provider(health_prober.snapshot, lambda: health_prober.version)
+    if not app.config.get('TESTING'):
+        health_prober.start()
+
 
 def load_api_keys_from_file() -> Dict[str, str]:
     """从本地文件加载 API 密钥配置
@@ -217,6 +312,12 @@ def save_api_keys_to_file(api_keys: Dict[str, str]) -> bool:
         return False
 
 
+@app.template_global()
+def asset_urls(bundle: str) -> List[str]:
+    """模板中 bundle 的地址（构建后为带哈希的文件，否则为源文件）"""
+    return asset_manifest.urls(bundle)
+
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -235,16 +336,262 @@ def serve_icon(filename):
     return send_from_directory(icons_dir, filename)
 
 
+@app.route('/static/dist/<path:filename>')
+@limiter.exempt
+def serve_bundle(filename):
+    """带哈希的静态资源 bundle（预压缩，Cache-Control: immutable）"""
+    return asset_manifest.send(filename)
+
+
 @app.route('/api/models')
 def get_models():
-    return jsonify(llm.get_models())
+    """可用模型 ID 列表（按注册表版本预序列化，支持 ETag/304 与 gzip/brotli）"""
+    return model_ids_response.response(llm.registry.version, llm.get_models)
+
+
+@app.route('/api/stats/client-pool', methods=['GET'])
+def client_pool_stats():
+    """Provider 客户端池统计（OpenAI / Google 客户端的命中、未命中与淘汰次数）"""
+    return jsonify(client_pool.stats())
+
+
+@app.route('/api/stats/http-pool', methods=['GET'])
+def http_pool_stats():
+    """Keep-Alive 会话池统计（Qwen / Spark / 智谱的主机数、连接数、请求数与连接复用率）"""
+    return jsonify(session_pool.stats())
+
+
+@app.route('/api/stats/hedging', methods=['GET'])
+def hedging_stats():
+    """对冲请求统计（对冲率、备用上游胜出率、当前对冲延迟）"""
+    return jsonify({'enabled': hedger.policy.enabled, 'models': hedger.stats()})
+
+
+@app.route('/api/stats/cache', methods=['GET'])
+def cache_stats():
+    """响应缓存统计（命中率、节省的字节数、内存层占用）"""
+    return jsonify({'enabled': response_cache.policy.enabled, **response_cache.stats()})
+
+
+@app.route('/api/stats/single-flight', methods=['GET'])
+def single_flight_stats():
+    """相同请求合并统计（leader 数、被合并的请求数、被取消的上游数）"""
+    return jsonify({'enabled': single_flight.enabled, **single_flight.stats()})
+
+
+@app.route('/metrics', methods=['GET'])
+@limiter.exempt
+def prometheus_metrics():
+    """Prometheus 指标（文本格式，按模型和提供商类型区分的延迟直方图与计数器）"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/stats/credentials', methods=['GET'])
+def credential_stats():
+    """签名凭据缓存统计（命中、签发、提前刷新次数）"""
+    return jsonify(credential_cache.stats())
+
+
+@app.route('/api/stats/logging', methods=['GET'])
+def logging_stats():
+    """日志管道统计（队列占用、队列满时丢弃与被采样丢弃的记录数）"""
+    return jsonify(log_pipeline.stats())
+
+
+@app.route('/api/stats/rate-limit', methods=['GET'])
+def rate_limit_stats():
+    """按 token 计费的速率限制统计（放行与限流次数、已扣减的 token）及本客户端的剩余额度"""
+    return jsonify({**token_limiter.stats(), 'remaining': token_limiter.remaining(get_remote_address())})
+
+
+@app.route('/api/stats/circuit-breakers', methods=['GET'])
+def circuit_breaker_stats():
+    """各上游端点的熔断器状态与全局重试预算"""
+    return jsonify({
+        'enabled': circuit_breakers.policy.enabled,
+        'endpoints': circuit_breakers.stats(),
+        'retry_budget': retry_budget.stats()
+    })
+
+
+@app.route('/api/stats/health-probe', methods=['GET'])
+def health_probe_stats():
+    """后台健康探测统计（探测轮数、次数、失败与跳过次数）"""
+    return jsonify(health_prober.stats())
+
+
+@app.route('/api/stats/http-cache', methods=['GET'])
+def http_cache_stats():
+    """预序列化 JSON 接口统计（重新生成、304、压缩响应次数与正文大小）"""
+    return jsonify({
+        'models_list': models_list_cache_stats(),
+        'models': model_ids_response.stats(),
+        'config': config_load_response.stats()
+    })
+
+
+@app.route('/api/stats/static-assets', methods=['GET'])
+def static_assets_stats():
+    """静态资源统计（使用中的 bundle 与带哈希文件的发送次数）"""
+    return jsonify(asset_manifest.stats())
+
+
+@app.route('/api/stats/conversations', methods=['GET'])
+def conversation_stats():
+    """对话存储统计（热集合占用、版本冲突、溢出与加载次数）"""
+    return jsonify(conversation_store.stats())
+
+
+def admin_token_error() -> Optional[tuple[Response, int]]:
+    """校验管理接口令牌
+
+    请求必须在 X-Admin-Token 头中携带与环境变量 ADMIN_TOKEN 相同的令牌；
+    未设置 ADMIN_TOKEN 时管理接口全部关闭（这些接口免 CSRF 校验，不能默认开放）。
+
+    Returns:
+        Optional[tuple[Response, int]]: 校验失败时的错误响应，通过时返回 None
+    """
+    token = os.environ.get('ADMIN_TOKEN')
+    if not token:
+        logger.warning('Rejected admin request: ADMIN_TOKEN is not set')
+        return jsonify({'error': 'Admin API disabled (ADMIN_TOKEN not set)'}), 403
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), token):
+        logger.warning('Rejected admin request with invalid token')
+        return jsonify({'error': 'Invalid admin token'}), 403
+    return None
+
+
+@app.route('/api/admin/similarity-cache', methods=['GET'])
+def similarity_cache_entries():
+    """查看近似重复缓存的统计和条目
+
+    查询参数:
+        model: 只列出该模型的条目（可选）
+        limit: 最多返回的条目数（默认 100）
+    """
+    error = admin_token_error()
+    if error:
+        return error
+    limit = request.args.get('limit', 100, type=int)
+    return jsonify({
+        'enabled': similarity_cache.policy.enabled,
+        'stats': similarity_cache.stats(),
+        'entries': similarity_cache.entries(model_id=request.args.get('model'), limit=limit)
+    })
+
+
+@app.route('/api/admin/similarity-cache', methods=['DELETE'])
+@rate_limit("10 per minute")
+@csrf.exempt
+def purge_similarity_cache():
+    """清理近似重复缓存
+
+    查询参数:
+        id: 只删除该条目（可选）
+        model: 只删除该模型的条目（可选），都不指定时清空
+    """
+    error = admin_token_error()
+    if error:
+        return error
+    purged = similarity_cache.purge(model_id=request.args.get('model'), entry_id=request.args.get('id'))
+    logger.info(f'Purged {purged} similarity cache entries')
+    return jsonify({'success': True, 'purged': purged})
+
+
+@app.route('/api/batch/jobs', methods=['POST'])
+@rate_limit("10 per minute")
+@csrf.exempt
+def submit_batch_job():
+    """提交批量任务
+
+    请求体为 JSONL，每行一个 {"custom_id", "model", "messages"}（或 "prompt"）。
+
+    查询参数:
+        model: 没有指定 model 的行使用的模型（可选）
+        name: 任务名称（可选）
+    """
+    error = admin_token_error()
+    if error:
+        return error
+
+    try:
+        items = parse_jsonl(request.get_data(as_text=True), default_model=request.args.get('model'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # 每一行与 /api/chat 使用相同的校验规则
+    for line_no, item in enumerate(items, 1):
+        message = validate_chat_payload({'model': item.model, 'messages': item.messages})
+        if message:
+            return jsonify({'error': f'Item {line_no} ({item.custom_id}): {message}'}), 400
+
+    try:
+        job_id = batch_queue.submit(items, name=request.args.get('name', ''))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'id': job_id, 'total': len(items)}), 202
+
+
+@app.route('/api/batch/jobs', methods=['GET'])
+def list_batch_jobs():
+    """列出最近的批量任务及其进度"""
+    error = admin_token_error()
+    if error:
+        return error
+    return jsonify({'jobs': batch_queue.jobs(limit=request.args.get('limit', 50, type=int))})
+
+
+@app.route('/api/batch/jobs/<job_id>', methods=['GET'])
+def batch_job_progress(job_id: str):
+    """查询批量任务进度（各状态条目数、条/分钟、预计剩余时间）"""
+    error = admin_token_error()
+    if error:
+        return error
+    job = batch_queue.job(job_id)
+    if job is None:
+        return jsonify({'error': 'Batch job not found'}), 404
+    return jsonify(job)
+
+
+@app.route('/api/batch/jobs/<job_id>/results', methods=['GET'])
+def batch_job_results(job_id: str):
+    """以流式 JSONL 下载批量任务结果（任务进行中时包含已完成的部分）"""
+    error = admin_token_error()
+    if error:
+        return error
+    if batch_queue.job(job_id) is None:
+        return jsonify({'error': 'Batch job not found'}), 404
+    return Response(
+        stream_with_context(batch_queue.iter_results(job_id)),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename=batch-{job_id}.jsonl'}
+    )
+
+
+@app.route('/api/batch/jobs/<job_id>', methods=['DELETE'])
+@rate_limit("10 per minute")
+@csrf.exempt
+def cancel_batch_job(job_id: str):
+    """取消批量任务"""
+    error = admin_token_error()
+    if error:
+        return error
+    if not batch_queue.cancel(job_id):
+        return jsonify({'error': 'Batch job not found or already finished'}), 404
+    return jsonify({'success': True})
+
+
+@app.route('/api/stats/batch', methods=['GET'])
+def batch_stats():
+    """批量任务统计（最近一分钟的条/分钟、各模型并发、待处理条目数）"""
+    return jsonify(batch_queue.stats())
 
 
 @app.route('/api/config/load', methods=['GET'])
 def load_config():
-    """加载 API 密钥配置（使用缓存）"""
-    api_keys = config_cache.get()
-    return jsonify(api_keys)
+    """加载 API 密钥配置（使用缓存，内容不变时不重新序列化，支持 ETag/304 与 gzip/brotli）"""
+    api_keys, version = config_cache.get_with_version()
+    return config_load_response.response(version, lambda: api_keys)
 
 
 @app.route('/api/config/save', methods=['POST'])
@@ -274,97 +621,378 @@ def save_config() -> tuple[Response, int] | Response:
         return jsonify({'success': False, 'message': '保存失败'}), 500
 
 
-@app.route('/api/chat', methods=['POST'])
-@rate_limit("10 per minute")  # 速率限制：每分钟最多 10 次请求
-@csrf.exempt  # API 端点使用其他认证方式（API Key）
-def chat() -> tuple[Response, int] | Response:
-    """流式聊天端点
+def validate_message(i: int, msg: Any) -> Optional[str]:
+    """验证单条消息
 
-    POST 请求格式:
-    {
-        "model": str,           # 模型 ID
-        "messages": List[Dict], # 消息列表
-        "api_keys": Dict        # API 密钥（可选）
-    }
+    Args:
+        i: 消息下标（用于错误信息）
+        msg: 消息
 
     Returns:
-        Response: 流式响应或错误信息
+        Optional[str]: 错误信息，验证通过时返回 None
     """
-    logger.info('Received chat request')
+    if not isinstance(msg, dict):
+        logger.warning(f'Invalid message at index {i}: not a dict')
+        return f'Message at index {i} must be a dict'
 
-    # 获取请求数据
-    if not request.json:
-        logger.warning('Invalid request: missing JSON body')
-        return jsonify({'error': 'Invalid request: missing JSON body'}), 400
+    if 'role' not in msg or 'content' not in msg:
+        logger.warning(f'Invalid message at index {i}: missing role or content')
+        return f'Message at index {i} missing role or content'
 
-    data = request.json
+    if msg['role'] not in ['user', 'assistant', 'system']:
+        logger.warning(f'Invalid message at index {i}: invalid role {msg["role"]}')
+        return f'Invalid role at index {i}: {msg["role"]}'
+
+    if not isinstance(msg['content'], str):
+        logger.warning(f'Invalid message at index {i}: content not a string')
+        return f'Message content at index {i} must be a string'
+
+    if len(msg['content']) > 10000:
+        logger.warning(f'Invalid message at index {i}: content too long ({len(msg["content"])} > 10000)')
+        return f'Message at index {i} too long (max 10000 characters)'
+
+    return None
+
+
+def validate_chat_payload(data: Dict[str, Any]) -> Optional[str]:
+    """验证聊天请求体
+
+    WSGI（Flask）与 ASGI 两条执行路径共用此校验逻辑。
+
+    Args:
+        data: 解析后的请求 JSON
+
+    Returns:
+        Optional[str]: 错误信息，验证通过时返回 None
+    """
     model_id = data.get('model')
     messages = data.get('messages')
-    api_keys = data.get('api_keys', {})
 
     # 输入验证
     if not model_id:
         logger.warning('Invalid request: missing model_id')
-        return jsonify({'error': 'Missing model_id'}), 400
+        return 'Missing model_id'
 
     if not isinstance(model_id, str):
         logger.warning(f'Invalid request: model_id must be string, got {type(model_id)}')
-        return jsonify({'error': 'model_id must be a string'}), 400
+        return 'model_id must be a string'
 
     if not messages:
         logger.warning('Invalid request: missing messages')
-        return jsonify({'error': 'Missing messages'}), 400
+        return 'Missing messages'
 
     if not isinstance(messages, list):
         logger.warning(f'Invalid request: messages must be list, got {type(messages)}')
-        return jsonify({'error': 'messages must be a list'}), 400
+        return 'messages must be a list'
 
-    if len(messages) > 100:
-        logger.warning(f'Invalid request: too many messages ({len(messages)} > 100)')
-        return jsonify({'error': 'Too many messages (max 100)'}), 400
+    if len(messages) > MAX_MESSAGES:
+        logger.warning(f'Invalid request: too many messages ({len(messages)} > {MAX_MESSAGES})')
+        return f'Too many messages (max {MAX_MESSAGES})'
 
     # 验证消息格式
     for i, msg in enumerate(messages):
-        if not isinstance(msg, dict):
-            logger.warning(f'Invalid message at index {i}: not a dict')
-            return jsonify({'error': f'Message at index {i} must be a dict'}), 400
+        error = validate_message(i, msg)
+        if error:
+            return error
+
+    # 验证模型是否存在（注册表字典查找，无文件 I/O）
+    if not llm.has_model(model_id):
+        logger.warning(f'Invalid request: model_id {model_id} not found')
+        return f'Invalid model_id: {model_id}'
+
+    return None
 
-        if 'role' not in msg or 'content' not in msg:
-            logger.warning(f'Invalid message at index {i}: missing role or content')
-            return jsonify({'error': f'Message at index {i} missing role or content'}), 400
 
-        if msg['role'] not in ['user', 'assistant', 'system']:
-            logger.warning(f'Invalid message at index {i}: invalid role {msg["role"]}')
-            return jsonify({'error': f'Invalid role at index {i}: {msg["role"]}'}), 400
+def validate_delta_payload(data: Dict[str, Any]) -> Optional[str]:
+    """验证增量聊天请求体（只校验新消息，开销与对话长度无关）
+
+    Args:
+        data: 解析后的请求 JSON
 
-        if not isinstance(msg['content'], str):
-            logger.warning(f'Invalid message at index {i}: content not a string')
-            return jsonify({'error': f'Message content at index {i} must be a string'}), 400
+    Returns:
+        Optional[str]: 错误信息，验证通过时返回 None
+    """
+    model_id = data.get('model')
+    conversation_id = data.get('conversation_id')
+    base_version = data.get('base_version')
+
+    if not model_id:
+        logger.warning('Invalid request: missing model_id')
+        return 'Missing model_id'
+
+    if not isinstance(model_id, str):
+        logger.warning(f'Invalid request: model_id must be string, got {type(model_id)}')
+        return 'model_id must be a string'
 
-        if len(msg['content']) > 10000:
-            logger.warning(f'Invalid message at index {i}: content too long ({len(msg["content"])} > 10000)')
-            return jsonify({'error': f'Message at index {i} too long (max 10000 characters)'}), 400
+    if not isinstance(conversation_id, str) or not CONVERSATION_ID_RE.match(conversation_id):
+        logger.warning('Invalid request: invalid conversation_id')
+        return 'Invalid conversation_id'
 
-    # 验证模型是否存在
-    available_models = llm.get_models()
-    if model_id not in available_models:
+    if not isinstance(base_version, int) or isinstance(base_version, bool) or base_version < 0:
+        logger.warning(f'Invalid request: invalid base_version {base_version!r}')
+        return 'base_version must be a non-negative integer'
+
+    message = data.get('message')
+    error = validate_message(base_version, message)
+    if error:
+        return error
+
+    # 增量请求的新消息总是本轮的用户消息
+    if message['role'] != 'user':
+        logger.warning(f'Invalid request: delta message role {message["role"]}')
+        return 'message role must be user'
+
+    if not llm.has_model(model_id):
         logger.warning(f'Invalid request: model_id {model_id} not found')
-        return jsonify({'error': f'Invalid model_id: {model_id}'}), 400
+        return f'Invalid model_id: {model_id}'
+
+    return None
+
+
+def open_chat_turn(
+    data: Dict[str, Any]
+) -> Tuple[Optional[List[Dict[str, str]]], Optional[ConversationTurn], Optional[Tuple[Dict[str, Any], int]]]:
+    """校验聊天请求并确定本轮发送给模型的消息
+
+    支持两种请求格式（WSGI 与 ASGI 两条执行路径共用）：
+    - 完整历史：{"model", "messages"}；同时携带 conversation_id 时用上传的历史
+      重新同步服务端对话
+    - 增量请求：{"model", "conversation_id", "base_version", "message"}，
+      base_version 与服务端不一致时返回 409，客户端应改为上传完整历史
 
-    logger.info(f'Chat request validated: Model={model_id}, Messages={len(messages)}')
+    Args:
+        data: 解析后的请求 JSON
+
+    Returns:
+        Tuple: (消息列表, 服务端对话的本轮, 错误)。错误为 (响应体, 状态码)；
+            不使用服务端对话时本轮为 None
+    """
+    if 'message' in data and 'messages' not in data:
+        error = validate_delta_payload(data)
+        if error:
+            return None, None, ({'error': error}, 400)
+        try:
+            turn = conversation_store.begin_turn(
+                data['conversation_id'], data['model'], data['base_version'], data['message']
+            )
+        except ConversationConflictError as e:
+            logger.info(f'Conversation {data["conversation_id"]} out of sync: client {data["base_version"]}, server {e.version}')
+            return None, None, ({'error': str(e), 'version': e.version}, 409)
+        except ConversationLimitError as e:
+            logger.warning(f'Invalid request: conversation {data["conversation_id"]} over limit: {e}')
+            return None, None, ({'error': str(e)}, 400)
+        return turn.messages, turn, None
+
+    error = validate_chat_payload(data)
+    if error:
+        return None, None, ({'error': error}, 400)
+
+    conversation_id = data.get('conversation_id')
+    if conversation_id is None:
+        return data['messages'], None, None
+    if not isinstance(conversation_id, str) or not CONVERSATION_ID_RE.match(conversation_id):
+        logger.warning('Invalid request: invalid conversation_id')
+        return None, None, ({'error': 'Invalid conversation_id'}, 400)
+    try:
+        turn = conversation_store.reset(conversation_id, data['model'], data['messages'])
+    except ConversationLimitError as e:
+        logger.warning(f'Invalid request: conversation {conversation_id} over limit: {e}')
+        return None, None, ({'error': str(e)}, 400)
+    return turn.messages, turn, None
+
+
+def reserve_tokens(
+    client: str,
+    model_ids: List[str],
+    messages: List[Dict[str, str]],
+    turn: Optional[ConversationTurn] = None
+) -> Tuple[Optional[Reservation], Optional[Tuple[Dict[str, Any], int, Dict[str, str]]]]:
+    """按估算的 token 数检查并预扣速率限制额度（WSGI 与 ASGI 两条执行路径共用）
+
+    Args:
+        client: 客户端地址
+        model_ids: 本次请求的模型 ID
+        messages: 发送给模型的消息
+        turn: 服务端对话的本轮（超出额度时结束本轮，不保存回复）
+
+    Returns:
+        Tuple: (预扣记录, 错误)。错误为 (响应体, 429, 响应头)，响应头包含 Retry-After
+    """
+    try:
+        return token_limiter.reserve(client, model_ids, messages), None
+    except RateLimitExceeded as e:
+        if turn is not None:
+            turn.finish('')
+        body = {'error': str(e), 'scope': e.scope, 'retry_after': e.retry_after_header}
+        return None, (body, 429, {'Retry-After': str(e.retry_after_header)})
+
+
+def provider_unavailable(
+    model_id: str,
+    turn: Optional[ConversationTurn] = None
+) -> Optional[Tuple[Dict[str, Any], int, Dict[str, str]]]:
+    """模型的上游端点熔断时立即拒绝请求（WSGI 与 ASGI 两条执行路径共用）
+
+    Args:
+        model_id: 模型 ID
+        turn: 服务端对话的本轮（拒绝时结束本轮，不保存回复）
+
+    Returns:
+        Optional[Tuple]: 熔断时为 (响应体, 503, 响应头)，响应头包含 Retry-After，否则为 None
+    """
+    error = llm.unavailable(model_id)
+    if error is None:
+        return None
+    if turn is not None:
+        turn.finish('')
+    body = {'error': str(error), 'error_type': error.error_type, 'retry_after': error.retry_after_header}
+    return body, 503, {'Retry-After': str(error.retry_after_header)}
+
+
+def conversation_headers(turn: Optional[ConversationTurn]) -> Dict[str, str]:
+    """服务端对话的响应头（对话 ID 与追加用户消息后的版本号）"""
+    if turn is None:
+        return {}
+    return {'X-Conversation-Id': turn.conversation_id, 'X-Conversation-Version': str(turn.version)}
+
+
+@app.route('/api/chat', methods=['POST'])
+@rate_limit("10 per minute", exempt_when=chat_limit_exempt)  # 速率限制：每分钟最多 10 次请求
+@csrf.exempt  # API 端点使用其他认证方式（API Key）
+def chat() -> tuple[Response, int] | Response:
+    """流式聊天端点
+
+    POST 请求格式（完整历史）:
+    {
+        "model": str,             # 模型 ID
+        "messages": List[Dict],   # 消息列表
+        "conversation_id": str,   # 对话 ID（可选，用完整历史重新同步服务端对话）
+        "api_keys": Dict,         # API 密钥（可选）
+        "stats": bool             # 是否在流末尾附加耗时统计帧（可选）
+    }
+
+    POST 请求格式（增量请求）:
+    {
+        "model": str,             # 模型 ID
+        "conversation_id": str,   # 对话 ID
+        "base_version": int,      # 客户端已知的版本号（历史消息条数）
+        "message": Dict,          # 新的用户消息
+        "api_keys": Dict,         # API 密钥（可选）
+        "stats": bool             # 是否在流末尾附加耗时统计帧（可选）
+    }
+
+    Returns:
+        Response: 流式响应或错误信息（版本冲突时返回 409）。Server-Timing 响应头
+        包含解析与校验耗时，X-Trace-Id 为慢请求日志中的追踪 ID；请求 stats 时
+        流以 "\x1e" 加一行 JSON 的统计帧结束（见 request_timing.py）
+    """
+    logger.info('Received chat request')
+    timing = RequestTiming()
+
+    # 获取请求数据
+    with timing.phase('parse'):
+        data = request.json
+    if not data:
+        logger.warning('Invalid request: missing JSON body')
+        return jsonify({'error': 'Invalid request: missing JSON body'}), 400
+
+    model_id = data.get('model')
+    api_keys = data.get('api_keys', {})
+
+    with timing.phase('validate'):
+        messages, turn, error = open_chat_turn(data)
+    if error:
+        return jsonify(error[0]), error[1]
+
+    unavailable = provider_unavailable(model_id, turn)
+    if unavailable:
+        return jsonify(unavailable[0]), unavailable[1], unavailable[2]
+
+    reservation, limited = reserve_tokens(get_remote_address(), [model_id], messages, turn)
+    if limited:
+        return jsonify(limited[0]), limited[1], limited[2]
+
+    logger.info(f'Chat request validated: Model={model_id}, Messages={len(messages)}, Trace={timing.trace_id}')
+    headers = {**conversation_headers(turn), **timing.headers()}
 
     def generate():
-        """生成流式响应"""
+        """生成流式响应（服务端对话在结束或客户端断开时保存已输出的回复）"""
         llm_with_keys = LLMWrapper(custom_api_keys=api_keys)
+        parts: List[str] = []
         try:
-            for chunk in llm_with_keys.chat_stream(model_id, messages):
+            for chunk in timing.wrap(llm_with_keys.chat_stream(model_id, messages)):
+                parts.append(chunk)
                 yield chunk
         except Exception as e:
             logger.error(f'Error during chat stream: {e}')
-            yield f'\n\n[错误: {str(e)}]'
+            parts.append(f'\n\n[错误: {str(e)}]')
+            yield parts[-1]
+        finally:
+            if turn is not None:
+                turn.finish(''.join(parts))
+            if reservation is not None:
+                reservation.settle(model_id, ''.join(parts))
+            slow_request_log.record(timing, model=model_id, chars=sum(len(part) for part in parts))
+        if data.get('stats') is True:
+            yield timing.stats_frame()
 
-    return Response(stream_with_context(generate()), mimetype='text/plain')
+    return Response(stream_with_context(generate()), mimetype='text/plain', headers=headers)
+
+
+
+@app.route('/api/chat/compare', methods=['POST'])
+@rate_limit("10 per minute", exempt_when=chat_limit_exempt)
+@csrf.exempt
+def chat_compare() -> tuple[Response, int] | Response:
+    """多模型并发对比端点
+
+    POST 请求格式:
+    {
+        "models": List[str],    # 模型 ID 列表（不超过 LLM_COMPARE_MAX_MODELS 个）
+        "messages": List[Dict], # 消息列表
+        "api_keys": Dict        # API 密钥（可选）
+    }
+
+    Returns:
+        Response: NDJSON 多路复用流，每行一个带模型 ID 的帧；每个模型的 done 帧
+        包含首字时间（ttft）和总耗时（total），最后以 end 帧结束
+    """
+    if not request.json:
+        return jsonify({'error': 'Invalid request: missing JSON body'}), 400
+
+    data = request.json
+    models = data.get('models')
+    messages = data.get('messages')
+    api_keys = data.get('api_keys', {})
 
+    if not isinstance(models, list) or not models or not all(isinstance(m, str) for m in models):
+        return jsonify({'error': 'models must be a non-empty list of model ids'}), 400
+    models = list(dict.fromkeys(models))
+    if len(models) > MAX_COMPARE_MODELS:
+        return jsonify({'error': f'Too many models (max {MAX_COMPARE_MODELS})'}), 400
+
+    # 消息只校验一次，其余模型只检查是否存在
+    error = validate_chat_payload({'model': models[0], 'messages': messages})
+    if error:
+        return jsonify({'error': error}), 400
+    for model_id in models[1:]:
+        if not llm.has_model(model_id):
+            return jsonify({'error': f'Invalid model_id: {model_id}'}), 400
+
+    reservation, limited = reserve_tokens(get_remote_address(), models, messages)
+    if limited:
+        return jsonify(limited[0]), limited[1], limited[2]
+
+    logger.info(f'Compare request validated: Models={models}, Messages={len(messages)}')
+    llm_with_keys = LLMWrapper(custom_api_keys=api_keys)
+
+    def upstream(model_id: str):
+        """创建上游流（启用速率限制时流结束后按实际输出调整预扣）"""
+        stream = llm_with_keys.iter_chat(model_id, messages)
+        return reservation.track(model_id, stream) if reservation is not None else stream
+
+    streams = {model_id: partial(upstream, model_id) for model_id in models}
+    return Response(stream_with_context(encode_frames(fan_out(streams))), mimetype='application/x-ndjson')
 
 if __name__ == '__main__':
     # 从环境变量读取配置
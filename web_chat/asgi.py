@@ -0,0 +1,246 @@
+"""ASGI 入口
+
+POST /api/chat 由原生 asyncio 流式引擎（AsyncLLMWrapper）处理，每个流只占用
+一个协程；其他路由通过 asgiref 的 WsgiToAsgi 转交给 Flask 应用。
+
+请求校验、模型注册表和速率限制与 Flask 路径共用同一套实现。
+
+启动方法:
+    uvicorn asgi:app --app-dir web_chat --host 127.0.0.1 --port 5000
+"""
+
+import json
+import time
+import math
+import asyncio
+import logging
+from contextlib import aclosing
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from asgiref.wsgi import WsgiToAsgi
+from limits import parse as parse_limit
+
+from app import (
+    app as flask_app,
+    chat_limit_exempt,
+    conversation_headers,
+    limiter,
+    open_chat_turn,
+    provider_unavailable,
+    reserve_tokens,
+    slow_request_log
+)
+from async_llm import AsyncLLMWrapper, async_clients
+from request_timing import RequestTiming
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+Scope = Dict[str, Any]
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+
+# 其他路由交给 Flask 处理
+wsgi_app = WsgiToAsgi(flask_app)
+
+# /api/chat 的速率限制（与 Flask 路由保持一致）
+CHAT_RATE_LIMIT = parse_limit("10000 per minute" if flask_app.config.get('TESTING') else "10 per minute")
+
+
+async def _send_json(send: Send, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+    """发送 JSON 响应"""
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode())
+        ] + [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _read_body(receive: Receive, max_length: int) -> Optional[bytes]:
+    """读取完整请求体，超过 max_length 时返回 None"""
+    chunks: List[bytes] = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ConnectionError('Client disconnected')
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > max_length:
+            return None
+        chunks.append(chunk)
+        if not message.get('more_body', False):
+            return b''.join(chunks)
+
+
+def _header(scope: Scope, name: bytes) -> str:
+    """读取请求头（不区分大小写）"""
+    for key, value in scope.get('headers', []):
+        if key.lower() == name:
+            return value.decode('latin-1')
+    return ''
+
+
+def _client_address(scope: Scope) -> str:
+    """获取客户端地址（与 flask_limiter.util.get_remote_address 一致）"""
+    client: Optional[Tuple[str, int]] = scope.get('client')
+    return client[0] if client else '127.0.0.1'
+
+
+async def _wait_for_disconnect(receive: Receive) -> None:
+    """等待客户端断开连接"""
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def chat(scope: Scope, receive: Receive, send: Send) -> None:
+    """异步流式聊天端点
+
+    请求格式、Server-Timing 响应头与统计帧与 Flask 的 /api/chat 相同。
+    客户端断开时取消上游流。
+    """
+    logger.info('Received async chat request')
+    timing = RequestTiming()
+
+    client = _client_address(scope)
+    if not chat_limit_exempt() and not limiter.limiter.hit(CHAT_RATE_LIMIT, 'asgi_chat', client):
+        logger.warning('Rate limit exceeded for /api/chat')
+        reset_at, _ = limiter.limiter.get_window_stats(CHAT_RATE_LIMIT, 'asgi_chat', client)
+        retry_after = str(max(1, math.ceil(reset_at - time.time())))
+        await _send_json(send, 429, {'error': 'Rate limit exceeded: 10 per minute'}, {'Retry-After': retry_after})
+        return
+
+    if 'application/json' not in _header(scope, b'content-type'):
+        await _send_json(send, 415, {'error': 'Invalid request: missing JSON body'})
+        return
+
+    body = await _read_body(receive, flask_app.config['MAX_CONTENT_LENGTH'])
+    if body is None:
+        await _send_json(send, 413, {'error': 'Request body too large'})
+        return
+
+    try:
+        with timing.phase('parse'):
+            data = json.loads(body)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        data = None
+    if not data or not isinstance(data, dict):
+        logger.warning('Invalid request: missing JSON body')
+        await _send_json(send, 400, {'error': 'Invalid request: missing JSON body'})
+        return
+
+    # 服务端对话可能需要从磁盘加载，令牌预留会写 SQLite，均放到线程池执行
+    with timing.phase('validate'):
+        messages, turn, error = await asyncio.to_thread(open_chat_turn, data)
+    if error:
+        await _send_json(send, error[1], error[0])
+        return
+
+    model_id = data['model']
+    unavailable = provider_unavailable(model_id, turn)
+    if unavailable:
+        await _send_json(send, unavailable[1], unavailable[0], unavailable[2])
+        return
+
+    reservation, limited = await asyncio.to_thread(reserve_tokens, client, [model_id], messages, turn)
+    if limited:
+        await _send_json(send, limited[1], limited[0], limited[2])
+        return
+    logger.info(f'Chat request validated: Model={model_id}, Messages={len(messages)}, Trace={timing.trace_id}')
+
+    headers = [(b'content-type', b'text/plain; charset=utf-8')]
+    extra_headers = {**conversation_headers(turn), **timing.headers()}
+    headers += [(name.lower().encode(), value.encode()) for name, value in extra_headers.items()]
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': headers
+    })
+
+    llm = AsyncLLMWrapper(custom_api_keys=data.get('api_keys', {}))
+
+    def finish(reply: str) -> None:
+        # 服务端对话保存已输出的回复（客户端断开时为部分回复）
+        if turn is not None:
+            turn.finish(reply)
+        if reservation is not None:
+            reservation.settle(model_id, reply)
+        slow_request_log.record(timing, model=model_id, chars=len(reply))
+
+    async def stream() -> None:
+        parts: List[str] = []
+        try:
+            async with aclosing(timing.awrap(llm.achat_stream(model_id, messages))) as chunks:
+                async for chunk in chunks:
+                    parts.append(chunk)
+                    await send({
+                        'type': 'http.response.body',
+                        'body': chunk.encode('utf-8'),
+                        'more_body': True
+                    })
+        except Exception as e:
+            logger.error(f'Error during chat stream: {e}')
+            parts.append(f'\n\n[错误: {str(e)}]')
+            await send({
+                'type': 'http.response.body',
+                'body': parts[-1].encode('utf-8'),
+                'more_body': True
+            })
+        finally:
+            # 在线程池中执行（涉及磁盘与 SQLite）；shield 保证客户端断开取消本协程时仍然执行完
+            await asyncio.shield(asyncio.to_thread(finish, ''.join(parts)))
+        if data.get('stats') is True:
+            await send({
+                'type': 'http.response.body',
+                'body': timing.stats_frame().encode('utf-8'),
+                'more_body': True
+            })
+
+    stream_task = asyncio.ensure_future(stream())
+    disconnect_task = asyncio.ensure_future(_wait_for_disconnect(receive))
+    done, _ = await asyncio.wait(
+        {stream_task, disconnect_task},
+        return_when=asyncio.FIRST_COMPLETED
+    )
+
+    if disconnect_task in done:
+        logger.info(f'Client disconnected, cancelling stream for {model_id}')
+        stream_task.cancel()
+        try:
+            await stream_task
+        except asyncio.CancelledError:
+            pass
+        return
+
+    disconnect_task.cancel()
+    stream_task.result()
+    await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+
+async def lifespan(scope: Scope, receive: Receive, send: Send) -> None:
+    """处理 ASGI lifespan 事件：关闭时释放共享连接池"""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await async_clients.aclose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope: Scope, receive: Receive, send: Send) -> None:
+    """ASGI 应用入口"""
+    if scope['type'] == 'lifespan':
+        await lifespan(scope, receive, send)
+    elif scope['type'] == 'http' and scope['path'] == '/api/chat' and scope['method'] == 'POST':
+        await chat(scope, receive, send)
+    else:
+        await wsgi_app(scope, receive, send)
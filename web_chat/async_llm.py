@@ -0,0 +1,388 @@
+"""LLM Wrapper 的 asyncio 版本
+
+为 ASGI 入口（asgi.py）提供原生异步的流式对话接口。每个流只占用一个
+协程而不是一个工作线程，单进程可以同时保持数千个流。
+
+- OpenAI 兼容接口使用 AsyncOpenAI，共享同一个 httpx.AsyncClient 连接池
+- Google Gemini 使用 genai.Client 的 aio 接口
+- Qwen / Spark / 智谱 使用 httpx.AsyncClient 发送流式请求
+
+请求构建、模型注册表和 API 密钥解析与同步版本 LLMWrapper 完全一致。
+"""
+
+import os
+import time
+import asyncio
+import inspect
+import logging
+from collections import OrderedDict
+from contextlib import aclosing
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from openai import AsyncOpenAI
+import google.genai as genai
+
+from llm_wrapper import LLMWrapper, LLMConfig
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from sse_parser import SSEParser, event_delta_content
+from request_timing import record_phase, timed
+from stream_retry import (
+    FirstTokenTimeoutError,
+    StreamRetryPolicy,
+    aretrying_stream,
+    with_assistant_prefix
+)
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+class AsyncClients:
+    """异步 Provider 客户端集合
+
+    所有异步请求共享一个 httpx.AsyncClient（连接池），SDK 客户端按
+    (api_key, base_url) 以 LRU 方式缓存。必须在同一个事件循环中使用。
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 1000,
+        max_keepalive_connections: int = 100,
+        max_sdk_clients: int = 32
+    ) -> None:
+        """初始化异步客户端集合（惰性创建）
+
+        Args:
+            max_connections: httpx 连接池的最大连接数
+            max_keepalive_connections: 保持的最大空闲连接数
+            max_sdk_clients: 缓存的 SDK 客户端数量上限
+        """
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections
+        )
+        self.max_sdk_clients = max_sdk_clients
+        self._http: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._sdk_clients: "OrderedDict[Tuple[str, str, Optional[str]], Any]" = OrderedDict()
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        """共享的 httpx.AsyncClient（事件循环变化时重新创建）"""
+        loop = asyncio.get_running_loop()
+        if self._http is None or self._http.is_closed or self._loop is not loop:
+            self._http = httpx.AsyncClient(limits=self.limits, timeout=None)
+            self._loop = loop
+            self._sdk_clients.clear()
+        return self._http
+
+    def _cached(self, key: Tuple[str, str, Optional[str]], factory: Any) -> Any:
+        """从 LRU 缓存获取 SDK 客户端"""
+        client = self._sdk_clients.get(key)
+        if client is None:
+            client = factory()
+            self._sdk_clients[key] = client
+            while len(self._sdk_clients) > self.max_sdk_clients:
+                # SDK 客户端不持有独立连接池，直接丢弃即可
+                self._sdk_clients.popitem(last=False)
+        else:
+            self._sdk_clients.move_to_end(key)
+        return client
+
+    def openai(self, api_key: str, base_url: Optional[str]) -> AsyncOpenAI:
+        """获取共享连接池的 AsyncOpenAI 客户端"""
+        http = self.http
+        return self._cached(
+            ("openai", api_key, base_url),
+            lambda: AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http)
+        )
+
+    def google(self, api_key: str, base_url: Optional[str] = None) -> Any:
+        """获取 Google GenAI 客户端"""
+        http_options = {"base_url": base_url} if base_url else None
+        return self._cached(
+            ("google", api_key, base_url),
+            lambda: genai.Client(api_key=api_key, http_options=http_options)
+        )
+
+    async def aclose(self) -> None:
+        """关闭共享连接池"""
+        self._sdk_clients.clear()
+        if self._http is not None and not self._http.is_closed:
+            await self._http.aclose()
+        self._http = None
+        self._loop = None
+
+
+def async_clients_settings_from_env() -> Dict[str, Any]:
+    """从环境变量读取异步连接池配置
+
+    Returns:
+        Dict[str, Any]: AsyncClients 的构造参数
+    """
+    return {
+        "max_connections": int(os.environ.get("LLM_ASYNC_MAX_CONNECTIONS", 1000)),
+        "max_keepalive_connections": int(os.environ.get("LLM_ASYNC_MAX_KEEPALIVE", 100))
+    }
+
+
+# 进程级异步客户端集合（ASGI 服务只有一个事件循环）
+async_clients = AsyncClients(**async_clients_settings_from_env())
+
+
+class AsyncLLMWrapper(LLMWrapper):
+    """LLMWrapper 的异步版本
+
+    Example:
+        >>> llm = AsyncLLMWrapper(custom_api_keys={'DEEPSEEK_API_KEY': 'sk-...'})
+        >>> async for chunk in llm.achat_stream('deepseek', messages):
+        ...     print(chunk, end='', flush=True)
+    """
+
+    def __init__(
+        self,
+        custom_api_keys: Optional[Dict[str, str]] = None,
+        config: Optional[LLMConfig] = None,
+        clients: Optional[AsyncClients] = None,
+        retry_policy: Optional[StreamRetryPolicy] = None
+    ) -> None:
+        """初始化异步 LLM 包装器
+
+        Args:
+            custom_api_keys: 前端提供的自定义 API 密钥字典
+            config: LLM 配置对象，如果为 None 则使用默认配置
+            clients: 异步客户端集合，默认使用进程级共享实例
+            retry_policy: 流式重试策略，如果为 None 则使用进程级默认策略
+        """
+        super().__init__(custom_api_keys=custom_api_keys, config=config, retry_policy=retry_policy)
+        self.clients = clients or async_clients
+
+    async def achat_stream(
+        self,
+        model_id: str,
+        messages: List[Dict[str, str]]
+    ) -> AsyncGenerator[str, None]:
+        """统一的异步流式对话接口
+
+        行为与 chat_stream 一致：未知模型和上游错误都以 "Error: ..." 文本返回。
+
+        Args:
+            model_id: 模型 ID
+            messages: 消息列表
+
+        Yields:
+            str: 流式响应的文本片段
+        """
+        logger.info(f"Starting async chat stream for {model_id}")
+        with timed("config"):
+            config = self._resolve_config(model_id)
+        if not config:
+            logger.error(f"Unknown model: {model_id}")
+            yield "Error: Unknown model"
+            return
+
+        adapters = {
+            "google": self._achat_google,
+            "openai": self._achat_openai,
+            "requests_sse": self._achat_qwen,
+            "spark_requests": self._achat_spark,
+            "zhipu": self._achat_zhipu
+        }
+        adapter = adapters.get(config["type"])
+        if adapter is None:
+            logger.error(f"Unimplemented model type: {config['type']}")
+            yield "Error: Unimplemented model type"
+            return
+
+        with timed("config"):
+            config, messages = self._fit_context(config, messages)
+        upstream = self._with_caches(
+            model_id, config, messages,
+            lambda: self.metrics.ainstrument(
+                "upstream", model_id, config["type"], self.breakers.aguard(config, adapter(config, messages))
+            ),
+            asynchronous=True
+        )()
+        upstream = self.metrics.ainstrument("chat", model_id, config["type"], upstream)
+
+        try:
+            # aclosing 保证客户端断开时上游连接被立即关闭
+            async with aclosing(upstream) as stream:
+                async for chunk in stream:
+                    yield chunk
+        except CircuitOpenError as e:
+            yield f"Error: {str(e)}"
+        except Exception as e:
+            logger.exception(f"Error during async chat stream for {model_id}")
+            yield f"Error: {str(e)}"
+
+    async def _aparse_sse_stream(self, response: httpx.Response) -> AsyncGenerator[str, None]:
+        """异步 SSE 流式响应解析器（与同步版本共用字节级增量解析器）
+
+        Args:
+            response: httpx.Response 流式响应对象
+
+        Yields:
+            str: 解析出的文本内容
+        """
+        parser = SSEParser()
+        async for chunk in response.aiter_bytes():
+            for data in parser.feed_data(chunk):
+                texts, done = event_delta_content(data)
+                for text in texts:
+                    yield text
+                if done:
+                    return
+        for event in parser.flush():
+            texts, _ = event_delta_content(event.data)
+            for text in texts:
+                yield text
+
+    async def _astream_sse(
+        self,
+        url: str,
+        headers: Dict[str, str],
+        payload: Dict[str, Any]
+    ) -> AsyncGenerator[str, None]:
+        """通过共享 httpx 连接池发送一次流式请求并解析 SSE（不含重试）
+
+        配置了首字时间预算时，从发出请求到收到首个 token 超过预算会抛出
+        FirstTokenTimeoutError。
+        """
+        timeout = httpx.Timeout(self.config.timeout)
+        first_token_timeout = self.retry_policy.first_token_timeout
+        deadline = asyncio.get_running_loop().time() + first_token_timeout if first_token_timeout else None
+        try:
+            async with asyncio.timeout_at(deadline) as first_token_deadline:
+                connect_started = time.perf_counter()
+                async with self.clients.http.stream(
+                    "POST", url, json=payload, headers=headers, timeout=timeout
+                ) as response:
+                    record_phase("connect", time.perf_counter() - connect_started)
+                    response.raise_for_status()
+                    async with aclosing(self._aparse_sse_stream(response)) as stream:
+                        async for chunk in stream:
+                            # 收到首个 token 后取消预算，之后只受读超时约束
+                            first_token_deadline.reschedule(None)
+                            yield chunk
+        except TimeoutError as e:
+            if first_token_deadline.expired():
+                raise FirstTokenTimeoutError(
+                    f"No token within {first_token_timeout}s from {url}"
+                ) from e
+            raise
+
+    async def _aretrying_sse(
+        self,
+        prepare: Callable[[List[Dict[str, str]]], Tuple[str, Dict[str, str], Dict[str, Any]]],
+        messages: List[Dict[str, str]],
+        resumable: bool,
+        description: str,
+        breaker: Optional[CircuitBreaker] = None
+    ) -> AsyncGenerator[str, None]:
+        """带重试和续写的 SSE 流式请求
+
+        Args:
+            prepare: 接收消息列表、返回 (url, headers, payload) 的请求构建函数
+            messages: 消息列表
+            resumable: 是否支持带 assistant 前缀续写
+            description: 日志中使用的名称
+            breaker: 上游端点的熔断器，打开后不再重试
+        """
+        def open_stream(prefix: str) -> AsyncGenerator[str, None]:
+            return self._astream_sse(*prepare(with_assistant_prefix(messages, prefix)))
+
+        async with aclosing(aretrying_stream(
+            open_stream, self.retry_policy, resumable=resumable, description=description, breaker=breaker
+        )) as stream:
+            async for chunk in stream:
+                yield chunk
+
+    async def _achat_google(
+        self,
+        config: Dict[str, Any],
+        messages: List[Dict[str, str]]
+    ) -> AsyncGenerator[str, None]:
+        """Google Gemini 异步聊天方法"""
+        google_contents = self._to_google_contents(messages)
+        if not google_contents:
+            logger.warning("No valid messages for Google API")
+            return
+
+        with timed("client"):
+            client = self.clients.google(config["api_key"], config.get("base_url"))
+        stream = client.aio.models.generate_content_stream(
+            model=config["model"],
+            contents=google_contents
+        )
+        # 不同版本的 SDK 返回异步迭代器或返回异步迭代器的协程
+        if inspect.isawaitable(stream):
+            stream = await stream
+        async for chunk in stream:
+            if chunk.text:
+                yield chunk.text
+
+    async def _achat_openai(
+        self,
+        config: Dict[str, Any],
+        messages: List[Dict[str, str]]
+    ) -> AsyncGenerator[str, None]:
+        """OpenAI 兼容接口异步聊天方法"""
+        with timed("client"):
+            client = self.clients.openai(config["api_key"], config["base_url"])
+        with timed("connect"):
+            completion = await client.chat.completions.create(
+                model=config["model"],
+                messages=self._inject_system_prompt(config, messages),
+                stream=True,
+                temperature=self.config.temperature,
+                max_tokens=config.get("max_tokens", self.config.max_tokens),
+                timeout=self.config.timeout
+            )
+        try:
+            async for chunk in completion:
+                content = chunk.choices[0].delta.content if chunk.choices else None
+                if content:
+                    yield content
+        finally:
+            await completion.close()
+
+    async def _achat_qwen(
+        self,
+        config: Dict[str, Any],
+        messages: List[Dict[str, str]]
+    ) -> AsyncGenerator[str, None]:
+        """Qwen 异步聊天方法（HTTP + SSE，支持重试与续写）"""
+        async with aclosing(self._aretrying_sse(
+            lambda msgs: self._prepare_qwen_request(config, msgs), messages, True, "qwen", self.breakers.get(config)
+        )) as stream:
+            async for chunk in stream:
+                yield chunk
+
+    async def _achat_spark(
+        self,
+        config: Dict[str, Any],
+        messages: List[Dict[str, str]]
+    ) -> AsyncGenerator[str, None]:
+        """Spark 异步聊天方法（HTTP + SSE，只发送最后一条用户消息，不支持续写）"""
+        request = self._prepare_spark_request(config, messages)
+        if request is None:
+            return
+        async with aclosing(self._aretrying_sse(
+            lambda msgs: request, messages, False, "spark", self.breakers.get(config)
+        )) as stream:
+            async for chunk in stream:
+                yield chunk
+
+    async def _achat_zhipu(
+        self,
+        config: Dict[str, Any],
+        messages: List[Dict[str, str]]
+    ) -> AsyncGenerator[str, None]:
+        """智谱 AI 异步聊天方法（JWT Token 认证，支持重试与续写）"""
+        async with aclosing(self._aretrying_sse(
+            lambda msgs: self._prepare_zhipu_request(config, msgs), messages, True, "zhipu", self.breakers.get(config)
+        )) as stream:
+            async for chunk in stream:
+                yield chunk
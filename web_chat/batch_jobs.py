@@ -0,0 +1,485 @@
+"""批量任务队列
+
+评测集、批量改写等场景需要把成千上万条提示词交给已配置的模型处理，逐条调用
+限流的 /api/chat 并不现实。本模块提供离线批量处理：
+
+- 以 JSONL 提交任务，每行一条 {"custom_id", "model", "messages"}（或 "prompt"）
+- 任务与每条提示词的状态保存在本地 SQLite 队列中；每条结果完成后立即写入，
+  服务重启后把中断的条目重新放回队列，从断点继续
+- 工作线程池按模型限制并发数，复用 LLMWrapper 的适配器（以及缓存、对冲等能力）
+- 可以查询任务进度与吞吐量（条/分钟），结果以流式 JSONL 下载
+
+Example:
+    >>> queue = BatchQueue(db_path, workers=4, model_concurrency=2)
+    >>> queue.bind(lambda: LLMWrapper(custom_api_keys=keys))
+    >>> job_id = queue.submit(parse_jsonl(text, default_model='deepseek'))
+    >>> queue.job(job_id)['prompts_per_min']
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Generator, List, Optional, Tuple
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 默认的队列数据库路径
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(__file__), "batch_jobs.db")
+
+# 吞吐量统计的时间窗口（秒）
+THROUGHPUT_WINDOW = 60.0
+
+
+def batch_settings_from_env() -> Dict[str, Any]:
+    """从环境变量读取批量任务配置
+
+    Returns:
+        Dict[str, Any]: BatchQueue 的构造参数
+    """
+    limits = os.environ.get("LLM_BATCH_MODEL_LIMITS", "")
+    model_limits = {}
+    for entry in limits.split(","):
+        model_id, _, limit = entry.partition("=")
+        if model_id.strip() and limit.strip():
+            model_limits[model_id.strip()] = int(limit)
+    return {
+        "db_path": os.environ.get("LLM_BATCH_DB") or DEFAULT_DB_PATH,
+        "workers": int(os.environ.get("LLM_BATCH_WORKERS", 4)),
+        "model_concurrency": int(os.environ.get("LLM_BATCH_MODEL_CONCURRENCY", 2)),
+        "model_limits": model_limits,
+        "max_attempts": int(os.environ.get("LLM_BATCH_MAX_ATTEMPTS", 3)),
+        "max_items": int(os.environ.get("LLM_BATCH_MAX_ITEMS", 10000))
+    }
+
+
+@dataclass(frozen=True)
+class BatchItem:
+    """批量任务中的一条提示词
+
+    Attributes:
+        custom_id: 调用方指定的 ID（原样出现在结果中）
+        model: 模型 ID
+        messages: 消息列表
+    """
+    custom_id: str
+    model: str
+    messages: List[Dict[str, str]]
+
+
+def parse_jsonl(text: str, default_model: Optional[str] = None) -> List[BatchItem]:
+    """解析 JSONL 格式的批量任务
+
+    每行一个 JSON 对象：messages 为完整消息列表，或用 prompt 表示单条用户消息；
+    没有 model 时使用 default_model；没有 custom_id 时使用行号。空行会被忽略。
+
+    Args:
+        text: JSONL 文本
+        default_model: 默认模型 ID
+
+    Returns:
+        List[BatchItem]: 提示词列表（只检查结构，消息内容由调用方校验）
+
+    Raises:
+        ValueError: 某一行格式错误（错误信息包含行号）
+    """
+    items = []
+    for line_no, line in enumerate(text.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Line {line_no}: invalid JSON ({e.msg})")
+        if not isinstance(record, dict):
+            raise ValueError(f"Line {line_no}: must be a JSON object")
+
+        messages = record.get("messages")
+        if messages is None and isinstance(record.get("prompt"), str):
+            messages = [{"role": "user", "content": record["prompt"]}]
+        if not isinstance(messages, list):
+            raise ValueError(f"Line {line_no}: missing messages or prompt")
+
+        model = record.get("model", default_model)
+        if not isinstance(model, str) or not model:
+            raise ValueError(f"Line {line_no}: missing model")
+
+        custom_id = record.get("custom_id", str(line_no))
+        items.append(BatchItem(str(custom_id), model, messages))
+    return items
+
+
+class _QueueStore:
+    """SQLite 队列（单连接，调用方负责加锁）"""
+
+    def __init__(self, path: str) -> None:
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " name TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " total INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " started_at REAL,"
+            " finished_at REAL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            " job_id TEXT NOT NULL,"
+            " idx INTEGER NOT NULL,"
+            " custom_id TEXT NOT NULL,"
+            " model TEXT NOT NULL,"
+            " messages TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " output TEXT,"
+            " error TEXT,"
+            " elapsed REAL,"
+            " PRIMARY KEY (job_id, idx))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS items_status ON items (status, model)")
+
+    def execute(self, sql: str, args: Tuple = ()) -> sqlite3.Cursor:
+        return self._conn.execute(sql, args)
+
+    def insert_job(self, job_id: str, name: str, items: List[BatchItem], now: float) -> None:
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "INSERT INTO jobs (id, name, status, total, created_at) VALUES (?, ?, 'queued', ?, ?)",
+                (job_id, name, len(items), now)
+            )
+            self._conn.executemany(
+                "INSERT INTO items (job_id, idx, custom_id, model, messages, status) VALUES (?, ?, ?, ?, ?, 'pending')",
+                [
+                    (job_id, idx, item.custom_id, item.model, json.dumps(item.messages, ensure_ascii=False))
+                    for idx, item in enumerate(items)
+                ]
+            )
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class BatchQueue:
+    """批量任务队列与工作线程池（线程安全，进程内共享）"""
+
+    def __init__(
+        self,
+        db_path: str = DEFAULT_DB_PATH,
+        workers: int = 4,
+        model_concurrency: int = 2,
+        model_limits: Optional[Dict[str, int]] = None,
+        max_attempts: int = 3,
+        max_items: int = 10000,
+        poll_interval: float = 1.0
+    ) -> None:
+        """初始化队列
+
+        Args:
+            db_path: SQLite 数据库路径
+            workers: 工作线程数
+            model_concurrency: 每个模型的默认并发上限
+            model_limits: 按模型覆盖的并发上限
+            max_attempts: 每条提示词的最大尝试次数
+            max_items: 单个任务的最大条目数
+            poll_interval: 没有可执行条目时的等待间隔（秒）
+        """
+        self.db_path = db_path
+        self.workers = workers
+        self.model_concurrency = model_concurrency
+        self.model_limits = dict(model_limits or {})
+        self.max_attempts = max_attempts
+        self.max_items = max_items
+        self.poll_interval = poll_interval
+        self._store: Optional[_QueueStore] = None
+        self._factory: Optional[Callable[[], Any]] = None
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+        self._in_flight: Dict[str, int] = {}
+        self._completions: Deque[float] = deque()
+        self._counters = {"completed": 0, "failed": 0, "retried": 0}
+
+    def bind(self, factory: Callable[[], Any]) -> None:
+        """设置创建 LLMWrapper 的函数（每条提示词调用一次，以获取最新的 API 密钥）
+
+        Args:
+            factory: 返回带 iter_chat() 方法的对象
+        """
+        self._factory = factory
+
+    def _db(self) -> _QueueStore:
+        """延迟打开数据库（调用方持有锁）"""
+        if self._store is None:
+            self._store = _QueueStore(self.db_path)
+        return self._store
+
+    def limit_for(self, model_id: str) -> int:
+        """获取模型的并发上限"""
+        return self.model_limits.get(model_id, self.model_concurrency)
+
+    def start(self) -> None:
+        """恢复中断的条目并启动工作线程（重复调用无效）"""
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping = False
+            recovered = self._db().execute("UPDATE items SET status = 'pending' WHERE status = 'running'").rowcount
+            if recovered:
+                logger.info(f"Resuming {recovered} interrupted batch items")
+            self._threads = [
+                threading.Thread(target=self._work, name=f"batch-worker-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """停止工作线程（正在处理的条目完成后退出）并关闭数据库"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        with self._lock:
+            self._threads = []
+            if self._store is not None:
+                self._store.close()
+                self._store = None
+
+    def submit(self, items: List[BatchItem], name: str = "") -> str:
+        """提交任务
+
+        Args:
+            items: 提示词列表
+            name: 任务名称（可选）
+
+        Returns:
+            str: 任务 ID
+
+        Raises:
+            ValueError: 任务为空或超过 max_items
+        """
+        if not items:
+            raise ValueError("Batch job is empty")
+        if len(items) > self.max_items:
+            raise ValueError(f"Too many items (max {self.max_items})")
+
+        job_id = uuid.uuid4().hex
+        with self._cond:
+            self._db().insert_job(job_id, name, items, time.time())
+            self._cond.notify_all()
+        logger.info(f"Batch job {job_id} submitted with {len(items)} items")
+        self.start()
+        return job_id
+
+    def cancel(self, job_id: str) -> bool:
+        """取消任务（未开始的条目不再处理，正在处理的条目完成后保留结果）
+
+        Returns:
+            bool: 任务存在且尚未结束时返回 True
+        """
+        with self._lock:
+            db = self._db()
+            updated = db.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status IN ('queued', 'running')",
+                (time.time(), job_id)
+            ).rowcount
+            if updated:
+                db.execute("UPDATE items SET status = 'cancelled' WHERE job_id = ? AND status = 'pending'", (job_id,))
+        return bool(updated)
+
+    def _claim(self) -> Optional[Tuple[str, int, str, str, int]]:
+        """领取一条可执行的条目（调用方持有锁）：跳过已达并发上限的模型"""
+        saturated = [m for m, n in self._in_flight.items() if n >= self.limit_for(m)]
+        sql = (
+            "SELECT i.job_id, i.idx, i.model, i.messages, i.attempts FROM items i"
+            " JOIN jobs j ON j.id = i.job_id"
+            " WHERE i.status = 'pending' AND j.status IN ('queued', 'running')"
+        )
+        if saturated:
+            sql += f" AND i.model NOT IN ({', '.join('?' * len(saturated))})"
+        sql += " ORDER BY j.created_at, i.idx LIMIT 1"
+
+        db = self._db()
+        row = db.execute(sql, tuple(saturated)).fetchone()
+        if row is None:
+            return None
+        job_id, idx, model = row[0], row[1], row[2]
+        db.execute("UPDATE items SET status = 'running' WHERE job_id = ? AND idx = ?", (job_id, idx))
+        db.execute(
+            "UPDATE jobs SET status = 'running', started_at = COALESCE(started_at, ?) WHERE id = ? AND status = 'queued'",
+            (time.time(), job_id)
+        )
+        self._in_flight[model] = self._in_flight.get(model, 0) + 1
+        return row
+
+    def _work(self) -> None:
+        """工作线程主循环"""
+        while True:
+            with self._cond:
+                if self._stopping:
+                    return
+                claimed = self._claim()
+                if claimed is None:
+                    self._cond.wait(self.poll_interval)
+                    continue
+            self._process(*claimed)
+
+    def _process(self, job_id: str, idx: int, model: str, messages: str, attempts: int) -> None:
+        """处理一条提示词并写入结果（检查点）"""
+        started = time.monotonic()
+        output: Optional[str] = None
+        error: Optional[str] = None
+        try:
+            if self._factory is None:
+                raise RuntimeError("Batch queue is not bound to an LLM wrapper")
+            output = "".join(self._factory().iter_chat(model, json.loads(messages)))
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            logger.warning(f"Batch item {job_id}/{idx} failed (attempt {attempts + 1}): {error}")
+        elapsed = time.monotonic() - started
+
+        with self._cond:
+            db = self._db()
+            if error is None:
+                db.execute(
+                    "UPDATE items SET status = 'done', attempts = ?, output = ?, error = NULL, elapsed = ?"
+                    " WHERE job_id = ? AND idx = ?",
+                    (attempts + 1, output, elapsed, job_id, idx)
+                )
+                self._counters["completed"] += 1
+                self._completions.append(time.monotonic())
+            else:
+                retry = attempts + 1 < self.max_attempts
+                db.execute(
+                    "UPDATE items SET status = ?, attempts = ?, error = ?, elapsed = ? WHERE job_id = ? AND idx = ?",
+                    ("pending" if retry else "error", attempts + 1, error, elapsed, job_id, idx)
+                )
+                self._counters["retried" if retry else "failed"] += 1
+            self._finish_job_if_done(job_id)
+            self._in_flight[model] -= 1
+            self._cond.notify_all()
+
+    def _finish_job_if_done(self, job_id: str) -> None:
+        """没有待处理条目时把任务标记为完成（调用方持有锁）"""
+        db = self._db()
+        remaining = db.execute(
+            "SELECT COUNT(*) FROM items WHERE job_id = ? AND status IN ('pending', 'running')", (job_id,)
+        ).fetchone()[0]
+        if not remaining:
+            db.execute(
+                "UPDATE jobs SET status = 'completed', finished_at = ? WHERE id = ? AND status = 'running'",
+                (time.time(), job_id)
+            )
+            logger.info(f"Batch job {job_id} completed")
+
+    def _job_dict(self, row: Tuple) -> Dict[str, Any]:
+        """组装任务进度（调用方持有锁）"""
+        job_id, name, status, total, created_at, started_at, finished_at = row
+        counts = dict(self._db().execute(
+            "SELECT status, COUNT(*) FROM items WHERE job_id = ? GROUP BY status", (job_id,)
+        ).fetchall())
+        processed = counts.get("done", 0) + counts.get("error", 0)
+        elapsed = ((finished_at or time.time()) - started_at) if started_at else 0.0
+        rate = processed / elapsed * 60 if elapsed > 0 else 0.0
+        remaining = counts.get("pending", 0) + counts.get("running", 0)
+        return {
+            "id": job_id,
+            "name": name,
+            "status": status,
+            "total": total,
+            "pending": counts.get("pending", 0),
+            "running": counts.get("running", 0),
+            "done": counts.get("done", 0),
+            "error": counts.get("error", 0),
+            "cancelled": counts.get("cancelled", 0),
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at,
+            "prompts_per_min": round(rate, 1),
+            "eta_seconds": round(remaining / rate * 60) if rate > 0 and remaining else None
+        }
+
+    def job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """获取任务进度
+
+        Returns:
+            Optional[Dict[str, Any]]: 各状态的条目数、吞吐量（条/分钟）与预计剩余时间；
+                任务不存在时返回 None
+        """
+        with self._lock:
+            row = self._db().execute(
+                "SELECT id, name, status, total, created_at, started_at, finished_at FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            return self._job_dict(row) if row else None
+
+    def jobs(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """列出最近的任务"""
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT id, name, status, total, created_at, started_at, finished_at FROM jobs"
+                " ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+            return [self._job_dict(row) for row in rows]
+
+    def iter_results(self, job_id: str, page_size: int = 500) -> Generator[str, None, None]:
+        """按条目顺序逐行输出结果（JSONL），分页读取，不把整个任务载入内存
+
+        Args:
+            job_id: 任务 ID
+            page_size: 每次从数据库读取的行数
+
+        Yields:
+            str: 一行 JSON（以换行结尾）
+        """
+        last = -1
+        while True:
+            with self._lock:
+                rows = self._db().execute(
+                    "SELECT idx, custom_id, model, status, output, error FROM items"
+                    " WHERE job_id = ? AND idx > ? ORDER BY idx LIMIT ?",
+                    (job_id, last, page_size)
+                ).fetchall()
+            if not rows:
+                return
+            for _, custom_id, model, status, output, error in rows:
+                yield json.dumps({
+                    "custom_id": custom_id,
+                    "model": model,
+                    "status": status,
+                    "output": output,
+                    "error": error
+                }, ensure_ascii=False) + "\n"
+            last = rows[-1][0]
+
+    def stats(self) -> Dict[str, Any]:
+        """获取队列统计
+
+        Returns:
+            Dict[str, Any]: 最近一分钟的吞吐量（条/分钟）、各模型正在处理的条目数、
+                待处理条目数，以及完成、失败、重试次数
+        """
+        with self._lock:
+            now = time.monotonic()
+            while self._completions and self._completions[0] < now - THROUGHPUT_WINDOW:
+                self._completions.popleft()
+            pending = self._db().execute("SELECT COUNT(*) FROM items WHERE status = 'pending'").fetchone()[0]
+            return {
+                **self._counters,
+                "workers": len(self._threads),
+                "pending": pending,
+                "in_flight": {m: n for m, n in self._in_flight.items() if n},
+                "prompts_per_min": len(self._completions) * 60 / THROUGHPUT_WINDOW
+            }
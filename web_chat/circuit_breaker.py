@@ -0,0 +1,550 @@
+"""按上游端点熔断与全局重试预算
+
+DeepSeek、SiliconFlow 等上游降级时，以前每个 /api/chat 仍然要等满请求超时和
+tenacity 的退避重试（最多 3 次，每次等待 1–10 秒），占住工作线程，并且所有
+请求一起重试，形成重试风暴。本模块：
+
+- 每个上游端点（API 类型 + 主机）一个熔断器，状态为 closed / open / half_open：
+  最近 window 次调用中失败（连接失败、超时、408/429/5xx）和慢调用（首字时间
+  超过阈值）的比例达到 failure_rate 时打开；打开 open_seconds 秒后进入半开状态，
+  放行少量探测请求，成功则关闭，失败则重新打开
+- 上游返回 429 并带有 Retry-After 时，只暂停该 API 密钥到该时间（Retry-After
+  通常是单个密钥的配额，/api/chat 允许用户使用自己的密钥，不能影响同一主机的
+  其他用户）
+- 熔断器打开时请求立即失败（CircuitOpenError），不再等待超时
+- 全局重试预算：一个时间窗口内的重试次数不超过请求数的 ratio（另有最少可重试
+  次数，避免低流量时完全不能重试），预算用完时不再重试
+
+stream_retry 在每次重试前检查熔断器和重试预算，并按 Retry-After 等待。
+
+Example:
+    >>> breaker = circuit_breakers.get(config)
+    >>> for chunk in circuit_breakers.guard(config, adapter(config, messages)):
+    ...     print(chunk, end='')
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, AsyncGenerator, Deque, Dict, Generator, Iterator, Optional
+from urllib.parse import urlsplit
+
+import httpx
+import openai
+import requests
+import urllib3
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 熔断器状态
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# 计为上游故障的 HTTP 状态码（5xx 之外）
+FAILURE_STATUS_CODES = frozenset({408, 429})
+
+# Google 模型未配置 base_url 时的默认端点
+GOOGLE_DEFAULT_HOST = "generativelanguage.googleapis.com"
+
+
+@dataclass(frozen=True)
+class CircuitBreakerPolicy:
+    """熔断策略
+
+    Attributes:
+        enabled: 是否启用熔断
+        window: 统计最近多少次调用
+        min_calls: 窗口内至少有多少次调用才判断是否打开
+        failure_rate: 失败（含慢调用）比例达到该值时打开
+        slow_call_seconds: 首字时间超过该值计为慢调用，0 表示不统计
+        open_seconds: 打开后多久进入半开状态（秒）
+        half_open_calls: 半开状态同时放行的探测请求数
+        max_retry_after: 按上游 Retry-After 打开时的最长时间（秒）
+    """
+    enabled: bool = True
+    window: int = 20
+    min_calls: int = 10
+    failure_rate: float = 0.5
+    slow_call_seconds: float = 30.0
+    open_seconds: float = 30.0
+    half_open_calls: int = 1
+    max_retry_after: float = 300.0
+
+
+def circuit_breaker_settings_from_env() -> Dict[str, Any]:
+    """从环境变量读取熔断配置
+
+    Returns:
+        Dict[str, Any]: CircuitBreakerPolicy 的构造参数
+    """
+    return {
+        "enabled": os.environ.get("LLM_CIRCUIT_BREAKER_ENABLED", "true").lower() == "true",
+        "window": int(os.environ.get("LLM_CIRCUIT_WINDOW", 20)),
+        "min_calls": int(os.environ.get("LLM_CIRCUIT_MIN_CALLS", 10)),
+        "failure_rate": float(os.environ.get("LLM_CIRCUIT_FAILURE_RATE", 0.5)),
+        "slow_call_seconds": float(os.environ.get("LLM_CIRCUIT_SLOW_CALL_SECONDS", 30)),
+        "open_seconds": float(os.environ.get("LLM_CIRCUIT_OPEN_SECONDS", 30)),
+        "half_open_calls": int(os.environ.get("LLM_CIRCUIT_HALF_OPEN_CALLS", 1)),
+        "max_retry_after": float(os.environ.get("LLM_CIRCUIT_MAX_RETRY_AFTER", 300))
+    }
+
+
+def retry_budget_settings_from_env() -> Dict[str, Any]:
+    """从环境变量读取重试预算配置
+
+    Returns:
+        Dict[str, Any]: RetryBudget 的构造参数
+    """
+    return {
+        "ratio": float(os.environ.get("LLM_RETRY_BUDGET_RATIO", 0.2)),
+        "min_retries": int(os.environ.get("LLM_RETRY_BUDGET_MIN_RETRIES", 10)),
+        "window_seconds": float(os.environ.get("LLM_RETRY_BUDGET_WINDOW", 10))
+    }
+
+
+class CircuitOpenError(Exception):
+    """上游端点的熔断器处于打开状态，请求未发出
+
+    Attributes:
+        endpoint: 端点（API 类型:主机）
+        retry_after: 多少秒后熔断器进入半开状态
+        error_type: 前端用于区分错误类型的标识
+    """
+
+    error_type = "provider_unavailable"
+
+    def __init__(self, endpoint: str, retry_after: float) -> None:
+        self.endpoint = endpoint
+        self.retry_after = max(0.0, retry_after)
+        super().__init__(
+            f"Provider {endpoint} is temporarily unavailable (circuit open), "
+            f"retry after {self.retry_after_header}s"
+        )
+
+    @property
+    def retry_after_header(self) -> int:
+        """Retry-After 响应头的值（向上取整的秒数，至少 1）"""
+        return max(1, int(-(-self.retry_after // 1)))
+
+
+def endpoint_key(config: Dict[str, Any]) -> str:
+    """上游端点标识：API 类型 + 主机（同一主机上的模型共用一个熔断器）"""
+    url = config.get("base_url") or config.get("url") or ""
+    host = urlsplit(url).netloc if url else ""
+    if not host and config.get("type") == "google":
+        host = GOOGLE_DEFAULT_HOST
+    return f"{config.get('type', 'unknown')}:{host}"
+
+
+def api_key_digest(config: Dict[str, Any]) -> str:
+    """模型配置中 API 密钥的摘要（按密钥区分 Retry-After，不保存密钥本身）"""
+    return hashlib.sha256(config.get("api_key", "").encode("utf-8")).hexdigest()[:16]
+
+
+def status_code(error: BaseException) -> Optional[int]:
+    """异常对应的 HTTP 状态码（不是 HTTP 错误时为 None）"""
+    if isinstance(error, (requests.exceptions.HTTPError, httpx.HTTPStatusError)):
+        response = error.response
+        return response.status_code if response is not None else None
+    for attr in ("status_code", "code"):  # openai.APIStatusError / google.genai.errors.APIError
+        value = getattr(error, attr, None)
+        if isinstance(value, int) and 100 <= value < 600:
+            return value
+    return None
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """429 / 503 响应的 Retry-After（秒数或 HTTP 日期），没有时为 None"""
+    if status_code(error) not in (429, 503):
+        return None
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    value = headers.get("Retry-After") if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_failure(error: BaseException) -> bool:
+    """判断异常是否说明上游端点出了故障
+
+    连接失败、超时、408/429/5xx 计为故障；400/401 等客户端错误说明上游正常
+    响应，不计为故障。
+    """
+    code = status_code(error)
+    if code is not None:
+        return code in FAILURE_STATUS_CODES or code >= 500
+    return isinstance(error, (
+        OSError,  # 包括 requests 的连接失败与超时、TimeoutError（含首字超时）
+        urllib3.exceptions.HTTPError,
+        httpx.TransportError,
+        openai.APIConnectionError
+    ))
+
+
+class CircuitBreaker:
+    """一个上游端点的熔断器（线程安全）"""
+
+    def __init__(self, endpoint: str, policy: CircuitBreakerPolicy) -> None:
+        self.endpoint = endpoint
+        self.policy = policy
+        self.state = CLOSED
+        self._outcomes: Deque[bool] = deque(maxlen=policy.window)  # True 表示失败或慢调用
+        self._open_until = 0.0
+        self._probes = 0
+        # 按上游 Retry-After 暂停的 API 密钥：密钥摘要 -> 恢复时间
+        self._blocked_keys: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._counters = {
+            "successes": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "opened": 0, "keys_blocked": 0
+        }
+
+    def _open(self, seconds: float, reason: str) -> None:
+        """打开熔断器（调用方持有锁）"""
+        if self.state != OPEN:
+            self._counters["opened"] += 1
+            logger.warning(f"Circuit for {self.endpoint} opened for {seconds:.0f}s: {reason}")
+        self.state = OPEN
+        self._open_until = max(self._open_until, time.monotonic() + seconds)
+        self._probes = 0
+        self._outcomes.clear()
+
+    def _key_blocked(self, key: Optional[str]) -> float:
+        """API 密钥被 Retry-After 暂停的剩余秒数，未暂停时为 0（调用方持有锁）"""
+        if key is None or key not in self._blocked_keys:
+            return 0.0
+        remaining = self._blocked_keys[key] - time.monotonic()
+        if remaining <= 0:
+            del self._blocked_keys[key]
+            return 0.0
+        return remaining
+
+    def _block_key(self, key: str, seconds: float, reason: str) -> None:
+        """暂停一个 API 密钥（调用方持有锁）"""
+        now = time.monotonic()
+        for expired in [k for k, until in self._blocked_keys.items() if until <= now]:
+            del self._blocked_keys[expired]
+        self._blocked_keys[key] = max(self._blocked_keys.get(key, 0.0), now + seconds)
+        self._counters["keys_blocked"] += 1
+        logger.warning(f"API key {key[:8]} on {self.endpoint} paused for {seconds:.0f}s: {reason}")
+
+    def retry_after(self, key: Optional[str] = None) -> Optional[float]:
+        """熔断器打开（或该 API 密钥被暂停）时距离恢复的秒数，否则为 None
+
+        Args:
+            key: API 密钥摘要（见 api_key_digest）
+        """
+        with self._lock:
+            remaining = self._key_blocked(key)
+            if self.state == OPEN:
+                remaining = max(remaining, self._open_until - time.monotonic())
+            return remaining if remaining > 0 else None
+
+    def before_call(self, key: Optional[str] = None) -> None:
+        """请求发出之前调用
+
+        Args:
+            key: API 密钥摘要（见 api_key_digest）
+
+        Raises:
+            CircuitOpenError: 熔断器打开、该 API 密钥被暂停，或半开状态的探测名额已用完
+        """
+        with self._lock:
+            blocked = self._key_blocked(key)
+            if blocked > 0:
+                self._counters["rejected"] += 1
+                raise CircuitOpenError(self.endpoint, blocked)
+            if self.state == OPEN:
+                remaining = self._open_until - time.monotonic()
+                if remaining > 0:
+                    self._counters["rejected"] += 1
+                    raise CircuitOpenError(self.endpoint, remaining)
+                self.state = HALF_OPEN
+                self._probes = 0
+                logger.info(f"Circuit for {self.endpoint} half-open, probing")
+            if self.state == HALF_OPEN:
+                if self._probes >= self.policy.half_open_calls:
+                    self._counters["rejected"] += 1
+                    raise CircuitOpenError(self.endpoint, 1.0)
+                self._probes += 1
+
+    def allows_retry(self) -> bool:
+        """只有关闭状态才允许重试（半开状态只放行探测请求本身）"""
+        with self._lock:
+            return self.state == CLOSED
+
+    def record_success(self, latency: Optional[float] = None) -> None:
+        """记录一次成功（latency 为首字时间，超过阈值计为慢调用）"""
+        slow = bool(self.policy.slow_call_seconds and latency is not None and latency > self.policy.slow_call_seconds)
+        with self._lock:
+            self._counters["slow_calls" if slow else "successes"] += 1
+            if self.state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                if slow:
+                    self._open(self.policy.open_seconds, f"slow probe ({latency:.1f}s)")
+                else:
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                    logger.info(f"Circuit for {self.endpoint} closed")
+                return
+            self._record(slow)
+
+    def record_failure(self, error: BaseException, key: Optional[str] = None) -> None:
+        """记录一次失败；上游 429 带 Retry-After 时直接暂停到该时间
+
+        Args:
+            error: 异常
+            key: API 密钥摘要；给出时 Retry-After 只暂停该密钥，不计入端点的失败比例
+        """
+        retry_after = retry_after_seconds(error)
+        with self._lock:
+            self._counters["failures"] += 1
+            if retry_after is not None and retry_after > 0:
+                seconds = min(retry_after, self.policy.max_retry_after)
+                reason = f"upstream Retry-After {retry_after:.0f}s"
+                if key is not None:
+                    self._block_key(key, seconds, reason)
+                    if self.state == HALF_OPEN:
+                        self._probes = max(0, self._probes - 1)
+                else:
+                    self._open(seconds, reason)
+                return
+            if self.state == HALF_OPEN:
+                self._open(self.policy.open_seconds, f"probe failed: {error!r}")
+                return
+            self._record(True)
+
+    def release(self) -> None:
+        """调用没有结果（客户端取消、本地错误）时归还半开状态的探测名额"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+
+    def trip(self, seconds: float, reason: str = "tripped") -> None:
+        """立即打开熔断器 seconds 秒"""
+        with self._lock:
+            self._open(min(seconds, self.policy.max_retry_after), reason)
+
+    def _record(self, failed: bool) -> None:
+        """关闭状态下记录结果并判断是否打开（调用方持有锁）"""
+        self._outcomes.append(failed)
+        calls = len(self._outcomes)
+        if calls >= self.policy.min_calls:
+            rate = sum(self._outcomes) / calls
+            if rate >= self.policy.failure_rate:
+                self._open(self.policy.open_seconds, f"failure rate {rate:.0%} over {calls} calls")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前状态、窗口内的失败比例与计数"""
+        with self._lock:
+            calls = len(self._outcomes)
+            now = time.monotonic()
+            remaining = self._open_until - now if self.state == OPEN else 0.0
+            return {
+                "state": self.state,
+                "blocked_keys": sum(until > now for until in self._blocked_keys.values()),
+                "calls": calls,
+                "failure_rate": round(sum(self._outcomes) / calls, 3) if calls else 0.0,
+                "retry_after": round(max(0.0, remaining), 1),
+                **self._counters
+            }
+
+
+class CircuitBreakerRegistry:
+    """各上游端点的熔断器（线程安全，进程内共享）"""
+
+    def __init__(self, policy: Optional[CircuitBreakerPolicy] = None) -> None:
+        """初始化熔断器集合
+
+        Args:
+            policy: 熔断策略，默认启用
+        """
+        self.policy = policy or CircuitBreakerPolicy()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, config: Dict[str, Any]) -> Optional[CircuitBreaker]:
+        """模型配置对应端点的熔断器，未启用时为 None"""
+        if not self.policy.enabled:
+            return None
+        key = endpoint_key(config)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(key, CircuitBreaker(key, self.policy))
+        return breaker
+
+    def check(self, config: Dict[str, Any]) -> Optional[CircuitOpenError]:
+        """熔断器打开（或配置的 API 密钥被暂停）时返回对应的错误（不占用半开探测名额），否则为 None"""
+        breaker = self.get(config)
+        retry_after = breaker.retry_after(api_key_digest(config)) if breaker is not None else None
+        return CircuitOpenError(breaker.endpoint, retry_after) if retry_after is not None else None
+
+    def guard(self, config: Dict[str, Any], stream: Iterator[str]) -> Generator[str, None, None]:
+        """在熔断器保护下读取上游流
+
+        第一次读取时检查熔断器（打开时抛出 CircuitOpenError，不发出请求）；
+        收到首个片段时记录成功和首字时间，首个片段之前出错时记录失败。
+        """
+        breaker = self.get(config)
+        if breaker is None:
+            yield from stream
+            return
+        key = api_key_digest(config)
+        breaker.before_call(key)
+        started = time.monotonic()
+        pending = True
+        try:
+            for chunk in stream:
+                if pending:
+                    pending = False
+                    breaker.record_success(time.monotonic() - started)
+                yield chunk
+            if pending:
+                pending = False
+                breaker.record_success(time.monotonic() - started)
+        except Exception as e:
+            if pending:
+                pending = False
+                self._record_error(breaker, e, key)
+            raise
+        finally:
+            if pending:
+                breaker.release()
+
+    async def aguard(self, config: Dict[str, Any], stream: AsyncIterator[str]) -> AsyncGenerator[str, None]:
+        """guard 的异步版本"""
+        breaker = self.get(config)
+        if breaker is None:
+            async for chunk in stream:
+                yield chunk
+            return
+        key = api_key_digest(config)
+        breaker.before_call(key)
+        started = time.monotonic()
+        pending = True
+        try:
+            async for chunk in stream:
+                if pending:
+                    pending = False
+                    breaker.record_success(time.monotonic() - started)
+                yield chunk
+            if pending:
+                pending = False
+                breaker.record_success(time.monotonic() - started)
+        except Exception as e:
+            if pending:
+                pending = False
+                self._record_error(breaker, e, key)
+            raise
+        finally:
+            if pending:
+                breaker.release()
+
+    @staticmethod
+    def _record_error(breaker: CircuitBreaker, error: BaseException, key: str) -> None:
+        if is_failure(error):
+            breaker.record_failure(error, key)
+        elif status_code(error) is not None:
+            breaker.record_success()  # 上游正常响应了客户端错误
+        else:
+            breaker.release()
+
+    def clear(self) -> None:
+        """丢弃所有熔断器（全部回到关闭状态）"""
+        with self._lock:
+            self._breakers.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """各端点熔断器的状态"""
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.endpoint: breaker.snapshot() for breaker in breakers}
+
+
+class RetryBudget:
+    """全局重试预算（线程安全）
+
+    window_seconds 内的重试次数不超过 max(min_retries, ratio × 请求数)。
+    """
+
+    def __init__(self, ratio: float = 0.2, min_retries: int = 10, window_seconds: float = 10.0) -> None:
+        """初始化重试预算
+
+        Args:
+            ratio: 允许重试的比例（0.2 表示重试最多为请求数的 20%），小于 0 表示不限制
+            min_retries: 窗口内至少允许的重试次数
+            window_seconds: 统计窗口（秒）
+        """
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window_seconds = window_seconds
+        self._requests: Deque[float] = deque()
+        self._retries: Deque[float] = deque()
+        self._lock = threading.Lock()
+        self.exhausted = 0
+
+    def _trim(self, now: float) -> None:
+        cutoff = now - self.window_seconds
+        for events in (self._requests, self._retries):
+            while events and events[0] < cutoff:
+                events.popleft()
+
+    def record_request(self) -> None:
+        """记录一次请求（不含重试）"""
+        if self.ratio < 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            self._requests.append(now)
+
+    def try_retry(self) -> bool:
+        """申请一次重试，预算用完时返回 False"""
+        if self.ratio < 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            if len(self._retries) >= max(self.min_retries, self.ratio * len(self._requests)):
+                self.exhausted += 1
+                return False
+            self._retries.append(now)
+            return True
+
+    def clear(self) -> None:
+        """清空窗口内的记录"""
+        with self._lock:
+            self._requests.clear()
+            self._retries.clear()
+            self.exhausted = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """窗口内的请求数与重试数，以及因预算用完而放弃的重试次数"""
+        with self._lock:
+            self._trim(time.monotonic())
+            return {
+                "ratio": self.ratio,
+                "window_seconds": self.window_seconds,
+                "requests": len(self._requests),
+                "retries": len(self._retries),
+                "exhausted": self.exhausted
+            }
+
+
+# 进程级熔断器与重试预算，所有请求共享
+circuit_breakers = CircuitBreakerRegistry(CircuitBreakerPolicy(**circuit_breaker_settings_from_env()))
+retry_budget = RetryBudget(**retry_budget_settings_from_env())
@@ -0,0 +1,291 @@
+"""Provider 客户端连接池
+
+为 OpenAI 兼容接口和 Google GenAI 提供进程级的客户端复用，避免每轮对话
+都重新创建 SDK 客户端（以及其内部的 httpx 连接池和 TLS 握手）。
+
+客户端按 (provider 类型, api_key, base_url) 分组缓存，支持：
+- LRU 容量淘汰和空闲超时淘汰
+- 线程安全的租借（lease）语义，被淘汰但仍在使用的客户端会在归还后关闭
+- 启动时根据 models.json 中的模型配置预热
+- 命中 / 未命中 / 淘汰计数
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Generator, Optional, Tuple
+
+from request_timing import timed
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 客户端工厂函数签名：factory(api_key, base_url) -> client
+ClientFactory = Callable[[str, Optional[str]], Any]
+ClientKey = Tuple[str, str, Optional[str]]
+
+
+@dataclass
+class _PoolEntry:
+    """连接池中的单个客户端条目
+
+    Attributes:
+        client: SDK 客户端实例
+        last_used: 最近一次被租借或归还的时间（monotonic）
+        leases: 当前正在使用该客户端的租借数
+        evicted: 是否已从池中移除（等待最后一个租借归还后关闭）
+    """
+    client: Any
+    last_used: float = field(default_factory=time.monotonic)
+    leases: int = 0
+    evicted: bool = False
+
+
+class ClientPool:
+    """线程安全的 Provider 客户端池
+
+    Example:
+        >>> pool = ClientPool(factories={'openai': lambda key, url: OpenAI(api_key=key, base_url=url)})
+        >>> with pool.lease('openai', 'sk-...', 'https://api.deepseek.com/v1') as client:
+        ...     client.chat.completions.create(...)
+    """
+
+    def __init__(
+        self,
+        factories: Optional[Dict[str, ClientFactory]] = None,
+        max_size: int = 32,
+        idle_timeout: float = 300.0
+    ) -> None:
+        """初始化客户端池
+
+        Args:
+            factories: provider 类型到客户端工厂函数的映射
+            max_size: 池中最多保留的客户端数量
+            idle_timeout: 客户端空闲多久后被淘汰（秒），0 表示不按空闲淘汰
+        """
+        self._factories: Dict[str, ClientFactory] = dict(factories or {})
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._entries: "OrderedDict[ClientKey, _PoolEntry]" = OrderedDict()
+        self._building: Dict[ClientKey, threading.Event] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def register_factory(self, provider_type: str, factory: ClientFactory) -> None:
+        """注册（或替换）某个 provider 类型的客户端工厂
+
+        Args:
+            provider_type: provider 类型，如 'openai'、'google'
+            factory: 客户端工厂函数
+        """
+        with self._lock:
+            self._factories[provider_type] = factory
+
+    def supports(self, provider_type: str) -> bool:
+        """判断某个 provider 类型是否由连接池管理"""
+        return provider_type in self._factories
+
+    @contextmanager
+    def lease(
+        self,
+        provider_type: str,
+        api_key: str,
+        base_url: Optional[str] = None
+    ) -> Generator[Any, None, None]:
+        """租借一个客户端，退出上下文时自动归还
+
+        Args:
+            provider_type: provider 类型
+            api_key: API 密钥
+            base_url: API 基础 URL（Google 为 None）
+
+        Yields:
+            Any: SDK 客户端实例
+
+        Raises:
+            KeyError: provider 类型没有注册工厂函数
+        """
+        key: ClientKey = (provider_type, api_key, base_url)
+        with timed("client"):
+            entry = self._acquire(key)
+        try:
+            yield entry.client
+        finally:
+            self._release(entry)
+
+    def _acquire(self, key: ClientKey) -> _PoolEntry:
+        """取出或创建客户端条目，并增加租借计数
+
+        创建客户端（SDK 初始化与 httpx 连接池）在锁外进行，不阻塞其他 key 的租借；
+        同一个 key 同时只有一个线程创建，其他线程等待后复用。
+        """
+        while True:
+            to_close = []
+            with self._lock:
+                to_close.extend(self._evict_idle_locked())
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                    entry.leases += 1
+                    entry.last_used = time.monotonic()
+                else:
+                    factory = self._factories[key[0]]
+                    building = self._building.get(key)
+                    owner = building is None
+                    if owner:
+                        building = self._building[key] = threading.Event()
+                        self.misses += 1
+            self._close_all(to_close)
+
+            if entry is not None:
+                return entry
+            if owner:
+                return self._create(key, factory, building)
+            # 等待另一个线程创建完成后重新查找（创建失败时由本线程重新创建）
+            building.wait()
+
+    def _create(self, key: ClientKey, factory: ClientFactory, building: threading.Event) -> _PoolEntry:
+        """在锁外创建客户端并放入池中（调用方已登记 building）"""
+        try:
+            client = factory(key[1], key[2])
+        except BaseException:
+            with self._lock:
+                self._building.pop(key, None)
+            building.set()
+            raise
+
+        with self._lock:
+            self._building.pop(key, None)
+            entry = _PoolEntry(client=client, leases=1)
+            self._entries[key] = entry
+            to_close = self._evict_overflow_locked()
+        building.set()
+        self._close_all(to_close)
+        return entry
+
+    def _release(self, entry: _PoolEntry) -> None:
+        """归还客户端；已被淘汰且无人使用时关闭"""
+        with self._lock:
+            entry.leases -= 1
+            entry.last_used = time.monotonic()
+            should_close = entry.evicted and entry.leases == 0
+
+        if should_close:
+            self._close_all([entry])
+
+    def _evict_locked(self, key: ClientKey) -> Optional[_PoolEntry]:
+        """从池中移除条目，返回可立即关闭的条目（调用方需持有锁）"""
+        entry = self._entries.pop(key)
+        entry.evicted = True
+        self.evictions += 1
+        return entry if entry.leases == 0 else None
+
+    def _evict_idle_locked(self) -> list:
+        """淘汰空闲超时的客户端（调用方需持有锁）"""
+        if self.idle_timeout <= 0:
+            return []
+        deadline = time.monotonic() - self.idle_timeout
+        expired = [
+            key for key, entry in self._entries.items()
+            if entry.leases == 0 and entry.last_used < deadline
+        ]
+        closable = [self._evict_locked(key) for key in expired]
+        return [entry for entry in closable if entry is not None]
+
+    def _evict_overflow_locked(self) -> list:
+        """按 LRU 顺序淘汰超出容量的客户端（调用方需持有锁）"""
+        closable = []
+        while len(self._entries) > self.max_size:
+            oldest_key = next(iter(self._entries))
+            entry = self._evict_locked(oldest_key)
+            if entry is not None:
+                closable.append(entry)
+        return closable
+
+    @staticmethod
+    def _close_all(entries: list) -> None:
+        """关闭客户端（在锁外执行，避免阻塞其他线程）"""
+        for entry in entries:
+            close = getattr(entry.client, "close", None)
+            if not callable(close):
+                continue
+            try:
+                close()
+            except Exception as e:
+                logger.debug(f"Failed to close pooled client: {e}")
+
+    def warm(self, configs: Dict[str, Dict[str, Any]]) -> int:
+        """根据模型配置预热客户端
+
+        只预热已配置 API 密钥、且 provider 类型由连接池管理的模型。
+
+        Args:
+            configs: 模型配置字典，格式同 LLMWrapper.configs
+
+        Returns:
+            int: 新创建的客户端数量
+        """
+        created = 0
+        for model_id, config in configs.items():
+            provider_type = config.get("type", "")
+            api_key = config.get("api_key", "")
+            if not api_key or not self.supports(provider_type):
+                continue
+
+            key: ClientKey = (provider_type, api_key, config.get("base_url"))
+            with self._lock:
+                if key in self._entries:
+                    continue
+            try:
+                with self.lease(*key):
+                    created += 1
+            except Exception as e:
+                logger.warning(f"Failed to warm client for {model_id}: {e}")
+
+        logger.info(f"Client pool warmed: {created} clients created")
+        return created
+
+    def stats(self) -> Dict[str, Any]:
+        """获取连接池统计信息
+
+        Returns:
+            Dict[str, Any]: 包含 size, hits, misses, evictions, hit_ratio
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / total if total else 0.0
+            }
+
+    def clear(self) -> None:
+        """清空连接池并关闭所有空闲客户端"""
+        with self._lock:
+            closable = [self._evict_locked(key) for key in list(self._entries)]
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+        self._close_all([entry for entry in closable if entry is not None])
+
+
+def pool_settings_from_env() -> Dict[str, Any]:
+    """从环境变量读取连接池配置
+
+    Returns:
+        Dict[str, Any]: ClientPool 的 max_size 和 idle_timeout 参数
+    """
+    return {
+        "max_size": int(os.environ.get("LLM_CLIENT_POOL_SIZE", 32)),
+        "idle_timeout": float(os.environ.get("LLM_CLIENT_IDLE_TIMEOUT", 300))
+    }
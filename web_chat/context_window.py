@@ -0,0 +1,223 @@
+"""上下文窗口管理
+
+/api/chat 最多允许 100 条、每条 10000 字符的消息并原样转发，长对话的提示词
+会越来越大：首字时间变长、费用变高，最终被上游以 400 拒绝。本模块在请求
+发出之前按模型的上下文预算处理消息：
+
+- 每个模型在 models.json 中声明 context_length（上下文长度）和
+  reserved_output_tokens（为输出保留的 token 数），可选 max_output_tokens
+- 本地快速估算 token 数：中日韩字符约 1 个 token，其他字符约 4 个一个 token；
+  按内容哈希缓存每条消息的估算结果，长对话的历史消息不会重复计算
+- 超出预算时保留系统提示词和最新的若干轮，丢弃中间的历史消息
+- 按剩余预算自动计算 max_tokens，代替固定的 LLMConfig.max_tokens
+
+没有声明 context_length 的模型不做处理。
+
+Example:
+    >>> budget = ContextBudget.from_config(config)
+    >>> fitted = fit_messages(messages, budget, system=config.get('system', ''))
+    >>> fitted.messages, fitted.max_tokens
+"""
+
+import os
+import re
+import math
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 中日韩字符（汉字、假名、谚文），分词器中大致每个字符一个 token
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff66-\uff9f]")
+
+# 其他字符平均每个 token 的字符数
+_LATIN_CHARS_PER_TOKEN = 4
+
+# 每条消息的格式开销（角色标记、分隔符）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文本的 token 数
+
+    估算值略偏保守：宁可多裁掉一点历史，也不要让上游因超长而拒绝请求。
+
+    Args:
+        text: 文本
+
+    Returns:
+        int: 估算的 token 数
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / _LATIN_CHARS_PER_TOKEN)
+
+
+class TokenCounter:
+    """带缓存的消息 token 计数器（线程安全）
+
+    按消息内容的哈希缓存估算结果。同一对话每一轮都会重新发送全部历史，
+    缓存后每轮只需要计算新增的消息。
+    """
+
+    def __init__(self, max_entries: int = 10000) -> None:
+        """初始化计数器
+
+        Args:
+            max_entries: 缓存的最大条目数（超出后淘汰最久未使用的条目）
+        """
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[bytes, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def count(self, text: str) -> int:
+        """估算一段文本的 token 数（带缓存）
+
+        Args:
+            text: 文本
+
+        Returns:
+            int: 估算的 token 数
+        """
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        with self._lock:
+            tokens = self._cache.get(key)
+            if tokens is not None:
+                self._cache.move_to_end(key)
+                return tokens
+
+        tokens = estimate_tokens(text)
+        with self._lock:
+            self._cache[key] = tokens
+            if len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return tokens
+
+    def message_tokens(self, message: Dict[str, str]) -> int:
+        """估算一条消息的 token 数（含格式开销）"""
+        return self.count(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+
+# 进程级 token 计数器，所有请求共享
+token_counter = TokenCounter(int(os.environ.get("LLM_TOKEN_CACHE_SIZE", 10000)))
+
+
+@dataclass(frozen=True)
+class ContextBudget:
+    """模型的上下文预算
+
+    Attributes:
+        context_length: 上下文长度（输入与输出 token 数之和的上限）
+        reserved_output_tokens: 裁剪历史时为输出保留的 token 数
+        max_output_tokens: 上游允许的最大输出 token 数
+        safety_margin: 估算误差余量（token 数）
+    """
+    context_length: int
+    reserved_output_tokens: int = 1024
+    max_output_tokens: int = 4096
+    safety_margin: int = 64
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], default_max_output: int = 4096) -> Optional["ContextBudget"]:
+        """从模型配置读取预算
+
+        Args:
+            config: 模型配置字典
+            default_max_output: 没有声明 max_output_tokens 时使用的值
+
+        Returns:
+            Optional[ContextBudget]: 没有声明 context_length 时返回 None
+        """
+        context_length = config.get("context_length")
+        if not context_length:
+            return None
+        max_output = int(config.get("max_output_tokens") or default_max_output)
+        reserved = int(config.get("reserved_output_tokens") or min(1024, max_output))
+        return cls(int(context_length), reserved, max_output)
+
+    @property
+    def prompt_budget(self) -> int:
+        """提示词可用的 token 数"""
+        return max(0, self.context_length - self.reserved_output_tokens - self.safety_margin)
+
+
+@dataclass
+class FittedContext:
+    """裁剪结果
+
+    Attributes:
+        messages: 裁剪后的消息列表
+        prompt_tokens: 估算的提示词 token 数（含模型配置中的系统提示词）
+        max_tokens: 按剩余预算计算的 max_tokens
+        dropped: 被丢弃的消息数
+    """
+    messages: List[Dict[str, str]]
+    prompt_tokens: int
+    max_tokens: int
+    dropped: int = 0
+
+
+def fit_messages(
+    messages: List[Dict[str, str]],
+    budget: ContextBudget,
+    system: str = "",
+    counter: Optional[TokenCounter] = None
+) -> FittedContext:
+    """按预算裁剪消息并计算 max_tokens
+
+    保留开头的系统消息和最后一条消息，从最新的消息往前尽量多地保留历史，
+    中间放不下的消息整体丢弃。保留的历史总是从用户消息开始，保证角色交替。
+
+    Args:
+        messages: 消息列表
+        budget: 上下文预算
+        system: 模型配置中的系统提示词（消息中没有系统消息时由适配器注入，
+            也要计入预算）
+        counter: token 计数器，默认使用进程级共享实例
+
+    Returns:
+        FittedContext: 裁剪结果
+    """
+    counter = counter or token_counter
+    head = [m for m in messages[:1] if m["role"] == "system"]
+    body = messages[len(head):]
+
+    used = sum(counter.message_tokens(m) for m in head)
+    if not head and system:
+        used += counter.count(system) + MESSAGE_OVERHEAD_TOKENS
+
+    kept: List[Dict[str, str]] = []
+    for index in range(len(body) - 1, -1, -1):
+        tokens = counter.message_tokens(body[index])
+        # 最新的一条消息总是保留，即使它本身已经超出预算
+        if kept and used + tokens > budget.prompt_budget:
+            break
+        kept.append(body[index])
+        used += tokens
+    kept.reverse()
+
+    # 丢弃历史后，保留部分不能以 assistant 消息开头（没有裁剪时原样保留，例如开场问候）
+    while len(body) > len(kept) > 1 and kept[0]["role"] == "assistant":
+        used -= counter.message_tokens(kept.pop(0))
+
+    dropped = len(body) - len(kept)
+    remaining = budget.context_length - used - budget.safety_margin
+    max_tokens = max(1, min(budget.max_output_tokens, remaining))
+    if dropped:
+        logger.info(
+            f"Trimmed {dropped} of {len(messages)} messages to fit context "
+            f"({used} prompt tokens, max_tokens={max_tokens})"
+        )
+    elif used > budget.prompt_budget:
+        logger.warning(f"Newest message alone exceeds the prompt budget ({used} > {budget.prompt_budget})")
+    # 没有裁剪时返回原列表（保留对话存储附带的格式转换缓存）
+    return FittedContext(head + kept if dropped else messages, used, max_tokens, dropped)
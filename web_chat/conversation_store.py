@@ -0,0 +1,466 @@
+"""服务端对话存储
+
+前端每一轮都会重新上传完整的对话历史，服务端也要逐条重新校验。本模块在
+服务端保存对话，客户端只需发送对话 ID、它所知道的版本号和新的用户消息，
+每轮的上传量和校验开销从 O(历史) 变为 O(新消息)：
+
+- 版本号就是对话中已保存的消息条数；base_version 与服务端不一致时返回冲突，
+  客户端改为上传完整历史重新同步
+- 用户消息在请求开始时追加，助手回复在流式输出结束（或客户端断开）时追加
+- 消息以 (角色, 内容) 元组紧凑保存；内存中的热集合按字节数限制大小，
+  超出时把最久未使用的对话写入磁盘，再次访问时重新加载
+- 每个对话缓存各提供商格式的转换结果（例如 Gemini 的 types.Content 列表），
+  追加消息后只转换新增部分
+
+Example:
+    >>> turn = store.begin_turn(conversation_id, 'deepseek', base_version, message)
+    >>> for chunk in llm.chat_stream('deepseek', turn.messages):
+    ...     parts.append(chunk)
+    >>> turn.finish(''.join(parts))
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 默认的溢出目录
+DEFAULT_SPILL_DIR = os.path.join(os.path.dirname(__file__), "conversations")
+
+# 对话 ID 格式（也用作溢出文件名，必须防止路径穿越）
+CONVERSATION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+# 单个对话的最大消息条数（与上传完整历史时的限制相同）
+MAX_MESSAGES = 100
+
+Record = Tuple[str, str]
+
+
+def conversation_store_settings_from_env() -> Dict[str, Any]:
+    """从环境变量读取对话存储配置
+
+    Returns:
+        Dict[str, Any]: ConversationStore 的构造参数
+    """
+    return {
+        "max_memory_bytes": int(os.environ.get("LLM_CONVERSATION_MEMORY_MB", 64)) * 1024 * 1024,
+        "spill_dir": os.environ.get("LLM_CONVERSATION_SPILL_DIR") or DEFAULT_SPILL_DIR,
+        "ttl": float(os.environ.get("LLM_CONVERSATION_TTL", 7 * 86400)),
+        "max_conversation_bytes": int(os.environ.get("LLM_CONVERSATION_MAX_MB", 4)) * 1024 * 1024
+    }
+
+
+class ConversationConflictError(Exception):
+    """客户端的 base_version 与服务端不一致
+
+    Attributes:
+        version: 服务端当前版本（对话不存在时为 0）
+    """
+
+    def __init__(self, version: int) -> None:
+        self.version = version
+        super().__init__(f"Conversation out of sync (server version {version})")
+
+
+class ConversationLimitError(Exception):
+    """对话超出消息条数或大小限制"""
+
+
+class ConversationMessages(list):
+    """传给适配器的消息列表，附带所属对话的格式转换缓存"""
+
+    conversions: Optional[Dict[str, Tuple[int, List[Any]]]] = None
+    lock: Optional[threading.Lock] = None
+
+
+def convert_messages(
+    messages: List[Dict[str, str]],
+    fmt: str,
+    convert: Callable[[Dict[str, str]], Optional[Any]]
+) -> List[Any]:
+    """把消息转换为提供商格式，对话消息使用增量缓存
+
+    对话只会追加消息，因此缓存的转换结果总是当前消息的前缀，只需转换新增的
+    消息。普通列表（或被上下文管理裁剪过的列表）每次全部转换。
+
+    Args:
+        messages: 消息列表
+        fmt: 格式名称（缓存键），例如 "google"
+        convert: 转换单条消息的函数，返回 None 表示跳过该消息
+
+    Returns:
+        List[Any]: 转换结果（新列表，调用方可以修改）
+    """
+    conversions = getattr(messages, "conversions", None)
+    if conversions is None:
+        return [item for item in map(convert, messages) if item is not None]
+
+    with messages.lock:
+        count, items = conversions.get(fmt, (0, []))
+        if count > len(messages):
+            count, items = 0, []
+        items = items + [item for item in map(convert, messages[count:]) if item is not None]
+        conversions[fmt] = (len(messages), items)
+        return list(items)
+
+
+class _Conversation:
+    """一个对话（消息记录、版本号与格式转换缓存）"""
+
+    __slots__ = ("conversation_id", "model_id", "records", "size", "updated_at", "conversions", "lock")
+
+    def __init__(self, conversation_id: str, model_id: str, records: List[Record], updated_at: float) -> None:
+        self.conversation_id = conversation_id
+        self.model_id = model_id
+        self.records = records
+        self.size = sum(len(content.encode("utf-8")) for _, content in records)
+        self.updated_at = updated_at
+        self.conversions: Dict[str, Tuple[int, List[Any]]] = {}
+        self.lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        return len(self.records)
+
+    def append(self, role: str, content: str) -> None:
+        self.records.append((role, content))
+        self.size += len(content.encode("utf-8"))
+        self.updated_at = time.time()
+
+    def view(self) -> ConversationMessages:
+        messages = ConversationMessages({"role": role, "content": content} for role, content in self.records)
+        messages.conversions = self.conversions
+        messages.lock = self.lock
+        return messages
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "model": self.model_id,
+            "records": self.records,
+            "updated_at": self.updated_at
+        }
+
+
+class ConversationTurn:
+    """一轮对话：持有发送给模型的消息，并在结束时保存助手回复"""
+
+    def __init__(self, store: "ConversationStore", conversation_id: str, version: int, messages: ConversationMessages) -> None:
+        self.store = store
+        self.conversation_id = conversation_id
+        self.version = version
+        self.messages = messages
+        self._finished = False
+
+    def finish(self, reply: str) -> None:
+        """保存助手回复（空回复不保存；重复调用无效）
+
+        Args:
+            reply: 已输出的完整回复（客户端中途断开时为已输出的部分）
+        """
+        if self._finished:
+            return
+        self._finished = True
+        if reply:
+            self.store.append_reply(self.conversation_id, self.version, reply)
+
+
+class ConversationStore:
+    """对话存储（线程安全，进程内共享）"""
+
+    def __init__(
+        self,
+        max_memory_bytes: int = 64 * 1024 * 1024,
+        spill_dir: Optional[str] = DEFAULT_SPILL_DIR,
+        ttl: float = 7 * 86400,
+        max_messages: int = MAX_MESSAGES,
+        max_conversation_bytes: int = 4 * 1024 * 1024
+    ) -> None:
+        """初始化对话存储
+
+        Args:
+            max_memory_bytes: 热集合的容量（按消息内容的 UTF-8 字节数计）
+            spill_dir: 溢出目录，为 None 时超出容量的对话直接丢弃
+            ttl: 对话闲置多久后过期（秒）
+            max_messages: 单个对话的最大消息条数（包括本轮的用户消息）
+            max_conversation_bytes: 单个对话的最大字节数（包括本轮的用户消息）
+        """
+        self.max_memory_bytes = max_memory_bytes
+        self.spill_dir = spill_dir
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self.max_conversation_bytes = max_conversation_bytes
+        self._hot: "OrderedDict[str, _Conversation]" = OrderedDict()
+        # 已淘汰、尚未写入磁盘的对话；再次访问时直接放回热集合
+        self._spilling: Dict[str, _Conversation] = {}
+        # 每个对话的 I/O 锁：[锁, 引用数]
+        self._guards: Dict[str, List[Any]] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"turns": 0, "conflicts": 0, "rejected": 0, "spilled": 0, "loaded": 0}
+
+    def _path(self, conversation_id: str) -> str:
+        return os.path.join(self.spill_dir, f"{conversation_id}.json")
+
+    @contextmanager
+    def _guard(self, conversation_id: str) -> Iterator[None]:
+        """持有对话的 I/O 锁
+
+        同一对话的加载、写入、删除溢出文件与状态变化都在这把锁内进行，
+        磁盘 I/O 不占用全局锁。加锁顺序固定为先对话锁、后全局锁。
+        """
+        with self._lock:
+            guard = self._guards.get(conversation_id)
+            if guard is None:
+                guard = self._guards[conversation_id] = [threading.Lock(), 0]
+            guard[1] += 1
+        try:
+            with guard[0]:
+                yield
+        finally:
+            with self._lock:
+                guard[1] -= 1
+                if not guard[1]:
+                    del self._guards[conversation_id]
+
+    def _load(self, conversation_id: str) -> None:
+        """把溢出的对话从磁盘加载到热集合（调用方持有对话锁，不持有全局锁）"""
+        if not self.spill_dir:
+            return
+        with self._lock:
+            if conversation_id in self._hot or conversation_id in self._spilling:
+                return
+        path = self._path(conversation_id)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to load spilled conversation {conversation_id}: {e}")
+            return
+        if data["updated_at"] + self.ttl > time.time():
+            records = [(role, content) for role, content in data["records"]]
+            conversation = _Conversation(conversation_id, data["model"], records, data["updated_at"])
+            # 超出容量时由调用方随后的 _evict 淘汰（不能在对话锁内写入其他对话）
+            with self._lock:
+                self._hot[conversation_id] = conversation
+                self._bytes += conversation.size
+                self._counters["loaded"] += 1
+        self._remove(conversation_id)
+
+    def _remove(self, conversation_id: str) -> None:
+        """删除溢出文件（调用方持有对话锁）"""
+        if not self.spill_dir:
+            return
+        try:
+            os.remove(self._path(conversation_id))
+        except OSError:
+            pass
+
+    def _get(self, conversation_id: str) -> Optional[_Conversation]:
+        """从热集合获取对话，尚未写入磁盘的对话放回热集合（调用方持有全局锁）"""
+        conversation = self._hot.get(conversation_id)
+        if conversation is None:
+            conversation = self._spilling.pop(conversation_id, None)
+            if conversation is None:
+                return None
+            self._hot[conversation_id] = conversation
+            self._bytes += conversation.size
+        if conversation.updated_at + self.ttl <= time.time():
+            self._drop(conversation_id)
+            return None
+        self._hot.move_to_end(conversation_id)
+        return conversation
+
+    def _drop(self, conversation_id: str) -> None:
+        """从热集合与待写入集合中移除对话（调用方持有全局锁）"""
+        conversation = self._hot.pop(conversation_id, None)
+        if conversation is not None:
+            self._bytes -= conversation.size
+        self._spilling.pop(conversation_id, None)
+
+    def _evict(self) -> List[_Conversation]:
+        """淘汰超出容量的对话（调用方持有全局锁），返回需要写入磁盘的对话"""
+        evicted = []
+        while self._bytes > self.max_memory_bytes and len(self._hot) > 1:
+            conversation_id, conversation = self._hot.popitem(last=False)
+            self._bytes -= conversation.size
+            if self.spill_dir:
+                self._spilling[conversation_id] = conversation
+                evicted.append(conversation)
+        return evicted
+
+    def _spill(self, evicted: List[_Conversation]) -> None:
+        """把淘汰的对话写入磁盘（不持有全局锁）
+
+        写入前后都在对话锁内确认对话仍在待写入集合中：期间被重新访问、
+        重新同步或删除的对话不再写入，旧内容不会覆盖新状态。
+        """
+        for conversation in evicted:
+            conversation_id = conversation.conversation_id
+            with self._guard(conversation_id):
+                with self._lock:
+                    if self._spilling.get(conversation_id) is not conversation:
+                        continue
+                path = self._path(conversation_id)
+                try:
+                    os.makedirs(self.spill_dir, exist_ok=True)
+                    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                        json.dump(conversation.to_json(), f, ensure_ascii=False, separators=(",", ":"))
+                    os.replace(f"{path}.tmp", path)
+                    spilled = True
+                except OSError as e:
+                    logger.warning(f"Failed to spill conversation {conversation_id}: {e}")
+                    spilled = False
+                with self._lock:
+                    if self._spilling.get(conversation_id) is conversation:
+                        del self._spilling[conversation_id]
+                    if spilled:
+                        self._counters["spilled"] += 1
+
+    def _check_limits(self, count: int, size: int) -> None:
+        """检查对话的消息条数与字节数（调用方持有全局锁）"""
+        if count > self.max_messages:
+            self._counters["rejected"] += 1
+            raise ConversationLimitError(f"Too many messages (max {self.max_messages})")
+        if size > self.max_conversation_bytes:
+            self._counters["rejected"] += 1
+            raise ConversationLimitError(f"Conversation too large (max {self.max_conversation_bytes} bytes)")
+
+    def begin_turn(
+        self,
+        conversation_id: str,
+        model_id: str,
+        base_version: int,
+        message: Dict[str, str]
+    ) -> ConversationTurn:
+        """开始新的一轮：校验版本并追加用户消息
+
+        Args:
+            conversation_id: 对话 ID
+            model_id: 模型 ID（与对话保存的模型不同时视为冲突）
+            base_version: 客户端已知的版本号（客户端历史中的消息条数）
+            message: 新的用户消息
+
+        Returns:
+            ConversationTurn: 本轮对话
+
+        Raises:
+            ConversationConflictError: 版本或模型与服务端不一致
+            ConversationLimitError: 追加后超出消息条数或大小限制
+        """
+        size = len(message["content"].encode("utf-8"))
+        with self._guard(conversation_id):
+            self._load(conversation_id)
+            with self._lock:
+                conversation = self._get(conversation_id)
+                version = conversation.version if conversation else 0
+                if base_version != version or (conversation and conversation.model_id != model_id):
+                    self._counters["conflicts"] += 1
+                    raise ConversationConflictError(version)
+                self._check_limits(version + 1, (conversation.size if conversation else 0) + size)
+                if conversation is None:
+                    conversation = _Conversation(conversation_id, model_id, [], time.time())
+                    self._hot[conversation_id] = conversation
+
+                conversation.append(message["role"], message["content"])
+                self._bytes += size
+                turn = ConversationTurn(self, conversation_id, conversation.version, conversation.view())
+                self._counters["turns"] += 1
+                evicted = self._evict()
+        self._spill(evicted)
+        return turn
+
+    def reset(self, conversation_id: str, model_id: str, messages: List[Dict[str, str]]) -> ConversationTurn:
+        """用客户端上传的完整历史替换对话（重新同步）
+
+        Args:
+            conversation_id: 对话 ID
+            model_id: 模型 ID
+            messages: 完整消息列表（最后一条是本轮的用户消息）
+
+        Returns:
+            ConversationTurn: 本轮对话
+
+        Raises:
+            ConversationLimitError: 历史超出消息条数或大小限制
+        """
+        records = [(m["role"], m["content"]) for m in messages]
+        conversation = _Conversation(conversation_id, model_id, records, time.time())
+        with self._guard(conversation_id):
+            with self._lock:
+                self._check_limits(conversation.version, conversation.size)
+                self._drop(conversation_id)
+                self._hot[conversation_id] = conversation
+                self._bytes += conversation.size
+                turn = ConversationTurn(self, conversation_id, conversation.version, conversation.view())
+                self._counters["turns"] += 1
+                evicted = self._evict()
+            # 丢弃可能残留的旧溢出文件
+            self._remove(conversation_id)
+        self._spill(evicted)
+        return turn
+
+    def append_reply(self, conversation_id: str, version: int, reply: str) -> bool:
+        """追加助手回复
+
+        Args:
+            conversation_id: 对话 ID
+            version: 开始本轮时的版本号（期间对话被重新同步时不追加）
+            reply: 助手回复
+
+        Returns:
+            bool: 是否追加成功
+        """
+        with self._guard(conversation_id):
+            self._load(conversation_id)
+            with self._lock:
+                conversation = self._get(conversation_id)
+                if conversation is None or conversation.version != version:
+                    logger.info(f"Conversation {conversation_id} changed during the turn, reply not stored")
+                    return False
+                conversation.append("assistant", reply)
+                self._bytes += len(reply.encode("utf-8"))
+                evicted = self._evict()
+        self._spill(evicted)
+        return True
+
+    def version(self, conversation_id: str) -> int:
+        """获取对话的当前版本号（对话不存在时为 0）"""
+        with self._guard(conversation_id):
+            self._load(conversation_id)
+            with self._lock:
+                conversation = self._get(conversation_id)
+                version = conversation.version if conversation else 0
+                evicted = self._evict()
+        self._spill(evicted)
+        return version
+
+    def delete(self, conversation_id: str) -> None:
+        """删除对话（包括溢出文件）"""
+        with self._guard(conversation_id):
+            with self._lock:
+                self._drop(conversation_id)
+            self._remove(conversation_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取存储统计
+
+        Returns:
+            Dict[str, Any]: 热集合的对话数与字节数，以及轮次、冲突、超限、溢出、加载次数
+        """
+        with self._lock:
+            return {
+                **self._counters,
+                "hot_conversations": len(self._hot),
+                "hot_bytes": self._bytes,
+                "max_memory_bytes": self.max_memory_bytes
+            }
@@ -0,0 +1,237 @@
+"""签名凭据缓存
+
+智谱 AI 使用 API Key 签发的 JWT 认证，令牌有效期一小时，但原来每次请求都要
+重新做 JSON 编码、base64 和 HMAC-SHA256 签名。本模块把签名认证抽象为可插拔的
+凭据提供者，并缓存签发的凭据：
+
+- CredentialProvider：按 API Key 签发带过期时间的凭据（如智谱的 JWT）
+- CredentialCache：线程安全、按条目数限制大小（LRU），按 (提供者, 密钥 ID) 缓存；
+  在过期前提前刷新，刷新时间带随机抖动，避免大量密钥同时刷新；一个线程刷新时
+  其他线程继续使用仍然有效的旧凭据
+- 其他签名认证的提供者实现 CredentialProvider 并调用 register() 即可接入
+
+Example:
+    >>> cache = CredentialCache()
+    >>> cache.register("zhipu", ZhipuJWTProvider())
+    >>> token = cache.get("zhipu", "id.secret")
+"""
+
+import os
+import json
+import time
+import hmac
+import base64
+import random
+import hashlib
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 智谱 JWT 的有效期（秒）
+ZHIPU_TOKEN_TTL = 3600
+
+
+def credential_settings_from_env() -> Dict[str, Any]:
+    """从环境变量读取凭据缓存配置
+
+    Returns:
+        Dict[str, Any]: CredentialCache 的构造参数
+    """
+    return {
+        "max_entries": int(os.environ.get("LLM_CREDENTIAL_CACHE_SIZE", 256)),
+        "refresh_ahead": float(os.environ.get("LLM_CREDENTIAL_REFRESH_AHEAD", 300)),
+        "jitter": float(os.environ.get("LLM_CREDENTIAL_REFRESH_JITTER", 60))
+    }
+
+
+def _b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def sign_zhipu_jwt(api_key: str, ttl: int = ZHIPU_TOKEN_TTL, now: Optional[float] = None) -> str:
+    """签发智谱 AI 的 JWT Token
+
+    Args:
+        api_key: API 密钥，格式为 id.secret
+        ttl: 有效期（秒）
+        now: 签发时间，默认为当前时间
+
+    Returns:
+        str: JWT Token 字符串
+
+    Raises:
+        ValueError: 如果 API Key 格式错误
+    """
+    try:
+        key_id, secret = api_key.split(".")
+    except ValueError:
+        raise ValueError("智谱 API Key 格式错误，应为 id.secret")
+
+    issued = int(now if now is not None else time.time())
+    header = {"alg": "HS256", "sign_type": "SIGN"}
+    payload = {"api_key": key_id, "exp": issued + ttl, "timestamp": issued}
+
+    message = (
+        f"{_b64url(json.dumps(header, separators=(',', ':')).encode())}."
+        f"{_b64url(json.dumps(payload, separators=(',', ':')).encode())}"
+    )
+    signature = hmac.new(secret.encode(), message.encode(), hashlib.sha256).digest()
+    return f"{message}.{_b64url(signature)}"
+
+
+@dataclass(frozen=True)
+class Credential:
+    """签发的凭据
+
+    Attributes:
+        value: 凭据内容（如 Bearer 令牌）
+        expires_at: 过期时间（Unix 时间戳）
+    """
+    value: str
+    expires_at: float
+
+
+class CredentialProvider(ABC):
+    """凭据提供者基类：按 API Key 签发带过期时间的凭据（子类必须实现 issue）"""
+
+    def cache_id(self, api_key: str) -> str:
+        """缓存键（默认为密钥的摘要，缓存中不保存原始密钥）"""
+        return hashlib.blake2b(api_key.encode(), digest_size=16).hexdigest()
+
+    @abstractmethod
+    def issue(self, api_key: str, now: float) -> Credential:
+        """签发凭据
+
+        Args:
+            api_key: API 密钥
+            now: 当前时间（Unix 时间戳）
+
+        Returns:
+            Credential: 新签发的凭据
+        """
+
+
+class ZhipuJWTProvider(CredentialProvider):
+    """智谱 AI 的 JWT 凭据"""
+
+    def __init__(self, ttl: int = ZHIPU_TOKEN_TTL) -> None:
+        self.ttl = ttl
+
+    def cache_id(self, api_key: str) -> str:
+        # 按密钥 ID 区分，并附带完整密钥的摘要：同一 ID 更换 secret 后不会用到旧令牌
+        return f"{api_key.split('.', 1)[0]}:{super().cache_id(api_key)}"
+
+    def issue(self, api_key: str, now: float) -> Credential:
+        return Credential(sign_zhipu_jwt(api_key, self.ttl, now), now + self.ttl)
+
+
+class _Entry:
+    """缓存条目"""
+
+    __slots__ = ("credential", "refresh_at", "refreshing")
+
+    def __init__(self, credential: Credential, refresh_at: float) -> None:
+        self.credential = credential
+        self.refresh_at = refresh_at
+        self.refreshing = False
+
+
+class CredentialCache:
+    """凭据缓存（线程安全，进程内共享）"""
+
+    def __init__(self, max_entries: int = 256, refresh_ahead: float = 300, jitter: float = 60) -> None:
+        """初始化缓存
+
+        Args:
+            max_entries: 最大条目数（超出后淘汰最久未使用的条目）
+            refresh_ahead: 在过期前多少秒开始刷新
+            jitter: 刷新时间的随机抖动上限（秒）
+        """
+        self.max_entries = max_entries
+        self.refresh_ahead = refresh_ahead
+        self.jitter = jitter
+        self._providers: Dict[str, CredentialProvider] = {}
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "issued": 0, "refreshed": 0, "evictions": 0}
+
+    def register(self, name: str, provider: CredentialProvider) -> None:
+        """注册凭据提供者
+
+        Args:
+            name: 提供者名称（适配器通过该名称获取凭据）
+            provider: 凭据提供者
+        """
+        self._providers[name] = provider
+
+    def _refresh_at(self, credential: Credential, now: float) -> float:
+        """计算提前刷新的时间（带随机抖动，且不早于签发时间）"""
+        ahead = self.refresh_ahead + random.uniform(0, self.jitter)
+        return max(now, credential.expires_at - ahead)
+
+    def get(self, name: str, api_key: str) -> str:
+        """获取凭据（缓存未命中或即将过期时重新签发）
+
+        Args:
+            name: 提供者名称
+            api_key: API 密钥
+
+        Returns:
+            str: 凭据内容
+
+        Raises:
+            KeyError: 提供者未注册
+            Exception: 提供者签发失败（如密钥格式错误）
+        """
+        provider = self._providers[name]
+        key = (name, provider.cache_id(api_key))
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                valid = now < entry.credential.expires_at
+                # 未到刷新时间，或其他线程正在刷新而旧凭据仍然有效
+                if valid and (now < entry.refresh_at or entry.refreshing):
+                    self._counters["hits"] += 1
+                    return entry.credential.value
+                entry.refreshing = True
+
+        try:
+            credential = provider.issue(api_key, now)
+        except Exception:
+            if entry is not None:
+                with self._lock:
+                    entry.refreshing = False
+            raise
+
+        with self._lock:
+            self._counters["refreshed" if entry is not None else "issued"] += 1
+            self._entries[key] = _Entry(credential, self._refresh_at(credential, now))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+        logger.debug(f"Issued {name} credential, expires in {credential.expires_at - now:.0f}s")
+        return credential.value
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计
+
+        Returns:
+            Dict[str, Any]: 命中、签发、刷新、淘汰次数与当前条目数
+        """
+        with self._lock:
+            return {**self._counters, "entries": len(self._entries), "providers": sorted(self._providers)}
@@ -0,0 +1,132 @@
+"""多模型并发对比（扇出与多路复用流）
+
+比较多个模型时，侧边栏只能一次向一个模型发送问题，总耗时是各模型耗时之和。
+本模块把同一组消息并发发给多个模型，合并为一条多路复用的帧流：
+
+- 每个模型在独立线程中读取上游，片段连同模型 ID 放入共享队列
+- 帧为一行 JSON（NDJSON）：{"model", "type": "chunk", "text"}；每个模型以
+  {"model", "type": "done", "ttft", "total", "chars", "error"} 结束；
+  全部结束后输出 {"type": "end", "elapsed"}
+- 已经就绪的多个帧合并为一次写出，减少小包
+- 客户端断开时通过 hedging 的取消作用域中止所有上游
+
+总耗时接近最慢的模型，而不是各模型耗时之和。
+
+Example:
+    >>> streams = {m: partial(llm.iter_chat, m, messages) for m in ['deepseek', 'qwen']}
+    >>> for payload in encode_frames(fan_out(streams)):
+    ...     print(payload, end='')
+"""
+
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from typing import Any, Callable, Dict, Generator, Iterable, Iterator, List
+
+from hedging import CancelScope, use_scope
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 单次对比的最大模型数
+MAX_COMPARE_MODELS = int(os.environ.get("LLM_COMPARE_MAX_MODELS", 4))
+
+# 生产者结束标记
+_DONE = object()
+
+
+def _produce(
+    model_id: str,
+    upstream: Callable[[], Iterator[str]],
+    scope: CancelScope,
+    frames: "queue.Queue",
+    started: float
+) -> None:
+    """在后台线程中读取一个模型的上游，把帧放入共享队列"""
+    ttft = None
+    chars = 0
+    error = None
+    with use_scope(scope):
+        try:
+            for chunk in upstream():
+                if scope.cancelled:
+                    break
+                if not chunk:
+                    continue
+                if ttft is None:
+                    ttft = time.monotonic() - started
+                chars += len(chunk)
+                frames.put({"model": model_id, "type": "chunk", "text": chunk})
+        except Exception as e:
+            logger.warning(f"Compare stream for {model_id} failed: {e}")
+            error = str(e)
+
+    frames.put({
+        "model": model_id,
+        "type": "done",
+        "ttft": round(ttft, 3) if ttft is not None else None,
+        "total": round(time.monotonic() - started, 3),
+        "chars": chars,
+        "error": error
+    })
+    frames.put(_DONE)
+
+
+def fan_out(streams: Dict[str, Callable[[], Iterator[str]]]) -> Generator[List[Dict[str, Any]], None, None]:
+    """并发执行多个流式请求，按到达顺序输出带模型 ID 的帧
+
+    Args:
+        streams: 模型 ID 到创建上游流函数的映射（上游出错时应抛出异常）
+
+    Yields:
+        List[Dict[str, Any]]: 一批已就绪的帧（chunk 帧与各模型的 done 帧），
+            最后一批以 end 帧结束
+    """
+    frames: "queue.Queue" = queue.Queue()
+    scopes = {model_id: CancelScope() for model_id in streams}
+    started = time.monotonic()
+    for model_id, upstream in streams.items():
+        threading.Thread(
+            target=_produce, args=(model_id, upstream, scopes[model_id], frames, started),
+            name=f"compare-{model_id}", daemon=True
+        ).start()
+
+    remaining = len(streams)
+    try:
+        while remaining:
+            batch = []
+            frame = frames.get()
+            while True:
+                if frame is _DONE:
+                    remaining -= 1
+                else:
+                    batch.append(frame)
+                try:
+                    frame = frames.get_nowait()
+                except queue.Empty:
+                    break
+            if not remaining:
+                batch.append({"type": "end", "elapsed": round(time.monotonic() - started, 3)})
+            if batch:
+                yield batch
+    finally:
+        if remaining:
+            logger.info(f"Compare stream closed early, cancelling {remaining} upstreams")
+            for scope in scopes.values():
+                scope.cancel()
+
+
+def encode_frames(batches: Iterable[List[Dict[str, Any]]]) -> Generator[str, None, None]:
+    """把帧编码为 NDJSON 文本，每批帧合并为一次写出
+
+    Args:
+        batches: fan_out() 输出的帧批次
+
+    Yields:
+        str: 一行或多行 JSON（每行以换行结尾）
+    """
+    for batch in batches:
+        yield "".join(json.dumps(frame, ensure_ascii=False) + "\n" for frame in batch)
@@ -0,0 +1,329 @@
+"""后台模型健康与延迟探测
+
+以前侧边栏给每个模型显示固定的“在线”，用户只能从超时中发现模型已经不可用或
+很慢。本模块在后台定期向每个已启用的模型发送一个最小的流式请求（一条很短的
+用户消息、max_tokens=1、收到首字后立即断开），并发且限速，记录：
+
+- 首字时间（TTFT）的指数加权移动平均（EWMA）
+- 可用性：探测成功率的 EWMA
+- 连续失败次数、最近一次错误与探测时间
+
+由此得到模型状态 online / degraded / offline / unknown，通过 /api/models/list
+返回给前端，也可供路由等功能通过 health() 使用。
+
+Example:
+    >>> prober = HealthProber(HealthProbePolicy(enabled=True, interval=60))
+    >>> prober.bind(lambda: LLMWrapper())
+    >>> prober.start()
+    >>> prober.health("deepseek")
+    {'status': 'online', 'ttft_ms': 820.0, 'availability': 1.0, ...}
+"""
+
+import os
+import math
+import time
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from llm_wrapper import LLMConfig
+from stream_retry import StreamRetryPolicy
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 模型状态
+ONLINE = "online"
+DEGRADED = "degraded"
+OFFLINE = "offline"
+UNKNOWN = "unknown"
+
+
+@dataclass(frozen=True)
+class HealthProbePolicy:
+    """健康探测策略
+
+    Attributes:
+        enabled: 是否启用后台探测（每次探测都会消耗少量 API 额度）
+        interval: 两轮探测之间的间隔（秒）
+        concurrency: 同时进行的探测数
+        rate: 每秒最多发起的探测数
+        timeout: 单次探测的超时时间（秒）
+        alpha: EWMA 的平滑系数（越大越看重最近的探测）
+        slow_ms: 首字时间 EWMA 超过该值时标记为 degraded（毫秒）
+        prompt: 探测使用的用户消息
+    """
+    enabled: bool = False
+    interval: float = 300.0
+    concurrency: int = 4
+    rate: float = 2.0
+    timeout: float = 15.0
+    alpha: float = 0.3
+    slow_ms: float = 5000.0
+    prompt: str = "ping"
+
+
+def health_probe_settings_from_env() -> Dict[str, Any]:
+    """从环境变量读取健康探测配置
+
+    Returns:
+        Dict[str, Any]: HealthProbePolicy 的构造参数
+    """
+    return {
+        "enabled": os.environ.get("LLM_HEALTH_PROBE_ENABLED", "false").lower() == "true",
+        "interval": float(os.environ.get("LLM_HEALTH_PROBE_INTERVAL", 300)),
+        "concurrency": int(os.environ.get("LLM_HEALTH_PROBE_CONCURRENCY", 4)),
+        "rate": float(os.environ.get("LLM_HEALTH_PROBE_RATE", 2)),
+        "timeout": float(os.environ.get("LLM_HEALTH_PROBE_TIMEOUT", 15)),
+        "alpha": float(os.environ.get("LLM_HEALTH_PROBE_ALPHA", 0.3)),
+        "slow_ms": float(os.environ.get("LLM_HEALTH_PROBE_SLOW_MS", 5000))
+    }
+
+
+class ModelHealth:
+    """一个模型的探测结果（调用方持有 HealthProber 的锁）"""
+
+    def __init__(self) -> None:
+        self.ttft_ms: Optional[float] = None
+        self.availability: Optional[float] = None
+        self.probes = 0
+        self.consecutive_failures = 0
+        self.last_checked: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def record(self, ttft: Optional[float], error: Optional[BaseException], alpha: float) -> None:
+        """记录一次探测结果（ttft 为秒，error 为 None 表示成功）"""
+        ok = 1.0 if error is None else 0.0
+        self.availability = ok if self.availability is None else alpha * ok + (1 - alpha) * self.availability
+        if error is None:
+            ttft_ms = ttft * 1000
+            self.ttft_ms = ttft_ms if self.ttft_ms is None else alpha * ttft_ms + (1 - alpha) * self.ttft_ms
+            self.consecutive_failures = 0
+            self.last_error = None
+        else:
+            self.consecutive_failures += 1
+            self.last_error = f"{type(error).__name__}: {error}"[:200]
+        self.probes += 1
+        self.last_checked = time.time()
+
+    def status(self, slow_ms: float) -> str:
+        """根据可用性、连续失败次数与首字时间得到模型状态"""
+        if not self.probes:
+            return UNKNOWN
+        if self.consecutive_failures >= 2 or self.availability < 0.5:
+            return OFFLINE
+        if self.consecutive_failures or self.availability < 0.9 or (self.ttft_ms or 0) > slow_ms:
+            return DEGRADED
+        return ONLINE
+
+    def snapshot(self, slow_ms: float) -> Dict[str, Any]:
+        """状态与统计（供 /api/models/list 返回）"""
+        return {
+            "status": self.status(slow_ms),
+            "ttft_ms": round(self.ttft_ms, 1) if self.ttft_ms is not None else None,
+            "availability": round(self.availability, 3) if self.availability is not None else None,
+            "probes": self.probes,
+            "consecutive_failures": self.consecutive_failures,
+            "last_checked": self.last_checked,
+            "last_error": self.last_error
+        }
+
+
+class HealthProber:
+    """后台健康探测器（线程安全）"""
+
+    def __init__(self, policy: Optional[HealthProbePolicy] = None) -> None:
+        """初始化探测器（调用 bind() 和 start() 后开始探测）
+
+        Args:
+            policy: 探测策略，默认关闭
+        """
+        self.policy = policy or HealthProbePolicy()
+        self._factory: Optional[Callable[[], Any]] = None
+        self._health: Dict[str, ModelHealth] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._counters = {"rounds": 0, "probes": 0, "failures": 0, "skipped": 0, "late": 0}
+        self._version = 0
+        # 本轮尚未记录结果的探测：模型 ID -> 令牌（结果与超时先到者记录，后到者忽略）
+        self._pending: Dict[str, object] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.policy.enabled
+
+    @property
+    def version(self) -> int:
+        """状态版本号，每记录一次探测结果加 1（供 /api/models/list 判断是否需要重新生成）"""
+        return self._version
+
+    def bind(self, factory: Callable[[], Any]) -> None:
+        """设置创建 LLMWrapper 的函数（每轮调用一次，以获取最新的 API 密钥和模型列表）
+
+        Args:
+            factory: 返回带 probe()、get_models() 方法和 config、retry_policy 属性的对象
+        """
+        self._factory = factory
+
+    def _wrapper(self) -> Any:
+        """创建使用探测超时、不重试的 LLMWrapper"""
+        if self._factory is None:
+            raise RuntimeError("HealthProber.bind() has not been called")
+        llm = self._factory()
+        llm.config = LLMConfig(temperature=0, max_tokens=1, timeout=self.policy.timeout)
+        llm.retry_policy = StreamRetryPolicy(max_attempts=1, first_token_timeout=self.policy.timeout)
+        return llm
+
+    def _record(
+        self,
+        model_id: str,
+        ttft: Optional[float],
+        error: Optional[BaseException],
+        token: Optional[object] = None
+    ) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if token is not None:
+                if self._pending.get(model_id) is not token:
+                    # 该探测已被记为超时（或已有新一轮探测），迟到的结果不再记录
+                    self._counters["late"] += 1
+                    return None
+                del self._pending[model_id]
+            health = self._health.setdefault(model_id, ModelHealth())
+            health.record(ttft, error, self.policy.alpha)
+            self._version += 1
+            self._counters["probes"] += 1
+            if error is not None:
+                self._counters["failures"] += 1
+            return health.snapshot(self.policy.slow_ms)
+
+    def probe(self, model_id: str, llm: Optional[Any] = None, token: Optional[object] = None) -> Optional[Dict[str, Any]]:
+        """探测一个模型并更新其状态
+
+        Args:
+            model_id: 模型 ID
+            llm: LLMWrapper（默认新建一个）
+            token: probe_all 分配的令牌；该探测已被记为超时时结果不再记录
+
+        Returns:
+            Optional[Dict[str, Any]]: 更新后的状态；未配置 API 密钥或结果迟到时为 None
+        """
+        llm = llm or self._wrapper()
+        try:
+            ttft = llm.probe(model_id, self.policy.prompt)
+        except Exception as e:
+            logger.info(f"Health probe for {model_id} failed: {e!r}")
+            return self._record(model_id, None, e, token)
+        if ttft is None:
+            self._skip(model_id, token)
+            return None
+        return self._record(model_id, ttft, None, token)
+
+    def _skip(self, model_id: str, token: Optional[object] = None) -> None:
+        """记录一次跳过的探测（未配置 API 密钥，或本轮结束时仍在排队）"""
+        with self._lock:
+            if token is not None:
+                if self._pending.get(model_id) is not token:
+                    return
+                del self._pending[model_id]
+            self._counters["skipped"] += 1
+
+    def probe_all(self) -> Dict[str, Dict[str, Any]]:
+        """探测所有已启用的模型一轮（并发、限速），超时的探测记为失败
+
+        每个探测的超时从它开始执行时计算，在线程池中排队的时间不计入；本轮结束时
+        仍在排队的探测直接取消并记为跳过（没有请求上游，不影响可用性）。超时后
+        才结束的探测不再重复记录。
+
+        Returns:
+            Dict[str, Dict[str, Any]]: 模型 ID -> 状态
+        """
+        llm = self._wrapper()
+        model_ids: List[str] = llm.get_models()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.policy.concurrency, thread_name_prefix="health-probe")
+        started_at: Dict[str, float] = {}
+
+        def run(model_id: str, token: object) -> Optional[Dict[str, Any]]:
+            started_at[model_id] = time.monotonic()
+            return self.probe(model_id, llm, token)
+
+        futures = {}
+        for i, model_id in enumerate(model_ids):
+            if i and self.policy.rate > 0 and self._stop.wait(1 / self.policy.rate):
+                break
+            token = object()
+            with self._lock:
+                self._pending[model_id] = token
+            futures[model_id] = (self._executor.submit(run, model_id, token), token)
+
+        grace = self.policy.timeout + 1
+        round_deadline = time.monotonic() + grace * math.ceil(len(futures) / self.policy.concurrency)
+        waiting = dict(futures)
+        while waiting:
+            now = time.monotonic()
+            for model_id, (future, token) in list(waiting.items()):
+                started = started_at.get(model_id)
+                if future.done():
+                    del waiting[model_id]
+                elif started is not None and now >= started + grace:
+                    del waiting[model_id]
+                    self._record(model_id, None, TimeoutError(f"probe timed out after {self.policy.timeout:.0f}s"), token)
+                elif started is None and now >= round_deadline and future.cancel():
+                    del waiting[model_id]
+                    self._skip(model_id, token)
+            if waiting:
+                deadlines = [started_at[m] + grace for m in waiting if m in started_at] + [round_deadline]
+                # 排队中的探测随时可能开始，最多等待 0.1 秒后重新检查
+                timeout = min(0.1, max(0.01, min(deadlines) - now))
+                wait([future for future, _ in waiting.values()], timeout=timeout, return_when=FIRST_COMPLETED)
+        with self._lock:
+            self._counters["rounds"] += 1
+        return self.snapshot()
+
+    def _run(self) -> None:
+        """后台线程：每隔 interval 秒探测一轮"""
+        while not self._stop.is_set():
+            try:
+                self.probe_all()
+            except Exception:
+                logger.exception("Health probe round failed")
+            self._stop.wait(self.policy.interval)
+
+    def start(self) -> None:
+        """启动后台探测线程（未启用或重复调用时无效）"""
+        if not self.policy.enabled or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="health-prober", daemon=True)
+        self._thread.start()
+        logger.info(f"Health prober started (every {self.policy.interval:.0f}s)")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """停止后台探测线程"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def health(self, model_id: str) -> Optional[Dict[str, Any]]:
+        """模型的最新状态，尚未探测时为 None"""
+        with self._lock:
+            health = self._health.get(model_id)
+            return health.snapshot(self.policy.slow_ms) if health else None
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """所有已探测模型的状态"""
+        with self._lock:
+            return {model_id: health.snapshot(self.policy.slow_ms) for model_id, health in self._health.items()}
+
+    def stats(self) -> Dict[str, Any]:
+        """探测轮数、探测次数、失败次数、跳过次数（未配置密钥或本轮未轮到）与超时后迟到的结果数"""
+        with self._lock:
+            return {"enabled": self.policy.enabled, "interval": self.policy.interval, **self._counters}
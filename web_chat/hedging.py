@@ -0,0 +1,435 @@
+"""对冲请求（Hedged Requests）
+
+降低首字时间（TTFT）的长尾：主上游在按历史 TTFT 百分位计算的延迟内
+还没有输出首个 token 时，向备用上游发送一个重复请求。备用上游可以是
+同一模型的另一个密钥/端点，也可以是指定的备用模型（models.json 中的
+hedge_to 字段）。哪一路先输出 token 就用哪一路，另一路的连接立即关闭。
+
+- 每个模型保留最近的 TTFT 样本，对冲延迟取其百分位（样本不足时用默认值）
+- 每一路在独立线程中运行，并有自己的取消作用域：适配器通过 on_cancel
+  登记中止连接的回调，失败的一路被取消时阻塞中的读取立即返回
+- 记录对冲率与备用上游胜出率，用于权衡延迟与额外的上游成本
+
+Example:
+    >>> hedger = Hedger(HedgePolicy(enabled=True, percentile=95))
+    >>> for chunk in hedger.stream('qwen', primary, ('qwen-backup', backup)):
+    ...     print(chunk, end='')
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Generator, Iterator, List, Optional, Tuple
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+StreamFactory = Callable[[], Iterator[str]]
+
+# 工作线程发往主线程的消息类型
+_CHUNK = "chunk"
+_DONE = "done"
+_ERROR = "error"
+
+
+@dataclass(frozen=True)
+class HedgePolicy:
+    """对冲策略
+
+    Attributes:
+        enabled: 是否启用对冲
+        percentile: 对冲延迟使用的 TTFT 百分位（0-100）
+        min_delay: 对冲延迟下限（秒）
+        max_delay: 对冲延迟上限（秒）
+        default_delay: 样本不足时使用的对冲延迟（秒）
+        min_samples: 使用百分位前需要的最少样本数
+        window: 每个模型保留的 TTFT 样本数
+    """
+    enabled: bool = False
+    percentile: float = 95.0
+    min_delay: float = 0.25
+    max_delay: float = 5.0
+    default_delay: float = 1.5
+    min_samples: int = 20
+    window: int = 200
+
+
+def hedge_settings_from_env() -> Dict[str, Any]:
+    """从环境变量读取对冲配置
+
+    Returns:
+        Dict[str, Any]: HedgePolicy 的构造参数
+    """
+    return {
+        "enabled": os.environ.get("LLM_HEDGE_ENABLED", "false").lower() == "true",
+        "percentile": float(os.environ.get("LLM_HEDGE_PERCENTILE", 95)),
+        "min_delay": float(os.environ.get("LLM_HEDGE_MIN_DELAY", 0.25)),
+        "max_delay": float(os.environ.get("LLM_HEDGE_MAX_DELAY", 5)),
+        "default_delay": float(os.environ.get("LLM_HEDGE_DEFAULT_DELAY", 1.5))
+    }
+
+
+class HedgeCancelledError(Exception):
+    """对冲中落败的一路已被取消"""
+
+
+class CancelScope:
+    """一路请求的取消作用域
+
+    适配器登记中止上游连接的回调；取消时依次调用。作用域已取消后再登记
+    的回调会被立即调用。
+    """
+
+    def __init__(self) -> None:
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self.cancelled = False
+
+    def add(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """登记取消回调
+
+        Returns:
+            Callable[[], None]: 注销函数。返回后回调保证不会再被调用，
+            因此连接归还连接池之前必须先注销
+        """
+        with self._lock:
+            if self.cancelled:
+                self._run(callback)
+            else:
+                self._callbacks.append(callback)
+
+        def remove() -> None:
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+
+        return remove
+
+    def cancel(self) -> None:
+        """取消作用域并调用所有回调"""
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            # 在锁内调用，保证与 remove() 互斥
+            for callback in self._callbacks:
+                self._run(callback)
+            self._callbacks = []
+
+    @staticmethod
+    def _run(callback: Callable[[], None]) -> None:
+        try:
+            callback()
+        except Exception as e:
+            logger.debug(f"Cancel callback failed: {e}")
+
+
+_local = threading.local()
+
+
+def _noop() -> None:
+    pass
+
+
+@contextmanager
+def use_scope(scope: CancelScope) -> Iterator[CancelScope]:
+    """在当前线程中进入取消作用域
+
+    作用域内的适配器通过 on_cancel 登记的回调会在 scope.cancel() 时被调用。
+
+    Args:
+        scope: 取消作用域
+
+    Yields:
+        CancelScope: 传入的作用域
+    """
+    previous = getattr(_local, "scope", None)
+    _local.scope = scope
+    try:
+        yield scope
+    finally:
+        _local.scope = previous
+
+
+def on_cancel(callback: Callable[[], None]) -> Callable[[], None]:
+    """在当前线程的取消作用域中登记回调（不在对冲请求中时什么也不做）
+
+    Args:
+        callback: 中止上游连接的函数，例如关闭响应
+
+    Returns:
+        Callable[[], None]: 注销函数
+    """
+    scope: Optional[CancelScope] = getattr(_local, "scope", None)
+    if scope is None:
+        return _noop
+    return scope.add(callback)
+
+
+def raise_if_cancelled() -> None:
+    """当前线程所在的一路已被取消时抛出 HedgeCancelledError
+
+    在发出新的上游请求之前调用，避免落败的一路被重试逻辑重新发起请求。
+
+    Raises:
+        HedgeCancelledError: 当前一路已被取消
+    """
+    scope: Optional[CancelScope] = getattr(_local, "scope", None)
+    if scope is not None and scope.cancelled:
+        raise HedgeCancelledError("Hedged request was cancelled")
+
+
+class _ModelStats:
+    """单个模型的 TTFT 样本与对冲计数"""
+
+    def __init__(self, window: int) -> None:
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.requests = 0
+        self.hedged = 0
+        self.backup_wins = 0
+
+
+class Hedger:
+    """对冲请求调度器（线程安全，进程内共享）"""
+
+    def __init__(self, policy: Optional[HedgePolicy] = None) -> None:
+        """初始化调度器
+
+        Args:
+            policy: 对冲策略，默认不启用
+        """
+        self.policy = policy or HedgePolicy()
+        self._models: Dict[str, _ModelStats] = {}
+        self._lock = threading.Lock()
+
+    def _stats_for(self, model_id: str) -> _ModelStats:
+        stats = self._models.get(model_id)
+        if stats is None:
+            stats = self._models.setdefault(model_id, _ModelStats(self.policy.window))
+        return stats
+
+    def record_ttft(self, model_id: str, seconds: float) -> None:
+        """记录一个 TTFT 样本
+
+        Args:
+            model_id: 模型 ID
+            seconds: 首字时间（秒）
+        """
+        with self._lock:
+            self._stats_for(model_id).samples.append(seconds)
+
+    def delay_for(self, model_id: str) -> float:
+        """计算模型当前的对冲延迟
+
+        Args:
+            model_id: 模型 ID
+
+        Returns:
+            float: 历史 TTFT 的百分位，限制在 [min_delay, max_delay] 内
+        """
+        policy = self.policy
+        with self._lock:
+            samples = sorted(self._stats_for(model_id).samples)
+        if len(samples) < policy.min_samples:
+            delay = policy.default_delay
+        else:
+            index = min(len(samples) - 1, int(len(samples) * policy.percentile / 100))
+            delay = samples[index]
+        return min(policy.max_delay, max(policy.min_delay, delay))
+
+    def stream(
+        self,
+        model_id: str,
+        primary: StreamFactory,
+        backup: Optional[Tuple[str, StreamFactory]] = None
+    ) -> Generator[str, None, None]:
+        """以对冲方式执行流式请求
+
+        Args:
+            model_id: 主模型 ID
+            primary: 创建主上游流的函数
+            backup: (备用模型 ID, 创建备用上游流的函数)，为 None 时只记录 TTFT
+
+        Yields:
+            str: 胜出一路的文本片段
+
+        Raises:
+            Exception: 所有上游都在输出首个 token 前失败时，抛出主上游的异常
+        """
+        with self._lock:
+            self._stats_for(model_id).requests += 1
+
+        if backup is None:
+            start = time.monotonic()
+            first = True
+            for chunk in primary():
+                if first:
+                    self.record_ttft(model_id, time.monotonic() - start)
+                    first = False
+                yield chunk
+            return
+
+        yield from self._race(model_id, primary, backup)
+
+    def _race(
+        self,
+        model_id: str,
+        primary: StreamFactory,
+        backup: Tuple[str, StreamFactory]
+    ) -> Generator[str, None, None]:
+        """主上游与备用上游竞速，第一个输出 token 的一路胜出"""
+        backup_id, backup_factory = backup
+        events: "queue.Queue[Tuple[str, str, Any]]" = queue.Queue()
+        scopes: Dict[str, CancelScope] = {}
+        started: Dict[str, float] = {}
+        errors: Dict[str, BaseException] = {}
+
+        def launch(leg: str, factory: StreamFactory) -> None:
+            scope = CancelScope()
+            scopes[leg] = scope
+            started[leg] = time.monotonic()
+            threading.Thread(
+                target=self._run_leg, args=(leg, factory, scope, events),
+                name=f"hedge-{leg}", daemon=True
+            ).start()
+
+        def cancel_race() -> None:
+            # 外层作用域被取消（例如合并请求的最后一个订阅者离开）时中止所有上游
+            events.put(("outer", _ERROR, HedgeCancelledError("Hedged request was cancelled")))
+
+        unregister = on_cancel(cancel_race)
+        delay = self.delay_for(model_id)
+        launch("primary", primary)
+        deadline = started["primary"] + delay
+        winner: Optional[str] = None
+        first_chunk: Optional[str] = None
+
+        try:
+            while winner is None:
+                timeout = None if "backup" in scopes else max(0.0, deadline - time.monotonic())
+                try:
+                    leg, kind, value = events.get(timeout=timeout)
+                except queue.Empty:
+                    logger.info(f"Hedging {model_id} -> {backup_id} after {delay:.2f}s without first token")
+                    launch("backup", backup_factory)
+                    continue
+
+                if leg == "outer":
+                    raise value
+                if kind == _ERROR:
+                    errors[leg] = value
+                    if leg == "primary" and "backup" not in scopes:
+                        # 主上游在首个 token 前失败，立即改用备用上游
+                        logger.info(f"Primary {model_id} failed before first token, hedging to {backup_id}")
+                        launch("backup", backup_factory)
+                    elif len(errors) == len(scopes):
+                        raise errors.get("primary") or value
+                    continue
+
+                winner = leg
+                if kind == _CHUNK:
+                    first_chunk = value
+
+            self._finish_race(model_id, backup_id, winner, scopes, started, "primary" in errors)
+            if first_chunk is None:
+                return  # 胜出的一路正常结束但没有输出
+            yield first_chunk
+
+            while True:
+                leg, kind, value = events.get()
+                if leg == "outer":
+                    raise value
+                if leg != winner:
+                    continue
+                if kind == _CHUNK:
+                    yield value
+                elif kind == _DONE:
+                    return
+                else:
+                    raise value
+        finally:
+            unregister()
+            for scope in scopes.values():
+                scope.cancel()
+
+    def _finish_race(
+        self,
+        model_id: str,
+        backup_id: str,
+        winner: str,
+        scopes: Dict[str, CancelScope],
+        started: Dict[str, float],
+        primary_failed: bool = False
+    ) -> None:
+        """取消失败的一路并记录 TTFT 和对冲统计（主上游在首字前失败时不记录它的样本）"""
+        now = time.monotonic()
+        for leg, scope in scopes.items():
+            if leg != winner:
+                scope.cancel()
+
+        with self._lock:
+            stats = self._stats_for(model_id)
+            # 主上游落败时它的 TTFT 未知，记录已等待的时间作为下限；
+            # 失败的耗时不是 TTFT 的下限，不记录
+            if not primary_failed:
+                stats.samples.append(now - started["primary"])
+            if "backup" in scopes:
+                stats.hedged += 1
+                if winner == "backup":
+                    stats.backup_wins += 1
+                    self._stats_for(backup_id).samples.append(now - started["backup"])
+
+    @staticmethod
+    def _run_leg(
+        leg: str,
+        factory: StreamFactory,
+        scope: CancelScope,
+        events: "queue.Queue[Tuple[str, str, Any]]"
+    ) -> None:
+        """在工作线程中读取一路上游流"""
+        stream: Optional[Iterator[str]] = None
+        with use_scope(scope):
+            try:
+                stream = factory()
+                for chunk in stream:
+                    if scope.cancelled:
+                        return
+                    events.put((leg, _CHUNK, chunk))
+                events.put((leg, _DONE, None))
+            except BaseException as e:
+                if not scope.cancelled:
+                    events.put((leg, _ERROR, e))
+            finally:
+                # 关闭生成器，释放上游连接
+                close = getattr(stream, "close", None)
+                if close is not None:
+                    close()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """获取每个模型的对冲统计
+
+        Returns:
+            Dict[str, Dict[str, Any]]: 模型 ID 到 requests, hedged, hedge_rate,
+            backup_wins, backup_win_rate, delay 的映射
+        """
+        with self._lock:
+            snapshot = {
+                model_id: (stats.requests, stats.hedged, stats.backup_wins)
+                for model_id, stats in self._models.items()
+            }
+        return {
+            model_id: {
+                "requests": requests_count,
+                "hedged": hedged,
+                "hedge_rate": hedged / requests_count if requests_count else 0.0,
+                "backup_wins": backup_wins,
+                "backup_win_rate": backup_wins / hedged if hedged else 0.0,
+                "delay": round(self.delay_for(model_id), 3)
+            }
+            for model_id, (requests_count, hedged, backup_wins) in snapshot.items()
+        }
@@ -0,0 +1,152 @@
+"""JSON 接口的条件请求与预压缩
+
+页面每次加载都会请求 /api/models/list、/api/models 和 /api/config/load，
+以前每次都重新读取文件并序列化完整列表，响应没有校验器也不压缩。本模块：
+
+- 按数据来源的版本号（模型注册表版本、文件修改时间、保存次数等）缓存序列化
+  后的字节，只有版本变化时才重新序列化
+- 同时预先算好 gzip 和 brotli（需要安装 brotli）压缩结果，按 Accept-Encoding
+  选择，小于 min_bytes 的响应不压缩
+- ETag 为响应内容的哈希，If-None-Match 匹配时返回 304，不发送正文
+
+重复加载页面时只需一次版本检查和一次哈希比较。
+
+Example:
+    >>> models_cache = PrecomputedJSON("models")
+    >>> @app.route('/api/models')
+    ... def get_models():
+    ...     return models_cache.response(registry.version, lambda: registry.model_ids())
+"""
+
+import os
+import gzip
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from flask import Response, current_app, request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli 是可选依赖
+    brotli = None
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+def http_cache_settings_from_env() -> Dict[str, Any]:
+    """从环境变量读取预压缩配置
+
+    Returns:
+        Dict[str, Any]: PrecomputedJSON 的构造参数（不含名称）
+    """
+    return {
+        "min_bytes": int(os.environ.get("LLM_HTTP_COMPRESS_MIN_BYTES", 1024)),
+        "gzip_level": int(os.environ.get("LLM_HTTP_GZIP_LEVEL", 9)),
+        "brotli_quality": int(os.environ.get("LLM_HTTP_BROTLI_QUALITY", 11))
+    }
+
+
+@dataclass(frozen=True)
+class _Entry:
+    """一个版本的序列化结果"""
+    version: Hashable
+    etag: str
+    body: bytes
+    encoded: Dict[str, bytes]
+
+
+class PrecomputedJSON:
+    """按版本缓存序列化结果、支持条件请求和预压缩的 JSON 响应（线程安全）"""
+
+    def __init__(
+        self,
+        name: str,
+        min_bytes: int = 1024,
+        gzip_level: int = 9,
+        brotli_quality: int = 11,
+        cache_control: str = "no-cache"
+    ) -> None:
+        """初始化
+
+        Args:
+            name: 名称（用于日志和统计）
+            min_bytes: 小于该大小的响应不压缩
+            gzip_level: gzip 压缩级别（只在版本变化时压缩一次，可以用最高级别）
+            brotli_quality: brotli 压缩质量
+            cache_control: Cache-Control 响应头（默认 no-cache：可以缓存，但每次使用前需要验证）
+        """
+        self.name = name
+        self.min_bytes = min_bytes
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.cache_control = cache_control
+        self._entry: Optional[_Entry] = None
+        self._lock = threading.Lock()
+        self._counters = {"builds": 0, "not_modified": 0, "compressed": 0, "full": 0}
+
+    def _build(self, version: Hashable, payload: Any) -> _Entry:
+        body = current_app.json.dumps(payload).encode("utf-8") + b"\n"
+        encoded: Dict[str, bytes] = {}
+        if len(body) >= self.min_bytes:
+            encoded["gzip"] = gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+            if brotli is not None:
+                encoded["br"] = brotli.compress(body, quality=self.brotli_quality)
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        return _Entry(version, etag, body, encoded)
+
+    def entry(self, version: Hashable, build: Callable[[], Any]) -> _Entry:
+        """获取版本对应的序列化结果，版本变化时调用 build() 重新生成
+
+        Args:
+            version: 数据来源的版本号
+            build: 返回要序列化的数据的函数
+
+        Returns:
+            _Entry: 序列化结果
+        """
+        entry = self._entry
+        if entry is not None and entry.version == version:
+            return entry
+        with self._lock:
+            entry = self._entry
+            if entry is None or entry.version != version:
+                entry = self._build(version, build())
+                self._entry = entry
+                self._counters["builds"] += 1
+                logger.debug(f"Rebuilt {self.name} response ({len(entry.body)} bytes, etag {entry.etag})")
+        return entry
+
+    def response(self, version: Hashable, build: Callable[[], Any]) -> Response:
+        """生成当前请求的响应（304、压缩正文或原始正文）
+
+        Args:
+            version: 数据来源的版本号
+            build: 返回要序列化的数据的函数
+
+        Returns:
+            Response: Flask 响应
+        """
+        entry = self.entry(version, build)
+        headers = {"ETag": f'"{entry.etag}"', "Cache-Control": self.cache_control, "Vary": "Accept-Encoding"}
+        if request.if_none_match.contains_weak(entry.etag):
+            self._counters["not_modified"] += 1
+            return Response(status=304, headers=headers)
+
+        encoding = request.accept_encodings.best_match([name for name in ("br", "gzip") if name in entry.encoded])
+        if encoding:
+            self._counters["compressed"] += 1
+            response = Response(entry.encoded[encoding], mimetype="application/json", headers=headers)
+            response.headers["Content-Encoding"] = encoding
+            return response
+        self._counters["full"] += 1
+        return Response(entry.body, mimetype="application/json", headers=headers)
+
+    def stats(self) -> Dict[str, Any]:
+        """重新生成、304、压缩与未压缩响应的次数，以及当前正文与压缩后的大小"""
+        entry = self._entry
+        sizes = {"identity": len(entry.body), **{k: len(v) for k, v in entry.encoded.items()}} if entry else {}
+        return {**self._counters, "sizes": sizes}
@@ -8,26 +8,40 @@
 
 import os
 import json
-import requests
 import time
-import hmac
+import requests
 import hashlib
-import base64
 import logging
-from typing import Dict, List, Optional, Generator, Any, Union
-from dataclasses import dataclass
-from functools import wraps
+import threading
+from typing import Callable, Dict, List, Optional, Generator, Any, Iterator, Tuple, Union
+from dataclasses import asdict, dataclass
+from functools import partial, wraps
 
 from openai import OpenAI
 import google.genai as genai
 from google.genai import types
 from dotenv import load_dotenv
-from tenacity import (
-    retry,
-    stop_after_attempt,
-    wait_exponential,
-    retry_if_exception_type,
-    before_sleep_log
+
+from client_pool import ClientPool, pool_settings_from_env
+from session_pool import SessionPool, abort_stream, session_pool_settings_from_env, set_read_timeout
+from model_registry import ModelRegistry, compile_builtin_models, load_models_file
+from sse_parser import iter_delta_content, iter_response_bytes
+from hedging import Hedger, HedgePolicy, hedge_settings_from_env, on_cancel, raise_if_cancelled
+from response_cache import ResponseCache, ResponseCachePolicy, cache_key, response_cache_settings_from_env
+from similarity_cache import SimilarityCache, SimilarityCachePolicy, similarity_cache_settings_from_env
+from single_flight import SingleFlight, single_flight_settings_from_env
+from context_window import ContextBudget, fit_messages
+from conversation_store import convert_messages
+from metrics import metrics
+from circuit_breaker import CircuitOpenError, circuit_breakers
+from request_timing import timed
+from credentials import CredentialCache, ZhipuJWTProvider, credential_settings_from_env, sign_zhipu_jwt
+from stream_retry import (
+    StreamInterruptedError,
+    StreamRetryPolicy,
+    retrying_stream,
+    stream_retry_settings_from_env,
+    with_assistant_prefix
 )
 
 # 加载环境变量（优先从 .env 文件）
@@ -39,6 +53,16 @@ logger = logging.getLogger(__name__)
 # 模型配置文件路径
 MODELS_FILE = os.path.join(os.path.dirname(__file__), "models.json")
 
+# 进程级模型注册表，所有 LLMWrapper 实例共享
+model_registry = ModelRegistry(
+    MODELS_FILE,
+    check_interval=float(os.environ.get("LLM_MODELS_CHECK_INTERVAL", 2))
+)
+
+
+class UnsupportedModelError(LookupError):
+    """模型不存在或模型类型未实现"""
+
 
 @dataclass
 class LLMConfig:
@@ -54,34 +78,102 @@ class LLMConfig:
     timeout: int = 30
 
 
-def _retry_generator(*retry_args, **retry_kwargs):
-    """为生成器函数添加重试机制的装饰器
+def _create_openai_client(api_key: str, base_url: Optional[str]) -> OpenAI:
+    """创建 OpenAI 兼容客户端（供连接池使用）"""
+    return OpenAI(api_key=api_key, base_url=base_url)
+
+
+def _create_google_client(api_key: str, base_url: Optional[str]) -> Any:
+    """创建 Google GenAI 客户端（供连接池使用，base_url 可指向代理或本地模拟上游）"""
+    if base_url:
+        client = genai.Client(api_key=api_key, http_options={"base_url": base_url})
+    else:
+        client = genai.Client(api_key=api_key)
+    _track_google_streams(client)
+    return client
+
 
-    Args:
-        *retry_args: tenacity.retry 的位置参数
-        **retry_kwargs: tenacity.retry 的关键字参数
+# 当前线程中 _chat_google 等待的流式响应接收函数
+_google_streams = threading.local()
 
-    Returns:
-        装饰器函数
 
-    Examples:
-        >>> @_retry_generator(
-        ...     stop=stop_after_attempt(3),
-        ...     wait=wait_exponential(multiplier=1, min=4, max=10)
-        ... )
-        ... def my_generator():
-        ...     yield "test"
+def _track_google_streams(client: Any) -> None:
+    """把 google-genai 内部创建的流式 HTTP 响应交给当前线程的 _chat_google
+
+    google-genai 在 generate_content_stream 的生成器内部发起请求，不返回响应对象，
+    对冲落败时无法关闭连接。这里包装客户端的 _request，拿到流式响应后交给
+    _chat_google 登记的取消回调。SDK 内部结构变化时不做包装（落败的一路在下一个
+    片段到达时结束）。
     """
-    def decorator(func):
-        @retry(*retry_args, **retry_kwargs)
-        def wrapper(*args, **kwargs):
-            # 调用原始生成器函数并返回生成器
-            return func(*args, **kwargs)
-        # 保留原始函数的生成器属性
-        if hasattr(func, '__wrapped__'):
-            wrapper.__wrapped__ = func.__wrapped__
-        return wrapper
-    return decorator
+    api_client = getattr(client, "_api_client", None)
+    request = getattr(api_client, "_request", None)
+    if request is None:
+        logger.warning("google-genai client has no _request, Gemini streams cannot be cancelled")
+        return
+
+    def tracked_request(http_request: Any, stream: bool = False) -> Any:
+        response = request(http_request, stream)
+        sink = getattr(_google_streams, "sink", None)
+        if stream and sink is not None and isinstance(response.response_stream, requests.Response):
+            sink(response.response_stream)
+        return response
+
+    api_client._request = tracked_request
+
+
+class _PendingAbort:
+    """取消回调：响应对象在登记回调之后才创建（取消先于响应到达时，响应一到达就中止）"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._response: Optional[requests.Response] = None
+        self._cancelled = False
+
+    def attach(self, response: requests.Response) -> None:
+        with self._lock:
+            self._response = response
+            cancelled = self._cancelled
+        if cancelled:
+            abort_stream(response)
+
+    def cancel(self) -> None:
+        with self._lock:
+            self._cancelled = True
+            response = self._response
+        if response is not None:
+            abort_stream(response)
+
+
+# 进程级 Provider 客户端池，所有 LLMWrapper 实例共享
+client_pool = ClientPool(
+    factories={
+        "openai": _create_openai_client,
+        "google": _create_google_client
+    },
+    **pool_settings_from_env()
+)
+
+# 进程级 HTTP Keep-Alive 会话池，供 requests 类适配器按上游主机复用连接
+session_pool = SessionPool(**session_pool_settings_from_env())
+
+# 流式重试策略（首字前失败重试、中途断开续写、首字时间预算）
+stream_retry_policy = StreamRetryPolicy(**stream_retry_settings_from_env())
+
+# 对冲请求调度器（默认关闭，LLM_HEDGE_ENABLED=true 启用）
+hedger = Hedger(HedgePolicy(**hedge_settings_from_env()))
+
+# 分层响应缓存（默认关闭，LLM_RESPONSE_CACHE_ENABLED=true 启用，按模型选择加入）
+response_cache = ResponseCache(ResponseCachePolicy(**response_cache_settings_from_env()))
+
+# 近似重复问题缓存（默认关闭，LLM_SIMILARITY_CACHE_ENABLED=true 启用，按模型选择加入）
+similarity_cache = SimilarityCache(SimilarityCachePolicy(**similarity_cache_settings_from_env()))
+
+# 相同请求合并（默认关闭，LLM_SINGLE_FLIGHT_ENABLED=true 启用）
+single_flight = SingleFlight(**single_flight_settings_from_env())
+
+# 进程级签名凭据缓存（智谱 JWT 等），所有请求共享
+credential_cache = CredentialCache(**credential_settings_from_env())
+credential_cache.register("zhipu", ZhipuJWTProvider())
 
 
 class LLMWrapper:
@@ -98,7 +190,8 @@ class LLMWrapper:
     def __init__(
         self,
         custom_api_keys: Optional[Dict[str, str]] = None,
-        config: Optional[LLMConfig] = None
+        config: Optional[LLMConfig] = None,
+        retry_policy: Optional[StreamRetryPolicy] = None
     ) -> None:
         """初始化 LLM 包装器
 
@@ -106,11 +199,25 @@ class LLMWrapper:
             custom_api_keys: 前端提供的自定义 API 密钥字典
                 格式: {'GOOGLE_API_KEY': 'sk-...', 'DEEPSEEK_API_KEY': 'sk-...'}
             config: LLM 配置对象，如果为 None 则使用默认配置
+            retry_policy: 流式重试策略，如果为 None 则使用进程级默认策略
         """
         self.custom_api_keys = custom_api_keys or {}
         self.config = config or LLMConfig()
-        # 从环境变量读取配置，提供安全的 API 密钥管理
-        self.configs = self._load_configs()
+        self.retry_policy = retry_policy or stream_retry_policy
+        self.hedger = hedger
+        self.response_cache = response_cache
+        self.similarity_cache = similarity_cache
+        self.single_flight = single_flight
+        self.credentials = credential_cache
+        self.metrics = metrics
+        self.breakers = circuit_breakers
+        # 模型配置来自进程级共享的注册表，API 密钥在使用时才解析
+        self.registry = model_registry
+
+    @property
+    def configs(self) -> Dict[str, Dict[str, Any]]:
+        """当前所有模型的配置（已解析 API 密钥）"""
+        return self._get_configs()
 
     def _get_default_configs(self) -> Dict[str, Dict[str, Any]]:
         """获取默认内置模型配置
@@ -121,89 +228,22 @@ class LLMWrapper:
             Dict[str, Dict[str, Any]]: 默认模型配置字典
         """
         return {
-            "google": {
-                "type": "google",
-                "api_key": self.custom_api_keys.get('GOOGLE_API_KEY') or os.environ.get("GOOGLE_API_KEY", ""),
-                "model": "gemini-2.5-flash"
-            },
-            "deepseek": {
-                "type": "openai",
-                "api_key": self.custom_api_keys.get('DEEPSEEK_API_KEY') or os.environ.get("DEEPSEEK_API_KEY", ""),
-                "base_url": os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com/v1"),
-                "model": "deepseek-chat",
-                "system": "You are a helpful assistant"
-            },
-            "moonshot": {
-                "type": "openai",
-                "api_key": self.custom_api_keys.get('MOONSHOT_API_KEY') or os.environ.get("MOONSHOT_API_KEY", ""),
-                "base_url": os.environ.get("MOONSHOT_BASE_URL", "https://api.moonshot.cn/v1"),
-                "model": "kimi-k2-turbo-preview",
-                "system": "你是一只猫娘，你每回答一次问题都会在最后面加一个：,喵~"
-            },
-            "qwen": {
-                "type": "requests_sse",
-                "url": os.environ.get("QWEN_BASE_URL", "https://api.siliconflow.cn/v1/chat/completions"),
-                "api_key": self.custom_api_keys.get('QWEN_API_KEY') or os.environ.get("QWEN_API_KEY", ""),
-                "model": "Qwen/Qwen2.5-VL-72B-Instruct"
-            },
-            "spark": {
-                "type": "spark_requests",
-                "url": os.environ.get("SPARK_BASE_URL", "https://spark-api-open.xf-yun.com/v2/chat/completions"),
-                "api_key": self.custom_api_keys.get('SPARK_API_KEY') or os.environ.get("SPARK_API_KEY", ""),
-                "model": "x1"
-            }
+            model_id: spec.resolve(self.custom_api_keys)
+            for model_id, spec in compile_builtin_models().items()
         }
 
     def _load_models_from_file(self) -> Dict[str, Dict[str, Any]]:
         """从 models.json 加载自定义模型配置
 
+        直接读取文件，不经过注册表缓存。
+
         Returns:
             Dict[str, Dict[str, Any]]: 自定义模型配置字典，格式为 {"model_id": {config_dict}, ...}
         """
-        if not os.path.exists(MODELS_FILE):
-            return {}
-
-        try:
-            with open(MODELS_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-
-            models_config = {}
-            for model in data.get("models", []):
-                if not model.get("enabled", True):
-                    continue
-
-                model_id = model["id"]
-                api_key_name = model.get("api_key_name", "")
-                config = {
-                    "type": model["type"],
-                    "model": model["model"],
-                    "api_key": self.custom_api_keys.get(api_key_name) or os.environ.get(api_key_name, "")
-                }
-
-                # 根据类型添加可选字段
-                if model["type"] == "openai":
-                    if "base_url" in model:
-                        config["base_url"] = model["base_url"]
-                    if "system" in model:
-                        config["system"] = model["system"]
-                elif model["type"] in ["requests_sse", "spark_requests"]:
-                    if "url" in model:
-                        config["url"] = model["url"]
-                elif model["type"] == "zhipu":
-                    if "base_url" in model:
-                        config["base_url"] = model["base_url"]
-                    if "system" in model:
-                        config["system"] = model["system"]
-                elif model["type"] == "google":
-                    pass  # Google 只需要 api_key 和 model
-
-                models_config[model_id] = config
-
-            return models_config
-
-        except (json.JSONDecodeError, IOError, KeyError) as e:
-            logger.warning(f"Failed to load models from file: {e}")
-            return {}
+        return {
+            model_id: spec.resolve(self.custom_api_keys)
+            for model_id, spec in load_models_file(MODELS_FILE).items()
+        }
 
     def _load_configs(self) -> Dict[str, Dict[str, Any]]:
         """加载模型配置
@@ -225,22 +265,41 @@ class LLMWrapper:
     def _get_configs(self) -> Dict[str, Dict[str, Any]]:
         """获取当前最新的模型配置
 
-        每次调用时重新加载，确保能获取到用户添加的新模型。
+        从注册表读取，注册表在 models.json 变化时自动更新。
 
         Returns:
             Dict[str, Dict[str, Any]]: 最新的模型配置字典
         """
-        return self._load_configs()
+        return {
+            model_id: spec.resolve(self.custom_api_keys)
+            for model_id, spec in self.registry.specs().items()
+        }
+
+    def _resolve_config(self, model_id: str) -> Optional[Dict[str, Any]]:
+        """解析单个模型的配置（字典查找 + 延迟解析 API 密钥）
+
+        Args:
+            model_id: 模型 ID
+
+        Returns:
+            Optional[Dict[str, Any]]: 模型配置，模型不存在时返回 None
+        """
+        spec = self.registry.get(model_id)
+        return spec.resolve(self.custom_api_keys) if spec else None
+
+    def has_model(self, model_id: str) -> bool:
+        """判断模型是否存在"""
+        return model_id in self.registry
 
     def get_models(self) -> List[str]:
         """获取可用的模型列表
 
-        每次调用时重新加载配置，确保返回最新的模型列表。
+        从注册表读取，确保返回最新的模型列表。
 
         Returns:
             List[str]: 可用模型 ID 列表
         """
-        return list(self._get_configs().keys())
+        return self.registry.model_ids()
 
     def chat_stream(
         self,
@@ -249,6 +308,8 @@ class LLMWrapper:
     ) -> Generator[str, None, None]:
         """统一的流式对话接口
 
+        出错时以 "Error: ..." 文本片段的形式输出错误信息，不抛出异常。
+
         Args:
             model_id: 模型 ID
             messages: 消息列表，格式为 [{"role": "user/assistant/system", "content": "..."}, ...]
@@ -261,36 +322,399 @@ class LLMWrapper:
             >>> for chunk in llm.chat_stream('deepseek', messages):
             ...     print(chunk, end='', flush=True)
         """
-        logger.info(f"Starting chat stream for {model_id}")
-        # 动态获取配置，确保使用最新的模型列表
-        config = self._get_configs().get(model_id)
-        if not config:
-            logger.error(f"Unknown model: {model_id}")
-            yield "Error: Unknown model"
-            return
-
         try:
-            if config["type"] == "google":
-                yield from self._chat_google(config, messages)
-            elif config["type"] == "openai":
-                yield from self._chat_openai(config, messages)
-            elif config["type"] == "requests_sse":
-                yield from self._chat_qwen(config, messages)
-            elif config["type"] == "spark_requests":
-                yield from self._chat_spark(config, messages)
-            elif config["type"] == "zhipu":
-                yield from self._chat_zhipu(config, messages)
-            else:
-                logger.error(f"Unimplemented model type: {config['type']}")
-                yield "Error: Unimplemented model type"
+            yield from self.iter_chat(model_id, messages)
+        except (UnsupportedModelError, CircuitOpenError) as e:
+            yield f"Error: {str(e)}"
         except Exception as e:
             logger.exception(f"Error during chat stream for {model_id}")
             yield f"Error: {str(e)}"
 
+    def iter_chat(
+        self,
+        model_id: str,
+        messages: List[Dict[str, str]]
+    ) -> Generator[str, None, None]:
+        """流式对话（出错时抛出异常，供批量任务等需要区分成功与失败的调用方使用）
+
+        Args:
+            model_id: 模型 ID
+            messages: 消息列表
+
+        Yields:
+            str: 流式响应的文本片段
+
+        Raises:
+            UnsupportedModelError: 模型不存在或类型未实现
+            Exception: 上游请求失败
+        """
+        logger.info(f"Starting chat stream for {model_id}")
+        with timed("config"):
+            # 从注册表查找配置，确保使用最新的模型列表
+            config = self._resolve_config(model_id)
+            if not config:
+                logger.error(f"Unknown model: {model_id}")
+                raise UnsupportedModelError("Unknown model")
+
+            adapter = self._adapter_for(config["type"])
+            if adapter is None:
+                logger.error(f"Unimplemented model type: {config['type']}")
+                raise UnsupportedModelError("Unimplemented model type")
+
+            config, messages = self._fit_context(config, messages)
+
+        def upstream() -> Iterator[str]:
+            if self.hedger.policy.enabled:
+                return self._hedged_stream(model_id, config, messages)
+            return self._upstream(model_id, config, adapter, messages)
+
+        cached = self._with_caches(model_id, config, messages, upstream)
+        if self.single_flight.enabled:
+            stream = self.single_flight.stream(self._flight_key(model_id, config, messages), cached)
+        else:
+            stream = cached()
+        yield from self.metrics.instrument("chat", model_id, config["type"], stream)
+
+    def probe(self, model_id: str, prompt: str = "ping") -> Optional[float]:
+        """发送一个最小的流式请求，测量首字时间（供健康探测使用）
+
+        直接调用适配器：不经过缓存、请求合并、对冲、熔断器和指标，
+        收到第一个片段后立即关闭上游流。超时与重试由本实例的
+        config.timeout 和 retry_policy 决定。
+
+        Args:
+            model_id: 模型 ID
+            prompt: 探测使用的用户消息
+
+        Returns:
+            Optional[float]: 首字时间（秒，上游没有输出时为总耗时）；
+            未配置 API 密钥时为 None（不发出请求）
+
+        Raises:
+            UnsupportedModelError: 模型不存在或类型未实现
+            Exception: 上游请求失败
+        """
+        config = self._resolve_config(model_id)
+        adapter = self._adapter_for(config["type"]) if config else None
+        if adapter is None:
+            raise UnsupportedModelError("Unknown model" if not config else "Unimplemented model type")
+        if not config.get("api_key"):
+            return None
+
+        started = time.perf_counter()
+        stream = adapter({**config, "max_tokens": 1}, [{"role": "user", "content": prompt}])
+        try:
+            next(stream, None)
+        finally:
+            stream.close()
+        return time.perf_counter() - started
+
+    def _adapter_for(self, model_type: str) -> Optional[Any]:
+        """根据 API 类型获取适配器方法
+
+        Args:
+            model_type: API 类型
+
+        Returns:
+            Optional[Any]: 适配器方法，未实现的类型返回 None
+        """
+        return {
+            "google": self._chat_google,
+            "openai": self._chat_openai,
+            "requests_sse": self._chat_qwen,
+            "spark_requests": self._chat_spark,
+            "zhipu": self._chat_zhipu
+        }.get(model_type)
+
+    def _fit_context(
+        self,
+        config: Dict[str, Any],
+        messages: List[Dict[str, str]]
+    ) -> Tuple[Dict[str, Any], List[Dict[str, str]]]:
+        """按模型的上下文预算裁剪历史消息并计算 max_tokens（见 context_window.py）
+
+        没有声明 context_length 的模型原样返回。
+
+        Args:
+            config: 模型配置字典
+            messages: 消息列表
+
+        Returns:
+            Tuple[Dict[str, Any], List[Dict[str, str]]]: (带 max_tokens 的新配置, 裁剪后的消息)
+        """
+        budget = ContextBudget.from_config(config, self.config.max_tokens)
+        if budget is None:
+            return config, messages
+        fitted = fit_messages(messages, budget, system=config.get("system", ""))
+        return {**config, "max_tokens": fitted.max_tokens}, fitted.messages
+
+    def _with_caches(
+        self,
+        model_id: str,
+        config: Dict[str, Any],
+        messages: List[Dict[str, str]],
+        upstream: Callable[[], Any],
+        asynchronous: bool = False
+    ) -> Callable[[], Any]:
+        """在上游流外面依次套上近似重复缓存和精确响应缓存
+
+        精确缓存在最外层先查；未命中时再查近似重复缓存（只处理单轮请求），
+        都未命中才访问上游。未启用的缓存层不套。
+
+        Args:
+            model_id: 模型 ID
+            config: 模型配置字典
+            messages: 消息列表
+            upstream: 创建上游流的函数
+            asynchronous: upstream 返回的是否为异步生成器
+
+        Returns:
+            Callable[[], Any]: 创建（带缓存的）流的函数
+        """
+        if self.similarity_cache.enabled_for(model_id, config):
+            single_turn = self.similarity_cache.single_turn_prompt(config, messages)
+            if single_turn is not None:
+                system, prompt = single_turn
+                similar_stream = self.similarity_cache.astream if asynchronous else self.similarity_cache.stream
+                upstream = partial(similar_stream, model_id, system, prompt, upstream)
+
+        if self.response_cache.enabled_for(model_id, config):
+            key = self._cache_key(model_id, config, messages)
+            exact_stream = self.response_cache.astream if asynchronous else self.response_cache.stream
+            upstream = partial(exact_stream, key, model_id, upstream)
+
+        return upstream
+
+    def _cache_key(
+        self,
+        model_id: str,
+        config: Dict[str, Any],
+        messages: List[Dict[str, str]]
+    ) -> str:
+        """计算响应缓存键（超时时间不影响回答内容，不参与计算）"""
+        params = asdict(self.config)
+        params.pop("timeout", None)
+        return cache_key(model_id, config, messages, params)
+
+    def _flight_key(
+        self,
+        model_id: str,
+        config: Dict[str, Any],
+        messages: List[Dict[str, str]]
+    ) -> str:
+        """计算请求合并键
+
+        在响应缓存键的基础上加入 API 密钥的哈希：使用不同密钥的请求不合并，
+        避免一个用户的请求消耗另一个用户的额度。
+        """
+        key_digest = hashlib.sha256(config.get("api_key", "").encode("utf-8")).hexdigest()[:16]
+        return f"{self._cache_key(model_id, config, messages)}:{key_digest}"
+
+    def _hedged_stream(
+        self,
+        model_id: str,
+        config: Dict[str, Any],
+        messages: List[Dict[str, str]]
+    ) -> Generator[str, None, None]:
+        """以对冲方式执行流式请求（见 hedging.py）
+
+        备用上游由模型配置的 hedge_to 字段指定：可以是同一模型使用另一个
+        密钥或端点的条目，也可以是另一个模型。没有备用上游时只记录 TTFT。
+
+        Args:
+            model_id: 模型 ID
+            config: 模型配置字典
+            messages: 消息列表
+
+        Yields:
+            str: 胜出一路的文本片段
+        """
+        adapter = self._adapter_for(config["type"])
+        backup = None
+        backup_id = config.get("hedge_to")
+        if backup_id and backup_id != model_id:
+            backup_config = self._resolve_config(backup_id)
+            backup_adapter = self._adapter_for(backup_config["type"]) if backup_config else None
+            if backup_adapter is not None:
+                backup_config, backup_messages = self._fit_context(backup_config, messages)
+                backup = (backup_id, lambda: self._upstream(
+                    backup_id, backup_config, backup_adapter, backup_messages
+                ))
+            else:
+                logger.warning(f"Hedge target {backup_id} for {model_id} is not available")
+
+        yield from self.hedger.stream(
+            model_id,
+            lambda: self._upstream(model_id, config, adapter, messages),
+            backup
+        )
+
+    def _upstream(
+        self,
+        model_id: str,
+        config: Dict[str, Any],
+        adapter: Callable[[Dict[str, Any], List[Dict[str, str]]], Iterator[str]],
+        messages: List[Dict[str, str]]
+    ) -> Iterator[str]:
+        """在端点熔断器保护下调用适配器，并记录上游指标"""
+        stream = self.breakers.guard(config, adapter(config, messages))
+        return self.metrics.instrument("upstream", model_id, config["type"], stream)
+
+    def unavailable(self, model_id: str) -> Optional[CircuitOpenError]:
+        """请求前检查模型的上游端点是否处于熔断状态
+
+        启用了响应缓存、近似重复缓存或对冲备用上游的模型不在请求前拒绝，
+        因为缓存命中或备用上游仍可能返回结果（上游流本身仍受熔断器保护）。
+
+        Args:
+            model_id: 模型 ID
+
+        Returns:
+            Optional[CircuitOpenError]: 熔断器打开时返回对应的错误，否则为 None
+        """
+        config = self._resolve_config(model_id)
+        if not config:
+            return None
+        if (self.response_cache.enabled_for(model_id, config)
+                or self.similarity_cache.enabled_for(model_id, config)
+                or (self.hedger.policy.enabled and config.get("hedge_to"))):
+            return None
+        return self.breakers.check(config)
+
+    def _inject_system_prompt(
+        self,
+        config: Dict[str, Any],
+        messages: List[Dict[str, str]]
+    ) -> List[Dict[str, str]]:
+        """注入系统提示词（如果在配置中定义且消息中不存在）
+
+        Args:
+            config: 模型配置字典
+            messages: 消息列表
+
+        Returns:
+            List[Dict[str, str]]: 新的消息列表（不修改原列表）
+        """
+        params_messages = list(messages)
+        if "system" in config:
+            if not params_messages or params_messages[0]["role"] != "system":
+                params_messages.insert(0, {"role": "system", "content": config["system"]})
+        return params_messages
+
+    def _to_google_contents(self, messages: List[Dict[str, str]]) -> List[types.Content]:
+        """转换消息为 Google 格式
+
+        服务端对话的消息带有转换缓存，每轮只转换新增的消息。
+
+        Args:
+            messages: 消息列表
+
+        Returns:
+            List[types.Content]: Google GenAI 的 Content 列表
+        """
+        return convert_messages(messages, "google", self._to_google_content)
+
+    @staticmethod
+    def _to_google_content(msg: Dict[str, str]) -> Optional[types.Content]:
+        """转换单条消息为 Google 格式（系统消息返回 None）"""
+        # 跳过系统消息（Google 简单映射不直接支持）
+        if msg["role"] == "system":
+            return None
+        role = "user" if msg["role"] == "user" else "model"
+        return types.Content(role=role, parts=[types.Part(text=msg["content"])])
+
+    def _prepare_qwen_request(
+        self,
+        config: Dict[str, Any],
+        messages: List[Dict[str, str]]
+    ) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """构建 Qwen（SiliconFlow）请求
+
+        Returns:
+            Tuple[str, Dict[str, str], Dict[str, Any]]: (url, headers, payload)
+        """
+        headers = {
+            "Authorization": f"Bearer {config['api_key']}",
+            "Content-Type": "application/json"
+        }
+        payload = {
+            "model": config["model"],
+            "messages": messages,
+            "stream": True,
+            "max_tokens": config.get("max_tokens", self.config.max_tokens)
+        }
+        return config["url"], headers, payload
+
+    def _prepare_spark_request(
+        self,
+        config: Dict[str, Any],
+        messages: List[Dict[str, str]]
+    ) -> Optional[Tuple[str, Dict[str, str], Dict[str, Any]]]:
+        """构建 Spark 请求
+
+        Spark 原始脚本只使用最后一条消息，我们尊重这个行为以确保 Spark 正常工作。
+
+        Returns:
+            Optional[Tuple[str, Dict[str, str], Dict[str, Any]]]: (url, headers, body)，
+                没有用户消息时返回 None
+        """
+        # Spark 格式化
+        auth = config["api_key"]
+        if not auth.startswith("Bearer "):
+            auth = f"Bearer {auth}"
+
+        headers = {
+            'Authorization': auth,
+            'content-type': "application/json"
+        }
+
+        last_user_msg = next((m for m in reversed(messages) if m["role"] == "user"), None)
+        if not last_user_msg:
+            logger.warning("No user message found for Spark API")
+            return None
+
+        body = {
+            "model": config["model"],
+            "user": "web_user",
+            "messages": [{"role": "user", "content": last_user_msg["content"]}],
+            "stream": True
+        }
+        return config["url"], headers, body
+
+    def _prepare_zhipu_request(
+        self,
+        config: Dict[str, Any],
+        messages: List[Dict[str, str]]
+    ) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """构建智谱 AI 请求（生成 JWT Token 并注入系统提示词）
+
+        Returns:
+            Tuple[str, Dict[str, str], Dict[str, Any]]: (url, headers, payload)
+        """
+        base_url = config.get("base_url", "https://open.bigmodel.cn/api/paas/v4")
+
+        # JWT Token 按密钥缓存，过期前才重新签名
+        token = self.credentials.get("zhipu", config["api_key"])
+
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json"
+        }
+
+        payload = {
+            "model": config["model"],
+            "messages": self._inject_system_prompt(config, messages),
+            "stream": True
+        }
+        if "max_tokens" in config:
+            payload["max_tokens"] = config["max_tokens"]
+        return f"{base_url}/chat/completions", headers, payload
+
     def _parse_sse_stream(self, response: requests.Response) -> Generator[str, None, None]:
         """通用的 SSE 流式响应解析器
 
-        解析 Server-Sent Events 格式的流式响应。
+        解析 Server-Sent Events 格式的流式响应，使用字节级增量解析器
+        （见 sse_parser.py），遇到 data: [DONE] 时结束。
 
         Args:
             response: requests.Response 对象
@@ -298,22 +722,48 @@ class LLMWrapper:
         Yields:
             str: 解析出的文本内容
         """
-        for line in response.iter_lines():
-            if not line:
-                continue
-            line_str = line.decode('utf-8')
-            if line_str.startswith('data: '):
-                data_str = line_str[6:].strip()
-                if data_str == '[DONE]':
-                    break
-                try:
-                    data = json.loads(data_str)
-                    content = data["choices"][0]["delta"].get("content", "")
-                    if content:
-                        yield content
-                except (json.JSONDecodeError, KeyError, IndexError) as e:
-                    logger.debug(f"Failed to parse SSE chunk: {e}")
-                    continue
+        yield from iter_delta_content(iter_response_bytes(response))
+
+    def _stream_sse(
+        self,
+        url: str,
+        headers: Dict[str, str],
+        payload: Dict[str, Any]
+    ) -> Generator[str, None, None]:
+        """通过会话池发送一次流式请求并解析 SSE（不含重试）
+
+        首个 token 之前的读超时使用首字时间预算，收到首个 token 后恢复为
+        正常读超时。
+
+        Args:
+            url: 请求 URL
+            headers: 请求头
+            payload: 请求体
+
+        Yields:
+            str: 响应文本片段
+        """
+        # 对冲请求中落败的一路不再发起新请求（包括重试）
+        raise_if_cancelled()
+        first_token_timeout = self.retry_policy.first_token_timeout or self.config.timeout
+        with session_pool.stream(
+            url,
+            json=payload,
+            headers=headers,
+            timeout=(self.config.timeout, first_token_timeout)
+        ) as response:
+            # 落败时从调度线程立即中止读取；连接归还连接池前必须注销
+            unregister = on_cancel(lambda: abort_stream(response))
+            try:
+                response.raise_for_status()
+                waiting_first_token = first_token_timeout != self.config.timeout
+                for chunk in self._parse_sse_stream(response):
+                    if waiting_first_token:
+                        set_read_timeout(response, self.config.timeout)
+                        waiting_first_token = False
+                    yield chunk
+            finally:
+                unregister()
 
     def _chat_google(
         self,
@@ -329,38 +779,41 @@ class LLMWrapper:
         Yields:
             str: 响应文本片段
         """
-        client = genai.Client(api_key=config["api_key"])
-
-        # 转换消息为 Google 格式
-        google_contents = []
-        for msg in messages:
-            role = "user" if msg["role"] == "user" else "model"
-            # 跳过系统消息（Google 简单映射不直接支持）
-            if msg["role"] == "system":
-                continue
-            google_contents.append(types.Content(role=role, parts=[types.Part(text=msg["content"])]))
+        google_contents = self._to_google_contents(messages)
 
         # 处理空历史情况
         if not google_contents:
             logger.warning("No valid messages for Google API")
             return
 
-        # 使用流式生成
-        try:
-            for chunk in client.models.generate_content_stream(
-                model=config["model"],
-                contents=google_contents
-            ):
-                if chunk.text:
-                    yield chunk.text
-        except AttributeError:
-            # 回退到非流式（如果方法不同）
-            logger.info("Falling back to non-streaming for Google API")
-            response = client.models.generate_content(
-                model=config["model"],
-                contents=google_contents
-            )
-            yield response.text
+        # 对冲请求中落败的一路不再发起新请求
+        raise_if_cancelled()
+        # 使用流式生成（客户端从连接池租借，流结束或被放弃时归还）
+        with client_pool.lease("google", config["api_key"], config.get("base_url")) as client:
+            # 对冲请求落败时由调度器中止 SDK 内部的流式响应
+            pending = _PendingAbort()
+            unregister = on_cancel(pending.cancel)
+            _google_streams.sink = pending.attach
+            try:
+                for chunk in client.models.generate_content_stream(
+                    model=config["model"],
+                    contents=google_contents
+                ):
+                    if chunk.text:
+                        yield chunk.text
+            except AttributeError:
+                # 中止后的读取错误不能触发回退（否则会重新发起请求）
+                raise_if_cancelled()
+                # 回退到非流式（如果方法不同）
+                logger.info("Falling back to non-streaming for Google API")
+                response = client.models.generate_content(
+                    model=config["model"],
+                    contents=google_contents
+                )
+                yield response.text
+            finally:
+                _google_streams.sink = None
+                unregister()
 
     def _chat_openai(
         self,
@@ -376,33 +829,29 @@ class LLMWrapper:
         Yields:
             str: 响应文本片段
         """
-        client = OpenAI(api_key=config["api_key"], base_url=config["base_url"])
-
-        # 注入系统提示词（如果在配置中定义且消息中不存在）
-        params_messages = list(messages)
-        if "system" in config:
-            if not params_messages or params_messages[0]["role"] != "system":
-                params_messages.insert(0, {"role": "system", "content": config["system"]})
-
-        completion = client.chat.completions.create(
-            model=config["model"],
-            messages=params_messages,
-            stream=True,
-            temperature=self.config.temperature,
-            max_tokens=self.config.max_tokens
-        )
+        params_messages = self._inject_system_prompt(config, messages)
+
+        # 客户端从连接池租借，复用其内部的 httpx 连接
+        with client_pool.lease("openai", config["api_key"], config["base_url"]) as client:
+            with timed("connect"):
+                completion = client.chat.completions.create(
+                    model=config["model"],
+                    messages=params_messages,
+                    stream=True,
+                    temperature=self.config.temperature,
+                    max_tokens=config.get("max_tokens", self.config.max_tokens)
+                )
+
+            # 对冲请求落败时由调度器关闭响应
+            unregister = on_cancel(lambda: completion.close())
+            try:
+                for chunk in completion:
+                    content = chunk.choices[0].delta.content
+                    if content:
+                        yield content
+            finally:
+                unregister()
 
-        for chunk in completion:
-            content = chunk.choices[0].delta.content
-            if content:
-                yield content
-
-    @_retry_generator(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=4, max=10),
-        retry=retry_if_exception_type((requests.exceptions.RequestException, requests.exceptions.HTTPError)),
-        before_sleep=before_sleep_log(logger, logging.INFO)
-    )
     def _chat_qwen(
         self,
         config: Dict[str, Any],
@@ -410,7 +859,8 @@ class LLMWrapper:
     ) -> Generator[str, None, None]:
         """Qwen 聊天方法（HTTP + SSE）
 
-        带有自动重试机制，网络临时故障时最多重试 3 次。
+        首个 token 之前的网络故障按退避策略重试；已输出部分内容后断开时，
+        带上已输出的内容续写（见 stream_retry.py）。
 
         Args:
             config: 模型配置字典
@@ -420,36 +870,17 @@ class LLMWrapper:
             str: 响应文本片段
 
         Raises:
-            requests.exceptions.RequestException: 网络请求失败（重试 3 次后）
+            requests.exceptions.RequestException: 网络请求失败（重试耗尽后）
+            StreamInterruptedError: 输出部分内容后中断且续写失败
         """
-        headers = {
-            "Authorization": f"Bearer {config['api_key']}",
-            "Content-Type": "application/json"
-        }
-        payload = {
-            "model": config["model"],
-            "messages": messages,
-            "stream": True,
-            "max_tokens": self.config.max_tokens
-        }
+        def open_stream(prefix: str) -> Generator[str, None, None]:
+            request = self._prepare_qwen_request(config, with_assistant_prefix(messages, prefix))
+            return self._stream_sse(*request)
 
-        response = requests.post(
-            config["url"],
-            json=payload,
-            headers=headers,
-            stream=True,
-            timeout=self.config.timeout
+        yield from retrying_stream(
+            open_stream, self.retry_policy, resumable=True, description="qwen", breaker=self.breakers.get(config)
         )
-        response.raise_for_status()
 
-        yield from self._parse_sse_stream(response)
-
-    @_retry_generator(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=4, max=10),
-        retry=retry_if_exception_type((requests.exceptions.RequestException, requests.exceptions.HTTPError)),
-        before_sleep=before_sleep_log(logger, logging.INFO)
-    )
     def _chat_spark(
         self,
         config: Dict[str, Any],
@@ -457,9 +888,10 @@ class LLMWrapper:
     ) -> Generator[str, None, None]:
         """Spark 聊天方法（HTTP + SSE）
 
-        带有自动重试机制，网络临时故障时最多重试 3 次。
+        首个 token 之前的网络故障按退避策略重试。
 
-        注意：Spark API 不支持对话历史，每次只发送最后一条用户消息。
+        注意：Spark API 不支持对话历史，每次只发送最后一条用户消息，因此
+        无法续写，中途断开时抛出 StreamInterruptedError。
 
         Args:
             config: 模型配置字典
@@ -469,45 +901,23 @@ class LLMWrapper:
             str: 响应文本片段
 
         Raises:
-            requests.exceptions.RequestException: 网络请求失败（重试 3 次后）
+            requests.exceptions.RequestException: 网络请求失败（重试耗尽后）
+            StreamInterruptedError: 输出部分内容后中断
         """
-        # Spark 格式化
-        auth = config["api_key"]
-        if not auth.startswith("Bearer "):
-            auth = f"Bearer {auth}"
-
-        headers = {
-            'Authorization': auth,
-            'content-type': "application/json"
-        }
-
-        # Spark 原始脚本只使用最后一条消息
-        # 我们尊重这个行为以确保 Spark 正常工作
-        last_user_msg = next((m for m in reversed(messages) if m["role"] == "user"), None)
-        if not last_user_msg:
-            logger.warning("No user message found for Spark API")
+        request = self._prepare_spark_request(config, messages)
+        if request is None:
             return
 
-        body = {
-            "model": config["model"],
-            "user": "web_user",
-            "messages": [{"role": "user", "content": last_user_msg["content"]}],
-            "stream": True
-        }
-
-        response = requests.post(
-            config["url"],
-            json=body,
-            headers=headers,
-            stream=True,
-            timeout=self.config.timeout
+        yield from retrying_stream(
+            lambda prefix: self._stream_sse(*request),
+            self.retry_policy,
+            resumable=False,
+            description="spark",
+            breaker=self.breakers.get(config)
         )
-        response.raise_for_status()
-
-        yield from self._parse_sse_stream(response)
 
     def _generate_zhipu_token(self, api_key: str) -> str:
-        """生成智谱 AI 的 JWT Token
+        """生成智谱 AI 的 JWT Token（不经过缓存，请求路径使用 self.credentials）
 
         Args:
             api_key: API 密钥，格式为 id.secret
@@ -518,53 +928,8 @@ class LLMWrapper:
         Raises:
             ValueError: 如果 API Key 格式错误
         """
-        try:
-            id, secret = api_key.split('.')
-        except ValueError:
-            raise ValueError("智谱 API Key 格式错误，应为 id.secret")
-
-        # Token 有效期：1小时
-        exp = int(time.time()) + 3600
-
-        header = {
-            "alg": "HS256",
-            "sign_type": "SIGN"
-        }
-
-        payload = {
-            "api_key": id,
-            "exp": exp,
-            "timestamp": int(time.time())
-        }
+        return sign_zhipu_jwt(api_key)
 
-        # 编码 header
-        header_b64 = base64.urlsafe_b64encode(
-            json.dumps(header, separators=(',', ':')).encode()
-        ).decode().rstrip('=')
-
-        # 编码 payload
-        payload_b64 = base64.urlsafe_b64encode(
-            json.dumps(payload, separators=(',', ':')).encode()
-        ).decode().rstrip('=')
-
-        # 生成签名
-        message = f"{header_b64}.{payload_b64}"
-        signature = hmac.new(
-            secret.encode(),
-            message.encode(),
-            hashlib.sha256
-        ).digest()
-
-        signature_b64 = base64.urlsafe_b64encode(signature).decode().rstrip('=')
-
-        return f"{message}.{signature_b64}"
-
-    @_retry_generator(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=4, max=10),
-        retry=retry_if_exception_type((requests.exceptions.RequestException, requests.exceptions.ConnectionError)),
-        before_sleep=before_sleep_log(logger, logging.INFO)
-    )
     def _chat_zhipu(
         self,
         config: Dict[str, Any],
@@ -572,7 +937,8 @@ class LLMWrapper:
     ) -> Generator[str, None, None]:
         """智谱 AI (GLM) 聊天方法（使用 JWT Token 认证）
 
-        带有自动重试机制，网络临时故障时最多重试 3 次。
+        首个 token 之前的网络故障按退避策略重试；已输出部分内容后断开时，
+        带上已输出的内容续写。
 
         Args:
             config: 模型配置字典
@@ -582,37 +948,13 @@ class LLMWrapper:
             str: 响应文本片段
 
         Raises:
-            requests.exceptions.RequestException: 网络请求失败（重试 3 次后）
+            requests.exceptions.RequestException: 网络请求失败（重试耗尽后）
+            StreamInterruptedError: 输出部分内容后中断且续写失败
         """
-        base_url = config.get("base_url", "https://open.bigmodel.cn/api/paas/v4")
-
-        # 生成 JWT Token
-        token = self._generate_zhipu_token(config["api_key"])
-
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
-
-        # 注入系统提示词
-        params_messages = list(messages)
-        if "system" in config:
-            if not params_messages or params_messages[0]["role"] != "system":
-                params_messages.insert(0, {"role": "system", "content": config["system"]})
-
-        payload = {
-            "model": config["model"],
-            "messages": params_messages,
-            "stream": True
-        }
+        def open_stream(prefix: str) -> Generator[str, None, None]:
+            request = self._prepare_zhipu_request(config, with_assistant_prefix(messages, prefix))
+            return self._stream_sse(*request)
 
-        response = requests.post(
-            f"{base_url}/chat/completions",
-            json=payload,
-            headers=headers,
-            stream=True,
-            timeout=self.config.timeout
+        yield from retrying_stream(
+            open_stream, self.retry_policy, resumable=True, description="zhipu", breaker=self.breakers.get(config)
         )
-
-        response.raise_for_status()
-        yield from self._parse_sse_stream(response)
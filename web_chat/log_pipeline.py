@@ -0,0 +1,323 @@
+"""非阻塞、可采样的结构化日志
+
+以前 app.py 使用同步的 logging.FileHandler('web_chat.log')：请求路径上的每次
+logger.info / warning 都在服务线程中等待磁盘写入，日志文件也不会轮转。本模块
+把日志写入移到后台线程：
+
+- 服务线程只把日志记录放入有界队列（QueueHandler），队列满时丢弃并计数，从不阻塞
+- 后台线程（QueueListener）写控制台和日志文件，日志文件按大小或按时间轮转
+- 可选 JSON 输出（python-json-logger，未安装时回退到文本格式）
+- 按日志器名称对 INFO 及以下级别的记录采样（WARNING 及以上总是保留）
+
+Example:
+    >>> pipeline = configure_logging(path="web_chat.log", fmt="json", sampling={"werkzeug": 0.1})
+    >>> logging.getLogger("llm_wrapper").info("Starting chat stream")  # 只是放入队列
+    >>> pipeline.flush()
+"""
+
+import os
+import math
+import queue
+import atexit
+import logging
+import itertools
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from typing import Any, Dict, List, Optional
+
+try:
+    from pythonjsonlogger import jsonlogger
+except ImportError:  # pragma: no cover - python-json-logger 是可选依赖
+    jsonlogger = None
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 文本格式（与以前的 basicConfig 相同）
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# JSON 格式包含的字段（extra 传入的字段也会输出）
+JSON_FORMAT = "%(asctime)s %(name)s %(levelname)s %(message)s"
+
+# 当前生效的根日志管道
+_pipeline: Optional["LogPipeline"] = None
+_pipeline_lock = threading.Lock()
+
+
+def log_settings_from_env() -> Dict[str, Any]:
+    """从环境变量读取日志配置
+
+    Returns:
+        Dict[str, Any]: configure_logging 的参数
+    """
+    sampling = {}
+    for entry in os.environ.get("LLM_LOG_SAMPLING", "").split(","):
+        name, _, rate = entry.partition("=")
+        if name.strip() and rate.strip():
+            sampling[name.strip()] = float(rate)
+    return {
+        "level": os.environ.get("LLM_LOG_LEVEL", "INFO").upper(),
+        "path": os.environ.get("LLM_LOG_FILE", "web_chat.log"),
+        "fmt": os.environ.get("LLM_LOG_FORMAT", "text").lower(),
+        "max_bytes": int(os.environ.get("LLM_LOG_MAX_BYTES", 10 * 1024 * 1024)),
+        "backup_count": int(os.environ.get("LLM_LOG_BACKUP_COUNT", 5)),
+        "rotate_when": os.environ.get("LLM_LOG_ROTATE_WHEN", ""),
+        "queue_size": int(os.environ.get("LLM_LOG_QUEUE_SIZE", 10000)),
+        "sampling": sampling
+    }
+
+
+def build_formatter(fmt: str = "text") -> logging.Formatter:
+    """创建格式化器
+
+    Args:
+        fmt: "text" 或 "json"
+
+    Returns:
+        logging.Formatter: 格式化器（未安装 python-json-logger 时 JSON 回退为文本）
+    """
+    if fmt == "json":
+        if jsonlogger is not None:
+            return jsonlogger.JsonFormatter(JSON_FORMAT, json_ensure_ascii=False)
+        logger.warning("python-json-logger is not installed, falling back to text logs")
+    return logging.Formatter(TEXT_FORMAT)
+
+
+def file_handler(
+    path: str,
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5,
+    rotate_when: str = ""
+) -> logging.Handler:
+    """创建轮转的日志文件处理器
+
+    Args:
+        path: 日志文件路径
+        max_bytes: 按大小轮转的阈值（字节），0 表示不按大小轮转
+        backup_count: 保留的历史文件数
+        rotate_when: 按时间轮转的周期（如 "midnight"、"H"），设置时不再按大小轮转
+
+    Returns:
+        logging.Handler: RotatingFileHandler 或 TimedRotatingFileHandler
+    """
+    if rotate_when:
+        return TimedRotatingFileHandler(path, when=rotate_when, backupCount=backup_count, encoding="utf-8", delay=True)
+    return RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+
+
+class SamplingFilter(logging.Filter):
+    """按日志器名称对 INFO 及以下级别的记录采样
+
+    rates 的键是日志器名称前缀（"llm_wrapper" 同时匹配 "llm_wrapper.xxx"，最长前缀
+    优先），值是保留比例。采样是确定性的：比例为 0.1 时每个日志器每 10 条保留 1 条
+    （保留第 1 条），WARNING 及以上级别总是保留。
+    """
+
+    def __init__(self, rates: Optional[Dict[str, float]] = None) -> None:
+        """初始化采样过滤器
+
+        Args:
+            rates: 日志器名称前缀 -> 保留比例（0 到 1）
+        """
+        super().__init__()
+        self.rates = dict(rates or {})
+        self.sampled_out = 0
+        self._resolved: Dict[str, float] = {}
+        self._counters: Dict[str, Any] = {}
+
+    def rate_for(self, name: str) -> float:
+        """日志器的保留比例（结果按名称缓存）"""
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate = 1.0
+            best = -1
+            for prefix, value in self.rates.items():
+                if (name == prefix or name.startswith(prefix + ".")) and len(prefix) > best:
+                    rate, best = value, len(prefix)
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO:
+            return True
+        rate = self.rate_for(record.name)
+        if rate >= 1:
+            return True
+        keep = False
+        if rate > 0:
+            counter = self._counters.get(record.name)
+            if counter is None:
+                counter = self._counters.setdefault(record.name, itertools.count(1))
+            n = next(counter)
+            keep = math.ceil(n * rate) > math.ceil((n - 1) * rate)
+        if not keep:
+            self.sampled_out += 1
+        return keep
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """队列满时丢弃记录（计数）而不是阻塞调用线程的 QueueHandler"""
+
+    def __init__(self, log_queue: "queue.Queue[Any]") -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._lock_dropped = threading.Lock()
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock_dropped:
+                self.dropped += 1
+
+
+class _FlushMarker:
+    """flush() 放入队列的标记：后台线程处理到它时刷新处理器并通知调用方"""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+
+
+class _Listener(QueueListener):
+    """处理 flush 标记的 QueueListener"""
+
+    def handle(self, record: Any) -> None:
+        if isinstance(record, _FlushMarker):
+            for handler in self.handlers:
+                handler.flush()
+            record.done.set()
+            return
+        super().handle(record)
+
+
+class LogPipeline:
+    """有界队列 + 后台写线程
+
+    handler 挂到日志器上；调用线程只做过滤、格式化消息参数和入队，处理器
+    （文件、控制台）在后台线程中执行。
+    """
+
+    def __init__(
+        self,
+        handlers: List[logging.Handler],
+        queue_size: int = 10000,
+        sampling: Optional[Dict[str, float]] = None
+    ) -> None:
+        """初始化日志管道（调用 start() 后开始写入）
+
+        Args:
+            handlers: 在后台线程中执行的处理器
+            queue_size: 队列容量，队列满时丢弃新记录
+            sampling: 日志器名称前缀 -> 保留比例，见 SamplingFilter
+        """
+        self.handlers = handlers
+        self.queue: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+        self.handler = NonBlockingQueueHandler(self.queue)
+        self.sampler = SamplingFilter(sampling)
+        self.handler.addFilter(self.sampler)
+        self._listener = _Listener(self.queue, *handlers, respect_handler_level=True)
+        self._running = False
+
+    def start(self) -> "LogPipeline":
+        """启动后台写线程"""
+        if not self._running:
+            self._listener.start()
+            self._running = True
+        return self
+
+    def stop(self) -> None:
+        """写完队列中的记录后停止后台线程并关闭处理器"""
+        if not self._running:
+            return
+        self._running = False
+        self._listener.stop()
+        for handler in self.handlers:
+            handler.close()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """等待此前入队的记录全部写出
+
+        Returns:
+            bool: 是否在超时前完成
+        """
+        if not self._running:
+            return True
+        marker = _FlushMarker()
+        self.queue.put(marker, timeout=timeout)
+        return marker.done.wait(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        """队列占用、队列满时丢弃的记录数与被采样丢弃的记录数"""
+        return {
+            "queued": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "dropped": self.handler.dropped,
+            "sampled_out": self.sampler.sampled_out,
+            "sampling": dict(self.sampler.rates)
+        }
+
+
+def configure_logging(
+    level: str = "INFO",
+    path: Optional[str] = "web_chat.log",
+    fmt: str = "text",
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5,
+    rotate_when: str = "",
+    queue_size: int = 10000,
+    sampling: Optional[Dict[str, float]] = None,
+    console: bool = True
+) -> LogPipeline:
+    """在根日志器上安装经由后台线程写入的日志管道
+
+    重复调用时替换之前的管道（先写完其队列中的记录）。
+
+    Args:
+        level: 根日志器级别
+        path: 日志文件路径，为空时只写控制台
+        fmt: "text" 或 "json"
+        max_bytes: 按大小轮转的阈值（字节）
+        backup_count: 保留的历史文件数
+        rotate_when: 按时间轮转的周期，设置时不再按大小轮转
+        queue_size: 队列容量
+        sampling: 日志器名称前缀 -> 保留比例
+        console: 是否同时输出到控制台
+
+    Returns:
+        LogPipeline: 已启动的日志管道
+    """
+    global _pipeline
+    formatter = build_formatter(fmt)
+    handlers: List[logging.Handler] = []
+    if console:
+        handlers.append(logging.StreamHandler())
+    if path:
+        handlers.append(file_handler(path, max_bytes, backup_count, rotate_when))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    pipeline = LogPipeline(handlers, queue_size, sampling)
+    root = logging.getLogger()
+    with _pipeline_lock:
+        previous, _pipeline = _pipeline, pipeline
+        if previous is not None:
+            root.removeHandler(previous.handler)
+            previous.stop()
+        root.addHandler(pipeline.handler)
+        root.setLevel(level)
+        pipeline.start()
+    return pipeline
+
+
+def current_pipeline() -> Optional[LogPipeline]:
+    """当前的根日志管道（尚未调用 configure_logging 时为 None）"""
+    return _pipeline
+
+
+def _shutdown() -> None:
+    """进程退出时写完队列中的记录"""
+    if _pipeline is not None:
+        _pipeline.stop()
+
+
+atexit.register(_shutdown)
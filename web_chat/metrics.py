@@ -0,0 +1,307 @@
+"""Prometheus 指标
+
+以前只能从 web_chat.log 的日志行里推断时间花在了哪里。本模块收集按模型 ID 和
+提供商类型（model / provider 标签）区分的指标，并以 Prometheus 文本格式在
+/metrics 输出：
+
+- 直方图：首字时间、总耗时、片段间隔、输出速度（字符/秒）
+- 计数器：请求数、按异常类型区分的错误数、重试次数；仪表：进行中的流
+- 两个层级：llm_chat_*（客户端看到的整个响应，包括缓存命中与对冲）和
+  llm_upstream_*（每一次适配器调用）
+
+采集路径不加锁：每个线程写自己的分片（threading.local），只有新线程登记分片、
+线程退出时合并分片以及抓取时汇总才需要加锁。抓取时读取的分片可能正在被写入，
+单个直方图的桶与总和之间可能有一次观测的偏差，这对监控没有影响。
+
+Example:
+    >>> for chunk in metrics.instrument("upstream", "deepseek", "openai", stream):
+    ...     yield chunk
+    >>> metrics.render()
+"""
+
+import os
+import time
+import bisect
+import weakref
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+Labels = Tuple[str, ...]
+
+# 当前正在读取的上游流的标签（供重试计数使用）
+_current_labels: contextvars.ContextVar[Optional[Labels]] = contextvars.ContextVar("metrics_labels", default=None)
+
+# 直方图的桶边界
+TTFT_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32)
+DURATION_BUCKETS = (0.5, 1, 2, 5, 10, 20, 40, 80, 160)
+GAP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+RATE_BUCKETS = (5, 10, 25, 50, 100, 200, 400, 800, 1600)
+
+_LABELS = ("model", "provider")
+
+# 指标族：名称 -> (类型, 说明, 标签名, 桶边界)
+FAMILIES: Dict[str, Tuple[str, str, Labels, Tuple[float, ...]]] = {}
+for _stage, _desc in (("chat", "chat responses"), ("upstream", "upstream adapter streams")):
+    FAMILIES.update({
+        f"llm_{_stage}_requests_total": ("counter", f"Number of {_desc}", _LABELS, ()),
+        f"llm_{_stage}_errors_total": ("counter", f"Failed {_desc} by exception class", _LABELS + ("error",), ()),
+        f"llm_{_stage}_streams_in_flight": ("gauge", f"{_desc.capitalize()} currently streaming", _LABELS, ()),
+        f"llm_{_stage}_ttft_seconds": ("histogram", f"Time to first token of {_desc}", _LABELS, TTFT_BUCKETS),
+        f"llm_{_stage}_duration_seconds": ("histogram", f"Total time of {_desc}", _LABELS, DURATION_BUCKETS),
+        f"llm_{_stage}_inter_chunk_gap_seconds": ("histogram", f"Gap between chunks of {_desc}", _LABELS, GAP_BUCKETS),
+        f"llm_{_stage}_output_chars_per_second": (
+            "histogram", f"Output rate after the first token of {_desc}", _LABELS, RATE_BUCKETS
+        )
+    })
+FAMILIES["llm_upstream_retries_total"] = ("counter", "Upstream stream retries", _LABELS, ())
+
+
+def metrics_enabled_from_env() -> bool:
+    """从环境变量读取是否启用指标采集（默认启用）"""
+    return os.environ.get("LLM_METRICS_ENABLED", "true").lower() == "true"
+
+
+class _Shard:
+    """一个线程的指标分片"""
+
+    __slots__ = ("values", "histograms", "__weakref__")
+
+    def __init__(self) -> None:
+        # 计数器与仪表：(名称, 标签值) -> 数值
+        self.values: Dict[Tuple[str, Labels], float] = {}
+        # 直方图：(名称, 标签值) -> [各桶计数..., +Inf 桶计数, 总和]
+        self.histograms: Dict[Tuple[str, Labels], List[float]] = {}
+
+    def merge(self, other: "_Shard") -> None:
+        for key, value in other.values.copy().items():
+            self.values[key] = self.values.get(key, 0) + value
+        for key, counts in other.histograms.copy().items():
+            mine = self.histograms.setdefault(key, [0.0] * len(counts))
+            for i, count in enumerate(list(counts)):
+                mine[i] += count
+
+
+class MetricsRegistry:
+    """指标注册表（采集路径无锁，进程内共享）"""
+
+    def __init__(self, enabled: bool = True) -> None:
+        """初始化注册表
+
+        Args:
+            enabled: 是否启用采集，关闭时 instrument() 直接转发
+        """
+        self.enabled = enabled
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        self._retired = _Shard()
+        self._lock = threading.Lock()
+
+    def _shard(self) -> _Shard:
+        """获取当前线程的分片（首次使用时登记）"""
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append(shard)
+            # 线程退出后把分片合并到 _retired，避免线程频繁创建时分片无限增长
+            weakref.finalize(threading.current_thread(), self._retire, weakref.ref(shard))
+        return shard
+
+    def _retire(self, ref: "weakref.ref[_Shard]") -> None:
+        shard = ref()
+        if shard is None:
+            return
+        with self._lock:
+            self._retired.merge(shard)
+            self._shards.remove(shard)
+
+    def add(self, name: str, labels: Labels, value: float = 1.0) -> None:
+        """计数器或仪表加上 value"""
+        values = self._shard().values
+        key = (name, labels)
+        values[key] = values.get(key, 0) + value
+
+    def observe(self, name: str, labels: Labels, value: float) -> None:
+        """直方图记录一次观测"""
+        buckets = FAMILIES[name][3]
+        histograms = self._shard().histograms
+        key = (name, labels)
+        counts = histograms.get(key)
+        if counts is None:
+            counts = histograms[key] = [0.0] * (len(buckets) + 2)
+        counts[bisect.bisect_left(buckets, value)] += 1
+        counts[-1] += value
+
+    def record_retry(self) -> None:
+        """记录当前上游流的一次重试（由 stream_retry 调用）"""
+        labels = _current_labels.get()
+        if labels is not None and self.enabled:
+            self.add("llm_upstream_retries_total", labels)
+
+    @contextmanager
+    def _stream(self, stage: str, labels: Labels) -> Iterator["_StreamTimer"]:
+        """记录一个流的请求数、进行中数量、错误与耗时"""
+        prefix = f"llm_{stage}_"
+        self.add(prefix + "requests_total", labels)
+        self.add(prefix + "streams_in_flight", labels)
+        timer = _StreamTimer()
+        try:
+            yield timer
+        except Exception as e:
+            self.add(prefix + "errors_total", labels + (type(e).__name__,))
+            raise
+        finally:
+            self.add(prefix + "streams_in_flight", labels, -1)
+            timer.finish(self, prefix, labels)
+
+    def instrument(self, stage: str, model_id: str, provider: str, stream: Iterator[str]) -> Iterator[str]:
+        """记录一个同步流的指标
+
+        Args:
+            stage: "chat"（整个响应）或 "upstream"（一次适配器调用）
+            model_id: 模型 ID
+            provider: 提供商类型（模型配置的 type）
+            stream: 文本片段迭代器
+
+        Yields:
+            str: 原样转发的文本片段
+        """
+        if not self.enabled:
+            yield from stream
+            return
+
+        labels = (model_id, provider)
+        iterator = iter(stream)
+        with self._stream(stage, labels) as timer:
+            try:
+                while True:
+                    token = _current_labels.set(labels) if stage == "upstream" else None
+                    try:
+                        chunk = next(iterator)
+                    except StopIteration:
+                        return
+                    finally:
+                        if token is not None:
+                            _current_labels.reset(token)
+                    timer.chunk(self, f"llm_{stage}_", labels, chunk)
+                    yield chunk
+            finally:
+                close = getattr(iterator, "close", None)
+                if close is not None:
+                    close()
+
+    async def ainstrument(self, stage: str, model_id: str, provider: str, stream: AsyncIterator[str]) -> AsyncIterator[str]:
+        """instrument() 的异步版本"""
+        if not self.enabled:
+            async for chunk in stream:
+                yield chunk
+            return
+
+        labels = (model_id, provider)
+        with self._stream(stage, labels) as timer:
+            try:
+                while True:
+                    token = _current_labels.set(labels) if stage == "upstream" else None
+                    try:
+                        chunk = await stream.__anext__()
+                    except StopAsyncIteration:
+                        return
+                    finally:
+                        if token is not None:
+                            _current_labels.reset(token)
+                    timer.chunk(self, f"llm_{stage}_", labels, chunk)
+                    yield chunk
+            finally:
+                aclose = getattr(stream, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+
+    def collect(self) -> _Shard:
+        """汇总所有分片"""
+        total = _Shard()
+        with self._lock:
+            total.merge(self._retired)
+            for shard in self._shards:
+                total.merge(shard)
+        return total
+
+    def render(self) -> str:
+        """以 Prometheus 文本格式输出所有指标
+
+        Returns:
+            str: text/plain; version=0.0.4 格式的指标
+        """
+        total = self.collect()
+        by_name: Dict[str, List[Tuple[Labels, Any]]] = {}
+        for (name, labels), value in total.values.items():
+            by_name.setdefault(name, []).append((labels, value))
+        for (name, labels), counts in total.histograms.items():
+            by_name.setdefault(name, []).append((labels, counts))
+
+        lines = []
+        for name, (kind, help_text, label_names, buckets) in FAMILIES.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(by_name.get(name, []), key=lambda item: item[0]):
+                label_text = _format_labels(label_names, labels)
+                if kind != "histogram":
+                    lines.append(f"{name}{{{label_text}}} {_format_value(value)}")
+                    continue
+                cumulative = 0.0
+                for bound, count in zip(buckets + (float("inf"),), value[:-1]):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else _format_value(bound)
+                    lines.append(f'{name}_bucket{{{label_text},le="{le}"}} {_format_value(cumulative)}')
+                lines.append(f"{name}_sum{{{label_text}}} {_format_value(value[-1])}")
+                lines.append(f"{name}_count{{{label_text}}} {_format_value(cumulative)}")
+        return "\n".join(lines) + "\n"
+
+
+class _StreamTimer:
+    """一个流的计时状态"""
+
+    __slots__ = ("started", "first", "last", "chars")
+
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self.first: Optional[float] = None
+        self.last: Optional[float] = None
+        self.chars = 0
+
+    def chunk(self, registry: MetricsRegistry, prefix: str, labels: Labels, chunk: str) -> None:
+        now = time.monotonic()
+        if self.first is None:
+            self.first = now
+            registry.observe(prefix + "ttft_seconds", labels, now - self.started)
+        else:
+            registry.observe(prefix + "inter_chunk_gap_seconds", labels, now - self.last)
+        self.last = now
+        self.chars += len(chunk)
+
+    def finish(self, registry: MetricsRegistry, prefix: str, labels: Labels) -> None:
+        now = time.monotonic()
+        registry.observe(prefix + "duration_seconds", labels, now - self.started)
+        if self.first is not None and self.last > self.first:
+            registry.observe(prefix + "output_chars_per_second", labels, self.chars / (self.last - self.first))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Labels, values: Labels) -> str:
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+# 进程级指标注册表
+metrics = MetricsRegistry(metrics_enabled_from_env())
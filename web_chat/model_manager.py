@@ -11,11 +11,13 @@ import os
 import json
 import uuid
 import logging
-from typing import Dict, Any, List, Optional, Tuple, Union
+from typing import Callable, Dict, Any, Hashable, List, Optional, Tuple, Union
 from flask import jsonify, request, Response
 from werkzeug.utils import secure_filename
 from werkzeug.datastructures import FileStorage
 
+from http_cache import PrecomputedJSON, http_cache_settings_from_env
+
 # 配置日志
 logger = logging.getLogger(__name__)
 
@@ -25,6 +27,57 @@ MODELS_EXAMPLE_FILE: str = os.path.join(os.path.dirname(__file__), "models.json.
 ICONS_DIR: str = os.path.join(os.path.dirname(__file__), "assets", "icons")
 ALLOWED_EXTENSIONS: set[str] = {"png", "jpg", "jpeg", "svg", "gif"}
 
+# 上下文预算字段（可选，正整数，见 context_window.py）
+CONTEXT_FIELDS: Tuple[str, ...] = ("context_length", "reserved_output_tokens", "max_output_tokens")
+
+# models.json 保存成功后调用的回调（如使模型注册表失效）
+_change_listeners: List[Callable[[], None]] = []
+
+# 返回各模型健康状态的函数（见 health_prober.py），未设置时 /api/models/list 不带 health 字段
+_status_provider: Optional[Callable[[], Dict[str, Dict[str, Any]]]] = None
+_status_version: Optional[Callable[[], Hashable]] = None
+
+# /api/models/list 的预序列化响应（models.json 或健康状态变化时才重新生成，见 http_cache.py）
+_models_list_response = PrecomputedJSON("models_list", **http_cache_settings_from_env())
+
+# save_models 成功的次数（同一时间片内多次保存时文件修改时间可能不变）
+_saves = 0
+
+
+def add_change_listener(listener: Callable[[], None]) -> None:
+    """注册 models.json 变更回调
+
+    Args:
+        listener: 无参回调函数，在 save_models 成功后调用
+    """
+    if listener not in _change_listeners:
+        _change_listeners.append(listener)
+
+
+def set_status_provider(
+    provider: Optional[Callable[[], Dict[str, Dict[str, Any]]]],
+    version: Optional[Callable[[], Hashable]] = None
+) -> None:
+    """设置模型健康状态来源
+
+    Args:
+        provider: 无参函数，返回模型 ID -> 健康状态字典；None 表示不返回健康状态
+        version: 无参函数，返回健康状态的版本号（状态变化时改变）；未提供时
+            /api/models/list 每次都重新生成
+    """
+    global _status_provider, _status_version
+    _status_provider = provider
+    _status_version = version
+
+
+def _notify_change() -> None:
+    """通知所有变更回调，单个回调失败不影响其他回调"""
+    for listener in list(_change_listeners):
+        try:
+            listener()
+        except Exception as e:
+            logger.warning(f"Models change listener failed: {e}")
+
 
 def load_models() -> Dict[str, Any]:
     """加载模型配置文件
@@ -78,10 +131,13 @@ def save_models(data: Dict[str, Any]) -> bool:
         >>> save_models(data)
         True
     """
+    global _saves
     try:
         with open(MODELS_FILE, "w", encoding="utf-8") as f:
             json.dump(data, f, indent=2, ensure_ascii=False)
         logger.debug(f"Saved models configuration to {MODELS_FILE}")
+        _saves += 1
+        _notify_change()
         return True
     except IOError as e:
         logger.error(f"Failed to save models file: {e}")
@@ -106,11 +162,32 @@ def allowed_file(filename: str) -> bool:
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+def _validate_context_fields(model_data: Dict[str, Any]) -> Optional[str]:
+    """校验上下文预算字段
+
+    Args:
+        model_data: 请求 JSON
+
+    Returns:
+        Optional[str]: 错误信息，校验通过时返回 None
+    """
+    for field in CONTEXT_FIELDS:
+        value = model_data.get(field)
+        if value is None:
+            continue
+        if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+            return f"{field} 必须是正整数"
+    return None
+
+
 def get_all_models() -> Response:
     """获取所有模型和 API 类型列表
 
+    设置了健康状态来源时，响应带有 health_probe: true，已探测过的模型带有
+    health 字段（status、ttft_ms、availability 等，见 health_prober.py）。
+
     Returns:
-        Response: JSON 响应，包含 success, models, api_types
+        Response: JSON 响应，包含 success, models, api_types, health_probe
 
     Examples:
         >>> response = get_all_models()
@@ -118,12 +195,52 @@ def get_all_models() -> Response:
         >>> data["success"]
         True
     """
+    return jsonify(_models_list_payload())
+
+
+def _models_list_payload() -> Dict[str, Any]:
+    """/api/models/list 的响应数据"""
     data = load_models()
-    return jsonify({
+    models = data.get("models", [])
+    if _status_provider is not None:
+        health = _status_provider()
+        models = [{**m, "health": health[m.get("id")]} if m.get("id") in health else m for m in models]
+    return {
         "success": True,
-        "models": data.get("models", []),
-        "api_types": data.get("api_types", {})
-    })
+        "models": models,
+        "api_types": data.get("api_types", {}),
+        "health_probe": _status_provider is not None
+    }
+
+
+def _models_list_version() -> Hashable:
+    """/api/models/list 的数据版本：models.json 的路径、修改时间与大小、保存次数和健康状态版本"""
+    try:
+        stat = os.stat(MODELS_FILE)
+        file_version: Tuple[Any, ...] = (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        file_version = ()
+    if _status_provider is None:
+        status_version: Hashable = None
+    else:
+        status_version = _status_version() if _status_version is not None else object()
+    return (MODELS_FILE, file_version, _saves, status_version)
+
+
+def get_all_models_cached() -> Response:
+    """获取所有模型和 API 类型列表（预序列化，支持 ETag/304 与 gzip/brotli）
+
+    只在 models.json 或健康状态变化时重新读取文件和序列化，见 http_cache.py。
+
+    Returns:
+        Response: 与 get_all_models 相同的 JSON，或 304
+    """
+    return _models_list_response.response(_models_list_version(), _models_list_payload)
+
+
+def models_list_cache_stats() -> Dict[str, Any]:
+    """/api/models/list 预序列化响应的统计"""
+    return _models_list_response.stats()
 
 
 def add_model() -> Union[Tuple[Response, int], Response]:
@@ -139,6 +256,9 @@ def add_model() -> Union[Tuple[Response, int], Response]:
         base_url (str, optional): API 基础 URL (openai 类型)
         url (str, optional): 完整 API URL (requests_sse/spark_requests 类型)
         system (str, optional): 系统提示词 (openai 类型)
+        context_length (int, optional): 上下文长度（token 数）
+        reserved_output_tokens (int, optional): 裁剪历史时为输出保留的 token 数
+        max_output_tokens (int, optional): 上游允许的最大输出 token 数
 
     Returns:
         Union[Tuple[Response, int], Response]:
@@ -164,6 +284,10 @@ def add_model() -> Union[Tuple[Response, int], Response]:
         if field not in model_data or not model_data[field]:
             return jsonify({"success": False, "message": f"缺少必填字段: {field}"}), 400
 
+    error = _validate_context_fields(model_data)
+    if error:
+        return jsonify({"success": False, "message": error}), 400
+
     data = load_models()
     models = data.get("models", [])
 
@@ -190,6 +314,9 @@ def add_model() -> Union[Tuple[Response, int], Response]:
         new_model["url"] = model_data["url"]
     if "system" in model_data:
         new_model["system"] = model_data["system"]
+    for field in CONTEXT_FIELDS:
+        if model_data.get(field) is not None:
+            new_model[field] = model_data[field]
 
     models.append(new_model)
     data["models"] = models
@@ -258,6 +385,9 @@ def update_model(model_id: str) -> Union[Tuple[Response, int], Response]:
         base_url (str, optional): API 基础 URL
         url (str, optional): 完整 API URL
         system (str, optional): 系统提示词
+        context_length (int, optional): 上下文长度（token 数）
+        reserved_output_tokens (int, optional): 裁剪历史时为输出保留的 token 数
+        max_output_tokens (int, optional): 上游允许的最大输出 token 数
 
     Returns:
         Union[Tuple[Response, int], Response]:
@@ -276,6 +406,10 @@ def update_model(model_id: str) -> Union[Tuple[Response, int], Response]:
         if field not in model_data or not model_data[field]:
             return jsonify({"success": False, "message": f"缺少必填字段: {field}"}), 400
 
+    error = _validate_context_fields(model_data)
+    if error:
+        return jsonify({"success": False, "message": error}), 400
+
     data = load_models()
     models = data.get("models", [])
 
@@ -310,6 +444,12 @@ def update_model(model_id: str) -> Union[Tuple[Response, int], Response]:
             elif "system" in models[i]:
                 del models[i]["system"]
 
+            for field in CONTEXT_FIELDS:
+                if model_data.get(field) is not None:
+                    models[i][field] = model_data[field]
+                elif field in models[i]:
+                    del models[i][field]
+
             data["models"] = models
 
             if save_models(data):
@@ -446,7 +586,7 @@ def register_routes(app, limiter=None) -> None:
             return limiter.limit(limit_string)
     @app.route("/api/models/list", methods=["GET"])
     def api_get_models() -> Response:
-        return get_all_models()
+        return get_all_models_cached()
 
     @app.route("/api/models/<model_id>", methods=["GET"])
     def api_get_model(model_id: str) -> Union[Tuple[Response, int], Response]:
@@ -0,0 +1,292 @@
+"""模型注册表
+
+在内存中保存编译后的模型配置，替代每次请求都重新读取和解析 models.json。
+
+- 内置模型与 models.json 中的自定义模型只在文件变化时解析一次
+- 每个模型编译为不可变的 ModelSpec，按模型 ID 字典查找
+- 文件变化时构建新快照并原子替换，读取路径不加锁
+- API 密钥不进入编译结果，而是在每次请求时按 api_key_name 延迟解析，
+  因此前端传入的自定义密钥依然生效
+- 热路径不做文件 I/O：文件修改时间最多每 check_interval 秒检查一次，
+  模型管理接口保存文件后会主动使注册表失效
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 各 API 类型需要从 models.json 复制的可选字段
+_OPTIONAL_FIELDS: Dict[str, tuple] = {
+    "openai": ("base_url", "system"),
+    "requests_sse": ("url",),
+    "spark_requests": ("url",),
+    "zhipu": ("base_url", "system"),
+    "google": ("base_url",)
+}
+
+# 所有 API 类型通用的可选字段（hedge_to: 对冲请求的备用模型 ID；cache: 是否启用响应缓存；
+# similarity_cache: 是否启用近似重复问题缓存；context_length / reserved_output_tokens /
+# max_output_tokens: 上下文预算，见 context_window.py）
+_COMMON_FIELDS: tuple = (
+    "hedge_to", "cache", "similarity_cache",
+    "context_length", "reserved_output_tokens", "max_output_tokens"
+)
+
+
+@dataclass(frozen=True)
+class ModelSpec:
+    """编译后的单个模型配置（不可变，不包含 API 密钥）
+
+    Attributes:
+        model_id: 模型 ID
+        type: API 类型（google, openai, requests_sse, spark_requests, zhipu）
+        model: API 使用的模型名称
+        api_key_name: API 密钥的环境变量名
+        options: 其他配置字段（base_url, url, system 等）
+    """
+    model_id: str
+    type: str
+    model: str
+    api_key_name: str
+    options: Mapping[str, Any] = field(default_factory=lambda: MappingProxyType({}))
+
+    def resolve(self, custom_api_keys: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """生成带 API 密钥的配置字典
+
+        密钥优先使用前端传入的自定义密钥，其次使用环境变量。
+
+        Args:
+            custom_api_keys: 前端提供的自定义 API 密钥字典
+
+        Returns:
+            Dict[str, Any]: 与 LLMWrapper 适配器兼容的配置字典
+        """
+        custom_api_keys = custom_api_keys or {}
+        config: Dict[str, Any] = {"type": self.type, "model": self.model}
+        config.update(self.options)
+        config["api_key"] = custom_api_keys.get(self.api_key_name) or os.environ.get(self.api_key_name, "")
+        return config
+
+
+def _make_spec(model_id: str, type: str, model: str, api_key_name: str, **options: Any) -> ModelSpec:
+    """创建 ModelSpec，options 包装为只读映射"""
+    return ModelSpec(model_id, type, model, api_key_name, MappingProxyType(dict(options)))
+
+
+def compile_builtin_models() -> Dict[str, ModelSpec]:
+    """编译默认内置模型
+
+    这些是系统预定义的模型，确保基础功能始终可用。
+
+    Returns:
+        Dict[str, ModelSpec]: 内置模型字典
+    """
+    return {
+        "google": _make_spec(
+            "google", "google", "gemini-2.5-flash", "GOOGLE_API_KEY",
+            context_length=1048576
+        ),
+        "deepseek": _make_spec(
+            "deepseek", "openai", "deepseek-chat", "DEEPSEEK_API_KEY",
+            base_url=os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com/v1"),
+            system="You are a helpful assistant",
+            context_length=65536
+        ),
+        "moonshot": _make_spec(
+            "moonshot", "openai", "kimi-k2-turbo-preview", "MOONSHOT_API_KEY",
+            base_url=os.environ.get("MOONSHOT_BASE_URL", "https://api.moonshot.cn/v1"),
+            system="你是一只猫娘，你每回答一次问题都会在最后面加一个：,喵~",
+            context_length=131072
+        ),
+        "qwen": _make_spec(
+            "qwen", "requests_sse", "Qwen/Qwen2.5-VL-72B-Instruct", "QWEN_API_KEY",
+            url=os.environ.get("QWEN_BASE_URL", "https://api.siliconflow.cn/v1/chat/completions"),
+            context_length=32768
+        ),
+        "spark": _make_spec(
+            "spark", "spark_requests", "x1", "SPARK_API_KEY",
+            url=os.environ.get("SPARK_BASE_URL", "https://spark-api-open.xf-yun.com/v2/chat/completions")
+        )
+    }
+
+
+def compile_models_data(data: Dict[str, Any]) -> Dict[str, ModelSpec]:
+    """编译 models.json 中已启用的自定义模型
+
+    格式错误的单个模型条目会被跳过并记录警告。
+
+    Args:
+        data: models.json 解析后的字典
+
+    Returns:
+        Dict[str, ModelSpec]: 模型 ID 到 ModelSpec 的字典
+    """
+    specs: Dict[str, ModelSpec] = {}
+    for model in data.get("models", []):
+        if not model.get("enabled", True):
+            continue
+        try:
+            model_type = model["type"]
+            options = {
+                name: model[name]
+                for name in _OPTIONAL_FIELDS.get(model_type, ()) + _COMMON_FIELDS
+                if name in model
+            }
+            specs[model["id"]] = _make_spec(
+                model["id"], model_type, model["model"], model.get("api_key_name", ""), **options
+            )
+        except (KeyError, TypeError) as e:
+            logger.warning(f"Skipping invalid model entry {model!r}: {e}")
+    return specs
+
+
+def load_models_file(path: str) -> Dict[str, ModelSpec]:
+    """读取并编译 models.json
+
+    Args:
+        path: models.json 路径
+
+    Returns:
+        Dict[str, ModelSpec]: 自定义模型字典，文件不存在或格式错误时为空
+    """
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return compile_models_data(json.load(f))
+    except (json.JSONDecodeError, IOError, AttributeError) as e:
+        logger.warning(f"Failed to load models from file: {e}")
+        return {}
+
+
+@dataclass(frozen=True)
+class _Snapshot:
+    """注册表的一个不可变版本"""
+    specs: Mapping[str, ModelSpec]
+    model_ids: tuple
+    version: str
+    mtime: Optional[float]
+
+
+class ModelRegistry:
+    """进程级共享的模型注册表
+
+    Example:
+        >>> registry = ModelRegistry('/path/to/models.json')
+        >>> spec = registry.get('deepseek')
+        >>> config = spec.resolve({'DEEPSEEK_API_KEY': 'sk-...'})
+    """
+
+    def __init__(self, path: str, check_interval: float = 2.0) -> None:
+        """初始化模型注册表（惰性加载）
+
+        Args:
+            path: models.json 路径
+            check_interval: 检查文件修改时间的最小间隔（秒）
+        """
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot: Optional[_Snapshot] = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def _file_mtime(self) -> Optional[float]:
+        """获取文件修改时间，不存在时返回 None"""
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    def _build(self, mtime: Optional[float]) -> _Snapshot:
+        """解析文件并构建新快照"""
+        raw = b""
+        if mtime is not None:
+            try:
+                with open(self.path, "rb") as f:
+                    raw = f.read()
+            except IOError as e:
+                logger.warning(f"Failed to read models file: {e}")
+
+        custom: Dict[str, ModelSpec] = {}
+        if raw:
+            try:
+                custom = compile_models_data(json.loads(raw))
+            except (json.JSONDecodeError, UnicodeDecodeError, AttributeError) as e:
+                logger.warning(f"Failed to load models from file: {e}")
+
+        builtin = compile_builtin_models()
+        # 合并配置（自定义模型可以覆盖默认模型）
+        specs = {**builtin, **custom}
+
+        digest = hashlib.sha256(raw)
+        digest.update(repr(sorted((k, sorted(v.options.items())) for k, v in builtin.items())).encode())
+        return _Snapshot(
+            specs=MappingProxyType(specs),
+            model_ids=tuple(specs),
+            version=digest.hexdigest()[:16],
+            mtime=mtime
+        )
+
+    def _current(self) -> _Snapshot:
+        """获取当前快照，必要时检查文件并原子替换"""
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is not None and now - self._last_check < self.check_interval:
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and now - self._last_check < self.check_interval:
+                return snapshot
+            mtime = self._file_mtime()
+            if snapshot is None or mtime != snapshot.mtime:
+                snapshot = self._build(mtime)
+                self._snapshot = snapshot
+                logger.info(f"Model registry loaded: {len(snapshot.model_ids)} models, version {snapshot.version}")
+            self._last_check = now
+            return snapshot
+
+    def get(self, model_id: str) -> Optional[ModelSpec]:
+        """按模型 ID 查找编译后的配置
+
+        Args:
+            model_id: 模型 ID
+
+        Returns:
+            Optional[ModelSpec]: 模型配置，不存在时返回 None
+        """
+        return self._current().specs.get(model_id)
+
+    def __contains__(self, model_id: str) -> bool:
+        return model_id in self._current().specs
+
+    def model_ids(self) -> List[str]:
+        """获取所有可用模型 ID（内置模型在前）"""
+        return list(self._current().model_ids)
+
+    def specs(self) -> Mapping[str, ModelSpec]:
+        """获取当前所有模型配置的只读映射"""
+        return self._current().specs
+
+    @property
+    def version(self) -> str:
+        """当前快照的内容版本号（文件内容哈希）"""
+        return self._current().version
+
+    def invalidate(self) -> None:
+        """使注册表失效，下一次访问时重新检查文件
+
+        文件修改时间精度不足（例如同一秒内多次保存）时也会重新加载。
+        """
+        with self._lock:
+            self._snapshot = None
+            self._last_check = 0.0
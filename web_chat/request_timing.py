@@ -0,0 +1,257 @@
+"""请求耗时分解与慢请求日志
+
+一个回答慢的时候，以前无法区分是本服务的开销还是提供商的延迟。本模块把一次
+/api/chat 请求拆分为以下阶段（毫秒）：
+
+- parse：解析请求 JSON
+- validate：校验请求（包括服务端对话的增量合并）
+- config：解析模型配置并裁剪上下文
+- client：从连接池取得 SDK 客户端或 HTTP 会话
+- connect：发出上游请求到收到响应头（重试时累加）
+- first_byte / last_byte：从收到请求到输出第一个 / 最后一个文本片段
+
+开始输出之前完成的阶段通过 Server-Timing 响应头返回；完整的分解在流结束时
+以统计帧返回（请求体带 "stats": true 时）。超过阈值的请求连同完整分解和追踪 ID
+（同时在 X-Trace-Id 响应头返回）写入单独的慢请求日志。
+
+连接池和适配器通过 timed() 记录阶段，不需要层层传递计时器：RequestTiming.wrap()
+在每次读取流时把计时器放入 contextvars，与 metrics 的重试计数方式相同。在其他
+线程中读取的上游（对冲请求、请求合并）不记录 client 与 connect 阶段。
+
+Example:
+    >>> timing = RequestTiming()
+    >>> with timing.phase("validate"):
+    ...     validate(data)
+    >>> for chunk in timing.wrap(llm.chat_stream(model_id, messages)):
+    ...     yield chunk
+    >>> slow_log.record(timing, model=model_id)
+"""
+
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+from log_pipeline import LogPipeline, file_handler
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 统计帧的前缀（ASCII 记录分隔符，与 RFC 7464 JSON 文本序列相同）
+STATS_FRAME_SEPARATOR = "\x1e"
+
+# 慢请求日志使用的日志器名称
+SLOW_LOGGER_NAME = "slow_requests"
+
+# 当前请求的计时器
+_current_timing: contextvars.ContextVar[Optional["RequestTiming"]] = contextvars.ContextVar(
+    "request_timing", default=None
+)
+
+
+def slow_log_settings_from_env() -> Dict[str, Any]:
+    """从环境变量读取慢请求日志配置
+
+    Returns:
+        Dict[str, Any]: SlowRequestLog 的构造参数
+    """
+    return {
+        "threshold_ms": float(os.environ.get("LLM_SLOW_REQUEST_MS", 10000)),
+        "path": os.environ.get("LLM_SLOW_LOG_FILE", "web_chat_slow.log")
+    }
+
+
+class RequestTiming:
+    """一次请求的耗时分解"""
+
+    def __init__(self, trace_id: Optional[str] = None) -> None:
+        """开始计时
+
+        Args:
+            trace_id: 追踪 ID，默认随机生成
+        """
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        """累加一个阶段的耗时"""
+        self.phases[name] = self.phases.get(name, 0.0) + seconds * 1000
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """记录一段代码的耗时"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def elapsed_ms(self) -> float:
+        """从收到请求到现在的时间（毫秒）"""
+        return (time.perf_counter() - self.started) * 1000
+
+    def _chunk(self) -> None:
+        now = self.elapsed_ms()
+        self.phases.setdefault("first_byte", now)
+        self.phases["last_byte"] = now
+
+    def wrap(self, stream: Iterator[str]) -> Iterator[str]:
+        """转发流，读取时设置当前计时器并记录首末字节时间
+
+        Args:
+            stream: 文本片段迭代器
+
+        Yields:
+            str: 原样转发的文本片段
+        """
+        iterator = iter(stream)
+        try:
+            while True:
+                token = _current_timing.set(self)
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    _current_timing.reset(token)
+                self._chunk()
+                yield chunk
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    async def awrap(self, stream: AsyncIterator[str]) -> AsyncIterator[str]:
+        """wrap() 的异步版本"""
+        try:
+            while True:
+                token = _current_timing.set(self)
+                try:
+                    chunk = await stream.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    _current_timing.reset(token)
+                self._chunk()
+                yield chunk
+        finally:
+            aclose = getattr(stream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    def headers(self) -> Dict[str, str]:
+        """响应头：已完成阶段的 Server-Timing 与追踪 ID"""
+        server_timing = ", ".join(f"{name};dur={ms:.2f}" for name, ms in self.phases.items())
+        headers = {"X-Trace-Id": self.trace_id}
+        if server_timing:
+            headers["Server-Timing"] = server_timing
+        return headers
+
+    def to_dict(self) -> Dict[str, Any]:
+        """完整的耗时分解（毫秒）"""
+        return {
+            "trace_id": self.trace_id,
+            "phases": {name: round(ms, 2) for name, ms in self.phases.items()},
+            "total": round(self.elapsed_ms(), 2)
+        }
+
+    def stats_frame(self) -> str:
+        """流末尾的统计帧：记录分隔符 + 一行 JSON"""
+        return f"{STATS_FRAME_SEPARATOR}{json.dumps(self.to_dict())}\n"
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    """把一段代码的耗时记入当前请求（没有正在计时的请求时不记录）
+
+    Args:
+        name: 阶段名称
+    """
+    timing = _current_timing.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timing is not None:
+            timing.add(name, time.perf_counter() - started)
+
+
+def record_phase(name: str, seconds: float) -> None:
+    """把一段已测得的耗时记入当前请求（用于无法包成上下文的代码，如 async with 的进入过程）
+
+    Args:
+        name: 阶段名称
+        seconds: 耗时（秒）
+    """
+    timing = _current_timing.get()
+    if timing is not None:
+        timing.add(name, seconds)
+
+
+class SlowRequestLog:
+    """慢请求日志：超过阈值的请求以一行 JSON 写入单独的日志文件"""
+
+    def __init__(
+        self,
+        threshold_ms: float = 10000,
+        path: Optional[str] = "web_chat_slow.log",
+        logger_name: str = SLOW_LOGGER_NAME
+    ) -> None:
+        """初始化慢请求日志
+
+        Args:
+            threshold_ms: 阈值（毫秒），不大于 0 时不记录
+            path: 日志文件路径，为空时写入主日志
+            logger_name: 日志器名称
+        """
+        self.threshold_ms = threshold_ms
+        self.path = path
+        self.recorded = 0
+        self._logger = logging.getLogger(logger_name)
+        self._pipeline: Optional[LogPipeline] = None
+        self._configured = False
+        self._lock = threading.Lock()
+
+    def _configure(self) -> None:
+        """首次写入时才创建日志文件（经由后台线程写入并按大小轮转）"""
+        with self._lock:
+            if self._configured:
+                return
+            if self.path:
+                handler = file_handler(self.path)
+                handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+                self._pipeline = LogPipeline([handler]).start()
+                self._logger.addHandler(self._pipeline.handler)
+                self._logger.propagate = False
+            self._configured = True
+
+    def flush(self) -> None:
+        """等待已记录的慢请求写入文件"""
+        if self._pipeline is not None:
+            self._pipeline.flush()
+
+    def record(self, timing: RequestTiming, **fields: Any) -> bool:
+        """请求结束时调用，超过阈值时写入日志
+
+        Args:
+            timing: 请求的耗时分解
+            **fields: 附加字段（如模型 ID、输出字符数）
+
+        Returns:
+            bool: 是否写入了慢请求日志
+        """
+        total = timing.elapsed_ms()
+        if self.threshold_ms <= 0 or total < self.threshold_ms:
+            return False
+        self._configure()
+        entry = {**timing.to_dict(), **fields}
+        self._logger.warning(json.dumps(entry, ensure_ascii=False))
+        self.recorded += 1
+        logger.info(f"Slow request {timing.trace_id}: {total:.0f}ms")
+        return True
@@ -0,0 +1,441 @@
+"""分层响应缓存
+
+完全相同的聊天请求（同一模型、同一配置、同一消息、同一生成参数）直接返回
+之前的回答，不再访问上游：
+
+- 缓存键是 (模型 ID, 解析后的模型配置, 消息, 生成参数) 的规范化 JSON 的
+  SHA-256；API 密钥和与生成结果无关的字段不参与计算
+- 第一层是按字节数限制大小的内存 LRU，第二层是 SQLite 持久化存储，
+  内存未命中时从磁盘读取并提升到内存
+- 条目有 TTL，过期条目在读取时丢弃
+- 按模型启用：models.json 中的 cache 字段，或 LLM_RESPONSE_CACHE_MODELS
+- 命中时按流的形式回放（可选按固定间隔输出），前端行为与真实上游一致
+- 只缓存正常结束的回答；上游出错或客户端中途断开时不写入
+
+Example:
+    >>> cache = ResponseCache(ResponseCachePolicy(enabled=True, models=('deepseek',)))
+    >>> key = cache_key('deepseek', config, messages, {'temperature': 0.7})
+    >>> for chunk in cache.stream(key, 'deepseek', lambda: adapter(config, messages)):
+    ...     print(chunk, end='')
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Callable, Dict, Generator, Iterator, List, Optional, Tuple
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 默认的 SQLite 文件路径
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(__file__), "response_cache.db")
+
+# 不参与缓存键计算的配置字段（密钥，以及只影响调度、不影响回答内容的字段）
+_KEY_EXCLUDED_FIELDS = frozenset({"api_key", "cache", "hedge_to", "similarity_cache"})
+
+
+@dataclass(frozen=True)
+class ResponseCachePolicy:
+    """响应缓存策略
+
+    Attributes:
+        enabled: 是否启用缓存
+        models: 启用缓存的模型 ID（models.json 中 cache 为 true 的模型也会启用）
+        ttl: 条目有效期（秒）
+        max_memory_bytes: 内存 LRU 的容量（按回答的 UTF-8 字节数计）
+        db_path: SQLite 文件路径，为空时只使用内存层
+        replay_chunk_chars: 回放时每个片段的字符数
+        replay_interval: 回放片段之间的间隔（秒），0 表示不限速
+    """
+    enabled: bool = False
+    models: Tuple[str, ...] = ()
+    ttl: float = 86400.0
+    max_memory_bytes: int = 16 * 1024 * 1024
+    db_path: Optional[str] = DEFAULT_DB_PATH
+    replay_chunk_chars: int = 16
+    replay_interval: float = 0.0
+
+
+def response_cache_settings_from_env() -> Dict[str, Any]:
+    """从环境变量读取响应缓存配置
+
+    Returns:
+        Dict[str, Any]: ResponseCachePolicy 的构造参数
+    """
+    models = os.environ.get("LLM_RESPONSE_CACHE_MODELS", "")
+    return {
+        "enabled": os.environ.get("LLM_RESPONSE_CACHE_ENABLED", "false").lower() == "true",
+        "models": tuple(m.strip() for m in models.split(",") if m.strip()),
+        "ttl": float(os.environ.get("LLM_RESPONSE_CACHE_TTL", 86400)),
+        "max_memory_bytes": int(os.environ.get("LLM_RESPONSE_CACHE_MEMORY_MB", 16)) * 1024 * 1024,
+        "db_path": os.environ.get("LLM_RESPONSE_CACHE_DB", DEFAULT_DB_PATH) or None,
+        "replay_chunk_chars": int(os.environ.get("LLM_RESPONSE_CACHE_REPLAY_CHARS", 16)),
+        "replay_interval": float(os.environ.get("LLM_RESPONSE_CACHE_REPLAY_INTERVAL", 0))
+    }
+
+
+def cache_key(
+    model_id: str,
+    config: Dict[str, Any],
+    messages: List[Dict[str, str]],
+    params: Dict[str, Any]
+) -> str:
+    """计算请求的规范化缓存键
+
+    Args:
+        model_id: 模型 ID
+        config: 解析后的模型配置（API 密钥会被排除）
+        messages: 消息列表
+        params: 生成参数（temperature, max_tokens 等）
+
+    Returns:
+        str: 十六进制 SHA-256
+    """
+    canonical = json.dumps(
+        {
+            "model_id": model_id,
+            "config": {k: v for k, v in config.items() if k not in _KEY_EXCLUDED_FIELDS},
+            "messages": [{"role": m["role"], "content": m["content"]} for m in messages],
+            "params": params
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def replay_chunks(text: str, chunk_chars: int, interval: float = 0.0) -> Generator[str, None, None]:
+    """把完整回答切成片段按流的形式输出
+
+    Args:
+        text: 完整回答
+        chunk_chars: 每个片段的字符数
+        interval: 片段之间的间隔（秒），0 表示不限速
+
+    Yields:
+        str: 文本片段
+    """
+    size = max(1, chunk_chars)
+    for i in range(0, len(text), size):
+        if interval and i:
+            time.sleep(interval)
+        yield text[i:i + size]
+
+
+async def areplay_chunks(text: str, chunk_chars: int, interval: float = 0.0) -> AsyncGenerator[str, None]:
+    """replay_chunks 的异步版本"""
+    size = max(1, chunk_chars)
+    for i in range(0, len(text), size):
+        if interval and i:
+            await asyncio.sleep(interval)
+        yield text[i:i + size]
+
+
+class _MemoryLRU:
+    """按字节数限制容量的 LRU（调用方负责加锁）"""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries: "OrderedDict[str, Tuple[str, int, float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str, now: float) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        text, size, expires_at = entry
+        if expires_at <= now:
+            self.pop(key)
+            return None
+        self._entries.move_to_end(key)
+        return text
+
+    def put(self, key: str, text: str, size: int, expires_at: float) -> None:
+        self.pop(key)
+        if size > self.max_bytes:
+            return  # 单个回答超过内存容量时只保存在磁盘层
+        self._entries[key] = (text, size, expires_at)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self.bytes -= evicted_size
+
+    def pop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.bytes = 0
+
+
+class _DiskStore:
+    """SQLite 持久化层（单连接，调用方负责加锁）"""
+
+    def __init__(self, path: str) -> None:
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " model_id TEXT NOT NULL,"
+            " response TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " expires_at REAL NOT NULL)"
+        )
+
+    def get(self, key: str, now: float) -> Optional[Tuple[str, float]]:
+        row = self._conn.execute(
+            "SELECT response, expires_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[1] <= now:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+        return row[0], row[1]
+
+    def put(self, key: str, model_id: str, text: str, now: float, expires_at: float) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO responses (key, model_id, response, created_at, expires_at)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (key, model_id, text, now, expires_at)
+        )
+
+    def purge(self, model_id: Optional[str], now: float, expired_only: bool) -> int:
+        clauses, args = [], []
+        if model_id is not None:
+            clauses.append("model_id = ?")
+            args.append(model_id)
+        if expired_only:
+            clauses.append("expires_at <= ?")
+            args.append(now)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._conn.execute(f"DELETE FROM responses{where}", args).rowcount
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class ResponseCache:
+    """分层响应缓存（线程安全，进程内共享）"""
+
+    def __init__(self, policy: Optional[ResponseCachePolicy] = None) -> None:
+        """初始化缓存
+
+        Args:
+            policy: 缓存策略，默认不启用
+        """
+        self.policy = policy or ResponseCachePolicy()
+        self._memory = _MemoryLRU(self.policy.max_memory_bytes)
+        self._disk: Optional[_DiskStore] = None
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "memory_hits": 0, "misses": 0, "stores": 0, "bytes_saved": 0}
+
+        if self.policy.enabled and self.policy.db_path:
+            try:
+                self._disk = _DiskStore(self.policy.db_path)
+            except sqlite3.Error as e:
+                logger.warning(f"Response cache database unavailable, using memory only: {e}")
+
+    def enabled_for(self, model_id: str, config: Dict[str, Any]) -> bool:
+        """判断模型是否启用缓存
+
+        Args:
+            model_id: 模型 ID
+            config: 解析后的模型配置
+
+        Returns:
+            bool: 全局启用且模型在 models 列表中或配置了 cache: true 时返回 True
+        """
+        if not self.policy.enabled:
+            return False
+        return model_id in self.policy.models or config.get("cache") is True
+
+    def get(self, key: str) -> Optional[str]:
+        """查找缓存的回答（先内存后磁盘，磁盘命中后提升到内存）
+
+        Args:
+            key: cache_key() 计算的缓存键
+
+        Returns:
+            Optional[str]: 缓存的回答，未命中或已过期时返回 None
+        """
+        now = time.time()
+        with self._lock:
+            text = self._memory.get(key, now)
+            if text is not None:
+                self._count_hit(text, memory=True)
+                return text
+
+            if self._disk is not None:
+                try:
+                    row = self._disk.get(key, now)
+                except sqlite3.Error as e:
+                    logger.warning(f"Response cache read failed: {e}")
+                    row = None
+                if row is not None:
+                    text, expires_at = row
+                    self._memory.put(key, text, len(text.encode("utf-8")), expires_at)
+                    self._count_hit(text, memory=False)
+                    return text
+
+            self._counters["misses"] += 1
+            return None
+
+    def _count_hit(self, text: str, memory: bool) -> None:
+        self._counters["hits"] += 1
+        self._counters["bytes_saved"] += len(text.encode("utf-8"))
+        if memory:
+            self._counters["memory_hits"] += 1
+
+    def put(self, key: str, model_id: str, text: str) -> None:
+        """写入缓存（内存与磁盘两层）
+
+        Args:
+            key: 缓存键
+            model_id: 模型 ID（用于按模型清理）
+            text: 完整回答
+        """
+        now = time.time()
+        expires_at = now + self.policy.ttl
+        with self._lock:
+            self._memory.put(key, text, len(text.encode("utf-8")), expires_at)
+            if self._disk is not None:
+                try:
+                    self._disk.put(key, model_id, text, now, expires_at)
+                except sqlite3.Error as e:
+                    logger.warning(f"Response cache write failed: {e}")
+            self._counters["stores"] += 1
+
+    def purge(self, model_id: Optional[str] = None, expired_only: bool = False) -> int:
+        """清理缓存
+
+        Args:
+            model_id: 只清理该模型的条目，None 表示所有模型
+            expired_only: 只清理已过期的磁盘条目
+
+        Returns:
+            int: 删除的磁盘条目数
+        """
+        now = time.time()
+        with self._lock:
+            if not expired_only:
+                # 内存层不记录模型 ID，按模型清理时也整体清空（下次从磁盘重新加载）
+                self._memory.clear()
+            if self._disk is None:
+                return 0
+            try:
+                return self._disk.purge(model_id, now, expired_only)
+            except sqlite3.Error as e:
+                logger.warning(f"Response cache purge failed: {e}")
+                return 0
+
+    def replay(self, text: str) -> Generator[str, None, None]:
+        """把缓存的回答按流的形式回放
+
+        Args:
+            text: 缓存的回答
+
+        Yields:
+            str: 文本片段（replay_interval 大于 0 时按间隔输出）
+        """
+        return replay_chunks(text, self.policy.replay_chunk_chars, self.policy.replay_interval)
+
+    def areplay(self, text: str) -> AsyncGenerator[str, None]:
+        """replay 的异步版本"""
+        return areplay_chunks(text, self.policy.replay_chunk_chars, self.policy.replay_interval)
+
+    def stream(
+        self,
+        key: str,
+        model_id: str,
+        upstream: Callable[[], Iterator[str]]
+    ) -> Generator[str, None, None]:
+        """命中时回放缓存，未命中时转发上游并在正常结束后写入缓存
+
+        Args:
+            key: 缓存键
+            model_id: 模型 ID
+            upstream: 创建上游流的函数（只在未命中时调用）
+
+        Yields:
+            str: 文本片段
+        """
+        text = self.get(key)
+        if text is not None:
+            logger.info(f"Response cache hit for {model_id}")
+            yield from self.replay(text)
+            return
+
+        parts: List[str] = []
+        for chunk in upstream():
+            parts.append(chunk)
+            yield chunk
+        # 只有上游正常结束才会执行到这里（异常和 GeneratorExit 都不会写入）
+        if parts:
+            self.put(key, model_id, "".join(parts))
+
+    async def astream(
+        self,
+        key: str,
+        model_id: str,
+        upstream: Callable[[], AsyncGenerator[str, None]]
+    ) -> AsyncGenerator[str, None]:
+        """stream 的异步版本（SQLite 读写放到线程池中执行）"""
+        text = await asyncio.to_thread(self.get, key)
+        if text is not None:
+            logger.info(f"Response cache hit for {model_id}")
+            async for chunk in self.areplay(text):
+                yield chunk
+            return
+
+        parts: List[str] = []
+        stream = upstream()
+        try:
+            async for chunk in stream:
+                parts.append(chunk)
+                yield chunk
+        finally:
+            await stream.aclose()
+        if parts:
+            await asyncio.to_thread(self.put, key, model_id, "".join(parts))
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计
+
+        Returns:
+            Dict[str, Any]: 命中/未命中次数、命中率、节省的字节数、内存层占用
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            memory_bytes, memory_entries = self._memory.bytes, len(self._memory)
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            **counters,
+            "lookups": lookups,
+            "hit_ratio": counters["hits"] / lookups if lookups else 0.0,
+            "memory_bytes": memory_bytes,
+            "memory_entries": memory_entries,
+            "persistent": self._disk is not None
+        }
+
+    def close(self) -> None:
+        """关闭磁盘层连接"""
+        with self._lock:
+            if self._disk is not None:
+                self._disk.close()
+                self._disk = None
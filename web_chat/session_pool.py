@@ -0,0 +1,303 @@
+"""HTTP Keep-Alive 会话池
+
+为基于 requests 的 SSE 适配器（Qwen, Spark, 智谱）按上游主机维护
+requests.Session，复用 TCP + TLS 连接，避免每轮对话都重新握手。
+
+功能：
+- 每个上游主机一个 Session，主机数量按 LRU 限制
+- 可配置每个主机的最大连接数
+- 空闲超时后重建 Session（上游通常已关闭空闲连接）
+- 对陈旧的 keep-alive 连接自动重试一次
+- 流被中途放弃时关闭响应，连接槽位干净地归还连接池
+- 连接复用率统计
+"""
+
+import os
+import time
+import socket
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Generator, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+from urllib3.util.retry import Retry
+
+from request_timing import timed
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+HostKey = Tuple[str, str]
+
+
+class _StaleConnectionRetry(Retry):
+    """只重试陈旧连接的 Retry
+
+    读超时不在这里重试：它意味着上游确实慢，由流式重试层（stream_retry）
+    按首字时间预算和退避策略处理，避免两层重试叠加。
+    """
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        if isinstance(error, ReadTimeoutError):
+            raise error
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+
+class _HostSession:
+    """单个上游主机的会话及其使用时间"""
+
+    def __init__(self, session: requests.Session, adapter: HTTPAdapter) -> None:
+        self.session = session
+        self.adapter = adapter
+        self.last_used = time.monotonic()
+        self.active = 0
+
+
+class SessionPool:
+    """按上游主机管理的 requests.Session 池
+
+    Example:
+        >>> pool = SessionPool()
+        >>> with pool.stream('https://api.siliconflow.cn/v1/chat/completions', json=payload) as response:
+        ...     for line in response.iter_lines():
+        ...         ...
+    """
+
+    def __init__(
+        self,
+        max_hosts: int = 16,
+        max_connections_per_host: int = 10,
+        idle_timeout: float = 60.0,
+        stale_retries: int = 1
+    ) -> None:
+        """初始化会话池
+
+        Args:
+            max_hosts: 最多保留的上游主机会话数
+            max_connections_per_host: 每个主机保持的最大连接数
+            idle_timeout: 主机会话空闲多久后重建（秒），0 表示不重建
+            stale_retries: 连接失效（如对端已关闭 keep-alive 连接）时的重试次数
+        """
+        self.max_hosts = max_hosts
+        self.max_connections_per_host = max_connections_per_host
+        self.idle_timeout = idle_timeout
+        self.stale_retries = stale_retries
+        self._hosts: "OrderedDict[HostKey, _HostSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        # 已关闭会话的累计连接/请求数，保证统计在会话重建后不丢失
+        self._retired_connections = 0
+        self._retired_requests = 0
+        self.abandoned_streams = 0
+
+    def _build_session(self) -> _HostSession:
+        """创建带连接池和陈旧连接重试的 Session"""
+        retry = _StaleConnectionRetry(
+            total=self.stale_retries,
+            connect=self.stale_retries,
+            read=self.stale_retries,
+            status=0,
+            other=0,
+            allowed_methods=None,  # 仅在收到响应头之前重试，POST 同样适用
+            raise_on_status=False,
+            backoff_factor=0
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.max_connections_per_host,
+            max_retries=retry
+        )
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return _HostSession(session, adapter)
+
+    @staticmethod
+    def _host_key(url: str) -> HostKey:
+        """提取 URL 的 (scheme, host:port)"""
+        parts = urlsplit(url)
+        return parts.scheme, parts.netloc
+
+    def _acquire(self, url: str) -> _HostSession:
+        """获取主机对应的会话，必要时创建或重建"""
+        key = self._host_key(url)
+        to_close = []
+        with self._lock:
+            host = self._hosts.get(key)
+            now = time.monotonic()
+            if (
+                host is not None
+                and self.idle_timeout > 0
+                and host.active == 0
+                and now - host.last_used > self.idle_timeout
+            ):
+                to_close.append(self._hosts.pop(key))
+                host = None
+
+            if host is None:
+                host = self._build_session()
+                self._hosts[key] = host
+                while len(self._hosts) > self.max_hosts:
+                    _, oldest = self._hosts.popitem(last=False)
+                    to_close.append(oldest)
+            else:
+                self._hosts.move_to_end(key)
+
+            host.active += 1
+            host.last_used = now
+            for retired in to_close:
+                self._retire_locked(retired)
+
+        for retired in to_close:
+            retired.session.close()
+        return host
+
+    def _release(self, host: _HostSession) -> None:
+        """归还主机会话"""
+        with self._lock:
+            host.active -= 1
+            host.last_used = time.monotonic()
+
+    def _retire_locked(self, host: _HostSession) -> None:
+        """累计即将关闭的会话统计（调用方需持有锁）"""
+        connections, requests_count = self._adapter_counts(host.adapter)
+        self._retired_connections += connections
+        self._retired_requests += requests_count
+
+    @staticmethod
+    def _adapter_counts(adapter: HTTPAdapter) -> Tuple[int, int]:
+        """读取 urllib3 连接池的新建连接数与请求数"""
+        connections = 0
+        requests_count = 0
+        pools = adapter.poolmanager.pools
+        for pool_key in pools.keys():
+            try:
+                pool = pools[pool_key]
+            except KeyError:
+                continue
+            connections += pool.num_connections
+            requests_count += pool.num_requests
+        return connections, requests_count
+
+    @contextmanager
+    def stream(self, url: str, **kwargs: Any) -> Generator[requests.Response, None, None]:
+        """以流式方式发送 POST 请求
+
+        正常读取完毕时排空剩余数据，让连接回到池中复用；如果调用方中途
+        放弃（例如客户端断开导致生成器被关闭），直接关闭响应，释放连接槽位。
+
+        Args:
+            url: 请求 URL
+            **kwargs: 透传给 requests.Session.post 的参数
+
+        Yields:
+            requests.Response: 流式响应对象
+        """
+        with timed("client"):
+            host = self._acquire(url)
+        response = None
+        completed = False
+        try:
+            with timed("connect"):
+                response = host.session.post(url, stream=True, **kwargs)
+            yield response
+            completed = True
+        finally:
+            if response is not None:
+                if completed:
+                    try:
+                        response.raw.drain_conn()
+                    except Exception as e:
+                        logger.debug(f"Failed to drain connection: {e}")
+                else:
+                    with self._lock:
+                        self.abandoned_streams += 1
+                response.close()
+            self._release(host)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取会话池统计信息
+
+        Returns:
+            Dict[str, Any]: 包含 hosts, connections, requests, reuse_ratio, abandoned_streams
+        """
+        with self._lock:
+            connections = self._retired_connections
+            requests_count = self._retired_requests
+            for host in self._hosts.values():
+                host_connections, host_requests = self._adapter_counts(host.adapter)
+                connections += host_connections
+                requests_count += host_requests
+            return {
+                "hosts": len(self._hosts),
+                "connections": connections,
+                "requests": requests_count,
+                "reuse_ratio": 1 - connections / requests_count if requests_count else 0.0,
+                "abandoned_streams": self.abandoned_streams
+            }
+
+    def close(self) -> None:
+        """关闭所有主机会话"""
+        with self._lock:
+            hosts = list(self._hosts.values())
+            for host in hosts:
+                self._retire_locked(host)
+            self._hosts.clear()
+        for host in hosts:
+            host.session.close()
+
+
+def set_read_timeout(response: requests.Response, timeout: Optional[float]) -> bool:
+    """修改流式响应剩余部分的读超时
+
+    用于收到首个 token 后把读超时从首字时间预算恢复为正常值。
+
+    Args:
+        response: 流式响应对象
+        timeout: 新的读超时（秒），None 表示不超时
+
+    Returns:
+        bool: 底层 socket 可访问且已修改时返回 True
+    """
+    connection = getattr(response.raw, "connection", None)
+    sock = getattr(connection, "sock", None)
+    if sock is None:
+        return False
+    sock.settimeout(timeout)
+    return True
+
+
+def abort_stream(response: requests.Response) -> None:
+    """从其他线程立即中止一个正在读取的流式响应
+
+    shutdown 会唤醒阻塞在该 socket 上的读取，随后关闭响应，连接不会被复用。
+
+    Args:
+        response: 流式响应对象
+    """
+    connection = getattr(response.raw, "connection", None)
+    sock = getattr(connection, "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    response.close()
+
+
+def session_pool_settings_from_env() -> Dict[str, Any]:
+    """从环境变量读取会话池配置
+
+    Returns:
+        Dict[str, Any]: SessionPool 的构造参数
+    """
+    return {
+        "max_hosts": int(os.environ.get("LLM_HTTP_POOL_SIZE", 16)),
+        "max_connections_per_host": int(os.environ.get("LLM_HTTP_MAX_PER_HOST", 10)),
+        "idle_timeout": float(os.environ.get("LLM_HTTP_IDLE_TIMEOUT", 60)),
+        "stale_retries": int(os.environ.get("LLM_HTTP_STALE_RETRIES", 1))
+    }
@@ -0,0 +1,478 @@
+"""近似重复问题缓存（MinHash + LSH）
+
+共享部署中经常有人用几乎相同的措辞问同一个问题（大小写、空白、标点不同）。
+本模块在本地计算相似度，不依赖任何外部向量服务：
+
+- 只处理单轮请求（除系统提示词外只有一条用户消息）
+- 对用户消息做规范化（小写、合并空白、去掉末尾的句号问号等），按字符 n-gram
+  切分为 shingle，计算 MinHash 签名；数字、运算符和符号都保留在 shingle 中
+- 数字与符号序列（如 "12+30"、"c#"）必须完全相同才会命中，避免只差一个
+  运算符或数字的问题返回错误的回答
+- LSH 分桶索引：签名按 band 切分，任一 band 完全相同的条目成为候选，
+  再用签名估计 Jaccard 相似度，超过阈值时直接返回已保存的回答
+- 作用域按 (模型 ID, 系统提示词) 隔离，不同模型或不同人设的回答不会混用
+- 条目数有上限，按最近最少使用淘汰，并有 TTL
+
+Example:
+    >>> cache = SimilarityCache(SimilarityCachePolicy(enabled=True, models=('deepseek',)))
+    >>> for chunk in cache.stream('deepseek', system, prompt, lambda: adapter(config, messages)):
+    ...     print(chunk, end='')
+"""
+
+import os
+import re
+import asyncio
+import time
+import struct
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Callable, Dict, Generator, Iterator, List, Optional, Set, Tuple
+
+from response_cache import areplay_chunks, replay_chunks
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# MinHash 使用的梅森素数与哈希掩码
+_MERSENNE_PRIME = (1 << 61) - 1
+_HASH_MASK = (1 << 64) - 1
+
+_WHITESPACE_RE = re.compile(r"\s+")
+# 问题末尾不影响含义的标点（句号、问号、感叹号、省略号等）
+_TRAILING_PUNCT_RE = re.compile(r"[\s.。!！?？…~～]+$")
+
+
+@dataclass(frozen=True)
+class SimilarityCachePolicy:
+    """近似重复缓存策略
+
+    Attributes:
+        enabled: 是否启用
+        models: 启用的模型 ID（models.json 中 similarity_cache 为 true 的模型也会启用）
+        threshold: 命中所需的最小 Jaccard 相似度（0-1）
+        num_perm: MinHash 签名长度
+        bands: LSH band 数（num_perm 必须能被整除）
+        shingle_size: 字符 n-gram 的长度
+        max_entries: 最多保存的条目数
+        max_prompt_chars: 超过此长度的问题不参与缓存
+        ttl: 条目有效期（秒）
+        replay_chunk_chars: 回放时每个片段的字符数
+        replay_interval: 回放片段之间的间隔（秒）
+    """
+    enabled: bool = False
+    models: Tuple[str, ...] = ()
+    threshold: float = 0.85
+    num_perm: int = 64
+    bands: int = 16
+    shingle_size: int = 3
+    max_entries: int = 5000
+    max_prompt_chars: int = 2000
+    ttl: float = 86400.0
+    replay_chunk_chars: int = 16
+    replay_interval: float = 0.0
+
+
+def similarity_cache_settings_from_env() -> Dict[str, Any]:
+    """从环境变量读取近似重复缓存配置
+
+    Returns:
+        Dict[str, Any]: SimilarityCachePolicy 的构造参数
+    """
+    models = os.environ.get("LLM_SIMILARITY_CACHE_MODELS", "")
+    return {
+        "enabled": os.environ.get("LLM_SIMILARITY_CACHE_ENABLED", "false").lower() == "true",
+        "models": tuple(m.strip() for m in models.split(",") if m.strip()),
+        "threshold": float(os.environ.get("LLM_SIMILARITY_CACHE_THRESHOLD", 0.85)),
+        "max_entries": int(os.environ.get("LLM_SIMILARITY_CACHE_MAX_ENTRIES", 5000)),
+        "ttl": float(os.environ.get("LLM_SIMILARITY_CACHE_TTL", 86400)),
+        "replay_chunk_chars": int(os.environ.get("LLM_RESPONSE_CACHE_REPLAY_CHARS", 16)),
+        "replay_interval": float(os.environ.get("LLM_RESPONSE_CACHE_REPLAY_INTERVAL", 0))
+    }
+
+
+def normalize_prompt(text: str) -> str:
+    """规范化问题文本
+
+    只转小写、合并空白并去掉末尾的句号、问号等；数字、运算符和其他符号保持不变
+    （"2+3" 与 "2-3"、"C#" 与 "C++" 是不同的问题）。
+
+    Args:
+        text: 原始文本
+
+    Returns:
+        str: 规范化后的文本
+    """
+    text = _WHITESPACE_RE.sub(" ", text.lower()).strip()
+    return _TRAILING_PUNCT_RE.sub("", text)
+
+
+def salient_chars(text: str) -> str:
+    """提取规范化文本中的数字与符号序列（相似问题必须完全相同才能命中）
+
+    Args:
+        text: 规范化后的文本
+
+    Returns:
+        str: 除字母和空白外的所有字符，按原顺序排列
+    """
+    return "".join(c for c in text if not (c.isalpha() or c.isspace()))
+
+
+def shingles(text: str, size: int) -> Set[str]:
+    """把文本切分为字符 n-gram 集合（中英文通用，不需要分词）
+
+    Args:
+        text: 规范化后的文本
+        size: n-gram 长度
+
+    Returns:
+        Set[str]: shingle 集合，文本短于 size 时返回整个文本
+    """
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class MinHasher:
+    """MinHash 签名计算（通用哈希族 (a*x + b) mod p）"""
+
+    def __init__(self, num_perm: int, seed: int = 1) -> None:
+        """初始化哈希族
+
+        Args:
+            num_perm: 签名长度
+            seed: 生成哈希参数的种子（同一进程内固定）
+        """
+        self.num_perm = num_perm
+        self._params: List[Tuple[int, int]] = []
+        for i in range(num_perm):
+            digest = hashlib.blake2b(f"{seed}:{i}".encode(), digest_size=16).digest()
+            a, b = struct.unpack("<QQ", digest)
+            self._params.append((a % (_MERSENNE_PRIME - 1) + 1, b % _MERSENNE_PRIME))
+
+    def signature(self, items: Set[str]) -> Tuple[int, ...]:
+        """计算集合的 MinHash 签名
+
+        Args:
+            items: shingle 集合
+
+        Returns:
+            Tuple[int, ...]: 长度为 num_perm 的签名
+        """
+        hashes = [
+            struct.unpack("<Q", hashlib.blake2b(item.encode("utf-8"), digest_size=8).digest())[0]
+            for item in items
+        ]
+        prime = _MERSENNE_PRIME
+        return tuple(min((a * h + b) % prime for h in hashes) for a, b in self._params)
+
+
+def estimate_jaccard(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+    """用 MinHash 签名估计 Jaccard 相似度"""
+    return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+
+class _Entry:
+    """一条缓存的问答"""
+
+    __slots__ = ("entry_id", "model_id", "scope", "prompt", "salient", "signature", "answer",
+                 "created_at", "expires_at", "hits")
+
+    def __init__(
+        self,
+        entry_id: str,
+        model_id: str,
+        scope: str,
+        prompt: str,
+        signature: Tuple[int, ...],
+        answer: str,
+        now: float,
+        ttl: float
+    ) -> None:
+        self.entry_id = entry_id
+        self.model_id = model_id
+        self.scope = scope
+        self.prompt = prompt
+        self.salient = salient_chars(prompt)
+        self.signature = signature
+        self.answer = answer
+        self.created_at = now
+        self.expires_at = now + ttl
+        self.hits = 0
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "id": self.entry_id,
+            "model": self.model_id,
+            "prompt": self.prompt,
+            "answer_chars": len(self.answer),
+            "hits": self.hits,
+            "created_at": self.created_at,
+            "expires_at": self.expires_at
+        }
+
+
+def scope_for(model_id: str, system: str) -> str:
+    """计算 (模型 ID, 系统提示词) 的作用域标识"""
+    return hashlib.sha256(f"{model_id}\0{system}".encode("utf-8")).hexdigest()[:16]
+
+
+class SimilarityCache:
+    """近似重复问题缓存（线程安全，进程内共享，只在内存中保存）"""
+
+    def __init__(self, policy: Optional[SimilarityCachePolicy] = None) -> None:
+        """初始化缓存
+
+        Args:
+            policy: 缓存策略，默认不启用
+
+        Raises:
+            ValueError: num_perm 不能被 bands 整除
+        """
+        self.policy = policy or SimilarityCachePolicy()
+        if self.policy.num_perm % self.policy.bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self._rows = self.policy.num_perm // self.policy.bands
+        self._hasher = MinHasher(self.policy.num_perm)
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._buckets: Dict[Tuple[str, int, Tuple[int, ...]], Set[str]] = {}
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def enabled_for(self, model_id: str, config: Dict[str, Any]) -> bool:
+        """判断模型是否启用近似重复缓存"""
+        if not self.policy.enabled:
+            return False
+        return model_id in self.policy.models or config.get("similarity_cache") is True
+
+    def single_turn_prompt(
+        self,
+        config: Dict[str, Any],
+        messages: List[Dict[str, str]]
+    ) -> Optional[Tuple[str, str]]:
+        """提取单轮请求的 (系统提示词, 用户问题)
+
+        Args:
+            config: 模型配置（消息中没有系统提示词时使用配置中的 system）
+            messages: 消息列表
+
+        Returns:
+            Optional[Tuple[str, str]]: 多轮对话或问题过长时返回 None
+        """
+        system = config.get("system", "")
+        turns = messages
+        if turns and turns[0]["role"] == "system":
+            system, turns = turns[0]["content"], turns[1:]
+        if len(turns) != 1 or turns[0]["role"] != "user":
+            return None
+        prompt = turns[0]["content"]
+        if len(prompt) > self.policy.max_prompt_chars:
+            return None
+        return system, prompt
+
+    def _bands(self, signature: Tuple[int, ...]) -> Iterator[Tuple[int, Tuple[int, ...]]]:
+        rows = self._rows
+        for band in range(self.policy.bands):
+            yield band, signature[band * rows:(band + 1) * rows]
+
+    def _signature(self, prompt: str) -> Tuple[str, Tuple[int, ...]]:
+        normalized = normalize_prompt(prompt)
+        return normalized, self._hasher.signature(shingles(normalized, self.policy.shingle_size))
+
+    def lookup(self, model_id: str, system: str, prompt: str) -> Optional[str]:
+        """查找相似问题的回答
+
+        Args:
+            model_id: 模型 ID
+            system: 系统提示词
+            prompt: 用户问题
+
+        Returns:
+            Optional[str]: 相似度最高且超过阈值的条目的回答，没有时返回 None
+        """
+        scope = scope_for(model_id, system)
+        normalized, signature = self._signature(prompt)
+        salient = salient_chars(normalized)
+        now = time.time()
+
+        with self._lock:
+            candidates: Set[str] = set()
+            for band, rows in self._bands(signature):
+                candidates |= self._buckets.get((scope, band, rows), set())
+
+            best: Optional[_Entry] = None
+            best_score = self.policy.threshold
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                if entry.expires_at <= now:
+                    self._remove(entry_id)
+                    continue
+                if entry.salient != salient:
+                    continue
+                score = estimate_jaccard(signature, entry.signature)
+                if score >= best_score:
+                    best, best_score = entry, score
+
+            if best is None:
+                self._counters["misses"] += 1
+                return None
+            best.hits += 1
+            self._entries.move_to_end(best.entry_id)
+            self._counters["hits"] += 1
+            logger.info(f"Similarity cache hit for {model_id} (jaccard~{best_score:.2f})")
+            return best.answer
+
+    def store(self, model_id: str, system: str, prompt: str, answer: str) -> None:
+        """保存问答，超过容量时淘汰最久未使用的条目
+
+        Args:
+            model_id: 模型 ID
+            system: 系统提示词
+            prompt: 用户问题
+            answer: 完整回答
+        """
+        scope = scope_for(model_id, system)
+        normalized, signature = self._signature(prompt)
+        entry_id = hashlib.sha256(f"{scope}\0{normalized}".encode("utf-8")).hexdigest()[:16]
+        entry = _Entry(entry_id, model_id, scope, normalized, signature, answer, time.time(), self.policy.ttl)
+
+        with self._lock:
+            self._remove(entry_id)
+            self._entries[entry_id] = entry
+            for band, rows in self._bands(signature):
+                self._buckets.setdefault((scope, band, rows), set()).add(entry_id)
+            self._counters["stores"] += 1
+            while len(self._entries) > self.policy.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._counters["evictions"] += 1
+
+    def _remove(self, entry_id: str) -> bool:
+        """从条目表和 LSH 索引中删除条目（调用方持有锁）"""
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return False
+        for band, rows in self._bands(entry.signature):
+            key = (entry.scope, band, rows)
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+        return True
+
+    def entries(self, model_id: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """列出条目（最近使用的在前）
+
+        Args:
+            model_id: 只列出该模型的条目
+            limit: 最多返回的条目数
+
+        Returns:
+            List[Dict[str, Any]]: 条目描述
+        """
+        with self._lock:
+            result = []
+            for entry in reversed(self._entries.values()):
+                if model_id is None or entry.model_id == model_id:
+                    result.append(entry.describe())
+                    if len(result) >= limit:
+                        break
+            return result
+
+    def purge(self, model_id: Optional[str] = None, entry_id: Optional[str] = None) -> int:
+        """删除条目
+
+        Args:
+            model_id: 只删除该模型的条目
+            entry_id: 只删除该条目
+
+        Returns:
+            int: 删除的条目数
+        """
+        with self._lock:
+            if entry_id is not None:
+                return int(self._remove(entry_id))
+            doomed = [
+                eid for eid, entry in self._entries.items()
+                if model_id is None or entry.model_id == model_id
+            ]
+            for eid in doomed:
+                self._remove(eid)
+            return len(doomed)
+
+    def stream(
+        self,
+        model_id: str,
+        system: str,
+        prompt: str,
+        upstream: Callable[[], Iterator[str]]
+    ) -> Generator[str, None, None]:
+        """命中时回放相似问题的回答，未命中时转发上游并在正常结束后保存
+
+        Args:
+            model_id: 模型 ID
+            system: 系统提示词
+            prompt: 用户问题
+            upstream: 创建上游流的函数（只在未命中时调用）
+
+        Yields:
+            str: 文本片段
+        """
+        answer = self.lookup(model_id, system, prompt)
+        if answer is not None:
+            yield from replay_chunks(answer, self.policy.replay_chunk_chars, self.policy.replay_interval)
+            return
+
+        parts: List[str] = []
+        for chunk in upstream():
+            parts.append(chunk)
+            yield chunk
+        if parts:
+            self.store(model_id, system, prompt, "".join(parts))
+
+    async def astream(
+        self,
+        model_id: str,
+        system: str,
+        prompt: str,
+        upstream: Callable[[], AsyncGenerator[str, None]]
+    ) -> AsyncGenerator[str, None]:
+        """stream 的异步版本（MinHash 计算与索引查找在线程中进行，不阻塞事件循环）"""
+        answer = await asyncio.to_thread(self.lookup, model_id, system, prompt)
+        if answer is not None:
+            async for chunk in areplay_chunks(answer, self.policy.replay_chunk_chars, self.policy.replay_interval):
+                yield chunk
+            return
+
+        parts: List[str] = []
+        stream = upstream()
+        try:
+            async for chunk in stream:
+                parts.append(chunk)
+                yield chunk
+        finally:
+            await stream.aclose()
+        if parts:
+            await asyncio.to_thread(self.store, model_id, system, prompt, "".join(parts))
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计
+
+        Returns:
+            Dict[str, Any]: 命中/未命中/写入/淘汰次数、命中率、当前条目数
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._entries)
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            **counters,
+            "lookups": lookups,
+            "hit_ratio": counters["hits"] / lookups if lookups else 0.0,
+            "entries": size,
+            "max_entries": self.policy.max_entries,
+            "threshold": self.policy.threshold
+        }
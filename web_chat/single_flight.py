@@ -0,0 +1,171 @@
+"""相同请求合并（Single-flight）
+
+同一个问题被并发提交（热门的预设问题、双击发送按钮）时，每个请求都会打开
+自己的上游流。本模块把正在进行中的相同请求合并到同一个上游流上：
+
+- 第一个请求（leader）在后台线程中读取上游，片段写入共享缓冲区
+- 之后到达的相同请求作为订阅者加入，先收到已经输出的前缀，再接着收到实时片段
+- 每个订阅者独立断开；只有最后一个订阅者离开时才取消上游（通过 hedging 的
+  取消作用域中止阻塞中的读取）
+- 上游结束后该请求从表中移除，之后到达的相同请求会重新发起（重复请求由
+  响应缓存处理）
+
+Example:
+    >>> flights = SingleFlight(enabled=True)
+    >>> for chunk in flights.stream(key, lambda: llm._chat_qwen(config, messages)):
+    ...     print(chunk, end='')
+"""
+
+import os
+import logging
+import threading
+from typing import Any, Callable, Dict, Generator, Iterator, List, Optional
+
+from hedging import CancelScope, use_scope
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+def single_flight_settings_from_env() -> Dict[str, Any]:
+    """从环境变量读取请求合并配置
+
+    Returns:
+        Dict[str, Any]: SingleFlight 的构造参数
+    """
+    return {"enabled": os.environ.get("LLM_SINGLE_FLIGHT_ENABLED", "false").lower() == "true"}
+
+
+class _Flight:
+    """一个正在进行中的上游流及其订阅者"""
+
+    def __init__(self, key: str) -> None:
+        self.key = key
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.cond = threading.Condition()
+        self.scope = CancelScope()
+
+
+class SingleFlight:
+    """相同请求合并器（线程安全，进程内共享）"""
+
+    def __init__(self, enabled: bool = False) -> None:
+        """初始化合并器
+
+        Args:
+            enabled: 是否启用合并，关闭时 stream() 直接转发上游
+        """
+        self.enabled = enabled
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self._counters = {"leaders": 0, "followers": 0, "cancelled": 0}
+
+    def stream(self, key: str, upstream: Callable[[], Iterator[str]]) -> Generator[str, None, None]:
+        """以合并方式执行流式请求
+
+        Args:
+            key: 请求的规范化哈希（相同的键视为相同请求）
+            upstream: 创建上游流的函数（只有 leader 会调用）
+
+        Yields:
+            str: 文本片段（后加入的订阅者先收到已输出的前缀）
+
+        Raises:
+            Exception: 上游抛出的异常会传给所有订阅者
+        """
+        if not self.enabled:
+            yield from upstream()
+            return
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight(key)
+                self._counters["leaders"] += 1
+            else:
+                self._counters["followers"] += 1
+                logger.info(f"Coalescing request {key[:12]} onto in-flight stream")
+            flight.subscribers += 1
+
+        if leader:
+            threading.Thread(
+                target=self._produce, args=(flight, upstream),
+                name=f"single-flight-{key[:8]}", daemon=True
+            ).start()
+
+        try:
+            yield from self._subscribe(flight)
+        finally:
+            self._leave(flight)
+
+    def _produce(self, flight: _Flight, upstream: Callable[[], Iterator[str]]) -> None:
+        """在后台线程中读取上游，把片段写入共享缓冲区"""
+        stream: Optional[Iterator[str]] = None
+        error: Optional[BaseException] = None
+        with use_scope(flight.scope):
+            try:
+                stream = upstream()
+                for chunk in stream:
+                    if flight.scope.cancelled:
+                        break
+                    with flight.cond:
+                        flight.chunks.append(chunk)
+                        flight.cond.notify_all()
+            except BaseException as e:
+                error = e
+            finally:
+                close = getattr(stream, "close", None)
+                if close is not None:
+                    close()
+
+        with flight.cond:
+            flight.error = error
+            flight.done = True
+            flight.cond.notify_all()
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+
+    @staticmethod
+    def _subscribe(flight: _Flight) -> Generator[str, None, None]:
+        """从共享缓冲区读取片段，直到上游结束"""
+        index = 0
+        while True:
+            with flight.cond:
+                while index >= len(flight.chunks) and not flight.done:
+                    flight.cond.wait()
+                chunks = flight.chunks[index:]
+                index += len(chunks)
+                done, error = flight.done, flight.error
+
+            # 在锁外输出，避免慢订阅者阻塞上游和其他订阅者
+            yield from chunks
+            if done:
+                if error is not None:
+                    raise error
+                return
+
+    def _leave(self, flight: _Flight) -> None:
+        """订阅者离开；最后一个订阅者离开且上游未结束时取消上游"""
+        with self._lock:
+            flight.subscribers -= 1
+            if flight.subscribers > 0 or flight.done:
+                return
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            self._counters["cancelled"] += 1
+        logger.info(f"Last subscriber left, cancelling upstream for {flight.key[:12]}")
+        flight.scope.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取合并统计
+
+        Returns:
+            Dict[str, Any]: leader 数、被合并的请求数、被取消的上游数、进行中的上游数
+        """
+        with self._lock:
+            return {**self._counters, "in_flight": len(self._flights)}
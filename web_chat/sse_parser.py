@@ -0,0 +1,331 @@
+"""增量式 SSE（Server-Sent Events）解析器
+
+在字节层面增量解析上游的 SSE 流，替代逐行 decode + json.loads 的做法：
+
+- 按到达的字节块增量解析，支持 LF / CRLF / CR 三种换行
+- 支持多行 data 字段，以及 event / id 字段和注释行
+- 安装了 orjson 时使用它解码 JSON，否则回退到标准库 json
+- 对不含 delta.content 的事件（仅包含 role 的首帧、usage 帧等）跳过完整 JSON 解码
+
+Example:
+    >>> for text in iter_delta_content(iter_response_bytes(response)):
+    ...     print(text, end='')
+"""
+
+import json
+import logging
+from typing import Any, Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from urllib3.response import HTTPResponse
+
+try:
+    import orjson
+    _json_loads: Callable[[Any], Any] = orjson.loads
+    JSON_DECODE_ERRORS: tuple = (orjson.JSONDecodeError, UnicodeDecodeError)
+except ImportError:  # pragma: no cover - orjson 是可选依赖
+    orjson = None
+    _json_loads = json.loads
+    JSON_DECODE_ERRORS = (json.JSONDecodeError, UnicodeDecodeError)
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 从 HTTP 响应读取的最大块大小（字节）
+READ_CHUNK_SIZE = 64 * 1024
+
+_DONE = b"[DONE]"
+_CONTENT_KEY = b'"content":'
+
+
+class SSEEvent(NamedTuple):
+    """一个完整的 SSE 事件
+
+    Attributes:
+        event: 事件类型，未指定时为 "message"
+        data: data 字段内容（多行 data 以 \\n 连接）
+        id: 最近一次的 id 字段
+    """
+    event: str
+    data: bytes
+    id: Optional[str]
+
+
+class SSEParser:
+    """增量式 SSE 解析器
+
+    Example:
+        >>> parser = SSEParser()
+        >>> parser.feed(b'data: {"a"')
+        []
+        >>> parser.feed(b': 1}\\n\\n')
+        [SSEEvent(event='message', data=b'{"a": 1}', id=None)]
+    """
+
+    def __init__(self) -> None:
+        self._buffer = b""
+        self._pending_cr = False
+        self._data: List[bytes] = []
+        self._event = ""
+        self._last_id: Optional[str] = None
+
+    @property
+    def last_event_id(self) -> Optional[str]:
+        """最近一次 id 字段的值"""
+        return self._last_id
+
+    def _split_blocks(self, chunk: bytes) -> List[bytes]:
+        """统一换行符并按空行切分出完整的块，剩余部分留在缓冲区"""
+        if self._pending_cr:
+            # 上一块以 CR 结尾：如果这一块以 LF 开头，二者是同一个 CRLF
+            if chunk[:1] == b"\n":
+                chunk = chunk[1:]
+            self._pending_cr = False
+        if b"\r" in chunk:
+            if chunk.endswith(b"\r"):
+                self._pending_cr = True
+            chunk = chunk.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+
+        if self._buffer:
+            chunk = self._buffer + chunk
+        blocks = chunk.split(b"\n\n")
+        self._buffer = blocks.pop()
+        return blocks
+
+    def feed(self, chunk: bytes) -> List[SSEEvent]:
+        """输入一个字节块，返回其中解析完成的事件
+
+        Args:
+            chunk: 从网络读到的原始字节
+
+        Returns:
+            List[SSEEvent]: 本次解析完成的事件
+        """
+        events: List[SSEEvent] = []
+        for block in self._split_blocks(chunk):
+            # 绝大多数事件只有一行 "data: ..."，走快速路径
+            if block[:6] == b"data: " and b"\n" not in block:
+                events.append(SSEEvent(self._event or "message", block[6:], self._last_id))
+                self._event = ""
+            else:
+                self._process_block(block, events)
+        return events
+
+    def feed_data(self, chunk: bytes) -> List[bytes]:
+        """与 feed 相同，但只返回每个事件的 data（热路径不创建 SSEEvent）
+
+        event 字段被忽略，id 字段仍会更新 last_event_id。
+
+        Args:
+            chunk: 从网络读到的原始字节
+
+        Returns:
+            List[bytes]: 本次解析完成的事件的 data
+        """
+        data: List[bytes] = []
+        for block in self._split_blocks(chunk):
+            if block[:6] == b"data: " and b"\n" not in block:
+                data.append(block[6:])
+            else:
+                # 少见的块（多行 data、event/id、注释）回退到完整解析
+                events: List[SSEEvent] = []
+                self._process_block(block, events)
+                data.extend(event.data for event in events)
+        return data
+
+    def _process_block(self, block: bytes, events: List[SSEEvent]) -> None:
+        """逐行处理一个以空行结尾的块（多行 data、event/id 字段等）"""
+        for line in block.split(b"\n"):
+            if line:
+                self._process_line(line)
+            else:
+                # 块开头的空行：上一个块之后多出的空行
+                event = self._dispatch()
+                if event is not None:
+                    events.append(event)
+        event = self._dispatch()
+        if event is not None:
+            events.append(event)
+
+    def flush(self) -> List[SSEEvent]:
+        """流结束时输出尚未以空行结尾的最后一个事件"""
+        events: List[SSEEvent] = []
+        if self._buffer:
+            self._process_block(self._buffer, events)
+            self._buffer = b""
+        return events
+
+    def _process_line(self, line: bytes) -> None:
+        """处理单个字段行"""
+        if line[:1] == b":":
+            return  # 注释行
+
+        name, sep, value = line.partition(b":")
+        if sep and value[:1] == b" ":
+            value = value[1:]
+
+        if name == b"data":
+            self._data.append(value)
+        elif name == b"event":
+            self._event = value.decode("utf-8", "replace")
+        elif name == b"id":
+            if b"\0" not in value:
+                self._last_id = value.decode("utf-8", "replace")
+        # retry 及未知字段按规范忽略
+
+    def _dispatch(self) -> Optional[SSEEvent]:
+        """在空行处生成事件"""
+        if not self._data:
+            self._event = ""
+            return None
+        data = self._data[0] if len(self._data) == 1 else b"\n".join(self._data)
+        event = SSEEvent(self._event or "message", data, self._last_id)
+        self._data = []
+        self._event = ""
+        return event
+
+
+def iter_sse_events(chunks: Iterable[bytes]) -> Iterator[SSEEvent]:
+    """把字节块流解析为 SSE 事件流
+
+    Args:
+        chunks: 字节块迭代器
+
+    Yields:
+        SSEEvent: 解析出的事件
+    """
+    parser = SSEParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.flush()
+
+
+def _may_have_content(data: bytes) -> bool:
+    """快速判断事件是否可能包含非空 delta.content
+
+    role-only 首帧和 usage 帧的 content 通常缺失、为 "" 或 null，
+    这些事件无需完整 JSON 解码。
+    """
+    index = data.find(_CONTENT_KEY)
+    while index != -1:
+        start = index + len(_CONTENT_KEY)
+        value = data[start:start + 2]
+        if value[:1] == b" ":
+            value = data[start:start + 8].lstrip()[:2]
+        if value != b'""' and value != b"nu":
+            return True
+        index = data.find(_CONTENT_KEY, start)
+    return False
+
+
+def _decode_content(data: bytes) -> Optional[str]:
+    """完整解码一个事件并取出 choices[0].delta.content"""
+    try:
+        content = _json_loads(data)["choices"][0]["delta"].get("content", "")
+    except JSON_DECODE_ERRORS + (KeyError, IndexError, TypeError, AttributeError) as e:
+        logger.debug(f"Failed to parse SSE chunk: {e}")
+        return None
+    return content or None
+
+
+def _multiline_delta_content(data: bytes) -> Tuple[List[str], bool]:
+    """处理多行 data
+
+    多行 data 通常是合法 JSON 被拆成多行；部分非标准上游在事件之间不发空行，
+    此时逐行解码，并在遇到 [DONE] 时结束。
+    """
+    if _DONE not in data and _may_have_content(data):
+        content = _decode_content(data)
+        if content is not None:
+            return [content], False
+
+    texts: List[str] = []
+    for line in data.split(b"\n"):
+        if line.strip() == _DONE:
+            return texts, True
+        if _may_have_content(line):
+            content = _decode_content(line)
+            if content is not None:
+                texts.append(content)
+    return texts, False
+
+
+def event_delta_content(data: bytes) -> Tuple[List[str], bool]:
+    """处理一个 OpenAI 兼容 SSE 事件的 data
+
+    Args:
+        data: SSE 事件的 data 字段
+
+    Returns:
+        Tuple[List[str], bool]: (文本片段, 是否遇到 [DONE])
+    """
+    if b"\n" in data:
+        return _multiline_delta_content(data)
+    index = data.find(_CONTENT_KEY)
+    if index == -1:
+        # 没有 content 字段：usage 帧、[DONE] 等
+        return [], data.strip() == _DONE
+    # 热路径内联判断第一个 content 的值，只有疑似空值时才做完整检查
+    value = data[index + len(_CONTENT_KEY):index + len(_CONTENT_KEY) + 2]
+    if (value == b'""' or value == b"nu" or value[:1] == b" ") and not _may_have_content(data):
+        return [], False
+    content = _decode_content(data)
+    return ([content] if content is not None else []), False
+
+
+def iter_delta_content(chunks: Iterable[bytes]) -> Iterator[str]:
+    """解析 OpenAI 兼容的 SSE 字节流，输出 delta.content 文本
+
+    遇到 data: [DONE] 时结束。
+
+    Args:
+        chunks: 字节块迭代器
+
+    Yields:
+        str: 文本片段
+    """
+    parser = SSEParser()
+    key_length = len(_CONTENT_KEY)
+    for chunk in chunks:
+        for data in parser.feed_data(chunk):
+            # 热路径：单行 data 且第一个 content 的值明显非空，直接解码
+            index = data.find(_CONTENT_KEY)
+            if index != -1 and b"\n" not in data:
+                value = data[index + key_length:index + key_length + 2]
+                if value != b'""' and value != b"nu" and value[:1] != b" ":
+                    content = _decode_content(data)
+                    if content:
+                        yield content
+                    continue
+            texts, done = event_delta_content(data)
+            yield from texts
+            if done:
+                return
+    for event in parser.flush():
+        texts, done = event_delta_content(event.data)
+        yield from texts
+        if done:
+            return
+
+
+def iter_response_bytes(response: Any, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[bytes]:
+    """以“有多少读多少”的方式读取 requests 流式响应
+
+    urllib3 2.x 的 read1 在数据到达时立即返回，不会为凑满 chunk_size 而阻塞，
+    既能大块读取又不增加首字延迟；旧版本回退到 iter_content(chunk_size=None)。
+
+    Args:
+        response: requests.Response（stream=True）
+        chunk_size: 单次读取的最大字节数
+
+    Yields:
+        bytes: 原始字节块
+    """
+    raw = getattr(response, "raw", None)
+    if isinstance(raw, HTTPResponse) and hasattr(raw, "read1"):
+        while True:
+            chunk = raw.read1(chunk_size, decode_content=True)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        yield from response.iter_content(chunk_size=None)
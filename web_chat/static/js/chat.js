@@ -22,6 +22,7 @@ const ErrorType = {
     RATE_LIMIT: 'rate_limit',     // 速率限制
     TIMEOUT: 'timeout',           // 请求超时
     SERVER_ERROR: 'server_error', // 服务器错误
+    PROVIDER_UNAVAILABLE: 'provider_unavailable', // 上游提供商熔断，暂时不可用
     UNKNOWN: 'unknown'            // 未知错误
 };
 
@@ -60,6 +61,12 @@ const ERROR_MESSAGES = {
         icon: '⚠️',
         solution: '建议：\n1. 稍后重试\n2. 如果问题持续，请联系技术支持'
     },
+    [ErrorType.PROVIDER_UNAVAILABLE]: {
+        title: '模型服务暂时不可用',
+        message: '该模型的服务商近期连续出错，请求已被暂停',
+        icon: '🔌',
+        solution: '建议：\n1. 稍等片刻后重试（服务会自动探测恢复）\n2. 暂时切换到其他服务商的模型'
+    },
     [ErrorType.UNKNOWN]: {
         title: '未知错误',
         message: '发生了意外错误',
@@ -83,6 +90,11 @@ function classifyError(error, response = null) {
     const errorMessage = error.message?.toLowerCase() || '';
     const errorName = error.name?.toLowerCase() || '';
 
+    // 上游熔断（服务端返回 503 与 error_type: provider_unavailable）
+    if (errorName === 'providerunavailableerror') {
+        return ErrorType.PROVIDER_UNAVAILABLE;
+    }
+
     // 网络错误
     if (errorName === 'networkerror' ||
         errorMessage.includes('network') ||
@@ -285,17 +297,42 @@ async function sendMessage() {
     let response = null; // 在 try 外部声明，以便 catch 中访问
 
     try {
-        response = await fetch('/api/chat', {
+        const model = window.appState.currentModel;
+        const history = window.appState.getModelHistory(model);
+        const conversationId = window.appState.getConversationId(model);
+        const apiKeys = await getStoredApiKeys();
+        const postChat = (payload) => fetch('/api/chat', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-                model: window.appState.currentModel,
-                messages: window.appState.getModelHistory(window.appState.currentModel),
-                api_keys: await getStoredApiKeys()
-            }),
+            body: JSON.stringify({ model, conversation_id: conversationId, api_keys: apiKeys, ...payload }),
             signal: window.appState.abortController.signal
         });
 
+        // 增量请求：只发送版本号（已有的历史消息条数）和新消息
+        response = await postChat({
+            base_version: history.length - 1,
+            message: history[history.length - 1]
+        });
+        if (response.status === 409) {
+            // 服务端对话与本地历史不一致，上传完整历史重新同步
+            console.debug('服务端对话版本不一致，改为上传完整历史');
+            response = await postChat({ messages: history });
+        }
+
+        if (response.status === 429) {
+            // 速率限制：服务端通过 Retry-After 告知多少秒后可以重试
+            const retryAfter = response.headers.get('Retry-After');
+            throw new Error(retryAfter ? `Rate limited, retry after ${retryAfter}s` : 'Rate limited');
+        }
+        if (response.status === 503) {
+            // 上游熔断：服务端不发出请求，直接返回 503 与 Retry-After
+            const body = await response.json().catch(() => ({}));
+            if (body.error_type === 'provider_unavailable') {
+                const error = new Error(body.error);
+                error.name = 'ProviderUnavailableError';
+                throw error;
+            }
+        }
         if (!response.ok) throw new Error('Network error: ' + response.statusText);
 
         const reader = response.body.getReader();
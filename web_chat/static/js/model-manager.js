@@ -0,0 +1,599 @@
+// === State ===
+const modal = document.getElementById('model-modal');
+const openModalBtn = document.getElementById('open-modal');
+const closeModalBtn = document.getElementById('close-modal');
+const cancelBtn = document.getElementById('cancel-btn');
+const saveBtn = document.getElementById('save-btn');
+const deleteBtn = document.getElementById('delete-btn');
+const themeToggle = document.getElementById('theme-toggle');
+const backToHomeBtn = document.getElementById('back-to-home');
+
+let isEditMode = false;
+let editingModelId = null;
+
+// === Theme Toggle ===
+// 与主页面的主题保持同步 - 使用相同的 light-theme 类名
+function applyTheme(theme) {
+    if (theme === 'light') {
+        document.body.classList.add('light-theme');
+    } else {
+        document.body.classList.remove('light-theme');
+    }
+    // 更新主题图标
+    document.getElementById('theme-icon-dark').style.display = theme === 'light' ? 'none' : 'block';
+    document.getElementById('theme-icon-light').style.display = theme === 'light' ? 'block' : 'none';
+}
+
+function getTheme() {
+    // 优先使用主页面的主题存储
+    const storedTheme = localStorage.getItem('theme');
+    if (storedTheme) {
+        return storedTheme;
+    }
+    // 兼容旧版本
+    const oldTheme = localStorage.getItem('model-manager-theme');
+    if (oldTheme) {
+        // 迁移到新存储键
+        localStorage.setItem('theme', oldTheme);
+        localStorage.removeItem('model-manager-theme');
+        return oldTheme;
+    }
+    return 'dark'; // 默认深色主题
+}
+
+function setTheme(theme) {
+    localStorage.setItem('theme', theme);
+    applyTheme(theme);
+}
+
+themeToggle.addEventListener('click', () => {
+    const currentTheme = document.body.classList.contains('light-theme') ? 'light' : 'dark';
+    setTheme(currentTheme === 'light' ? 'dark' : 'light');
+});
+
+// 监听其他页面的主题变化
+window.addEventListener('storage', (e) => {
+    if (e.key === 'theme' && e.newValue) {
+        applyTheme(e.newValue);
+    }
+});
+
+// 监听页面可见性变化时同步主题
+document.addEventListener('visibilitychange', () => {
+    if (!document.hidden) {
+        applyTheme(getTheme());
+    }
+});
+
+// Initialize theme from localStorage
+applyTheme(getTheme());
+
+// === Back to Home ===
+backToHomeBtn.addEventListener('click', () => {
+    window.location.href = '/';
+});
+
+// === Modal ===
+function openModal() {
+    modal.classList.add('active');
+}
+
+function closeModal() {
+    modal.classList.remove('active');
+    resetForm();
+}
+
+openModalBtn.addEventListener('click', () => {
+    isEditMode = false;
+    editingModelId = null;
+    document.getElementById('modal-title-text').textContent = '添加模型';
+    deleteBtn.style.display = 'none';
+    resetForm();
+    openModal();
+});
+
+closeModalBtn.addEventListener('click', closeModal);
+cancelBtn.addEventListener('click', closeModal);
+
+modal.addEventListener('click', (e) => {
+    if (e.target === modal) closeModal();
+});
+
+// === Dynamic Fields ===
+const apiTypeInputs = document.querySelectorAll('input[name="api_type"]');
+const fieldBaseUrl = document.getElementById('field-base-url');
+const fieldFullUrl = document.getElementById('field-full-url');
+const fieldSystemPrompt = document.getElementById('field-system-prompt');
+
+function updateDynamicFields() {
+    const selectedType = document.querySelector('input[name="api_type"]:checked').value;
+    fieldBaseUrl.classList.remove('visible');
+    fieldFullUrl.classList.remove('visible');
+    fieldSystemPrompt.classList.remove('visible');
+
+    switch (selectedType) {
+        case 'openai':
+        case 'zhipu':
+            fieldBaseUrl.classList.add('visible');
+            fieldSystemPrompt.classList.add('visible');
+            break;
+        case 'requests_sse':
+        case 'spark_requests':
+            fieldFullUrl.classList.add('visible');
+            break;
+    }
+}
+
+apiTypeInputs.forEach(input => {
+    input.addEventListener('change', updateDynamicFields);
+});
+
+updateDynamicFields();
+
+// === Auto-generate API Key Name ===
+const modelIdInput = document.getElementById('model-id');
+const apiKeyNameInput = document.getElementById('api-key-name');
+
+modelIdInput.addEventListener('input', () => {
+    const modelId = modelIdInput.value.trim().toUpperCase().replace(/[^A-Z0-9]/g, '_');
+    apiKeyNameInput.value = modelId ? `${modelId}_API_KEY` : '';
+});
+
+// === Icon Upload ===
+const iconUploadInput = document.getElementById('icon-upload-input');
+iconUploadInput.addEventListener('change', (e) => {
+    const file = e.target.files[0];
+    if (file) {
+        const reader = new FileReader();
+        reader.onload = (event) => {
+            const iconSelector = document.querySelector('.icon-grid');
+            const uploadBtn = iconSelector.querySelector('.upload-btn');
+            const customId = 'icon_custom_' + Date.now();
+
+            const newOption = document.createElement('div');
+            newOption.className = 'icon-option';
+            newOption.innerHTML = `
+                <input type="radio" name="model_icon" id="${customId}" value="${event.target.result}" checked>
+                <label class="icon-label" for="${customId}">
+                    <img src="${event.target.result}" alt="Custom">
+                </label>
+            `;
+
+            const prevCustom = iconSelector.querySelector('input[value^="data:image"]');
+            if (prevCustom) prevCustom.parentElement.remove();
+
+            iconSelector.insertBefore(newOption, uploadBtn);
+        };
+        reader.readAsDataURL(file);
+    }
+});
+
+// === Validation ===
+function validateForm() {
+    let isValid = true;
+    const selectedType = document.querySelector('input[name="api_type"]:checked').value;
+
+    const requiredFields = [
+        { id: 'model-id', message: '请输入模型 ID' },
+        { id: 'model-name', message: '请输入模型名称' },
+        { id: 'model-identifier', message: '请输入模型标识' }
+    ];
+
+    if (!isEditMode) {
+        requiredFields.push({ id: 'api-key-value', message: '请输入 API Key' });
+    }
+
+    requiredFields.forEach(field => {
+        const input = document.getElementById(field.id);
+        if (!input.value.trim()) {
+            input.classList.add('error');
+            isValid = false;
+        } else {
+            input.classList.remove('error');
+        }
+    });
+
+    // Type-specific validation
+    if (selectedType === 'openai' || selectedType === 'zhipu') {
+        const baseUrl = document.getElementById('base-url');
+        if (!baseUrl.value.trim()) {
+            baseUrl.classList.add('error');
+            isValid = false;
+        } else {
+            baseUrl.classList.remove('error');
+        }
+    } else if (selectedType === 'requests_sse' || selectedType === 'spark_requests') {
+        const fullUrl = document.getElementById('full-url');
+        if (!fullUrl.value.trim()) {
+            fullUrl.classList.add('error');
+            isValid = false;
+        } else {
+            fullUrl.classList.remove('error');
+        }
+    }
+
+    return isValid;
+}
+
+// Clear error on input
+document.querySelectorAll('.form-input').forEach(input => {
+    input.addEventListener('input', () => input.classList.remove('error'));
+});
+
+// === Save Model ===
+saveBtn.addEventListener('click', async () => {
+    if (!validateForm()) return;
+
+    const apiKeyName = document.getElementById('api-key-name').value.trim().toUpperCase();
+    let apiKeyValue = document.getElementById('api-key-value').value.trim();
+
+    const modelData = {
+        id: document.getElementById('model-id').value.trim(),
+        name: document.getElementById('model-name').value.trim(),
+        type: document.querySelector('input[name="api_type"]:checked').value,
+        model: document.getElementById('model-identifier').value.trim(),
+        api_key_name: apiKeyName,
+        icon: document.querySelector('input[name="model_icon"]:checked')?.value || 'deepseek_logo.svg'
+    };
+
+    const baseUrl = document.getElementById('base-url').value.trim();
+    if (baseUrl) modelData.base_url = baseUrl;
+
+    const fullUrl = document.getElementById('full-url').value.trim();
+    if (fullUrl) modelData.url = fullUrl;
+
+    const systemPrompt = document.getElementById('system-prompt').value.trim();
+    if (systemPrompt) modelData.system = systemPrompt;
+
+    try {
+        if (isEditMode && !apiKeyValue) {
+            try {
+                const configResponse = await fetch('/api/config/load');
+                const existingKeys = await configResponse.json();
+                apiKeyValue = existingKeys[apiKeyName] || '';
+            } catch (e) {}
+        }
+
+        if (!isEditMode && !apiKeyValue) {
+            alert('请输入 API Key 值');
+            return;
+        }
+
+        const apiUrl = isEditMode ? `/api/models/${editingModelId}` : '/api/models';
+        const apiMethod = isEditMode ? 'PUT' : 'POST';
+
+        const response = await fetch(apiUrl, {
+            method: apiMethod,
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(modelData)
+        });
+
+        const result = await response.json();
+
+        if (result.success) {
+            if (apiKeyValue) {
+                try {
+                    const configResponse = await fetch('/api/config/load');
+                    const existingKeys = await configResponse.json();
+                    existingKeys[apiKeyName] = apiKeyValue;
+                    await fetch('/api/config/save', {
+                        method: 'POST',
+                        headers: { 'Content-Type': 'application/json' },
+                        body: JSON.stringify(existingKeys)
+                    });
+                } catch (configError) {
+                    console.error('Error saving API key:', configError);
+                }
+            }
+
+            closeModal();
+            alert(isEditMode ? '模型更新成功！' : '模型添加成功！');
+            loadModelsList();
+        } else {
+            throw new Error(result.message || '操作失败');
+        }
+    } catch (error) {
+        console.error('Error saving model:', error);
+        alert('操作失败：' + error.message);
+    }
+});
+
+// === Delete Model ===
+deleteBtn.addEventListener('click', async () => {
+    if (!editingModelId) return;
+    if (confirm(`确定要删除模型 "${editingModelId}" 吗？`)) {
+        try {
+            const response = await fetch(`/api/models/${editingModelId}`, {
+                method: 'DELETE'
+            });
+            const result = await response.json();
+
+            if (result.success) {
+                closeModal();
+                alert('模型已删除！');
+                loadModelsList();
+            } else {
+                throw new Error(result.message || '删除失败');
+            }
+        } catch (error) {
+            console.error('Error deleting model:', error);
+            alert('删除失败：' + error.message);
+        }
+    }
+});
+
+// === Reset Form ===
+function resetForm() {
+    document.getElementById('model-id').value = '';
+    document.getElementById('model-id').disabled = false;
+    document.getElementById('model-name').value = '';
+    document.getElementById('model-identifier').value = '';
+    document.getElementById('api-key-name').value = '';
+    document.getElementById('api-key-value').value = '';
+    document.getElementById('api-key-value').placeholder = 'sk-...';
+    document.getElementById('base-url').value = '';
+    document.getElementById('full-url').value = '';
+    document.getElementById('system-prompt').value = '';
+    document.getElementById('type_openai').checked = true;
+    document.getElementById('icon_openai').checked = true;
+
+    document.querySelectorAll('.form-input').forEach(el => el.classList.remove('error'));
+    updateDynamicFields();
+}
+
+// === Edit Model ===
+function editModel(modelId) {
+    isEditMode = true;
+    editingModelId = modelId;
+    document.getElementById('modal-title-text').textContent = '编辑模型';
+    deleteBtn.style.display = 'flex';
+
+    fetch(`/api/models/${modelId}`)
+        .then(res => res.json())
+        .then(data => {
+            if (data.success && data.model) {
+                const model = data.model;
+
+                document.getElementById('model-id').value = model.id || '';
+                document.getElementById('model-id').disabled = true;
+                document.getElementById('model-name').value = model.name || '';
+
+                const typeRadio = document.getElementById(`type_${model.type}`);
+                if (typeRadio) typeRadio.checked = true;
+
+                document.getElementById('model-identifier').value = model.model || '';
+                document.getElementById('api-key-name').value = model.api_key_name || '';
+
+                fetch('/api/config/load')
+                    .then(res => res.json())
+                    .then(apiKeys => {
+                        const existingKey = apiKeys[model.api_key_name];
+                        if (existingKey) {
+                            document.getElementById('api-key-value').placeholder = '已配置（留空保持不变）';
+                        }
+                    })
+                    .catch(() => {});
+
+                if ((model.type === 'openai' || model.type === 'zhipu') && model.base_url) {
+                    document.getElementById('base-url').value = model.base_url;
+                }
+                if ((model.type === 'requests_sse' || model.type === 'spark_requests') && model.url) {
+                    document.getElementById('full-url').value = model.url;
+                }
+                if (model.system) {
+                    document.getElementById('system-prompt').value = model.system;
+                }
+
+                if (model.icon) {
+                    if (model.icon.startsWith('data:')) {
+                        const prevCustom = document.querySelector('input[value^="data:image"]')?.parentElement;
+                        if (prevCustom) prevCustom.remove();
+
+                        const iconSelector = document.querySelector('.icon-grid');
+                        const uploadBtn = iconSelector.querySelector('.upload-btn');
+                        const customId = 'icon_custom_' + Date.now();
+
+                        const newOption = document.createElement('div');
+                        newOption.className = 'icon-option';
+                        newOption.innerHTML = `
+                            <input type="radio" name="model_icon" id="${customId}" value="${model.icon}" checked>
+                            <label class="icon-label" for="${customId}">
+                                <img src="${model.icon}" alt="Custom">
+                            </label>
+                        `;
+                        iconSelector.insertBefore(newOption, uploadBtn);
+                    } else {
+                        const iconRadio = document.querySelector(`input[name="model_icon"][value="${model.icon}"]`);
+                        if (iconRadio) iconRadio.checked = true;
+                    }
+                }
+
+                updateDynamicFields();
+            }
+        })
+        .catch(err => {
+            console.error('Error loading model:', err);
+            alert('加载模型数据失败：' + err.message);
+        });
+
+    openModal();
+}
+
+// === Load Models List ===
+async function loadModelsList() {
+    const modelsList = document.getElementById('models-list');
+    const loading = document.getElementById('loading');
+
+    try {
+        const response = await fetch('/api/models/list');
+        const data = await response.json();
+
+        if (data.success) {
+            const models = data.models || [];
+            const builtinModels = ['google', 'deepseek', 'moonshot', 'qwen', 'spark'];
+
+            if (models.length === 0) {
+                modelsList.innerHTML = `
+                    <div class="empty-state">
+                        <div class="empty-icon">
+                            <svg fill="none" viewBox="0 0 24 24" stroke-width="1.5" stroke="currentColor">
+                                <path stroke-linecap="round" stroke-linejoin="round" d="M10.5 6h9.75M10.5 6a1.5 1.5 0 11-3 0m3 0a1.5 1.5 0 10-3 0M3.75 6H7.5m3 12h9.75m-9.75 0a1.5 1.5 0 01-3 0m3 0a1.5 1.5 0 00-3 0m-3.75 0H7.5m9-6h3.75m-3.75 0a1.5 1.5 0 01-3 0m3 0a1.5 1.5 0 00-3 0m-9.75 0h9.75" />
+                            </svg>
+                        </div>
+                        <div class="empty-title">暂无模型</div>
+                        <div class="empty-description">点击"添加模型"按钮开始添加自定义模型</div>
+                    </div>
+                `;
+                return;
+            }
+
+            modelsList.innerHTML = models.map(model => {
+                const isBuiltin = builtinModels.includes(model.id);
+                const iconHtml = getIconHtml(model.icon, model.name);
+
+                return `
+                    <div class="model-card">
+                        <div class="card-header">
+                            <div class="model-icon">${iconHtml}</div>
+                            <div class="card-title-group">
+                                <div class="model-name">
+                                    ${model.name}
+                                    ${isBuiltin ? '<span class="builtin-badge">内置</span>' : ''}
+                                </div>
+                                <div class="model-id">${model.id}</div>
+                            </div>
+                        </div>
+                        <div class="card-body">
+                            <div class="data-grid">
+                                <div class="data-item">
+                                    <div class="data-label">API 类型</div>
+                                    <div class="data-value">${getApiTypeName(model.type)}</div>
+                                </div>
+                                <div class="data-item">
+                                    <div class="data-label">模型</div>
+                                    <div class="data-value">${model.model}</div>
+                                </div>
+                                <div class="data-item">
+                                    <div class="data-label">密钥变量</div>
+                                    <div class="data-value">${model.api_key_name}</div>
+                                </div>
+                                <div class="data-item">
+                                    <div class="data-label">状态</div>
+                                    <div class="status-indicator ${model.enabled ? '' : 'disabled'}">
+                                        <span class="status-dot"></span>
+                                        ${model.enabled ? '已启用' : '已禁用'}
+                                    </div>
+                                </div>
+                            </div>
+                        </div>
+                        <div class="card-actions">
+                            <button class="action-btn edit" onclick="editModel('${model.id}')">
+                                <svg fill="none" viewBox="0 0 24 24" stroke-width="2" stroke="currentColor">
+                                    <path stroke-linecap="round" stroke-linejoin="round" d="m16.862 4.487 1.687-1.688a1.875 1.875 0 1 1 2.652 2.652L6.832 19.82a4.5 4.5 0 0 1-1.897 1.13l-2.685.8.8-2.685a4.5 4.5 0 0 1 1.13-1.897L16.863 4.487zm0 0L19.5 7.125" />
+                                </svg>
+                                编辑
+                            </button>
+                            ${!isBuiltin ? `
+                                <button class="action-btn delete" onclick="confirmDeleteModel('${model.id}', '${model.name}')">
+                                    <svg fill="none" viewBox="0 0 24 24" stroke-width="2" stroke="currentColor">
+                                        <path stroke-linecap="round" stroke-linejoin="round" d="m14.74 9-.346 9m-4.788 0L9.26 9m9.968-3.21c.342.052.682.107 1.022.166m-1.022-.165L18.16 19.673a2.25 2.25 0 0 1-2.244 2.077H8.084a2.25 2.25 0 0 1-2.244-2.077L4.772 5.79m14.456 0a48.108 48.108 0 0 0-3.478-.397m-12 .562c.34-.059.68-.114 1.022-.165m0 0a48.11 48.11 0 0 1 3.478-.397m7.5 0v-.916c0-1.18-.91-2.164-2.09-2.201a51.964 51.964 0 0 0-3.32 0c-1.18.037-2.09 1.022-2.09 2.201v.916m7.5 0a48.667 48.667 0 0 0-7.5 0" />
+                                    </svg>
+                                    删除
+                                </button>
+                            ` : `
+                                <button class="action-btn" disabled style="opacity:0.5;cursor:not-allowed">
+                                    内置模型
+                                </button>
+                            `}
+                        </div>
+                    </div>
+                `;
+            }).join('');
+        }
+    } catch (error) {
+        console.error('Error loading models list:', error);
+        modelsList.innerHTML = `
+            <div class="empty-state">
+                <div class="empty-icon">
+                    <svg fill="none" viewBox="0 0 24 24" stroke-width="1.5" stroke="currentColor">
+                        <path stroke-linecap="round" stroke-linejoin="round" d="M12 9v3.75m-9.303 3.376c-.866 1.5.217 3.374 1.948 3.374h14.71c1.73 0 2.813-1.874 1.948-3.374L13.949 3.378c-.866-1.5-3.032-1.5-3.898 0L2.697 16.126zM12 15.75h.007v.008H12v-.008z" />
+                    </svg>
+                </div>
+                <div class="empty-title">加载失败</div>
+                <div class="empty-description">${error.message}</div>
+            </div>
+        `;
+    } finally {
+        if (loading) loading.remove();
+    }
+}
+
+function getIconHtml(iconFile, modelName) {
+    if (!iconFile) {
+        return `<svg fill="none" viewBox="0 0 24 24" stroke-width="1.5" stroke="currentColor" style="width:20px;height:20px;color:var(--text-tertiary)"><path stroke-linecap="round" stroke-linejoin="round" d="M9.813 15.904L9 18.75l-.813-2.846a4.5 4.5 0 00-3.09-3.09L2.25 12l2.846-.813a4.5 4.5 0 003.09-3.09L9 5.25l.813 2.846a4.5 4.5 0 003.09 3.09L15.75 12l-2.846.813a4.5 4.5 0 00-3.09 3.09zM18.259 8.715L18 9.75l-.259-1.035a3.375 3.375 0 00-2.455-2.456L14.25 6l1.036-.259a3.375 3.375 0 002.455-2.456L18 2.25l.259 1.035a3.375 3.375 0 002.456 2.456L21.75 6l-1.035.259a3.375 3.375 0 00-2.456 2.456zM16.894 20.567L16.5 21.75l-.394-1.183a2.25 2.25 0 00-1.423-1.423L13.5 18.75l1.183-.394a2.25 2.25 0 001.423-1.423l.394-1.183.394 1.183a2.25 2.25 0 001.423 1.423l1.183.394-1.183.394a2.25 2.25 0 00-1.423 1.423z" /></svg>`;
+    }
+
+    if (iconFile.startsWith('data:')) {
+        return `<img src="${iconFile}" alt="${modelName}" onerror="this.parentElement.innerHTML='<svg fill=\\'none\\' viewBox=\\'0 0 24 24\\' stroke-width=\\'1.5\\' stroke=\\'currentColor\\' style=\\'width:20px;height:20px;color:var(--text-tertiary)\\'><path stroke-linecap=\\'round\\' stroke-linejoin=\\'round\\' d=\\'M9.813 15.904L9 18.75l-.813-2.846a4.5 4.5 0 00-3.09-3.09L2.25 12l2.846-.813a4.5 4.5 0 003.09-3.09L9 5.25l.813 2.846a4.5 4.5 0 003.09 3.09L15.75 12l-2.846.813a4.5 4.5 0 00-3.09 3.09zM18.259 8.715L18 9.75l-.259-1.035a3.375 3.375 0 00-2.455-2.456L14.25 6l1.036-.259a3.375 3.375 0 002.455-2.456L18 2.25l.259 1.035a3.375 3.375 0 002.456 2.456L21.75 6l-1.035.259a3.375 3.375 0 00-2.456 2.456zM16.894 20.567L16.5 21.75l-.394-1.183a2.25 2.25 0 00-1.423-1.423L13.5 18.75l1.183-.394a2.25 2.25 0 001.423-1.423l.394-1.183.394 1.183a2.25 2.25 0 001.423 1.423l1.183.394-1.183.394a2.25 2.25 0 00-1.423 1.423z\\' /></svg>'">`;
+    }
+
+    if (iconFile.startsWith('http')) {
+        return `<img src="${iconFile}" alt="${modelName}" onerror="this.parentElement.innerHTML='<svg fill=\\'none\\' viewBox=\\'0 0 24 24\\' stroke-width=\\'1.5\\' stroke=\\'currentColor\\' style=\\'width:20px;height:20px;color:var(--text-tertiary)\\'><path stroke-linecap=\\'round\\' stroke-linejoin=\\'round\\' d=\\'M9.813 15.904L9 18.75l-.813-2.846a4.5 4.5 0 00-3.09-3.09L2.25 12l2.846-.813a4.5 4.5 0 003.09-3.09L9 5.25l.813 2.846a4.5 4.5 0 003.09 3.09L15.75 12l-2.846.813a4.5 4.5 0 00-3.09 3.09zM18.259 8.715L18 9.75l-.259-1.035a3.375 3.375 0 00-2.455-2.456L14.25 6l1.036-.259a3.375 3.375 0 002.455-2.456L18 2.25l.259 1.035a3.375 3.375 0 002.456 2.456L21.75 6l-1.035.259a3.375 3.375 0 00-2.456 2.456zM16.894 20.567L16.5 21.75l-.394-1.183a2.25 2.25 0 00-1.423-1.423L13.5 18.75l1.183-.394a2.25 2.25 0 001.423-1.423l.394-1.183.394 1.183a2.25 2.25 0 001.423 1.423l1.183.394-1.183.394a2.25 2.25 0 00-1.423 1.423z\\' /></svg>'">`;
+    }
+
+    if (iconFile.includes('.')) {
+        return `<img src="/assets/icons/${iconFile}" alt="${modelName}" onerror="this.parentElement.innerHTML='<svg fill=\\'none\\' viewBox=\\'0 0 24 24\\' stroke-width=\\'1.5\\' stroke=\\'currentColor\\' style=\\'width:20px;height:20px;color:var(--text-tertiary)\\'><path stroke-linecap=\\'round\\' stroke-linejoin=\\'round\\' d=\\'M9.813 15.904L9 18.75l-.813-2.846a4.5 4.5 0 00-3.09-3.09L2.25 12l2.846-.813a4.5 4.5 0 003.09-3.09L9 5.25l.813 2.846a4.5 4.5 0 003.09 3.09L15.75 12l-2.846.813a4.5 4.5 0 00-3.09 3.09zM18.259 8.715L18 9.75l-.259-1.035a3.375 3.375 0 00-2.455-2.456L14.25 6l1.036-.259a3.375 3.375 0 002.455-2.456L18 2.25l.259 1.035a3.375 3.375 0 002.456 2.456L21.75 6l-1.035.259a3.375 3.375 0 00-2.456 2.456zM16.894 20.567L16.5 21.75l-.394-1.183a2.25 2.25 0 00-1.423-1.423L13.5 18.75l1.183-.394a2.25 2.25 0 001.423-1.423l.394-1.183.394 1.183a2.25 2.25 0 001.423 1.423l1.183.394-1.183.394a2.25 2.25 0 00-1.423 1.423z\\' /></svg>'">`;
+    }
+
+    return `<svg fill="none" viewBox="0 0 24 24" stroke-width="1.5" stroke="currentColor" style="width:20px;height:20px;color:var(--text-tertiary)"><path stroke-linecap="round" stroke-linejoin="round" d="M9.813 15.904L9 18.75l-.813-2.846a4.5 4.5 0 00-3.09-3.09L2.25 12l2.846-.813a4.5 4.5 0 003.09-3.09L9 5.25l.813 2.846a4.5 4.5 0 003.09 3.09L15.75 12l-2.846.813a4.5 4.5 0 00-3.09 3.09zM18.259 8.715L18 9.75l-.259-1.035a3.375 3.375 0 00-2.455-2.456L14.25 6l1.036-.259a3.375 3.375 0 002.455-2.456L18 2.25l.259 1.035a3.375 3.375 0 002.456 2.456L21.75 6l-1.035.259a3.375 3.375 0 00-2.456 2.456zM16.894 20.567L16.5 21.75l-.394-1.183a2.25 2.25 0 00-1.423-1.423L13.5 18.75l1.183-.394a2.25 2.25 0 001.423-1.423l.394-1.183.394 1.183a2.25 2.25 0 001.423 1.423l1.183.394-1.183.394a2.25 2.25 0 00-1.423 1.423z" /></svg>`;
+}
+
+function getApiTypeName(type) {
+    const typeNames = {
+        'google': 'Google Gemini',
+        'openai': 'OpenAI 兼容',
+        'requests_sse': 'HTTP + SSE',
+        'spark_requests': 'Spark 特殊',
+        'zhipu': '智谱 GLM'
+    };
+    return typeNames[type] || type;
+}
+
+function confirmDeleteModel(modelId, modelName) {
+    if (confirm(`确定要删除模型 "${modelName}" 吗？此操作不可恢复。`)) {
+        deleteModel(modelId);
+    }
+}
+
+async function deleteModel(modelId) {
+    try {
+        const response = await fetch(`/api/models/${modelId}`, {
+            method: 'DELETE'
+        });
+
+        const result = await response.json();
+
+        if (result.success) {
+            alert('模型删除成功！');
+            await loadModelsList();
+        } else {
+            throw new Error(result.message || '删除失败');
+        }
+    } catch (error) {
+        console.error('Error deleting model:', error);
+        alert('删除失败：' + error.message);
+    }
+}
+
+// === Initial Load ===
+loadModelsList();
+
+// === Keyboard Shortcuts ===
+document.addEventListener('keydown', (e) => {
+    if (e.key === 'Escape' && modal.classList.contains('active')) {
+        closeModal();
+    }
+    if ((e.ctrlKey || e.metaKey) && e.key === 'Enter' && modal.classList.contains('active')) {
+        saveBtn.click();
+    }
+});
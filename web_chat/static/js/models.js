@@ -1,5 +1,58 @@
 // ==================== 模型管理 ====================
 
+// 模型健康状态的显示文字（health 由服务端后台探测得到，见 health_prober.py）
+const MODEL_STATUS_LABELS = {
+    online: '在线',
+    degraded: '较慢',
+    offline: '离线',
+    unknown: '未检测'
+};
+
+// 健康状态刷新间隔（毫秒）
+const MODEL_STATUS_REFRESH_MS = 60000;
+let modelStatusTimer = null;
+
+// 格式化首字时间
+function formatLatency(ms) {
+    return ms >= 1000 ? `${(ms / 1000).toFixed(1)}s` : `${Math.round(ms)}ms`;
+}
+
+// 生成状态点和文字，返回 { html, title }
+function renderModelStatus(health) {
+    const status = health?.status || 'unknown';
+    let label = MODEL_STATUS_LABELS[status] || MODEL_STATUS_LABELS.unknown;
+    if (health?.ttft_ms != null && status !== 'offline') {
+        label += ` · ${formatLatency(health.ttft_ms)}`;
+    }
+    let title = '';
+    if (health) {
+        const availability = health.availability != null ? `${Math.round(health.availability * 100)}%` : '-';
+        title = `可用性 ${availability}`;
+        if (health.last_error) title += `\n最近错误: ${health.last_error}`;
+    }
+    return {
+        html: `<span class="status-dot ${status}"></span><span>${label}</span>`,
+        title
+    };
+}
+
+// 更新侧边栏中各模型的状态（不重建列表）
+function refreshModelStatus() {
+    fetch('/api/models/list')
+        .then(r => r.json())
+        .then(data => {
+            if (!data.success || !data.models) return;
+            data.models.forEach(m => {
+                const el = document.querySelector(`.model-button[data-model-id="${CSS.escape(m.id)}"] .model-status`);
+                if (!el) return;
+                const { html, title } = renderModelStatus(m.health);
+                el.innerHTML = html;
+                el.title = title;
+            });
+        })
+        .catch(err => console.error('Error refreshing model status:', err));
+}
+
 // 加载模型列表
 function loadModels() {
     fetch('/api/models/list')
@@ -30,6 +83,8 @@ function loadModels() {
 
                 const btn = document.createElement('button');
                 btn.className = 'model-button';
+                btn.dataset.modelId = m.id;
+                const modelStatus = renderModelStatus(m.health);
                 btn.innerHTML = `
                     <div class="model-icon ${iconClass}">
                         <img src="${iconSrc}" alt="${m.id}" style="width: 24px; height: 24px;">
@@ -37,15 +92,20 @@ function loadModels() {
                     <div class="model-info">
                         <div class="model-name">${m.id}</div>
                         <div class="model-status">
-                            <span class="status-dot"></span>
-                            <span>在线</span>
+                            ${modelStatus.html}
                         </div>
                     </div>
                 `;
+                btn.querySelector('.model-status').title = modelStatus.title;
                 btn.onclick = () => selectModel(m.id, btn);
                 list.appendChild(btn);
             });
 
+            // 服务端启用了健康探测时定期刷新状态
+            if (!modelStatusTimer && data.health_probe) {
+                modelStatusTimer = setInterval(refreshModelStatus, MODEL_STATUS_REFRESH_MS);
+            }
+
             // 获取启用的模型ID列表
             const enabledModelIds = models.filter(m => m.enabled).map(m => m.id);
 
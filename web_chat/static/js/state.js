@@ -11,6 +11,7 @@ window.appState = {
     currentModel: null,
     isSending: false,
     modelHistories: {},
+    conversationIds: {}, // 每个模型的服务端对话 ID（增量请求只上传新消息）
     modelInfoCache: {}, // 缓存模型信息（包括 icon）
     abortController: null, // 用于中断 AI 输出
 };
@@ -22,7 +23,8 @@ window.appState.saveToLocalStorage = function() {
     try {
         const data = {
             currentModel: this.currentModel,
-            modelHistories: this.modelHistories
+            modelHistories: this.modelHistories,
+            conversationIds: this.conversationIds
         };
         localStorage.setItem(STORAGE_KEYS.MODEL_HISTORIES, JSON.stringify(data));
         console.debug('已保存对话历史到 LocalStorage');
@@ -40,6 +42,7 @@ window.appState.loadFromLocalStorage = function() {
         if (savedData) {
             const data = JSON.parse(savedData);
             this.modelHistories = data.modelHistories || {};
+            this.conversationIds = data.conversationIds || {};
             this.currentModel = data.currentModel || null;
             console.debug('已从 LocalStorage 加载对话历史');
             return true;
@@ -88,8 +91,22 @@ window.appState.addMessageToHistory = function(model, role, content) {
     this.saveToLocalStorage(); // 添加消息后自动保存
 };
 
+/**
+ * 获取模型的服务端对话 ID（不存在时生成新的 ID）
+ */
+window.appState.getConversationId = function(model) {
+    if (!this.conversationIds[model]) {
+        this.conversationIds[model] = window.crypto && crypto.randomUUID
+            ? crypto.randomUUID()
+            : Date.now().toString(36) + Math.random().toString(36).slice(2, 12);
+        this.saveToLocalStorage();
+    }
+    return this.conversationIds[model];
+};
+
 window.appState.clearHistory = function(model) {
     this.modelHistories[model] = [];
+    delete this.conversationIds[model]; // 清空后开始新的服务端对话
     this.saveToLocalStorage(); // 清空历史后自动保存
 };
 
@@ -0,0 +1,470 @@
+"""静态资源构建与长期缓存
+
+以前页面分别加载 8 个 JS 文件和未压缩的 main.css，model_manager.html 的样式与脚本
+内联在页面中；这些资源没有指纹，每次访问都要重新验证或重新下载。本模块：
+
+- 构建：按 BUNDLES 把源文件合并、压缩（去掉注释与多余空白），按内容哈希命名写入
+  static/dist/，同时生成 .gz 和 .br（需要安装 brotli）预压缩文件与 manifest.json
+- 运行时：模板中的 asset_urls() 按 manifest 返回带哈希的地址；未构建、已关闭或
+  源文件在构建后被修改时返回原始源文件地址（开发时无需构建）
+- 带哈希的文件按 Accept-Encoding 直接发送预压缩版本，并设置
+  Cache-Control: public, max-age=31536000, immutable
+
+压缩只删除注释、缩进和不影响语义的空白，保留换行（不依赖自动分号插入的细节），
+字符串、模板字符串和正则表达式原样保留。
+
+构建方法（在项目根目录下）:
+    python web_chat/static_assets.py
+    python web_chat/static_assets.py --no-brotli
+
+Example:
+    >>> manifest = AssetManifest(STATIC_DIR)
+    >>> manifest.load()
+    >>> manifest.urls('app.js')  # 模板中: {% for url in asset_urls('app.js') %}
+    ['/static/dist/app.3f2a9c1d7e4b.js']
+"""
+
+import os
+import re
+import sys
+import gzip
+import json
+import hashlib
+import logging
+import argparse
+from typing import Any, Dict, List, Optional, Set
+
+from flask import Response, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli 是可选依赖
+    brotli = None
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIR_NAME = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+# 打包配置：bundle 名称 -> 按加载顺序排列的源文件（相对 static/）
+BUNDLES: Dict[str, List[str]] = {
+    'app.js': [
+        'js/state.js',
+        'js/icons.js',
+        'js/theme.js',
+        'js/models.js',
+        'js/chat.js',
+        'js/api-config.js',
+        'js/ui.js',
+        'js/app.js'
+    ],
+    'main.css': ['css/main.css'],
+    'model-manager.js': ['js/model-manager.js'],
+    'model-manager.css': ['css/model-manager.css']
+}
+
+# 带哈希的文件内容不会变化，可以永久缓存
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# 预压缩文件的扩展名（按优先级排列）
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+MIMETYPES = {'.js': 'text/javascript', '.css': 'text/css'}
+
+
+def static_assets_settings_from_env() -> Dict[str, Any]:
+    """从环境变量读取静态资源配置
+
+    Returns:
+        Dict[str, Any]: AssetManifest 的构造参数（不含目录）
+    """
+    return {
+        "enabled": os.environ.get("LLM_STATIC_BUNDLES", "true").lower() == "true"
+    }
+
+
+# ==================== 压缩 ====================
+
+_WORD = re.compile(r'[\w$\u0080-\uffff]')
+
+# 这些字符或关键字之后的 / 是正则表达式的开始，而不是除号
+_REGEX_PRECEDERS = set('(,=:[!&|?{};+-*%<>~^')
+_REGEX_KEYWORDS = {'return', 'typeof', 'instanceof', 'in', 'of', 'new', 'delete', 'void', 'throw', 'case', 'do', 'else', 'yield', 'await'}
+
+
+def _skip_string(source: str, i: int) -> int:
+    """返回从 i 开始的字符串字面量之后的位置"""
+    quote = source[i]
+    i += 1
+    while i < len(source) and source[i] != quote:
+        i += 2 if source[i] == '\\' else 1
+    return i + 1
+
+
+def _skip_template(source: str, i: int) -> int:
+    """返回从 i 开始的模板字符串之后的位置（${...} 中的代码原样保留）"""
+    i += 1
+    while i < len(source) and source[i] != '`':
+        if source[i] == '\\':
+            i += 2
+        elif source.startswith('${', i):
+            i = _skip_braces(source, i + 1)
+        else:
+            i += 1
+    return i + 1
+
+
+def _skip_braces(source: str, i: int) -> int:
+    """返回从 i 处的 { 开始、到匹配的 } 之后的位置（跳过其中的字符串与注释）"""
+    depth = 0
+    while i < len(source):
+        char = source[i]
+        if char in '\'"':
+            i = _skip_string(source, i)
+            continue
+        if char == '`':
+            i = _skip_template(source, i)
+            continue
+        if source.startswith('//', i):
+            end = source.find('\n', i)
+            i = len(source) if end < 0 else end
+            continue
+        if source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            i = len(source) if end < 0 else end + 2
+            continue
+        if char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return i
+
+
+def _skip_regex(source: str, i: int) -> int:
+    """返回从 i 开始的正则表达式字面量（含标志）之后的位置"""
+    i += 1
+    in_class = False
+    while i < len(source) and source[i] != '\n':
+        char = source[i]
+        if char == '\\':
+            i += 2
+            continue
+        if char == '[':
+            in_class = True
+        elif char == ']':
+            in_class = False
+        elif char == '/' and not in_class:
+            i += 1
+            break
+        i += 1
+    while i < len(source) and _WORD.match(source[i]):
+        i += 1
+    return i
+
+
+def _regex_allowed(out: List[str]) -> bool:
+    """根据已输出的内容判断下一个 / 是否开始正则表达式"""
+    text = ''.join(out[-3:]).rstrip()
+    if not text:
+        return True
+    if text[-1] in _REGEX_PRECEDERS:
+        return True
+    match = re.search(r'[\w$]+$', text)
+    return bool(match) and match.group() in _REGEX_KEYWORDS
+
+
+def minify_js(source: str) -> str:
+    """删除 JavaScript 的注释、缩进与多余空白（保留换行）
+
+    Args:
+        source: JavaScript 源码
+
+    Returns:
+        str: 压缩后的源码
+    """
+    out: List[str] = []
+    pending = ''  # 待输出的空白：'' / ' ' / '\n'
+    i = 0
+    while i < len(source):
+        char = source[i]
+        if char in ' \t\r\n\f\v\ufeff' or source.startswith('//', i) or source.startswith('/*', i):
+            if source.startswith('//', i):
+                end = source.find('\n', i)
+                i = len(source) if end < 0 else end
+                continue
+            if source.startswith('/*', i):
+                end = source.find('*/', i + 2)
+                end = len(source) if end < 0 else end + 2
+                if '\n' in source[i:end]:
+                    pending = '\n'
+                elif not pending:
+                    pending = ' '
+                i = end
+                continue
+            if char == '\n':
+                pending = '\n'
+            elif not pending:
+                pending = ' '
+            i += 1
+            continue
+
+        if char in '\'"':
+            end = _skip_string(source, i)
+        elif char == '`':
+            end = _skip_template(source, i)
+        elif char == '/' and _regex_allowed(out):
+            end = _skip_regex(source, i)
+        else:
+            end = i + 1
+
+        if pending and out:
+            last = out[-1][-1]
+            if pending == '\n':
+                out.append('\n')
+            elif (_WORD.match(last) and _WORD.match(char)) or (last == char and char in '+-/') \
+                    or (last.isdigit() and char == '.'):
+                out.append(' ')
+        pending = ''
+        out.append(source[i:end])
+        i = end
+    return ''.join(out).strip() + '\n'
+
+
+_CSS_TIGHT = re.compile(r'\s*([{};,>])\s*')
+
+
+def minify_css(source: str) -> str:
+    """删除 CSS 的注释与多余空白
+
+    Args:
+        source: CSS 源码
+
+    Returns:
+        str: 压缩后的源码
+    """
+    parts: List[str] = []
+    chunk: List[str] = []
+
+    def flush() -> None:
+        text = re.sub(r'\s+', ' ', ''.join(chunk))
+        text = _CSS_TIGHT.sub(r'\1', text)
+        text = re.sub(r':\s+', ':', text)
+        text = re.sub(r'\s+!', '!', text)
+        parts.append(text)
+        chunk.clear()
+
+    i = 0
+    while i < len(source):
+        char = source[i]
+        if char in '\'"':
+            end = _skip_string(source, i)
+            flush()
+            parts.append(source[i:end])
+        elif source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            end = len(source) if end < 0 else end + 2
+            chunk.append(' ')
+        else:
+            end = i + 1
+            chunk.append(char)
+        i = end
+    flush()
+    return ''.join(parts).replace(';}', '}').strip() + '\n'
+
+
+# ==================== 构建 ====================
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _read_sources(static_dir: str, sources: List[str]) -> bytes:
+    """按顺序读取并拼接源文件（JS 之间用分号隔开，避免依赖自动分号插入）"""
+    texts = []
+    for path in sources:
+        with open(os.path.join(static_dir, path), 'r', encoding='utf-8') as f:
+            texts.append(f.read())
+    separator = '\n;\n' if sources[0].endswith('.js') else '\n'
+    return separator.join(texts).encode('utf-8')
+
+
+def _write(path: str, data: bytes) -> None:
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def build_assets(
+    static_dir: str = STATIC_DIR,
+    bundles: Optional[Dict[str, List[str]]] = None,
+    use_brotli: bool = True
+) -> Dict[str, Any]:
+    """构建所有 bundle，写入 static/dist/ 并更新 manifest.json
+
+    保留上一次构建的文件（已加载旧页面的客户端仍可能请求），更早的文件会被删除。
+
+    Args:
+        static_dir: 静态文件目录
+        bundles: 打包配置，默认 BUNDLES
+        use_brotli: 安装了 brotli 时是否生成 .br 文件
+
+    Returns:
+        Dict[str, Any]: manifest 内容
+    """
+    bundles = bundles or BUNDLES
+    dist_dir = os.path.join(static_dir, DIST_DIR_NAME)
+    os.makedirs(dist_dir, exist_ok=True)
+    manifest_path = os.path.join(dist_dir, MANIFEST_NAME)
+    previous = _read_manifest(manifest_path) or {}
+
+    entries: Dict[str, Dict[str, Any]] = {}
+    for name, sources in bundles.items():
+        raw = _read_sources(static_dir, sources)
+        text = raw.decode('utf-8')
+        minified = (minify_js(text) if name.endswith('.js') else minify_css(text)).encode('utf-8')
+        stem, ext = os.path.splitext(name)
+        filename = f'{stem}.{_sha256(minified)[:12]}{ext}'
+        sizes = {'source': len(raw), 'identity': len(minified)}
+
+        _write(os.path.join(dist_dir, filename), minified)
+        encoded = gzip.compress(minified, compresslevel=9, mtime=0)
+        _write(os.path.join(dist_dir, filename + '.gz'), encoded)
+        sizes['gzip'] = len(encoded)
+        if use_brotli and brotli is not None:
+            encoded = brotli.compress(minified, quality=11)
+            _write(os.path.join(dist_dir, filename + '.br'), encoded)
+            sizes['br'] = len(encoded)
+
+        entries[name] = {'file': filename, 'sources': sources, 'source_hash': _sha256(raw), 'sizes': sizes}
+        logger.debug(f'Built {filename}: {sizes}')
+
+    manifest = {'bundles': entries}
+    _write(manifest_path, json.dumps(manifest, indent=2, ensure_ascii=False).encode('utf-8'))
+
+    keep = {MANIFEST_NAME}
+    for entry in [*entries.values(), *previous.get('bundles', {}).values()]:
+        keep.update(entry['file'] + suffix for suffix in ('', '.gz', '.br'))
+    for filename in os.listdir(dist_dir):
+        if filename not in keep:
+            os.remove(os.path.join(dist_dir, filename))
+    return manifest
+
+
+def _read_manifest(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (json.JSONDecodeError, IOError) as e:
+        logger.warning(f'Failed to read asset manifest {path}: {e}')
+        return None
+
+
+# ==================== 运行时 ====================
+
+class AssetManifest:
+    """模板中的资源地址与带哈希文件的发送"""
+
+    def __init__(self, static_dir: str = STATIC_DIR, enabled: bool = True) -> None:
+        """初始化（调用 load() 读取 manifest）
+
+        Args:
+            static_dir: 静态文件目录
+            enabled: 是否使用构建后的 bundle（关闭时总是返回源文件地址）
+        """
+        self.static_dir = static_dir
+        self.dist_dir = os.path.join(static_dir, DIST_DIR_NAME)
+        self.enabled = enabled
+        self._files: Dict[str, str] = {}
+        self._served: Set[str] = set()
+        self._counters = {"immutable": 0, "compressed": 0}
+
+    def load(self) -> None:
+        """读取 manifest，跳过源文件在构建后被修改的 bundle"""
+        files: Dict[str, str] = {}
+        manifest = _read_manifest(os.path.join(self.dist_dir, MANIFEST_NAME)) if self.enabled else None
+        for name, entry in (manifest or {}).get('bundles', {}).items():
+            try:
+                current = _sha256(_read_sources(self.static_dir, entry['sources']))
+            except (OSError, KeyError, IndexError):
+                current = None
+            if current != entry.get('source_hash') or not os.path.exists(os.path.join(self.dist_dir, entry['file'])):
+                logger.warning(f'Asset bundle {name} is stale, serving source files (run python web_chat/static_assets.py)')
+                continue
+            files[name] = entry['file']
+        self._files = files
+        # 允许发送当前与上一次构建的文件（由 build_assets 保留）
+        self._served = set(os.listdir(self.dist_dir)) if files else set()
+
+    def urls(self, bundle: str) -> List[str]:
+        """bundle 在页面中的地址：构建后的带哈希文件，或按顺序排列的源文件
+
+        Args:
+            bundle: bundle 名称（BUNDLES 的键）
+
+        Returns:
+            List[str]: 地址列表
+        """
+        filename = self._files.get(bundle)
+        if filename:
+            return [url_for('static', filename=f'{DIST_DIR_NAME}/{filename}')]
+        return [url_for('static', filename=path) for path in BUNDLES[bundle]]
+
+    def send(self, filename: str) -> Response:
+        """发送带哈希的文件，按 Accept-Encoding 选择预压缩版本
+
+        Args:
+            filename: static/dist/ 下的文件名
+
+        Returns:
+            Response: Flask 响应（未知文件为 404）
+        """
+        if filename not in self._served or filename == MANIFEST_NAME or filename.endswith(('.gz', '.br')):
+            return Response('Not Found', status=404, mimetype='text/plain')
+
+        mimetype = MIMETYPES.get(os.path.splitext(filename)[1], 'application/octet-stream')
+        available = [name for name, suffix in ENCODINGS if filename + suffix in self._served]
+        encoding = request.accept_encodings.best_match(available) if available else None
+        suffix = dict(ENCODINGS)[encoding] if encoding else ''
+
+        response = send_from_directory(self.dist_dir, filename + suffix, mimetype=mimetype, max_age=31536000)
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        response.headers.pop('Content-Disposition', None)
+        response.headers['Vary'] = 'Accept-Encoding'
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+            self._counters["compressed"] += 1
+        self._counters["immutable"] += 1
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        """使用中的 bundle 与带哈希文件的发送次数"""
+        return {"enabled": self.enabled, "bundles": dict(self._files), **self._counters}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="构建带内容哈希的静态资源 bundle")
+    parser.add_argument("--static-dir", default=STATIC_DIR, help="静态文件目录")
+    parser.add_argument("--no-brotli", action="store_true", help="不生成 .br 文件")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    if brotli is None and not args.no_brotli:
+        logger.warning('brotli is not installed, only .gz files will be generated')
+    manifest = build_assets(args.static_dir, use_brotli=not args.no_brotli)
+    for name, entry in manifest['bundles'].items():
+        sizes = entry['sizes']
+        compressed = ', '.join(f'{key} {sizes[key]:,}' for key in ('gzip', 'br') if key in sizes)
+        print(f"{name:20s} -> {entry['file']:32s} {sizes['source']:>9,} -> {sizes['identity']:>9,} bytes ({compressed})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
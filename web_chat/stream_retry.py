@@ -0,0 +1,337 @@
+"""流式响应的重试与续写
+
+tenacity 装饰器只能包住“创建生成器”的调用，而 requests 类适配器的 HTTP
+请求在第一次 next() 时才真正发出，因此连接失败从未被重试，流中途断开时
+回答也只会被悄悄截断。本模块让重试作用于迭代过程本身：
+
+- 首个 token 之前的失败（连接失败、超时、5xx/429）按指数退避重试
+- 已经输出部分内容后断开时，可以续写：把已输出的内容作为 assistant 前缀
+  追加到消息末尾重新请求；不支持续写时抛出 StreamInterruptedError
+- 首字时间（TTFT）预算与整体读超时分开配置
+- 重试受全局重试预算限制；端点熔断器打开后不再重试；上游 429 带 Retry-After
+  时至少等待该时间，超过最长退避时间则不再重试（由熔断器暂停该 API 密钥）
+
+Example:
+    >>> def open_stream(prefix):
+    ...     request = llm._prepare_qwen_request(config, with_assistant_prefix(messages, prefix))
+    ...     return llm._stream_sse(*request)
+    >>> for chunk in retrying_stream(open_stream, StreamRetryPolicy(), resumable=True):
+    ...     print(chunk, end='')
+"""
+
+import os
+import logging
+from contextlib import aclosing, closing
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Callable, Dict, Generator, List, Optional
+
+import httpx
+import requests
+import urllib3
+from tenacity import (
+    AsyncRetrying,
+    Retrying,
+    stop_after_attempt,
+    wait_exponential
+)
+
+from circuit_breaker import CircuitBreaker, retry_after_seconds, retry_budget
+from metrics import metrics
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 可重试的 HTTP 状态码
+RETRYABLE_STATUS_CODES = frozenset({408, 409, 425, 429, 500, 502, 503, 504})
+
+
+@dataclass(frozen=True)
+class StreamRetryPolicy:
+    """流式重试策略
+
+    Attributes:
+        max_attempts: 最大尝试次数（含首次请求和续写请求）
+        backoff_multiplier: 指数退避的乘数
+        backoff_min: 最短等待时间（秒）
+        backoff_max: 最长等待时间（秒）
+        first_token_timeout: 首字时间预算（秒），None 表示沿用请求读超时
+        resume: 已输出部分内容后是否尝试续写
+    """
+    max_attempts: int = 3
+    backoff_multiplier: float = 1.0
+    backoff_min: float = 1.0
+    backoff_max: float = 10.0
+    first_token_timeout: Optional[float] = None
+    resume: bool = True
+
+
+def stream_retry_settings_from_env() -> Dict[str, Any]:
+    """从环境变量读取流式重试配置
+
+    Returns:
+        Dict[str, Any]: StreamRetryPolicy 的构造参数
+    """
+    first_token_timeout = float(os.environ.get("LLM_FIRST_TOKEN_TIMEOUT", 0))
+    return {
+        "max_attempts": int(os.environ.get("LLM_STREAM_MAX_ATTEMPTS", 3)),
+        "backoff_min": float(os.environ.get("LLM_STREAM_BACKOFF_MIN", 1)),
+        "backoff_max": float(os.environ.get("LLM_STREAM_BACKOFF_MAX", 10)),
+        "first_token_timeout": first_token_timeout or None,
+        "resume": os.environ.get("LLM_STREAM_RESUME", "true").lower() == "true"
+    }
+
+
+class FirstTokenTimeoutError(TimeoutError):
+    """在首字时间预算内没有收到第一个 token"""
+
+
+class StreamInterruptedError(Exception):
+    """流在输出部分内容后中断，且无法续写
+
+    Attributes:
+        partial: 中断前已经输出的文本
+        attempts: 已进行的尝试次数
+    """
+
+    def __init__(self, partial: str, attempts: int, cause: BaseException) -> None:
+        self.partial = partial
+        self.attempts = attempts
+        super().__init__(
+            f"Stream interrupted after {len(partial)} characters "
+            f"({attempts} attempts): {cause}"
+        )
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """判断异常是否属于可重试的临时故障
+
+    Args:
+        error: 捕获的异常
+
+    Returns:
+        bool: 连接失败、超时、连接中断以及 408/429/5xx 等状态码返回 True
+    """
+    if isinstance(error, requests.exceptions.HTTPError):
+        response = error.response
+        return response is not None and response.status_code in RETRYABLE_STATUS_CODES
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (
+        FirstTokenTimeoutError,
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+        requests.exceptions.ChunkedEncodingError,
+        urllib3.exceptions.ProtocolError,
+        urllib3.exceptions.TimeoutError,
+        httpx.TransportError
+    ))
+
+
+def with_assistant_prefix(messages: List[Dict[str, str]], prefix: str) -> List[Dict[str, str]]:
+    """把已输出的内容作为 assistant 前缀追加到消息末尾（用于续写）
+
+    Args:
+        messages: 原始消息列表
+        prefix: 已输出的文本，为空时原样返回
+
+    Returns:
+        List[Dict[str, str]]: 新的消息列表（不修改原列表）
+    """
+    if not prefix:
+        return messages
+    return list(messages) + [{"role": "assistant", "content": prefix}]
+
+
+class _ResumeState:
+    """记录已输出内容，并去掉续写时模型重复输出的前缀
+
+    部分上游不会接着 assistant 前缀往下写，而是从头重新回答。续写结果如果
+    以已输出内容开头，重复部分会被丢弃。
+    """
+
+    def __init__(self) -> None:
+        self.parts: List[str] = []
+        self.attempts = 0
+        self._skip = ""
+        self._pending = ""
+
+    @property
+    def emitted(self) -> str:
+        return "".join(self.parts)
+
+    def start_attempt(self) -> str:
+        """开始新的一次尝试，返回本次请求使用的 assistant 前缀"""
+        self.attempts += 1
+        prefix = self.emitted
+        self._skip = prefix
+        self._pending = ""
+        return prefix
+
+    def accept(self, chunk: str) -> str:
+        """处理上游片段，返回应输出给调用方的文本"""
+        if self._skip:
+            self._pending += chunk
+            if self._skip.startswith(self._pending):
+                if len(self._pending) < len(self._skip):
+                    return ""
+                chunk = ""
+            elif self._pending.startswith(self._skip):
+                chunk = self._pending[len(self._skip):]
+            else:
+                chunk = self._pending
+            self._skip = self._pending = ""
+        if chunk:
+            self.parts.append(chunk)
+        return chunk
+
+    def finish(self) -> str:
+        """上游正常结束，返回仍在缓冲中的文本"""
+        pending, self._skip, self._pending = self._pending, "", ""
+        if pending:
+            self.parts.append(pending)
+        return pending
+
+
+def _retry_kwargs(
+    policy: StreamRetryPolicy,
+    state: _ResumeState,
+    resumable: bool,
+    description: str,
+    breaker: Optional[CircuitBreaker] = None
+) -> Dict[str, Any]:
+    """构建 tenacity 重试参数"""
+    backoff = wait_exponential(
+        multiplier=policy.backoff_multiplier,
+        min=policy.backoff_min,
+        max=policy.backoff_max
+    )
+
+    def should_retry(retry_state: Any) -> bool:
+        # tenacity 先判断是否重试再判断是否停止：最后一次尝试失败后不会再重试，不能扣减重试预算
+        error = retry_state.outcome.exception()
+        if error is None or not is_retryable_error(error):
+            return False
+        if state.parts and not (resumable and policy.resume):
+            return False
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None and retry_after > policy.backoff_max:
+            # 不打开端点熔断器：Retry-After 通常是单个 API 密钥的配额，由熔断器按密钥记录
+            logger.warning(f"Not retrying {description}: upstream asked to wait {retry_after:.0f}s")
+            return False
+        if retry_state.attempt_number >= policy.max_attempts:
+            return False
+        if breaker is not None and not breaker.allows_retry():
+            return False
+        if not retry_budget.try_retry():
+            logger.warning(f"Not retrying {description}: retry budget exhausted")
+            return False
+        return True
+
+    def wait(retry_state: Any) -> float:
+        delay = backoff(retry_state)
+        retry_after = retry_after_seconds(retry_state.outcome.exception())
+        return max(delay, retry_after) if retry_after is not None else delay
+
+    def log_retry(retry_state: Any) -> None:
+        metrics.record_retry()
+        logger.info(
+            f"Retrying {description} in {retry_state.next_action.sleep:.1f}s "
+            f"(attempt {retry_state.attempt_number}): {retry_state.outcome.exception()!r}"
+        )
+
+    return {
+        "stop": stop_after_attempt(policy.max_attempts),
+        "wait": wait,
+        "retry": should_retry,
+        "before_sleep": log_retry,
+        "reraise": True
+    }
+
+
+def retrying_stream(
+    open_stream: Callable[[str], Generator[str, None, None]],
+    policy: StreamRetryPolicy,
+    resumable: bool = False,
+    description: str = "stream",
+    breaker: Optional[CircuitBreaker] = None
+) -> Generator[str, None, None]:
+    """对流式迭代过程进行重试
+
+    Args:
+        open_stream: 接收 assistant 前缀（首次为空字符串）并返回文本片段生成器的函数，
+            请求在迭代时才发出也没有关系
+        policy: 重试策略
+        resumable: 上游是否支持带 assistant 前缀续写
+        description: 日志中使用的名称
+        breaker: 上游端点的熔断器，打开后不再重试
+
+    Yields:
+        str: 文本片段（续写时不会重复已输出的内容）
+
+    Raises:
+        StreamInterruptedError: 输出部分内容后中断且无法续写或重试耗尽
+    """
+    state = _ResumeState()
+    retry_budget.record_request()
+    try:
+        for attempt in Retrying(**_retry_kwargs(policy, state, resumable, description, breaker)):
+            with attempt:
+                prefix = state.start_attempt()
+                if prefix:
+                    logger.info(f"Resuming {description} after {len(prefix)} characters")
+                with closing(open_stream(prefix)) as stream:
+                    for chunk in stream:
+                        text = state.accept(chunk)
+                        if text:
+                            yield text
+                text = state.finish()
+                if text:
+                    yield text
+    except Exception as e:
+        if state.parts:
+            raise StreamInterruptedError(state.emitted, state.attempts, e) from e
+        raise
+
+
+async def aretrying_stream(
+    open_stream: Callable[[str], AsyncGenerator[str, None]],
+    policy: StreamRetryPolicy,
+    resumable: bool = False,
+    description: str = "stream",
+    breaker: Optional[CircuitBreaker] = None
+) -> AsyncGenerator[str, None]:
+    """retrying_stream 的异步版本
+
+    Args:
+        open_stream: 接收 assistant 前缀并返回异步文本片段生成器的函数
+        policy: 重试策略
+        resumable: 上游是否支持带 assistant 前缀续写
+        description: 日志中使用的名称
+        breaker: 上游端点的熔断器，打开后不再重试
+
+    Yields:
+        str: 文本片段
+
+    Raises:
+        StreamInterruptedError: 输出部分内容后中断且无法续写或重试耗尽
+    """
+    state = _ResumeState()
+    retry_budget.record_request()
+    try:
+        async for attempt in AsyncRetrying(**_retry_kwargs(policy, state, resumable, description, breaker)):
+            with attempt:
+                prefix = state.start_attempt()
+                if prefix:
+                    logger.info(f"Resuming {description} after {len(prefix)} characters")
+                async with aclosing(open_stream(prefix)) as stream:
+                    async for chunk in stream:
+                        text = state.accept(chunk)
+                        if text:
+                            yield text
+                text = state.finish()
+                if text:
+                    yield text
+    except Exception as e:
+        if state.parts:
+            raise StreamInterruptedError(state.emitted, state.attempts, e) from e
+        raise
@@ -5,9 +5,13 @@
 
 import os
 import sys
+import json
+import time
 import tempfile
+import threading
 import pytest
 from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 # 添加项目根目录到 Python 路径
 project_root = Path(__file__).parent.parent.parent
@@ -99,6 +103,55 @@ def disable_rate_limiting():
     app.config['TESTING'] = True
 
 
+@pytest.fixture(autouse=True)
+def reset_client_pool():
+    """每个测试前后清空 Provider 客户端池
+
+    避免上一个测试缓存的（Mock）客户端被下一个测试复用。应用导入的是顶层
+    llm_wrapper 模块，与 web_chat.llm_wrapper 各有一个连接池，两个都要清空。
+    """
+    import sys
+    import web_chat.llm_wrapper  # noqa: F401
+
+    def clear():
+        for name in ('llm_wrapper', 'web_chat.llm_wrapper'):
+            module = sys.modules.get(name)
+            if module is not None:
+                module.client_pool.clear()
+
+    clear()
+    yield
+    clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_circuit_breakers():
+    """每个测试前清空熔断器与重试预算
+
+    避免前面测试中的上游失败让后面测试的端点熔断或用完重试预算。
+    """
+    import sys
+    import web_chat.circuit_breaker  # noqa: F401
+    for name in ('circuit_breaker', 'web_chat.circuit_breaker'):
+        module = sys.modules.get(name)
+        if module is not None:
+            module.circuit_breakers.clear()
+            module.retry_budget.clear()
+
+
+@pytest.fixture(autouse=True)
+def fast_stream_retry(monkeypatch):
+    """测试中使用无退避等待的流式重试策略"""
+    import sys
+    from web_chat.stream_retry import StreamRetryPolicy
+    policy = StreamRetryPolicy(max_attempts=3, backoff_min=0, backoff_max=0, backoff_multiplier=0)
+    for name in ('llm_wrapper', 'web_chat.llm_wrapper'):
+        module = sys.modules.get(name)
+        if module is not None:
+            monkeypatch.setattr(module, 'stream_retry_policy', policy)
+    return policy
+
+
 @pytest.fixture
 def app_context():
     """Flask 应用上下文"""
@@ -157,3 +210,123 @@ def temp_icons_dir():
     import shutil
     if os.path.exists(temp_path):
         shutil.rmtree(temp_path)
+
+
+class FakeSSEServer:
+    """本地 SSE 假服务器
+
+    模拟 OpenAI 兼容的流式接口，用于测试连接复用、重试等网络行为。
+    每个请求按顺序从 scenarios 中取出一个场景，取完后使用默认场景。
+
+    场景字典字段:
+        chunks (List[str]): 依次发送的 delta.content 片段
+        status (int): HTTP 状态码，默认 200
+        drop_after (int): 发送若干片段后直接断开连接（模拟中途断流）
+        delay (float): 发送响应头前的等待时间（秒）
+        ttft (float): 发送响应头后、第一个片段前的等待时间（秒）
+        chunk_delay (float): 每个片段之间的等待时间（秒）
+    """
+
+    def __init__(self) -> None:
+        self.scenarios = []
+        self.default_scenario = {"chunks": ["Hello", " World"]}
+        self.requests = []
+        self.connections = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                server.connections += 1
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                try:
+                    self._handle_post()
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True
+
+            def _handle_post(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length) if length else b""
+                server.requests.append({
+                    "path": self.path,
+                    "headers": dict(self.headers),
+                    "json": json.loads(body) if body else None
+                })
+                scenario = server.scenarios.pop(0) if server.scenarios else server.default_scenario
+
+                time.sleep(scenario.get("delay", 0))
+                status = scenario.get("status", 200)
+                if status != 200:
+                    payload = b'{"error": "fake error"}'
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                drop_after = scenario.get("drop_after")
+                time.sleep(scenario.get("ttft", 0))
+                for i, text in enumerate(scenario.get("chunks", [])):
+                    if drop_after is not None and i >= drop_after:
+                        self.wfile.flush()
+                        self.close_connection = True
+                        self.connection.shutdown(2)
+                        return
+                    event = {"choices": [{"delta": {"content": text}}]}
+                    self._write_chunk(f"data: {json.dumps(event)}\n\n".encode())
+                    time.sleep(scenario.get("chunk_delay", 0))
+                self._write_chunk(b"data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+            def _write_chunk(self, data: bytes) -> None:
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1/chat/completions"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def start(self) -> "FakeSSEServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def fake_sse_server():
+    """启动本地 SSE 假服务器
+
+    Yields:
+        FakeSSEServer: 运行中的假服务器
+    """
+    server = FakeSSEServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def backup_sse_server():
+    """启动第二个本地 SSE 假服务器（模拟备用上游）
+
+    Yields:
+        FakeSSEServer: 运行中的假服务器
+    """
+    server = FakeSSEServer().start()
+    yield server
+    server.stop()
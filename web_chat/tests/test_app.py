@@ -44,6 +44,39 @@ class TestAPIModels:
         assert 'deepseek' in data
 
 
+@pytest.mark.integration
+class TestAPIStats:
+    """测试 /api/stats/* 端点"""
+
+    def test_hedging_stats(self, client):
+        """测试获取对冲统计"""
+        response = client.get('/api/stats/hedging')
+        assert response.status_code == 200
+
+        data = json.loads(response.data)
+        assert data['enabled'] is False
+        assert isinstance(data['models'], dict)
+
+    def test_cache_stats(self, client):
+        """测试获取响应缓存统计"""
+        response = client.get('/api/stats/cache')
+        assert response.status_code == 200
+
+        data = json.loads(response.data)
+        assert data['enabled'] is False
+        assert 'hit_ratio' in data
+        assert 'bytes_saved' in data
+
+    def test_single_flight_stats(self, client):
+        """测试获取相同请求合并统计"""
+        response = client.get('/api/stats/single-flight')
+        assert response.status_code == 200
+
+        data = json.loads(response.data)
+        assert data['enabled'] is False
+        assert data['in_flight'] == 0
+
+
 @pytest.mark.integration
 class TestAPIConfig:
     """测试配置 API 端点"""
@@ -0,0 +1,143 @@
+"""异步流式引擎测试
+
+测试 AsyncLLMWrapper 与 ASGI 入口，包括：
+- 异步 SSE 适配器（使用本地 SSE 假服务器）
+- ASGI /api/chat 的请求校验与流式响应，阻塞调用不在事件循环线程执行
+- 非 /api/chat 路由转交 Flask 处理
+"""
+
+import json
+import asyncio
+import threading
+import pytest
+import httpx
+from unittest.mock import patch
+from web_chat.async_llm import AsyncLLMWrapper, AsyncClients
+
+
+def _collect(agen):
+    """在新事件循环中收集异步生成器输出"""
+    async def run():
+        return [chunk async for chunk in agen]
+    return asyncio.run(run())
+
+
+def _qwen_config(url):
+    return {"type": "requests_sse", "url": url, "api_key": "k", "model": "m"}
+
+
+@pytest.mark.unit
+class TestAsyncLLMWrapper:
+    """测试异步适配器"""
+
+    def test_unknown_model(self, sample_messages):
+        """测试未知模型 ID"""
+        llm = AsyncLLMWrapper()
+        assert _collect(llm.achat_stream('unknown_model', sample_messages)) == ["Error: Unknown model"]
+
+    def test_qwen_stream(self, fake_sse_server, sample_messages):
+        """测试异步 Qwen 适配器"""
+        async def run():
+            clients = AsyncClients()
+            llm = AsyncLLMWrapper(clients=clients)
+            try:
+                return [c async for c in llm._achat_qwen(_qwen_config(fake_sse_server.url), sample_messages)]
+            finally:
+                await clients.aclose()
+
+        assert asyncio.run(run()) == ["Hello", " World"]
+        assert fake_sse_server.requests[0]["json"]["messages"] == sample_messages
+
+    def test_upstream_error_reported(self, fake_sse_server, sample_messages):
+        """测试上游错误以 Error 文本返回"""
+        fake_sse_server.default_scenario = {"status": 500}
+
+        async def run():
+            clients = AsyncClients()
+            llm = AsyncLLMWrapper(clients=clients)
+            with patch.object(llm, '_resolve_config', return_value=_qwen_config(fake_sse_server.url)):
+                try:
+                    return [c async for c in llm.achat_stream('qwen', sample_messages)]
+                finally:
+                    await clients.aclose()
+
+        result = asyncio.run(run())
+        assert len(result) == 1
+        assert result[0].startswith("Error:")
+
+
+@pytest.mark.integration
+class TestASGIApp:
+    """测试 ASGI 入口"""
+
+    @staticmethod
+    def _request(method, path, **kwargs):
+        from web_chat import asgi
+
+        async def run():
+            transport = httpx.ASGITransport(app=asgi.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.request(method, path, **kwargs)
+        return asyncio.run(run())
+
+    def test_chat_validation_preserved(self):
+        """测试与 Flask 路径相同的请求校验"""
+        response = self._request("POST", "/api/chat", json={'model': 'google', 'messages': 'not a list'})
+        assert response.status_code == 400
+        assert 'list' in response.json()['error']
+
+        response = self._request("POST", "/api/chat", json={
+            'model': 'unknown_model', 'messages': [{'role': 'user', 'content': 'test'}]
+        })
+        assert response.status_code == 400
+        assert 'Invalid model_id' in response.json()['error']
+
+    def test_chat_missing_json_body(self):
+        """测试缺少 JSON body"""
+        response = self._request("POST", "/api/chat")
+        assert response.status_code in [400, 415]
+
+    def test_chat_stream(self, fake_sse_server):
+        """测试流式返回上游内容"""
+        from web_chat import asgi
+        config = _qwen_config(fake_sse_server.url)
+        with patch.object(asgi.AsyncLLMWrapper, '_resolve_config', return_value=config):
+            response = self._request("POST", "/api/chat", json={
+                'model': 'qwen', 'messages': [{'role': 'user', 'content': 'Hi'}]
+            })
+
+        assert response.status_code == 200
+        assert response.text == "Hello World"
+
+    def test_blocking_calls_off_event_loop(self, fake_sse_server):
+        """测试令牌预留、回复结算与慢请求记录在线程池中执行"""
+        from web_chat import asgi
+        threads = {}
+
+        def reserve_tokens(*args):
+            threads['reserve'] = threading.get_ident()
+            reservation, limited = original_reserve(*args)
+            return Reservation(), limited
+
+        class Reservation:
+            def settle(self, model_id, reply):
+                threads['settle'] = threading.get_ident()
+
+        original_reserve = asgi.reserve_tokens
+        config = _qwen_config(fake_sse_server.url)
+        with patch.object(asgi.AsyncLLMWrapper, '_resolve_config', return_value=config), \
+                patch.object(asgi, 'reserve_tokens', reserve_tokens), \
+                patch.object(asgi.slow_request_log, 'record', lambda *a, **kw: threads.setdefault('record', threading.get_ident())):
+            response = self._request("POST", "/api/chat", json={
+                'model': 'qwen', 'messages': [{'role': 'user', 'content': 'Hi'}]
+            })
+
+        assert response.text == "Hello World"
+        assert set(threads) == {'reserve', 'settle', 'record'}
+        assert threading.get_ident() not in threads.values()
+
+    def test_other_routes_served_by_flask(self):
+        """测试其他路由由 Flask 处理"""
+        response = self._request("GET", "/api/models")
+        assert response.status_code == 200
+        assert 'google' in response.json()
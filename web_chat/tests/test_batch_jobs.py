@@ -0,0 +1,240 @@
+"""批量任务队列测试
+
+测试 batch_jobs 模块，包括：
+- JSONL 解析（prompt 简写、默认模型、行号错误）
+- 工作线程处理、按模型限制并发、重试与失败
+- 断点恢复与取消
+- 批量任务接口：提交、进度、流式下载结果
+"""
+
+import json
+import time
+import threading
+import pytest
+from web_chat.batch_jobs import BatchItem, BatchQueue, parse_jsonl
+
+
+class _FakeWrapper:
+    """记录调用与并发数的 LLMWrapper 替身"""
+
+    def __init__(self, delay=0.0, fail=()):
+        self.delay = delay
+        self.fail = set(fail)
+        self.calls = []
+        self.active = {}
+        self.peak = {}
+        self.lock = threading.Lock()
+
+    def iter_chat(self, model_id, messages):
+        prompt = messages[-1]["content"]
+        with self.lock:
+            self.calls.append(prompt)
+            self.active[model_id] = self.active.get(model_id, 0) + 1
+            self.peak[model_id] = max(self.peak.get(model_id, 0), self.active[model_id])
+        try:
+            time.sleep(self.delay)
+            if prompt in self.fail:
+                raise ConnectionError("upstream down")
+            yield f"{model_id}:"
+            yield prompt.upper()
+        finally:
+            with self.lock:
+                self.active[model_id] -= 1
+
+
+ADMIN = {"X-Admin-Token": "secret"}
+
+
+def _queue(tmp_path, wrapper, **kwargs):
+    queue = BatchQueue(db_path=str(tmp_path / "batch.db"), poll_interval=0.02, **kwargs)
+    queue.bind(lambda: wrapper)
+    return queue
+
+
+def _items(model, *prompts):
+    return [BatchItem(p, model, [{"role": "user", "content": p}]) for p in prompts]
+
+
+def _wait(queue, job_id, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.job(job_id)
+        if job["status"] in ("completed", "cancelled"):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"Batch job did not finish: {queue.job(job_id)}")
+
+
+def _results(queue, job_id):
+    return [json.loads(line) for line in queue.iter_results(job_id, page_size=2)]
+
+
+@pytest.mark.unit
+class TestParseJsonl:
+    """测试 JSONL 解析"""
+
+    def test_parse(self):
+        """测试 prompt 简写、默认模型与默认 custom_id"""
+        text = '{"prompt": "hi"}\n\n{"custom_id": "x", "model": "qwen", "messages": [{"role": "user", "content": "yo"}]}\n'
+        items = parse_jsonl(text, default_model="deepseek")
+        assert items == [
+            BatchItem("1", "deepseek", [{"role": "user", "content": "hi"}]),
+            BatchItem("x", "qwen", [{"role": "user", "content": "yo"}])
+        ]
+
+    def test_errors_report_line(self):
+        """测试格式错误时报告行号"""
+        with pytest.raises(ValueError, match="Line 2"):
+            parse_jsonl('{"prompt": "a"}\nnot json', default_model="m")
+        with pytest.raises(ValueError, match="missing model"):
+            parse_jsonl('{"prompt": "a"}')
+        with pytest.raises(ValueError, match="missing messages"):
+            parse_jsonl('{"model": "m"}')
+
+
+@pytest.mark.unit
+class TestBatchQueue:
+    """测试处理、并发、重试、恢复与取消"""
+
+    def test_processes_job_in_order(self, tmp_path):
+        """测试任务完成后按提交顺序输出结果，并统计吞吐量"""
+        wrapper = _FakeWrapper()
+        queue = _queue(tmp_path, wrapper, workers=3)
+        try:
+            job_id = queue.submit(_items("m", "a", "b", "c", "d", "e"), name="eval")
+            job = _wait(queue, job_id)
+            assert job["done"] == 5 and job["name"] == "eval"
+            assert job["prompts_per_min"] > 0
+            assert [r["output"] for r in _results(queue, job_id)] == ["m:A", "m:B", "m:C", "m:D", "m:E"]
+            assert queue.stats()["completed"] == 5
+        finally:
+            queue.stop()
+
+    def test_per_model_concurrency(self, tmp_path):
+        """测试每个模型的并发数不超过上限"""
+        wrapper = _FakeWrapper(delay=0.05)
+        queue = _queue(tmp_path, wrapper, workers=6, model_concurrency=2, model_limits={"slow": 1})
+        try:
+            job_id = queue.submit(_items("fast", *"abcdef") + _items("slow", *"ghi"))
+            _wait(queue, job_id)
+            assert wrapper.peak == {"fast": 2, "slow": 1}
+        finally:
+            queue.stop()
+
+    def test_retry_then_fail(self, tmp_path):
+        """测试失败的条目重试到上限后记录错误，不影响其他条目"""
+        wrapper = _FakeWrapper(fail={"bad"})
+        queue = _queue(tmp_path, wrapper, workers=1, max_attempts=2)
+        try:
+            job_id = queue.submit(_items("m", "ok", "bad"))
+            job = _wait(queue, job_id)
+            assert job["done"] == 1 and job["error"] == 1
+            result = _results(queue, job_id)[1]
+            assert result["status"] == "error" and "upstream down" in result["error"]
+            assert wrapper.calls.count("bad") == 2
+            assert queue.stats()["retried"] == 1 and queue.stats()["failed"] == 1
+        finally:
+            queue.stop()
+
+    def test_resume_after_restart(self, tmp_path):
+        """测试重启后中断的条目重新处理，已完成的条目不再请求"""
+        first = _queue(tmp_path, _FakeWrapper())
+        with first._lock:
+            db = first._db()
+            db.insert_job("job1", "", _items("m", "a", "b", "c"), time.time())
+            db.execute("UPDATE jobs SET status = 'running', started_at = ? WHERE id = 'job1'", (time.time(),))
+            db.execute("UPDATE items SET status = 'done', output = 'saved' WHERE idx = 0")
+            db.execute("UPDATE items SET status = 'running' WHERE idx = 1")
+        first.stop()
+
+        wrapper = _FakeWrapper()
+        second = _queue(tmp_path, wrapper)
+        try:
+            second.start()
+            assert _wait(second, "job1")["done"] == 3
+            assert sorted(wrapper.calls) == ["b", "c"]
+            assert _results(second, "job1")[0]["output"] == "saved"
+        finally:
+            second.stop()
+
+    def test_cancel(self, tmp_path):
+        """测试取消后未开始的条目不再处理"""
+        wrapper = _FakeWrapper(delay=0.05)
+        queue = _queue(tmp_path, wrapper, workers=1)
+        try:
+            job_id = queue.submit(_items("m", *"abcdef"))
+            time.sleep(0.02)
+            assert queue.cancel(job_id)
+            job = _wait(queue, job_id)
+            assert job["status"] == "cancelled" and job["cancelled"] >= 4
+            assert not queue.cancel(job_id)
+        finally:
+            queue.stop()
+
+    def test_submit_limits(self, tmp_path):
+        """测试空任务和超过条目上限的任务被拒绝"""
+        queue = _queue(tmp_path, _FakeWrapper(), max_items=2)
+        with pytest.raises(ValueError):
+            queue.submit([])
+        with pytest.raises(ValueError, match="max 2"):
+            queue.submit(_items("m", "a", "b", "c"))
+
+
+@pytest.mark.integration
+class TestBatchAPI:
+    """测试批量任务接口"""
+
+    @pytest.fixture
+    def batch_app(self, monkeypatch, tmp_path, fake_sse_server):
+        import web_chat.app as app_module
+        queue = BatchQueue(db_path=str(tmp_path / "batch.db"), poll_interval=0.02)
+        config = {"type": "requests_sse", "url": fake_sse_server.url, "api_key": "k", "model": "m"}
+
+        def factory():
+            llm = app_module.LLMWrapper()
+            llm._resolve_config = lambda model_id: config
+            return llm
+
+        queue.bind(factory)
+        monkeypatch.setattr(app_module, "batch_queue", queue)
+        monkeypatch.setenv("ADMIN_TOKEN", "secret")
+        yield queue
+        queue.stop()
+
+    def test_submit_progress_and_results(self, client, batch_app):
+        """测试提交 JSONL、查询进度并下载结果"""
+        body = '{"custom_id": "q1", "prompt": "one"}\n{"custom_id": "q2", "prompt": "two"}\n'
+        response = client.post('/api/batch/jobs?model=qwen', data=body, content_type='application/x-ndjson', headers=ADMIN)
+        assert response.status_code == 202
+        job_id = json.loads(response.data)['id']
+
+        _wait(batch_app, job_id)
+        progress = json.loads(client.get(f'/api/batch/jobs/{job_id}', headers=ADMIN).data)
+        assert progress['done'] == 2 and progress['status'] == 'completed'
+
+        response = client.get(f'/api/batch/jobs/{job_id}/results', headers=ADMIN)
+        assert response.mimetype == 'application/x-ndjson'
+        lines = [json.loads(line) for line in response.data.decode().splitlines()]
+        assert [(r['custom_id'], r['output']) for r in lines] == [('q1', 'Hello World'), ('q2', 'Hello World')]
+        assert json.loads(client.get('/api/batch/jobs', headers=ADMIN).data)['jobs'][0]['id'] == job_id
+
+    def test_validation_and_not_found(self, client, batch_app):
+        """测试逐行校验与不存在的任务"""
+        response = client.post('/api/batch/jobs', data='{"model": "nope", "prompt": "x"}', headers=ADMIN)
+        assert response.status_code == 400
+        assert 'Invalid model_id' in json.loads(response.data)['error']
+        assert client.get('/api/batch/jobs/missing', headers=ADMIN).status_code == 404
+        assert client.delete('/api/batch/jobs/missing', headers=ADMIN).status_code == 404
+
+    def test_admin_token_required(self, client, batch_app, monkeypatch):
+        """测试缺少或错误的管理令牌、以及未设置 ADMIN_TOKEN 时一律返回 403"""
+        body = '{"prompt": "one"}\n'
+        assert client.post('/api/batch/jobs?model=qwen', data=body).status_code == 403
+        assert client.get('/api/batch/jobs', headers={'X-Admin-Token': 'wrong'}).status_code == 403
+
+        monkeypatch.delenv('ADMIN_TOKEN')
+        for method in ('get', 'post'):
+            response = getattr(client, method)('/api/batch/jobs?model=qwen', headers=ADMIN)
+            assert response.status_code == 403
+            assert 'ADMIN_TOKEN' in json.loads(response.data)['error']
+        assert batch_app.jobs() == []
@@ -0,0 +1,352 @@
+"""按上游端点熔断与重试预算测试
+
+测试 circuit_breaker 模块，包括：
+- 失败比例（含慢调用）达到阈值时打开，打开期间快速失败，半开探测后关闭或重新打开
+- 上游 429 的 Retry-After（秒数与 HTTP 日期）直接打开熔断器；经由 guard 时只暂停
+  对应的 API 密钥，同一主机的其他密钥不受影响
+- 错误分类：连接失败、超时与 5xx 计为故障，4xx 不计
+- 全局重试预算与 stream_retry 的集成
+- /api/chat 在熔断时返回 503、Retry-After 与 provider_unavailable 错误类型
+"""
+
+import time
+import asyncio
+from email.utils import formatdate
+import pytest
+import httpx
+import requests
+from unittest.mock import patch
+from web_chat import stream_retry
+from web_chat.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitBreakerPolicy,
+    CircuitBreakerRegistry,
+    CircuitOpenError,
+    RetryBudget,
+    endpoint_key,
+    is_failure,
+    retry_after_seconds
+)
+from web_chat.stream_retry import StreamRetryPolicy, retrying_stream
+
+CONFIG = {"type": "requests_sse", "url": "https://api.example.com/v1/chat/completions", "api_key": "k", "model": "m"}
+
+
+def _http_error(status, retry_after=None):
+    response = requests.Response()
+    response.status_code = status
+    if retry_after is not None:
+        response.headers["Retry-After"] = retry_after
+    return requests.exceptions.HTTPError(f"{status} error", response=response)
+
+
+def _failing(error):
+    raise error
+    yield  # pragma: no cover
+
+
+def _chunks(*chunks):
+    yield from chunks
+
+
+@pytest.mark.unit
+class TestCircuitBreaker:
+    """测试单个熔断器的状态转换"""
+
+    def test_opens_on_failure_rate(self):
+        """测试失败比例达到阈值时打开并快速失败"""
+        breaker = CircuitBreaker("e", CircuitBreakerPolicy(window=4, min_calls=4, failure_rate=0.5))
+        error = requests.exceptions.ConnectionError("refused")
+        breaker.record_success()
+        breaker.record_failure(error)
+        breaker.record_success()
+        assert breaker.state == CLOSED
+        breaker.record_failure(error)
+        assert breaker.state == OPEN
+
+        with pytest.raises(CircuitOpenError) as exc:
+            breaker.before_call()
+        assert exc.value.endpoint == "e" and 29 < exc.value.retry_after <= 30
+        assert exc.value.retry_after_header == 30
+        assert breaker.snapshot()["rejected"] == 1
+
+    def test_slow_calls_count_as_failures(self):
+        """测试首字时间超过阈值的调用计为失败"""
+        breaker = CircuitBreaker("e", CircuitBreakerPolicy(window=2, min_calls=2, slow_call_seconds=1))
+        breaker.record_success(0.5)
+        breaker.record_success(5)
+        assert breaker.state == OPEN
+        assert breaker.snapshot()["slow_calls"] == 1
+
+    def test_half_open_probe(self):
+        """测试打开时间过后放行一个探测请求，成功则关闭，失败则重新打开"""
+        breaker = CircuitBreaker("e", CircuitBreakerPolicy(open_seconds=0.05))
+        breaker.trip(0.05)
+        time.sleep(0.06)
+
+        breaker.before_call()
+        assert breaker.state == HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()  # 探测名额已用完
+        assert not breaker.allows_retry()
+        breaker.record_failure(requests.exceptions.Timeout())
+        assert breaker.state == OPEN
+
+        time.sleep(0.06)
+        breaker.before_call()
+        breaker.record_success(0.1)
+        assert breaker.state == CLOSED and breaker.allows_retry()
+
+    def test_retry_after_opens(self):
+        """测试上游 429 的 Retry-After 直接打开熔断器，时间不超过上限"""
+        breaker = CircuitBreaker("e", CircuitBreakerPolicy(max_retry_after=60))
+        breaker.record_failure(_http_error(429, "120"))
+        assert breaker.state == OPEN
+        assert 59 < breaker.retry_after() <= 60
+
+    def test_retry_after_scoped_to_key(self):
+        """测试给出 API 密钥时 Retry-After 只暂停该密钥，不打开端点熔断器"""
+        breaker = CircuitBreaker("e", CircuitBreakerPolicy(max_retry_after=60, window=1, min_calls=1))
+        breaker.record_failure(_http_error(429, "120"), "a")
+        assert breaker.state == CLOSED and breaker.retry_after() is None and breaker.retry_after("b") is None
+        assert 59 < breaker.retry_after("a") <= 60
+        with pytest.raises(CircuitOpenError) as exc:
+            breaker.before_call("a")
+        assert 59 < exc.value.retry_after <= 60
+        breaker.before_call("b")
+        assert breaker.snapshot()["blocked_keys"] == 1
+
+
+@pytest.mark.unit
+class TestErrorClassification:
+    """测试错误分类与 Retry-After 解析"""
+
+    def test_is_failure(self):
+        """测试连接失败、超时与 5xx 计为故障，客户端错误与本地错误不计"""
+        assert is_failure(_http_error(503))
+        assert is_failure(_http_error(429))
+        assert not is_failure(_http_error(401))
+        assert is_failure(requests.exceptions.ConnectionError())
+        assert is_failure(httpx.ConnectTimeout("timeout"))
+        assert is_failure(stream_retry.FirstTokenTimeoutError())
+        assert not is_failure(ValueError("bad key"))
+
+    def test_retry_after_seconds(self):
+        """测试解析秒数与 HTTP 日期，只对 429/503 生效"""
+        assert retry_after_seconds(_http_error(429, "7")) == 7
+        assert 55 < retry_after_seconds(_http_error(503, formatdate(time.time() + 60, usegmt=True))) <= 60
+        assert retry_after_seconds(_http_error(500, "7")) is None
+        assert retry_after_seconds(_http_error(429)) is None
+        assert retry_after_seconds(ValueError()) is None
+
+    def test_endpoint_key(self):
+        """测试同一主机上的模型共用一个熔断器"""
+        assert endpoint_key(CONFIG) == "requests_sse:api.example.com"
+        assert endpoint_key({"type": "openai", "base_url": "https://api.deepseek.com/v1"}) == "openai:api.deepseek.com"
+        assert endpoint_key({"type": "google"}) == "google:generativelanguage.googleapis.com"
+
+
+@pytest.mark.unit
+class TestRegistry:
+    """测试熔断器集合与流保护"""
+
+    def test_guard_records_outcomes(self):
+        """测试首个片段记录成功，首个片段之前的错误记录失败，客户端错误不计为失败"""
+        registry = CircuitBreakerRegistry(CircuitBreakerPolicy(window=3, min_calls=3))
+        assert list(registry.guard(CONFIG, iter(["a", "b"]))) == ["a", "b"]
+        with pytest.raises(requests.exceptions.HTTPError):
+            list(registry.guard(CONFIG, _failing(_http_error(400))))
+        assert registry.stats()["requests_sse:api.example.com"]["successes"] == 2
+
+        with pytest.raises(requests.exceptions.ConnectionError):
+            list(registry.guard(CONFIG, _failing(requests.exceptions.ConnectionError())))
+        with pytest.raises(requests.exceptions.ConnectionError):
+            list(registry.guard(CONFIG, _failing(requests.exceptions.ConnectionError())))
+        assert registry.check(CONFIG) is not None
+
+        upstream_called = []
+        with pytest.raises(CircuitOpenError):
+            list(registry.guard(CONFIG, (upstream_called.append(1) or c for c in ["x"])))
+        assert upstream_called == []
+
+    def test_retry_after_pauses_only_key(self):
+        """测试一个用户密钥的 429 Retry-After 不影响同一主机上其他密钥的请求"""
+        registry = CircuitBreakerRegistry(CircuitBreakerPolicy())
+        other = dict(CONFIG, api_key="other")
+        with pytest.raises(requests.exceptions.HTTPError):
+            list(registry.guard(CONFIG, _failing(_http_error(429, "60"))))
+
+        assert 59 < registry.check(CONFIG).retry_after <= 60
+        assert registry.check(other) is None
+        assert list(registry.guard(other, iter(["a"]))) == ["a"]
+        with pytest.raises(CircuitOpenError):
+            list(registry.guard(CONFIG, iter(["a"])))
+        assert registry.get(CONFIG).state == CLOSED
+
+    def test_cancelled_probe_released(self):
+        """测试半开探测在首个片段之前被取消时归还名额"""
+        registry = CircuitBreakerRegistry(CircuitBreakerPolicy())
+        breaker = registry.get(CONFIG)
+        breaker.trip(0.01)
+        time.sleep(0.02)
+
+        async def never():
+            await asyncio.sleep(10)
+            yield "x"
+
+        async def run():
+            task = asyncio.ensure_future(registry.aguard(CONFIG, never()).__anext__())
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(run())
+        breaker.before_call()  # 名额已归还
+        assert breaker.state == HALF_OPEN
+
+    def test_disabled(self):
+        """测试未启用时不创建熔断器"""
+        registry = CircuitBreakerRegistry(CircuitBreakerPolicy(enabled=False))
+        assert registry.get(CONFIG) is None and registry.check(CONFIG) is None
+        assert list(registry.guard(CONFIG, iter(["a"]))) == ["a"]
+
+
+@pytest.mark.unit
+class TestRetryBudget:
+    """测试全局重试预算与 stream_retry 的集成"""
+
+    def test_ratio_and_minimum(self):
+        """测试重试次数不超过 max(最少次数, 比例 × 请求数)"""
+        budget = RetryBudget(ratio=0.1, min_retries=2)
+        for _ in range(30):
+            budget.record_request()
+        assert [budget.try_retry() for _ in range(4)] == [True, True, True, False]
+        assert budget.stats()["exhausted"] == 1
+
+        unlimited = RetryBudget(ratio=-1)
+        assert all(unlimited.try_retry() for _ in range(100))
+
+    def test_budget_stops_retries(self, monkeypatch):
+        """测试预算用完时不再重试"""
+        monkeypatch.setattr(stream_retry, "retry_budget", RetryBudget(ratio=0, min_retries=0))
+        attempts = []
+
+        def open_stream(prefix):
+            attempts.append(prefix)
+            return _failing(requests.exceptions.ConnectionError())
+
+        with pytest.raises(requests.exceptions.ConnectionError):
+            list(retrying_stream(open_stream, StreamRetryPolicy(backoff_min=0, backoff_max=0)))
+        assert len(attempts) == 1
+
+    def test_final_attempt_not_charged(self, monkeypatch):
+        """测试最后一次尝试失败后不扣减重试预算（只有真正发生的重试才计数）"""
+        budget = RetryBudget()
+        monkeypatch.setattr(stream_retry, "retry_budget", budget)
+
+        def open_stream(prefix):
+            return _failing(requests.exceptions.ConnectionError())
+
+        with pytest.raises(requests.exceptions.ConnectionError):
+            list(retrying_stream(open_stream, StreamRetryPolicy(max_attempts=1)))
+        assert budget.stats()["requests"] == 1 and budget.stats()["retries"] == 0
+
+        with pytest.raises(requests.exceptions.ConnectionError):
+            list(retrying_stream(open_stream, StreamRetryPolicy(max_attempts=3, backoff_min=0, backoff_max=0)))
+        assert budget.stats()["requests"] == 2 and budget.stats()["retries"] == 2
+
+    def test_long_retry_after_not_retried(self):
+        """测试 Retry-After 超过最长退避时间时不重试（也不打开端点熔断器），较短时按其等待"""
+        breaker = CircuitBreaker("e", CircuitBreakerPolicy())
+        attempts = []
+
+        def open_stream(prefix):
+            attempts.append(prefix)
+            return _failing(_http_error(429, "60"))
+
+        with pytest.raises(requests.exceptions.HTTPError):
+            list(retrying_stream(open_stream, StreamRetryPolicy(backoff_max=10), breaker=breaker))
+        assert len(attempts) == 1 and breaker.state == CLOSED
+
+        errors = iter([_http_error(429, "0.2")])
+
+        def flaky(prefix):
+            error = next(errors, None)
+            return _failing(error) if error else _chunks("ok")
+
+        start = time.monotonic()
+        assert list(retrying_stream(flaky, StreamRetryPolicy(backoff_min=0, backoff_max=10, backoff_multiplier=0))) == ["ok"]
+        assert time.monotonic() - start >= 0.2
+
+    def test_open_breaker_stops_retries(self):
+        """测试熔断器打开后不再重试"""
+        breaker = CircuitBreaker("e", CircuitBreakerPolicy())
+        breaker.trip(30)
+        attempts = []
+
+        def open_stream(prefix):
+            attempts.append(prefix)
+            return _failing(_http_error(502))
+
+        with pytest.raises(requests.exceptions.HTTPError):
+            list(retrying_stream(open_stream, StreamRetryPolicy(backoff_min=0, backoff_max=0), breaker=breaker))
+        assert len(attempts) == 1
+
+
+@pytest.mark.integration
+class TestChatFastFail:
+    """测试聊天接口在熔断时快速失败"""
+
+    def test_flask_chat(self, client, monkeypatch, sample_messages):
+        """测试熔断时返回 503、Retry-After 与 provider_unavailable，且不访问上游"""
+        import web_chat.app as app_module
+        registry = CircuitBreakerRegistry(CircuitBreakerPolicy())
+        registry.get(CONFIG).trip(20)
+        monkeypatch.setattr(app_module.llm, "breakers", registry)
+        monkeypatch.setattr(app_module.LLMWrapper, "_resolve_config", lambda self, model_id: CONFIG)
+
+        response = client.post('/api/chat', json={'model': 'qwen', 'messages': sample_messages})
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '20'
+        body = response.get_json()
+        assert body['error_type'] == 'provider_unavailable' and body['retry_after'] == 20
+
+    def test_in_stream_rejection(self, monkeypatch, fake_sse_server, sample_messages):
+        """测试上游流本身同样受保护：熔断后不再连接上游"""
+        import web_chat.app as app_module
+        config = {**CONFIG, "url": fake_sse_server.url}
+        llm = app_module.LLMWrapper()
+        monkeypatch.setattr(app_module.LLMWrapper, "_resolve_config", lambda self, model_id: config)
+        assert "".join(llm.chat_stream("qwen", sample_messages)) == "Hello World"
+
+        llm.breakers.get(config).trip(20)
+        assert "circuit open" in "".join(llm.chat_stream("qwen", sample_messages))
+        assert len(fake_sse_server.requests) == 1
+
+    def test_asgi_chat(self, sample_messages):
+        """测试 ASGI 路径同样返回 503"""
+        from web_chat import asgi
+        import app as flat_app
+        registry = CircuitBreakerRegistry(CircuitBreakerPolicy())
+        registry.get(CONFIG).trip(20)
+
+        async def run():
+            transport = httpx.ASGITransport(app=asgi.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+                return await http.post("/api/chat", json={'model': 'qwen', 'messages': sample_messages})
+
+        with patch.object(flat_app.LLMWrapper, '_resolve_config', return_value=CONFIG), \
+                patch.object(flat_app.llm, 'breakers', registry):
+            response = asyncio.run(run())
+        assert response.status_code == 503 and response.headers['retry-after'] == '20'
+        assert response.json()['error_type'] == 'provider_unavailable'
+
+    def test_stats(self, client):
+        """测试统计接口"""
+        response = client.get('/api/stats/circuit-breakers')
+        assert response.status_code == 200
+        assert {'enabled', 'endpoints', 'retry_budget'} <= set(response.get_json())
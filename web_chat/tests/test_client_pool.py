@@ -0,0 +1,237 @@
+"""ClientPool 单元测试
+
+测试 Provider 客户端池的核心功能，包括：
+- 客户端复用与命中统计
+- LRU 与空闲超时淘汰
+- 租借中的客户端延迟关闭
+- 根据模型配置预热
+- 创建客户端时不持有池锁
+"""
+
+import time
+import threading
+import pytest
+from unittest.mock import Mock, patch
+from web_chat.client_pool import ClientPool
+from web_chat.llm_wrapper import LLMWrapper
+
+
+def _make_pool(**kwargs):
+    """创建使用 Mock 工厂的客户端池"""
+    factory = Mock(side_effect=lambda key, url: Mock(name=f"client-{key}-{url}"))
+    return ClientPool(factories={"openai": factory}, **kwargs), factory
+
+
+@pytest.mark.unit
+class TestClientPoolLease:
+    """测试客户端租借与复用"""
+
+    def test_same_key_reuses_client(self):
+        """测试相同 key 复用同一个客户端"""
+        pool, factory = _make_pool()
+
+        with pool.lease("openai", "key", "https://a") as first:
+            pass
+        with pool.lease("openai", "key", "https://a") as second:
+            pass
+
+        assert first is second
+        assert factory.call_count == 1
+        assert pool.stats()["hits"] == 1
+        assert pool.stats()["misses"] == 1
+
+    def test_different_keys_create_clients(self):
+        """测试不同 key / base_url 创建不同客户端"""
+        pool, factory = _make_pool()
+
+        with pool.lease("openai", "key-1", "https://a") as first:
+            pass
+        with pool.lease("openai", "key-2", "https://a") as second:
+            pass
+        with pool.lease("openai", "key-1", "https://b") as third:
+            pass
+
+        assert len({id(first), id(second), id(third)}) == 3
+        assert pool.stats()["size"] == 3
+
+    def test_unknown_provider_type(self):
+        """测试未注册的 provider 类型"""
+        pool, _ = _make_pool()
+        with pytest.raises(KeyError):
+            with pool.lease("google", "key"):
+                pass
+
+
+@pytest.mark.unit
+class TestClientPoolConcurrency:
+    """测试并发租借"""
+
+    def test_slow_build_does_not_block_other_keys(self):
+        """测试一个 key 的客户端创建较慢时，其他 key 的租借不需要等待"""
+        started, release = threading.Event(), threading.Event()
+
+        def factory(key, url):
+            if key == "slow":
+                started.set()
+                release.wait(5)
+            return Mock(name=key)
+
+        pool = ClientPool(factories={"openai": factory})
+        with pool.lease("openai", "fast"):
+            pass
+
+        def lease_slow():
+            with pool.lease("openai", "slow"):
+                pass
+
+        thread = threading.Thread(target=lease_slow)
+        thread.start()
+        try:
+            assert started.wait(5)
+            begin = time.monotonic()
+            with pool.lease("openai", "fast"):
+                pass
+            with pool.lease("openai", "other"):
+                pass
+            assert time.monotonic() - begin < 1
+        finally:
+            release.set()
+            thread.join(5)
+        assert pool.stats()["size"] == 3
+
+    def test_same_key_built_once(self):
+        """测试多个线程同时租借同一个 key 时只创建一个客户端"""
+        def factory(key, url):
+            time.sleep(0.05)
+            return Mock(name=key)
+
+        factory = Mock(side_effect=factory)
+        pool = ClientPool(factories={"openai": factory})
+        clients = []
+
+        def lease():
+            with pool.lease("openai", "key") as client:
+                clients.append(client)
+
+        threads = [threading.Thread(target=lease) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        assert factory.call_count == 1
+        assert len(clients) == 8 and len({id(c) for c in clients}) == 1
+        assert pool.stats()["misses"] == 1 and pool.stats()["hits"] == 7
+
+    def test_failed_build_retried(self):
+        """测试创建失败时抛出异常，下一次租借重新创建"""
+        factory = Mock(side_effect=[ConnectionError("boom"), Mock(name="client")])
+        pool = ClientPool(factories={"openai": factory})
+        with pytest.raises(ConnectionError):
+            with pool.lease("openai", "key"):
+                pass
+        with pool.lease("openai", "key") as client:
+            assert client is not None
+        assert factory.call_count == 2 and pool.stats()["size"] == 1
+
+
+@pytest.mark.unit
+class TestClientPoolEviction:
+    """测试客户端淘汰"""
+
+    def test_lru_eviction_closes_client(self):
+        """测试超出容量时淘汰最久未使用的客户端"""
+        pool, _ = _make_pool(max_size=2)
+
+        with pool.lease("openai", "key-1") as first:
+            pass
+        with pool.lease("openai", "key-2"):
+            pass
+        with pool.lease("openai", "key-3"):
+            pass
+
+        assert pool.stats()["size"] == 2
+        assert pool.stats()["evictions"] == 1
+        first.close.assert_called_once()
+
+    def test_idle_eviction(self):
+        """测试空闲超时淘汰"""
+        pool, factory = _make_pool(idle_timeout=0.01)
+
+        with pool.lease("openai", "key") as first:
+            pass
+        time.sleep(0.02)
+        with pool.lease("openai", "key") as second:
+            pass
+
+        assert first is not second
+        assert factory.call_count == 2
+        first.close.assert_called_once()
+
+    def test_leased_client_closed_after_release(self):
+        """测试被淘汰但仍在使用的客户端在归还后才关闭"""
+        pool, _ = _make_pool(max_size=1)
+
+        with pool.lease("openai", "key-1") as first:
+            with pool.lease("openai", "key-2"):
+                pass
+            first.close.assert_not_called()
+
+        first.close.assert_called_once()
+
+
+@pytest.mark.unit
+class TestClientPoolWarm:
+    """测试客户端池预热"""
+
+    def test_warm_skips_missing_keys_and_unmanaged_types(self):
+        """测试预热跳过无密钥和非托管类型的模型"""
+        pool, factory = _make_pool()
+        configs = {
+            "deepseek": {"type": "openai", "api_key": "sk-1", "base_url": "https://a"},
+            "moonshot": {"type": "openai", "api_key": "", "base_url": "https://b"},
+            "qwen": {"type": "requests_sse", "api_key": "sk-2", "url": "https://c"}
+        }
+
+        assert pool.warm(configs) == 1
+        assert pool.warm(configs) == 0
+        assert factory.call_count == 1
+
+        with pool.lease("openai", "sk-1", "https://a"):
+            pass
+        assert pool.stats()["hits"] == 1
+
+
+@pytest.mark.unit
+class TestLLMWrapperUsesPool:
+    """测试 LLMWrapper 通过连接池获取客户端"""
+
+    @patch('web_chat.llm_wrapper.OpenAI')
+    def test_openai_client_reused_across_wrappers(self, mock_openai, sample_messages):
+        """测试多个 LLMWrapper 实例复用同一个 OpenAI 客户端"""
+        mock_chunk = Mock()
+        mock_chunk.choices = [Mock(delta=Mock(content='Hi'))]
+        mock_openai.return_value.chat.completions.create.side_effect = lambda **kw: iter([mock_chunk])
+
+        for _ in range(3):
+            llm = LLMWrapper(custom_api_keys={'DEEPSEEK_API_KEY': 'test-key'})
+            assert list(llm.chat_stream('deepseek', sample_messages)) == ['Hi']
+
+        assert mock_openai.call_count == 1
+
+    def test_google_client_base_url(self):
+        """测试 Google 客户端使用模型配置的 base_url（代理或本地模拟上游）"""
+        from web_chat.llm_wrapper import _create_google_client
+        client = _create_google_client('k', 'http://127.0.0.1:9000')
+        assert client._api_client._http_options['base_url'] == 'http://127.0.0.1:9000'
+
+    def test_stats_endpoint(self, client, monkeypatch):
+        """测试 /api/stats/client-pool 返回应用所用连接池的命中与未命中次数"""
+        import llm_wrapper as flat_llm_wrapper
+        pool = flat_llm_wrapper.client_pool
+        monkeypatch.setitem(pool._factories, "test", lambda key, url: Mock())
+        for _ in range(2):
+            with pool.lease("test", "key"):
+                pass
+        stats = client.get("/api/stats/client-pool").get_json()
+        assert stats["misses"] == 1 and stats["hits"] == 1
+        assert stats["hit_ratio"] == 0.5
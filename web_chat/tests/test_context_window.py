@@ -0,0 +1,142 @@
+"""上下文窗口管理测试
+
+测试 context_window 模块，包括：
+- 中日韩与拉丁文本的 token 估算和按内容哈希的缓存
+- 按预算裁剪历史（保留系统提示词和最新的若干轮）
+- 按剩余预算计算 max_tokens
+- LLMWrapper 在发出请求前裁剪消息
+"""
+
+import pytest
+from web_chat.llm_wrapper import LLMWrapper
+from web_chat.context_window import (
+    MESSAGE_OVERHEAD_TOKENS,
+    ContextBudget,
+    TokenCounter,
+    estimate_tokens,
+    fit_messages
+)
+
+
+def _conversation(turns, size=400):
+    messages = [{"role": "system", "content": "You are helpful."}]
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"question {i} " + "x" * size})
+        messages.append({"role": "assistant", "content": f"answer {i} " + "y" * size})
+    messages.append({"role": "user", "content": "latest question"})
+    return messages
+
+
+@pytest.mark.unit
+class TestTokenEstimation:
+    """测试 token 估算"""
+
+    def test_cjk_and_latin(self):
+        """测试中日韩字符按字计数，其他字符约 4 个一个 token"""
+        assert estimate_tokens("") == 0
+        assert estimate_tokens("a" * 40) == 10
+        assert estimate_tokens("你好世界") == 4
+        assert estimate_tokens("こんにちは") == 5
+        assert estimate_tokens("你好 hello") == 2 + 2
+
+    def test_counter_caches_by_content(self):
+        """测试相同内容只计算一次，并按容量淘汰"""
+        counter = TokenCounter(max_entries=2)
+        assert counter.count("你好") == 2
+        assert counter.count("你好") == 2
+        assert len(counter) == 1
+        counter.count("a")
+        counter.count("b")
+        assert len(counter) == 2
+        assert counter.message_tokens({"role": "user", "content": "你好"}) == 2 + MESSAGE_OVERHEAD_TOKENS
+
+
+@pytest.mark.unit
+class TestFitMessages:
+    """测试裁剪策略"""
+
+    def test_budget_from_config(self):
+        """测试从模型配置读取预算"""
+        assert ContextBudget.from_config({"type": "openai"}) is None
+        budget = ContextBudget.from_config({"context_length": 8192}, default_max_output=2048)
+        assert budget == ContextBudget(8192, reserved_output_tokens=1024, max_output_tokens=2048)
+
+    def test_fits_without_trimming(self):
+        """测试预算充足时原样保留，max_tokens 取上游上限"""
+        messages = _conversation(2, size=10)
+        fitted = fit_messages(messages, ContextBudget(32768), counter=TokenCounter())
+        assert fitted.messages == messages
+        assert fitted.dropped == 0
+        assert fitted.max_tokens == 4096
+
+    @pytest.mark.parametrize("head", [[], [{"role": "system", "content": "You are helpful."}]])
+    def test_untrimmed_leading_assistant_kept(self, head):
+        """测试没有裁剪时保留开头的 assistant 消息（例如开场问候）"""
+        messages = head + [{"role": "assistant", "content": "Hello!"}, {"role": "user", "content": "hi"}]
+        fitted = fit_messages(messages, ContextBudget(100000), counter=TokenCounter())
+        assert fitted.messages == messages
+        assert fitted.dropped == 0
+
+    def test_trims_middle_keeps_system_and_newest(self):
+        """测试超出预算时丢弃中间的历史"""
+        messages = _conversation(10)
+        budget = ContextBudget(1000, reserved_output_tokens=300, max_output_tokens=4096)
+        fitted = fit_messages(messages, budget, counter=TokenCounter())
+
+        assert fitted.messages[0] == messages[0]
+        assert fitted.messages[-1] == messages[-1]
+        assert fitted.messages[1]["role"] == "user"
+        assert fitted.messages[1:] == messages[-len(fitted.messages) + 1:]
+        assert fitted.dropped > 0
+        assert fitted.prompt_tokens <= budget.prompt_budget
+        assert fitted.max_tokens == budget.context_length - fitted.prompt_tokens - budget.safety_margin
+        assert fitted.max_tokens >= budget.reserved_output_tokens
+
+    def test_config_system_prompt_counts(self):
+        """测试模型配置中的系统提示词计入预算"""
+        messages = [{"role": "user", "content": "hi"}]
+        budget = ContextBudget(2000)
+        without = fit_messages(messages, budget, counter=TokenCounter())
+        with_system = fit_messages(messages, budget, system="s" * 400, counter=TokenCounter())
+        assert with_system.prompt_tokens == without.prompt_tokens + 100 + MESSAGE_OVERHEAD_TOKENS
+
+    def test_newest_message_always_kept(self):
+        """测试最新消息本身超出预算时仍然保留"""
+        messages = [{"role": "user", "content": "old"}, {"role": "assistant", "content": "ok"},
+                    {"role": "user", "content": "z" * 8000}]
+        fitted = fit_messages(messages, ContextBudget(1500, reserved_output_tokens=200), counter=TokenCounter())
+        assert fitted.messages == messages[-1:]
+        assert fitted.max_tokens == 1
+
+
+@pytest.mark.integration
+class TestWrapperContext:
+    """测试 LLMWrapper 在发出请求前裁剪消息"""
+
+    def test_request_is_trimmed_and_sized(self, fake_sse_server):
+        """测试发往上游的消息被裁剪，max_tokens 按剩余预算计算"""
+        llm = LLMWrapper()
+        llm._resolve_config = lambda model_id: {
+            "type": "requests_sse", "url": fake_sse_server.url, "api_key": "k", "model": "m",
+            "context_length": 1000, "reserved_output_tokens": 300
+        }
+        messages = _conversation(10)
+
+        assert "".join(llm.chat_stream("qwen", messages)) == "Hello World"
+        payload = fake_sse_server.requests[0]["json"]
+        assert payload["messages"][0] == messages[0]
+        assert payload["messages"][-1] == messages[-1]
+        assert len(payload["messages"]) < len(messages)
+        assert 300 <= payload["max_tokens"] < 1000
+
+    def test_models_without_budget_unchanged(self, fake_sse_server):
+        """测试没有声明 context_length 的模型原样转发"""
+        llm = LLMWrapper()
+        llm._resolve_config = lambda model_id: {
+            "type": "requests_sse", "url": fake_sse_server.url, "api_key": "k", "model": "m"
+        }
+        messages = _conversation(10)
+        "".join(llm.chat_stream("qwen", messages))
+        payload = fake_sse_server.requests[0]["json"]
+        assert payload["messages"] == messages
+        assert payload["max_tokens"] == llm.config.max_tokens
@@ -0,0 +1,286 @@
+"""服务端对话存储测试
+
+测试 conversation_store 模块，包括：
+- 版本号校验、用户消息与助手回复的追加、重新同步
+- 单个对话的消息条数与字节数限制
+- 热集合按字节数淘汰、溢出到磁盘与重新加载、TTL
+- 磁盘 I/O 不占用全局锁，重新同步或删除后不会被延迟的溢出写回
+- 提供商格式转换的增量缓存
+- /api/chat 的增量请求、版本冲突与完整历史回退
+"""
+
+import os
+import json
+import time
+import threading
+import pytest
+from types import SimpleNamespace
+from web_chat.context_window import ContextBudget, fit_messages
+from web_chat.conversation_store import (
+    ConversationConflictError,
+    ConversationLimitError,
+    ConversationStore,
+    convert_messages
+)
+
+CID = "conversation-1"
+
+
+def _user(content):
+    return {"role": "user", "content": content}
+
+
+@pytest.mark.unit
+class TestConversationStore:
+    """测试版本号与追加"""
+
+    def test_turns_append_messages(self, tmp_path):
+        """测试每轮追加用户消息和助手回复，版本号为消息条数"""
+        store = ConversationStore(spill_dir=str(tmp_path))
+        turn = store.begin_turn(CID, "deepseek", 0, _user("hi"))
+        assert turn.version == 1
+        assert turn.messages == [_user("hi")]
+        turn.finish("hello")
+
+        turn = store.begin_turn(CID, "deepseek", 2, _user("again"))
+        assert turn.messages == [_user("hi"), {"role": "assistant", "content": "hello"}, _user("again")]
+        assert store.version(CID) == 3
+
+    def test_conflict(self, tmp_path):
+        """测试版本号或模型不一致时报告服务端版本"""
+        store = ConversationStore(spill_dir=str(tmp_path))
+        with pytest.raises(ConversationConflictError) as exc:
+            store.begin_turn(CID, "deepseek", 4, _user("hi"))
+        assert exc.value.version == 0
+
+        store.begin_turn(CID, "deepseek", 0, _user("hi")).finish("hello")
+        with pytest.raises(ConversationConflictError) as exc:
+            store.begin_turn(CID, "deepseek", 0, _user("hi"))
+        assert exc.value.version == 2
+        with pytest.raises(ConversationConflictError):
+            store.begin_turn(CID, "moonshot", 2, _user("hi"))
+        assert store.stats()["conflicts"] == 3
+
+    def test_empty_and_stale_replies_not_stored(self, tmp_path):
+        """测试空回复不保存，重新同步后旧一轮的回复不保存"""
+        store = ConversationStore(spill_dir=str(tmp_path))
+        store.begin_turn(CID, "deepseek", 0, _user("hi")).finish("")
+        assert store.version(CID) == 1
+
+        stale = store.begin_turn(CID, "deepseek", 1, _user("second"))
+        store.reset(CID, "deepseek", [_user("fresh")])
+        stale.finish("late reply")
+        assert store.version(CID) == 1
+
+    def test_limits(self, tmp_path):
+        """测试追加或重新同步后超出消息条数、字节数限制时拒绝，对话保持不变"""
+        store = ConversationStore(spill_dir=str(tmp_path), max_messages=3, max_conversation_bytes=20)
+        store.begin_turn(CID, "m", 0, _user("hi")).finish("hello")
+        with pytest.raises(ConversationLimitError):
+            store.begin_turn(CID, "m", 2, _user("x" * 14))
+        store.begin_turn(CID, "m", 2, _user("again")).finish("ok")
+        with pytest.raises(ConversationLimitError, match="max 3"):
+            store.begin_turn(CID, "m", 4, _user("more"))
+        assert store.version(CID) == 4
+
+        with pytest.raises(ConversationLimitError):
+            store.reset(CID, "m", [_user("a")] * 4)
+        assert store.version(CID) == 4
+        assert store.stats()["rejected"] == 3
+
+    def test_spill_and_reload(self, tmp_path):
+        """测试超出容量时最久未使用的对话写入磁盘，再次访问时重新加载"""
+        store = ConversationStore(max_memory_bytes=10, spill_dir=str(tmp_path))
+        store.begin_turn("conversation-a", "m", 0, _user("a" * 8)).finish("reply")
+        store.begin_turn("conversation-b", "m", 0, _user("b" * 8))
+        assert os.path.exists(tmp_path / "conversation-a.json")
+        assert store.stats()["hot_conversations"] == 1
+
+        turn = store.begin_turn("conversation-a", "m", 2, _user("next"))
+        assert [m["content"] for m in turn.messages] == ["a" * 8, "reply", "next"]
+        assert not os.path.exists(tmp_path / "conversation-a.json")
+        stats = store.stats()
+        assert stats["spilled"] == 2 and stats["loaded"] == 1
+
+    def test_load_outside_store_lock(self, tmp_path, monkeypatch):
+        """测试从磁盘加载一个对话时，其他对话不被阻塞"""
+        import web_chat.conversation_store as store_module
+        store = ConversationStore(max_memory_bytes=10, spill_dir=str(tmp_path))
+        store.begin_turn("conversation-a", "m", 0, _user("a" * 8)).finish("reply")
+        store.begin_turn("conversation-b", "m", 0, _user("b" * 8))
+
+        entered, release = threading.Event(), threading.Event()
+
+        def slow_load(f):
+            entered.set()
+            release.wait(5)
+            return json.load(f)
+
+        monkeypatch.setattr(store_module, "json", SimpleNamespace(load=slow_load, dump=json.dump))
+        versions = []
+        loader = threading.Thread(target=lambda: versions.append(store.version("conversation-a")))
+        loader.start()
+        assert entered.wait(5)
+        started = time.monotonic()
+        store.begin_turn("conversation-c", "m", 0, _user("c"))
+        assert store.stats()["turns"] == 3
+        assert time.monotonic() - started < 1
+        release.set()
+        loader.join(5)
+        assert versions == [2]
+
+    @pytest.mark.parametrize("action", ["reset", "delete"])
+    def test_late_spill_does_not_resurrect(self, tmp_path, monkeypatch, action):
+        """测试淘汰后尚未写入磁盘的对话被重新同步或删除时，旧内容不再写回"""
+        store = ConversationStore(max_memory_bytes=10, spill_dir=str(tmp_path))
+        store.begin_turn("conversation-a", "m", 0, _user("a" * 8)).finish("reply")
+        pending = []
+        monkeypatch.setattr(store, "_spill", pending.extend)
+        store.begin_turn("conversation-b", "m", 0, _user("b" * 8))
+        assert [c.conversation_id for c in pending] == ["conversation-a"]
+
+        if action == "reset":
+            store.reset("conversation-a", "m", [_user("fresh")])
+        else:
+            store.delete("conversation-a")
+        monkeypatch.undo()
+        store._spill(pending)
+
+        assert not os.path.exists(tmp_path / "conversation-a.json")
+        assert store.version("conversation-a") == (1 if action == "reset" else 0)
+        assert store.stats()["spilled"] == len(pending) - 1
+
+    def test_pending_spill_reclaimed(self, tmp_path, monkeypatch):
+        """测试尚未写入磁盘的对话再次访问时直接放回热集合"""
+        store = ConversationStore(max_memory_bytes=10, spill_dir=str(tmp_path))
+        store.begin_turn("conversation-a", "m", 0, _user("a" * 8)).finish("reply")
+        pending = []
+        monkeypatch.setattr(store, "_spill", pending.extend)
+        store.begin_turn("conversation-b", "m", 0, _user("b" * 8))
+        turn = store.begin_turn("conversation-a", "m", 2, _user("next"))
+        monkeypatch.undo()
+        store._spill(pending)
+
+        assert [m["content"] for m in turn.messages] == ["a" * 8, "reply", "next"]
+        assert not os.path.exists(tmp_path / "conversation-a.json")
+        assert store.stats()["loaded"] == 0
+
+    def test_ttl(self, tmp_path):
+        """测试闲置超过 TTL 的对话过期"""
+        store = ConversationStore(spill_dir=str(tmp_path), ttl=0.05)
+        store.begin_turn(CID, "m", 0, _user("hi"))
+        time.sleep(0.06)
+        assert store.version(CID) == 0
+
+
+@pytest.mark.unit
+class TestConvertMessages:
+    """测试格式转换缓存"""
+
+    def test_incremental_conversion(self, tmp_path):
+        """测试对话追加消息后只转换新增部分，裁剪后的列表全部转换"""
+        store = ConversationStore(spill_dir=str(tmp_path))
+        converted = []
+
+        def convert(msg):
+            converted.append(msg["content"])
+            return None if msg["role"] == "system" else msg["content"].upper()
+
+        turn = store.begin_turn(CID, "m", 0, {"role": "system", "content": "sys"})
+        turn.finish("a")
+        assert convert_messages(store.begin_turn(CID, "m", 2, _user("b")).messages, "g", convert) == ["A", "B"]
+        assert converted == ["sys", "a", "b"]
+
+        turn = store.begin_turn(CID, "m", 3, _user("c"))
+        assert convert_messages(turn.messages, "g", convert) == ["A", "B", "C"]
+        assert converted[3:] == ["c"]
+
+        assert convert_messages(list(turn.messages), "g", convert) == ["A", "B", "C"]
+        assert len(converted) == 8
+
+    def test_untrimmed_messages_keep_cache(self, tmp_path):
+        """测试上下文管理没有裁剪时保留原列表（及其转换缓存）"""
+        store = ConversationStore(spill_dir=str(tmp_path))
+        messages = store.begin_turn(CID, "m", 0, _user("hi")).messages
+        assert fit_messages(messages, ContextBudget(100000)).messages is messages
+
+
+@pytest.mark.integration
+class TestConversationAPI:
+    """测试 /api/chat 的增量请求"""
+
+    @pytest.fixture
+    def chat_app(self, monkeypatch, tmp_path, fake_sse_server):
+        import web_chat.app as app_module
+        # 使用 app 导入的类，冲突异常才能被路由捕获
+        store = app_module.ConversationStore(spill_dir=str(tmp_path))
+        monkeypatch.setattr(app_module, "conversation_store", store)
+        config = {"type": "requests_sse", "url": fake_sse_server.url, "api_key": "k", "model": "m"}
+        monkeypatch.setattr(app_module.LLMWrapper, "_resolve_config", lambda self, model_id: config)
+        return store
+
+    def _delta(self, client, base_version, content, conversation_id=CID):
+        return client.post('/api/chat', json={
+            'model': 'qwen', 'conversation_id': conversation_id,
+            'base_version': base_version, 'message': _user(content)
+        })
+
+    def test_delta_requests(self, client, chat_app, fake_sse_server):
+        """测试增量请求只上传新消息，服务端拼出完整历史"""
+        response = self._delta(client, 0, 'first')
+        assert response.status_code == 200
+        assert response.data.decode() == 'Hello World'
+        assert response.headers['X-Conversation-Id'] == CID
+        assert response.headers['X-Conversation-Version'] == '1'
+
+        assert self._delta(client, 2, 'second').status_code == 200
+        assert fake_sse_server.requests[1]["json"]["messages"] == [
+            _user('first'), {'role': 'assistant', 'content': 'Hello World'}, _user('second')
+        ]
+        assert chat_app.version(CID) == 4
+
+    def test_conflict_and_resync(self, client, chat_app):
+        """测试版本不一致时返回 409，上传完整历史后重新同步"""
+        response = self._delta(client, 6, 'hi')
+        assert response.status_code == 409
+        assert json.loads(response.data)['version'] == 0
+
+        history = [_user('a'), {'role': 'assistant', 'content': 'b'}, _user('c')]
+        response = client.post('/api/chat', json={'model': 'qwen', 'conversation_id': CID, 'messages': history})
+        assert response.status_code == 200
+        assert response.headers['X-Conversation-Version'] == '3'
+        assert response.data.decode() == 'Hello World'
+        assert chat_app.version(CID) == 4
+
+    def test_delta_validation(self, client, chat_app):
+        """测试增量请求的参数校验"""
+        assert self._delta(client, 0, 'hi', conversation_id='../etc').status_code == 400
+        response = self._delta(client, 0, 'x' * 10001)
+        assert 'too long' in json.loads(response.data)['error']
+        response = client.post('/api/chat', json={
+            'model': 'qwen', 'conversation_id': CID, 'base_version': -1, 'message': _user('hi')
+        })
+        assert response.status_code == 400
+
+    @pytest.mark.parametrize('role', ['system', 'assistant'])
+    def test_delta_message_must_be_user(self, client, chat_app, role):
+        """测试增量请求只接受用户消息，不能插入系统消息或以助手消息结尾"""
+        response = client.post('/api/chat', json={
+            'model': 'qwen', 'conversation_id': CID, 'base_version': 0,
+            'message': {'role': role, 'content': 'hi'}
+        })
+        assert response.status_code == 400
+        assert json.loads(response.data)['error'] == 'message role must be user'
+        assert chat_app.version(CID) == 0
+
+    def test_delta_message_limit(self, client, chat_app):
+        """测试增量请求与完整历史一样最多 100 条消息"""
+        import web_chat.app as app_module
+        history = [_user('q'), {'role': 'assistant', 'content': 'a'}] * 49 + [_user('q')]
+        assert client.post('/api/chat', json={'model': 'qwen', 'conversation_id': CID, 'messages': history}).status_code == 200
+        assert chat_app.version(CID) == 100
+
+        response = self._delta(client, 100, 'one more')
+        assert response.status_code == 400
+        assert json.loads(response.data)['error'] == f'Too many messages (max {app_module.MAX_MESSAGES})'
+        assert chat_app.version(CID) == 100
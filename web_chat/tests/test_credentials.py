@@ -0,0 +1,173 @@
+"""签名凭据缓存测试
+
+测试 credentials 模块，包括：
+- 智谱 JWT 的签发与校验
+- 凭据提供者必须实现 issue
+- 缓存命中、提前刷新（带抖动）、过期与容量淘汰
+- 刷新期间其他线程继续使用旧凭据，签发失败不污染缓存
+- LLMWrapper 接入
+"""
+
+import json
+import time
+import hmac
+import base64
+import hashlib
+import threading
+import pytest
+from web_chat.credentials import (
+    Credential,
+    CredentialCache,
+    CredentialProvider,
+    ZhipuJWTProvider,
+    sign_zhipu_jwt
+)
+
+
+def _b64decode(part):
+    return base64.urlsafe_b64decode(part + "=" * (-len(part) % 4))
+
+
+class _CountingProvider(CredentialProvider):
+    """记录签发次数的提供者"""
+
+    def __init__(self, ttl=3600.0):
+        self.ttl = ttl
+        self.issued = 0
+
+    def issue(self, api_key, now):
+        self.issued += 1
+        return Credential(f"{api_key}-{self.issued}", now + self.ttl)
+
+
+def _cache(provider, **kwargs):
+    cache = CredentialCache(**kwargs)
+    cache.register("p", provider)
+    return cache
+
+
+@pytest.mark.unit
+class TestZhipuJWT:
+    """测试智谱 JWT 签发"""
+
+    def test_sign(self):
+        """测试载荷中的过期时间与 HMAC-SHA256 签名"""
+        token = sign_zhipu_jwt("kid.secret", ttl=60, now=1000)
+        header, payload, signature = token.split(".")
+        assert json.loads(_b64decode(payload)) == {"api_key": "kid", "exp": 1060, "timestamp": 1000}
+        expected = hmac.new(b"secret", f"{header}.{payload}".encode(), hashlib.sha256).digest()
+        assert _b64decode(signature) == expected
+
+    def test_invalid_key(self):
+        """测试 API Key 格式错误"""
+        with pytest.raises(ValueError, match="API Key 格式错误"):
+            sign_zhipu_jwt("invalid_key")
+
+    def test_cache_id_separates_secrets(self):
+        """测试同一密钥 ID 更换 secret 后使用不同的缓存键"""
+        provider = ZhipuJWTProvider()
+        assert provider.cache_id("kid.a").startswith("kid:")
+        assert provider.cache_id("kid.a") != provider.cache_id("kid.b")
+
+
+@pytest.mark.unit
+class TestCredentialCache:
+    """测试缓存、刷新与淘汰"""
+
+    def test_provider_must_implement_issue(self):
+        """测试未实现 issue 的提供者在实例化时即失败，而不是在第一次请求时"""
+        class Incomplete(CredentialProvider):
+            pass
+
+        with pytest.raises(TypeError):
+            Incomplete()
+
+    def test_hit(self):
+        """测试有效期内只签发一次"""
+        provider = _CountingProvider()
+        cache = _cache(provider)
+        assert cache.get("p", "k") == cache.get("p", "k") == "k-1"
+        assert provider.issued == 1
+        assert cache.stats()["hits"] == 1
+
+    def test_refresh_ahead_with_jitter(self):
+        """测试刷新时间落在 [过期 - 提前量 - 抖动, 过期 - 提前量] 之间，到期前重新签发"""
+        cache = _cache(_CountingProvider(ttl=1000), refresh_ahead=100, jitter=50)
+        cache.get("p", "k")
+        entry = next(iter(cache._entries.values()))
+        expires_at = entry.credential.expires_at
+        assert expires_at - 150 <= entry.refresh_at <= expires_at - 100
+
+        provider = _CountingProvider(ttl=100)
+        cache = _cache(provider, refresh_ahead=100, jitter=0)
+        assert cache.get("p", "k") == "k-1"
+        assert cache.get("p", "k") == "k-2"
+        assert cache.stats()["refreshed"] == 1
+
+    def test_expired_reissued(self):
+        """测试过期后重新签发"""
+        provider = _CountingProvider(ttl=0.05)
+        cache = _cache(provider, refresh_ahead=0, jitter=0)
+        cache.get("p", "k")
+        time.sleep(0.06)
+        assert cache.get("p", "k") == "k-2"
+
+    def test_bounded(self):
+        """测试超出容量时淘汰最久未使用的条目"""
+        cache = _cache(_CountingProvider(), max_entries=2)
+        for key in ("a", "b", "a", "c"):
+            cache.get("p", key)
+        assert cache.stats()["entries"] == 2 and cache.stats()["evictions"] == 1
+        assert cache.get("p", "a") == "a-1"
+
+    def test_stale_served_while_refreshing(self):
+        """测试一个线程刷新时，其他线程继续使用仍然有效的旧凭据"""
+        release = threading.Event()
+        started = threading.Event()
+
+        class SlowProvider(_CountingProvider):
+            def issue(self, api_key, now):
+                if self.issued:
+                    started.set()
+                    release.wait(1)
+                return super().issue(api_key, now)
+
+        cache = _cache(SlowProvider(ttl=100), refresh_ahead=100, jitter=0)
+        cache.get("p", "k")
+        results = []
+        refresher = threading.Thread(target=lambda: results.append(cache.get("p", "k")))
+        refresher.start()
+        assert started.wait(1)
+        assert cache.get("p", "k") == "k-1"
+        release.set()
+        refresher.join(1)
+        assert results == ["k-2"]
+
+    def test_issue_failure_not_cached(self):
+        """测试签发失败时抛出异常，之后可以重新签发"""
+        cache = CredentialCache()
+        cache.register("zhipu", ZhipuJWTProvider())
+        with pytest.raises(ValueError):
+            cache.get("zhipu", "invalid_key")
+        assert cache.stats()["entries"] == 0
+        with pytest.raises(KeyError):
+            cache.get("unknown", "k")
+
+
+@pytest.mark.integration
+class TestZhipuIntegration:
+    """测试 LLMWrapper 接入"""
+
+    def test_request_reuses_token(self):
+        """测试同一密钥的多次请求复用同一个 JWT"""
+        from web_chat.llm_wrapper import LLMWrapper
+        llm = LLMWrapper()
+        llm.credentials = CredentialCache()
+        llm.credentials.register("zhipu", ZhipuJWTProvider())
+        config = {"api_key": "kid.secret", "model": "glm-4"}
+        messages = [{"role": "user", "content": "hi"}]
+
+        first = llm._prepare_zhipu_request(config, messages)[1]["Authorization"]
+        second = llm._prepare_zhipu_request(config, messages)[1]["Authorization"]
+        assert first == second
+        assert llm.credentials.stats()["issued"] == 1
@@ -0,0 +1,112 @@
+"""多模型并发对比测试
+
+测试 fan_out 模块，包括：
+- 并发执行，总耗时接近最慢的模型
+- 每个模型的 done 帧包含首字时间与总耗时，异常写入 done 帧
+- 客户端提前断开时取消所有上游
+- /api/chat/compare 的多路复用流与参数校验
+"""
+
+import json
+import time
+import threading
+import pytest
+from web_chat.llm_wrapper import on_cancel
+from web_chat.fan_out import encode_frames, fan_out
+
+
+def _slow(chunks, delay):
+    def upstream():
+        for chunk in chunks:
+            time.sleep(delay)
+            yield chunk
+    return upstream
+
+
+def _frames(batches):
+    return [frame for batch in batches for frame in batch]
+
+
+@pytest.mark.unit
+class TestFanOut:
+    """测试扇出与多路复用"""
+
+    def test_runs_models_concurrently(self):
+        """测试总耗时接近最慢的模型，而不是耗时之和"""
+        started = time.monotonic()
+        frames = _frames(fan_out({"a": _slow(["a1", "a2"], 0.1), "b": _slow(["b1", "b2"], 0.1)}))
+        assert time.monotonic() - started < 0.35
+
+        for model in ("a", "b"):
+            texts = [f["text"] for f in frames if f.get("model") == model and f["type"] == "chunk"]
+            assert texts == [f"{model}1", f"{model}2"]
+            done = next(f for f in frames if f.get("model") == model and f["type"] == "done")
+            assert 0.05 < done["ttft"] < done["total"] and done["chars"] == 4 and done["error"] is None
+        assert frames[-1]["type"] == "end"
+
+    def test_error_reported_in_done_frame(self):
+        """测试一个模型出错不影响其他模型"""
+        def failing():
+            yield "partial"
+            raise ConnectionError("upstream down")
+
+        frames = _frames(fan_out({"bad": failing, "ok": _slow(["x"], 0)}))
+        done = {f["model"]: f for f in frames if f["type"] == "done"}
+        assert done["bad"]["error"] == "upstream down" and done["bad"]["chars"] == 7
+        assert done["ok"]["error"] is None
+
+    def test_close_cancels_upstreams(self):
+        """测试提前关闭流时中止仍在阻塞读取的上游"""
+        cancelled = threading.Event()
+
+        def blocking():
+            release = threading.Event()
+            unregister = on_cancel(lambda: (cancelled.set(), release.set()))
+            try:
+                yield "first"
+                release.wait(5)
+            finally:
+                unregister()
+
+        stream = fan_out({"m": blocking})
+        assert next(stream)[0]["text"] == "first"
+        stream.close()
+        assert cancelled.wait(1)
+
+    def test_encode_frames(self):
+        """测试每批帧编码为多行 JSON"""
+        payloads = list(encode_frames([[{"model": "m", "type": "chunk", "text": "你好"}, {"type": "end"}]]))
+        assert payloads == ['{"model": "m", "type": "chunk", "text": "你好"}\n{"type": "end"}\n']
+
+
+@pytest.mark.integration
+class TestCompareAPI:
+    """测试 /api/chat/compare"""
+
+    def test_multiplexed_stream(self, client, monkeypatch, fake_sse_server, sample_messages):
+        """测试两个模型的帧按模型 ID 区分，并各自带有耗时统计"""
+        import web_chat.app as app_module
+        config = {"type": "requests_sse", "url": fake_sse_server.url, "api_key": "k", "model": "m"}
+        monkeypatch.setattr(app_module.LLMWrapper, "_resolve_config", lambda self, model_id: config)
+
+        response = client.post('/api/chat/compare', json={'models': ['qwen', 'deepseek'], 'messages': sample_messages})
+        assert response.mimetype == 'application/x-ndjson'
+        frames = [json.loads(line) for line in response.data.decode().splitlines()]
+
+        for model in ('qwen', 'deepseek'):
+            text = ''.join(f['text'] for f in frames if f.get('model') == model and f['type'] == 'chunk')
+            assert text == 'Hello World'
+            done = next(f for f in frames if f.get('model') == model and f['type'] == 'done')
+            assert done['ttft'] is not None and done['total'] >= done['ttft']
+        assert frames[-1]['type'] == 'end'
+        assert len(fake_sse_server.requests) == 2
+
+    def test_validation(self, client, sample_messages):
+        """测试模型列表与消息校验"""
+        assert client.post('/api/chat/compare', json={'models': [], 'messages': sample_messages}).status_code == 400
+        response = client.post('/api/chat/compare', json={'models': ['qwen', 'nope'], 'messages': sample_messages})
+        assert 'Invalid model_id: nope' in json.loads(response.data)['error']
+        response = client.post('/api/chat/compare', json={'models': ['a', 'b', 'c', 'd', 'e'], 'messages': sample_messages})
+        assert 'Too many models' in json.loads(response.data)['error']
+        response = client.post('/api/chat/compare', json={'models': ['qwen'], 'messages': 'x'})
+        assert response.status_code == 400
@@ -0,0 +1,225 @@
+"""后台健康探测测试
+
+测试 health_prober 模块，包括：
+- 首字时间与可用性的 EWMA，以及 online / degraded / offline / unknown 状态
+- 探测成功、失败、未配置密钥时跳过；一轮探测并发进行，超时的探测记为失败
+- LLMWrapper.probe() 只发送最小请求，收到首字后断开
+- /api/models/list 返回 health 字段
+"""
+
+import time
+import threading
+import pytest
+from web_chat.health_prober import (
+    DEGRADED,
+    OFFLINE,
+    ONLINE,
+    UNKNOWN,
+    HealthProbePolicy,
+    HealthProber,
+    ModelHealth,
+    health_probe_settings_from_env
+)
+
+
+class _FakeLLM:
+    """按模型返回首字时间、None（未配置密钥）或抛出异常的假 LLMWrapper"""
+
+    def __init__(self, results, delay=0.0):
+        self.results = results
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def get_models(self):
+        return list(self.results)
+
+    def probe(self, model_id, prompt):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(self.delay)
+            result = self.results[model_id]
+            if isinstance(result, Exception):
+                raise result
+            return result
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def _prober(llm, **policy):
+    prober = HealthProber(HealthProbePolicy(enabled=True, rate=0, **policy))
+    prober.bind(lambda: llm)
+    return prober
+
+
+@pytest.mark.unit
+class TestModelHealth:
+    """测试单个模型的统计与状态"""
+
+    def test_ewma(self):
+        """测试首字时间和可用性按 EWMA 更新，失败不影响首字时间"""
+        health = ModelHealth()
+        assert health.status(5000) == UNKNOWN
+        health.record(1.0, None, 0.5)
+        health.record(0.2, None, 0.5)
+        assert health.ttft_ms == pytest.approx(600)
+        health.record(None, ConnectionError("refused"), 0.5)
+        assert health.ttft_ms == pytest.approx(600)
+        assert health.availability == pytest.approx(0.5)
+        assert health.last_error == "ConnectionError: refused"
+
+    def test_status(self):
+        """测试状态：连续失败两次为 offline，偶发失败或很慢为 degraded"""
+        health = ModelHealth()
+        health.record(0.3, None, 0.3)
+        assert health.status(5000) == ONLINE
+        assert health.status(100) == DEGRADED
+        health.record(None, TimeoutError(), 0.3)
+        assert health.status(5000) == DEGRADED
+        health.record(None, TimeoutError(), 0.3)
+        assert health.status(5000) == OFFLINE
+        health.record(0.3, None, 0.3)
+        assert health.status(5000) == DEGRADED  # 可用性仍低于 0.9
+        assert health.snapshot(5000)["consecutive_failures"] == 0
+
+
+@pytest.mark.unit
+class TestHealthProber:
+    """测试探测器"""
+
+    def test_probe_outcomes(self):
+        """测试成功、失败与未配置密钥时的记录"""
+        llm = _FakeLLM({"ok": 0.25, "down": ConnectionError("refused"), "nokey": None})
+        prober = _prober(llm)
+        assert prober.probe("ok", llm)["status"] == ONLINE
+        assert prober.probe("down", llm)["status"] == OFFLINE  # 首次探测即失败
+        assert prober.probe("nokey", llm) is None
+        assert prober.health("nokey") is None
+        assert prober.health("ok")["ttft_ms"] == 250
+        stats = prober.stats()
+        assert stats["probes"] == 2 and stats["failures"] == 1 and stats["skipped"] == 1
+
+    def test_probe_all_concurrent(self):
+        """测试一轮探测并发进行且不超过并发上限"""
+        llm = _FakeLLM({f"m{i}": 0.1 for i in range(6)}, delay=0.1)
+        prober = _prober(llm, concurrency=3)
+        try:
+            start = time.monotonic()
+            snapshot = prober.probe_all()
+            elapsed = time.monotonic() - start
+        finally:
+            prober.stop()
+        assert len(snapshot) == 6 and llm.peak == 3
+        assert elapsed < 0.5
+        assert prober.stats()["rounds"] == 1
+
+    def test_probe_all_timeout(self):
+        """测试超时的探测记为失败"""
+        llm = _FakeLLM({"slow": 0.1}, delay=1.5)
+        prober = _prober(llm, timeout=0.1)
+        try:
+            snapshot = prober.probe_all()
+        finally:
+            prober.stop()
+        assert snapshot["slow"]["consecutive_failures"] == 1
+        assert "timed out" in snapshot["slow"]["last_error"]
+
+    def test_late_result_not_recorded(self):
+        """测试超时后探测才结束时不重复记录"""
+        llm = _FakeLLM({"slow": 0.1}, delay=1.5)
+        prober = _prober(llm, timeout=0.1)
+        try:
+            prober.probe_all()
+            prober._executor.shutdown(wait=True)
+        finally:
+            prober.stop()
+        snapshot = prober.snapshot()
+        assert snapshot["slow"]["probes"] == 1
+        assert "timed out" in snapshot["slow"]["last_error"]
+        stats = prober.stats()
+        assert stats["probes"] == 1 and stats["late"] == 1
+
+    def test_queued_probe_timeout_starts_when_run(self):
+        """测试排队时间不计入超时：并发数小于模型数时健康的模型不被记为失败"""
+        llm = _FakeLLM({f"m{i}": 0.1 for i in range(4)}, delay=0.4)
+        prober = _prober(llm, timeout=0.5, concurrency=1)
+        try:
+            snapshot = prober.probe_all()
+        finally:
+            prober.stop()
+        assert all(health["status"] == "online" for health in snapshot.values())
+        assert prober.stats()["failures"] == 0
+
+    def test_unstarted_probe_skipped(self):
+        """测试本轮结束时仍在排队的探测被取消并记为跳过，不计为失败"""
+        llm = _FakeLLM({"hung": 0.1, "queued": 0.1}, delay=2.5)
+        prober = _prober(llm, timeout=0.1, concurrency=1)
+        try:
+            snapshot = prober.probe_all()
+        finally:
+            prober.stop()
+        assert snapshot["hung"]["consecutive_failures"] == 1
+        assert "queued" not in snapshot
+        stats = prober.stats()
+        assert stats["skipped"] == 1 and stats["failures"] == 1
+
+    def test_background_thread(self):
+        """测试后台线程定期探测，未启用时不启动"""
+        disabled = HealthProber()
+        disabled.start()
+        assert disabled._thread is None
+
+        prober = _prober(_FakeLLM({"m": 0.1}), interval=0.05)
+        prober.start()
+        try:
+            deadline = time.monotonic() + 2
+            while prober.stats()["rounds"] < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            prober.stop()
+        assert prober.stats()["rounds"] >= 2
+
+    def test_settings_from_env(self, monkeypatch):
+        """测试环境变量解析"""
+        monkeypatch.setenv("LLM_HEALTH_PROBE_ENABLED", "true")
+        monkeypatch.setenv("LLM_HEALTH_PROBE_INTERVAL", "60")
+        settings = health_probe_settings_from_env()
+        assert settings["enabled"] and settings["interval"] == 60
+
+
+@pytest.mark.integration
+class TestProbeRequests:
+    """测试探测请求与接口"""
+
+    def test_llm_probe(self, monkeypatch, fake_sse_server):
+        """测试探测请求只要 1 个输出 token，未配置密钥时不发出请求"""
+        from web_chat.llm_wrapper import LLMWrapper
+        config = {"type": "requests_sse", "url": fake_sse_server.url, "api_key": "k", "model": "m"}
+        monkeypatch.setattr(LLMWrapper, "_resolve_config", lambda self, model_id: config)
+        fake_sse_server.scenarios.append({"chunks": ["Hi", " there"], "ttft": 0.05})
+
+        ttft = LLMWrapper().probe("qwen")
+        assert 0.05 <= ttft < 2
+        request = fake_sse_server.requests[0]["json"]
+        assert request["max_tokens"] == 1
+        assert request["messages"][-1] == {"role": "user", "content": "ping"}
+
+        config["api_key"] = ""
+        assert LLMWrapper().probe("qwen") is None
+        assert len(fake_sse_server.requests) == 1
+
+    def test_models_list_health(self, monkeypatch, app_context):
+        """测试 /api/models/list 为已探测的模型返回 health 字段"""
+        from web_chat import model_manager
+        monkeypatch.setattr(model_manager, "load_models", lambda: {"models": [{"id": "a"}, {"id": "b"}]})
+        assert model_manager.get_all_models().get_json()["health_probe"] is False
+
+        monkeypatch.setattr(model_manager, "_status_provider", lambda: {"a": {"status": "online", "ttft_ms": 320.0}})
+        data = model_manager.get_all_models().get_json()
+        assert data["health_probe"] is True
+        assert data["models"][0]["health"]["status"] == "online"
+        assert "health" not in data["models"][1]
@@ -0,0 +1,222 @@
+"""对冲请求测试
+
+测试 hedging 模块，包括：
+- 按 TTFT 百分位计算对冲延迟
+- 主上游超时未出首字时发出备用请求，先出首字的一路胜出
+- 落败一路的取消回调被立即调用
+- 主上游失败时立即改用备用上游
+- LLMWrapper.chat_stream 通过 hedge_to 对冲到备用模型（本地 SSE 假服务器）
+"""
+
+import time
+import threading
+import pytest
+from web_chat import llm_wrapper
+from web_chat.hedging import Hedger, HedgePolicy, on_cancel
+from web_chat.llm_wrapper import LLMWrapper
+from web_chat.session_pool import SessionPool
+
+FAST = dict(enabled=True, default_delay=0.05, min_delay=0.01)
+
+
+def _slow_stream(first_token_delay, chunks, cancelled=None):
+    """首个 token 之前等待一段时间的流，被取消时设置 cancelled 事件"""
+    def factory():
+        wake = threading.Event()
+        on_cancel(wake.set)
+        if wake.wait(first_token_delay) and cancelled is not None:
+            cancelled.set()
+            return
+        yield from chunks
+    return factory
+
+
+def _failing_stream(error):
+    def factory():
+        raise error
+        yield  # pragma: no cover
+    return factory
+
+
+@pytest.mark.unit
+class TestHedgeDelay:
+    """测试对冲延迟计算"""
+
+    def test_default_delay_until_enough_samples(self):
+        """测试样本不足时使用默认延迟"""
+        hedger = Hedger(HedgePolicy(default_delay=1.5, min_samples=5))
+        for _ in range(4):
+            hedger.record_ttft('m', 0.1)
+        assert hedger.delay_for('m') == 1.5
+
+    def test_percentile_and_clamping(self):
+        """测试百分位与上下限"""
+        hedger = Hedger(HedgePolicy(percentile=90, min_samples=10, min_delay=0.25, max_delay=5))
+        for i in range(1, 101):
+            hedger.record_ttft('m', i / 100)
+        assert hedger.delay_for('m') == pytest.approx(0.91)
+
+        for _ in range(200):
+            hedger.record_ttft('fast', 0.01)
+            hedger.record_ttft('slow', 60)
+        assert hedger.delay_for('fast') == 0.25
+        assert hedger.delay_for('slow') == 5
+
+
+@pytest.mark.unit
+class TestHedgerRace:
+    """测试竞速逻辑"""
+
+    def test_fast_primary_does_not_hedge(self):
+        """测试主上游及时出首字时不发备用请求"""
+        hedger = Hedger(HedgePolicy(enabled=True, default_delay=1.0))
+        backup_called = []
+
+        def backup():
+            backup_called.append(True)
+            yield "backup"
+
+        assert list(hedger.stream('m', lambda: iter(["a", "b"]), ('b', backup))) == ["a", "b"]
+        assert backup_called == []
+        assert hedger.stats()['m']['hedged'] == 0
+
+    def test_backup_wins_and_primary_cancelled(self):
+        """测试备用上游先出首字时胜出，主上游被立即取消"""
+        hedger = Hedger(HedgePolicy(**FAST))
+        cancelled = threading.Event()
+        primary = _slow_stream(5.0, ["slow"], cancelled)
+
+        start = time.monotonic()
+        output = list(hedger.stream('m', primary, ('b', lambda: iter(["fast", "!"]))))
+
+        assert output == ["fast", "!"]
+        assert cancelled.wait(1.0)
+        assert time.monotonic() - start < 1.0
+        stats = hedger.stats()['m']
+        assert stats['hedged'] == 1
+        assert stats['backup_wins'] == 1
+        assert stats['hedge_rate'] == 1.0
+        assert stats['backup_win_rate'] == 1.0
+
+    def test_primary_wins_after_hedge(self):
+        """测试已发备用请求但主上游先出首字"""
+        hedger = Hedger(HedgePolicy(**FAST))
+        cancelled = threading.Event()
+        output = list(hedger.stream(
+            'm', _slow_stream(0.1, ["primary"]), ('b', _slow_stream(5.0, ["backup"], cancelled))
+        ))
+        assert output == ["primary"]
+        assert cancelled.wait(1.0)
+        assert hedger.stats()['m']['backup_win_rate'] == 0.0
+
+    def test_primary_failure_falls_back_immediately(self):
+        """测试主上游首字前失败时立即改用备用上游"""
+        hedger = Hedger(HedgePolicy(enabled=True, default_delay=5.0))
+        start = time.monotonic()
+        output = list(hedger.stream('m', _failing_stream(ConnectionError("down")), ('b', lambda: iter(["ok"]))))
+        assert output == ["ok"]
+        assert time.monotonic() - start < 1.0
+        # 主上游失败的耗时不是 TTFT 样本
+        assert list(hedger._models['m'].samples) == []
+        assert len(hedger._models['b'].samples) == 1
+
+    def test_all_failed_raises_primary_error(self):
+        """测试所有上游失败时抛出主上游的异常"""
+        hedger = Hedger(HedgePolicy(**FAST))
+        with pytest.raises(ConnectionError, match="primary"):
+            list(hedger.stream(
+                'm', _failing_stream(ConnectionError("primary")), ('b', _failing_stream(ValueError("backup")))
+            ))
+
+    def test_consumer_close_cancels_all_legs(self):
+        """测试调用方放弃时取消所有上游"""
+        hedger = Hedger(HedgePolicy(**FAST))
+        cancelled = threading.Event()
+
+        def primary():
+            wake = threading.Event()
+            on_cancel(wake.set)
+            yield "first"
+            if wake.wait(5.0):
+                cancelled.set()
+
+        stream = hedger.stream('m', primary, ('b', _slow_stream(5.0, ["backup"])))
+        assert next(stream) == "first"
+        stream.close()
+        assert cancelled.wait(1.0)
+
+
+@pytest.mark.integration
+class TestLLMWrapperHedging:
+    """测试 chat_stream 的对冲模式"""
+
+    def test_hedge_to_backup_model(self, fake_sse_server, backup_sse_server, sample_messages, monkeypatch):
+        """测试主上游首字慢时对冲到 hedge_to 指定的模型，并中止主上游连接"""
+        pool = SessionPool()
+        monkeypatch.setattr(llm_wrapper, 'session_pool', pool)
+        fake_sse_server.default_scenario = {"chunks": ["primary"], "ttft": 3.0}
+        backup_sse_server.default_scenario = {"chunks": ["backup", " answer"]}
+        configs = {
+            'qwen': {"type": "requests_sse", "url": fake_sse_server.url, "api_key": "k",
+                     "model": "m", "hedge_to": "qwen-backup"},
+            'qwen-backup': {"type": "requests_sse", "url": backup_sse_server.url, "api_key": "k2", "model": "m"}
+        }
+
+        llm = LLMWrapper()
+        # 使用 llm_wrapper 实际导入的 hedging 模块，取消作用域才能生效
+        llm.hedger = llm_wrapper.Hedger(llm_wrapper.HedgePolicy(**FAST))
+        llm._resolve_config = configs.get
+
+        start = time.monotonic()
+        assert "".join(llm.chat_stream('qwen', sample_messages)) == "backup answer"
+        assert time.monotonic() - start < 2.0
+        assert backup_sse_server.requests[0]["headers"]["Authorization"] == "Bearer k2"
+
+        deadline = time.monotonic() + 2.0
+        while pool.stats()["abandoned_streams"] < 1 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert pool.stats()["abandoned_streams"] == 1
+        assert llm.hedger.stats()['qwen']['backup_wins'] == 1
+        pool.close()
+
+    def test_gemini_loser_connection_closed(self, fake_sse_server, backup_sse_server, sample_messages, monkeypatch):
+        """测试 Gemini 主上游落败时立即中止其流式响应，不等到下一个片段"""
+        aborted = []
+
+        def abort_stream(response):
+            aborted.append(time.monotonic())
+            original_abort(response)
+
+        original_abort = llm_wrapper.abort_stream
+        monkeypatch.setattr(llm_wrapper, 'abort_stream', abort_stream)
+        fake_sse_server.default_scenario = {"chunks": ["primary"], "ttft": 3.0}
+        base_url = fake_sse_server.url.split('/v1/')[0]
+        configs = {
+            'gemini': {"type": "google", "api_key": "k", "model": "gemini-test",
+                       "base_url": base_url, "hedge_to": "qwen-backup"},
+            'qwen-backup': {"type": "requests_sse", "url": backup_sse_server.url, "api_key": "k2", "model": "m"}
+        }
+
+        llm = LLMWrapper()
+        llm.hedger = llm_wrapper.Hedger(llm_wrapper.HedgePolicy(**FAST))
+        llm._resolve_config = configs.get
+
+        start = time.monotonic()
+        assert "".join(llm.chat_stream('gemini', sample_messages)) == "Hello World"
+        assert 'streamGenerateContent' in fake_sse_server.requests[0]["path"]
+
+        deadline = time.monotonic() + 2.0
+        while not aborted and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert aborted and aborted[0] - start < 2.0
+        assert len(fake_sse_server.requests) == 1
+
+    def test_hedging_disabled_by_default(self, fake_sse_server, sample_messages):
+        """测试默认不启用对冲"""
+        llm = LLMWrapper()
+        assert llm.hedger.policy.enabled is False
+        llm._resolve_config = lambda model_id: {
+            "type": "requests_sse", "url": fake_sse_server.url, "api_key": "k", "model": "m", "hedge_to": "x"
+        }
+        assert "".join(llm.chat_stream('qwen', sample_messages)) == "Hello World"
+        assert len(fake_sse_server.requests) == 1
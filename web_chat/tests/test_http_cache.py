@@ -0,0 +1,146 @@
+"""JSON 接口的条件请求与预压缩测试
+
+测试 http_cache 模块，包括：
+- 只在版本变化时重新序列化，ETag 为内容哈希
+- If-None-Match 匹配时返回 304
+- 按 Accept-Encoding 返回预先压缩的 gzip / brotli 正文，小响应不压缩
+- /api/models、/api/models/list 与 /api/config/load 的 ETag 与 304
+"""
+
+import gzip
+import json
+import pytest
+from flask import Flask
+from web_chat.http_cache import PrecomputedJSON
+
+
+@pytest.fixture
+def json_app():
+    """只有一个预序列化接口的 Flask 应用，数据与版本号可在测试中修改"""
+    app = Flask(__name__)
+    state = {"version": 1, "payload": {"models": [f"model-{i}" for i in range(200)]}, "builds": 0}
+    cached = PrecomputedJSON("test", min_bytes=1024, cache_control="no-cache")
+
+    def build():
+        state["builds"] += 1
+        return state["payload"]
+
+    @app.route("/data")
+    def data():
+        return cached.response(state["version"], build)
+
+    return app.test_client(), state, cached
+
+
+@pytest.mark.unit
+class TestPrecomputedJSON:
+    """测试预序列化响应"""
+
+    def test_builds_once_per_version(self, json_app):
+        """测试同一版本只序列化一次，版本变化后重新生成并换新的 ETag"""
+        client, state, cached = json_app
+        first = client.get("/data")
+        second = client.get("/data")
+        assert state["builds"] == 1
+        assert first.headers["ETag"] == second.headers["ETag"]
+        assert first.get_json() == state["payload"]
+        assert first.headers["Cache-Control"] == "no-cache"
+        assert first.headers["Vary"] == "Accept-Encoding"
+
+        state["version"] = 2
+        state["payload"] = {"models": ["x"]}
+        third = client.get("/data")
+        assert state["builds"] == 2 and third.get_json() == {"models": ["x"]}
+        assert third.headers["ETag"] != first.headers["ETag"]
+
+    def test_not_modified(self, json_app):
+        """测试 If-None-Match（含弱校验器和多个值）匹配时返回空正文的 304"""
+        client, state, cached = json_app
+        etag = client.get("/data").headers["ETag"]
+        for header in (etag, f"W/{etag}", f'"other", {etag}'):
+            response = client.get("/data", headers={"If-None-Match": header})
+            assert response.status_code == 304 and response.data == b""
+            assert response.headers["ETag"] == etag
+        assert client.get("/data", headers={"If-None-Match": '"other"'}).status_code == 200
+        assert cached.stats()["not_modified"] == 3
+
+    def test_gzip(self, json_app):
+        """测试按 Accept-Encoding 返回 gzip 正文，ETag 与未压缩时相同"""
+        client, state, cached = json_app
+        plain = client.get("/data", headers={"Accept-Encoding": "identity"})
+        compressed = client.get("/data", headers={"Accept-Encoding": "gzip"})
+        assert "Content-Encoding" not in plain.headers
+        assert compressed.headers["Content-Encoding"] == "gzip"
+        assert len(compressed.data) < len(plain.data) // 4
+        assert gzip.decompress(compressed.data) == plain.data
+        assert compressed.headers["ETag"] == plain.headers["ETag"]
+        assert state["builds"] == 1
+
+    def test_brotli(self, json_app):
+        """测试客户端支持 brotli 时优先返回 brotli 正文"""
+        brotli = pytest.importorskip("brotli")
+        client, state, cached = json_app
+        response = client.get("/data", headers={"Accept-Encoding": "gzip, deflate, br"})
+        assert response.headers["Content-Encoding"] == "br"
+        assert json.loads(brotli.decompress(response.data)) == state["payload"]
+
+    def test_small_payload_not_compressed(self, json_app):
+        """测试小于 min_bytes 的响应不压缩"""
+        client, state, cached = json_app
+        state["payload"] = {"models": []}
+        response = client.get("/data", headers={"Accept-Encoding": "gzip, br"})
+        assert "Content-Encoding" not in response.headers
+        assert response.get_json() == {"models": []}
+
+
+@pytest.mark.integration
+class TestJsonEndpoints:
+    """测试应用中的预序列化接口"""
+
+    def _revalidate(self, client, url):
+        first = client.get(url)
+        assert first.status_code == 200 and first.headers.get("ETag")
+        second = client.get(url, headers={"If-None-Match": first.headers["ETag"]})
+        assert second.status_code == 304
+        return first
+
+    def test_models(self, client):
+        """测试 /api/models 按注册表版本返回 ETag 与 304"""
+        first = self._revalidate(client, "/api/models")
+        assert isinstance(first.get_json(), list)
+
+    def test_models_list(self, client, monkeypatch, temp_models_file):
+        """测试 /api/models/list 在 models.json 保存后返回新内容"""
+        import model_manager as flat_model_manager
+        monkeypatch.setattr(flat_model_manager, "MODELS_FILE", temp_models_file)
+        assert flat_model_manager.save_models({"version": "1.0.0", "models": [{"id": "a"}], "api_types": {}})
+        first = self._revalidate(client, "/api/models/list")
+        assert [m["id"] for m in first.get_json()["models"]] == ["a"]
+
+        assert flat_model_manager.save_models({"version": "1.0.0", "models": [{"id": "b"}], "api_types": {}})
+        response = client.get("/api/models/list", headers={"If-None-Match": first.headers["ETag"]})
+        assert response.status_code == 200
+        assert [m["id"] for m in response.get_json()["models"]] == ["b"]
+
+    def test_config_load(self, client, monkeypatch, tmp_path):
+        """测试 /api/config/load 只允许私有缓存，保存后返回新内容"""
+        import web_chat.app as app_module
+        monkeypatch.setattr(app_module, "API_KEYS_FILE", str(tmp_path / "api_keys.json"))
+        monkeypatch.setattr(app_module, "config_cache", app_module.ConfigCache())
+        monkeypatch.setattr(app_module, "config_load_response", PrecomputedJSON("config", cache_control="private, no-cache"))
+        assert app_module.config_cache.set({"OPENAI_API_KEY": "sk-1"})
+
+        first = self._revalidate(client, "/api/config/load")
+        assert first.headers["Cache-Control"] == "private, no-cache"
+        assert first.get_json() == {"OPENAI_API_KEY": "sk-1"}
+
+        assert app_module.config_cache.set({"OPENAI_API_KEY": "sk-2"})
+        response = client.get("/api/config/load", headers={"If-None-Match": first.headers["ETag"]})
+        assert response.status_code == 200 and response.get_json() == {"OPENAI_API_KEY": "sk-2"}
+
+    def test_stats(self, client):
+        """测试统计接口"""
+        client.get("/api/models")
+        stats = client.get("/api/stats/http-cache").get_json()
+        assert {"models_list", "models", "config"} <= set(stats)
+        assert stats["models"]["builds"] >= 1
@@ -159,10 +159,10 @@ class TestSSEParser:
     def mock_response(self):
         """模拟 HTTP 响应"""
         response = Mock()
-        response.iter_lines = Mock(return_value=iter([
-            b'data: {"choices":[{"delta":{"content":"Hello"}}]}',
-            b'data: {"choices":[{"delta":{"content":" World"}}]}',
-            b'data: [DONE]',
+        response.iter_content = Mock(return_value=iter([
+            b'data: {"choices":[{"delta":{"content":"Hello"}}]}\n\n',
+            b'data: {"choices":[{"delta":{"content":" World"}}]}\n\n',
+            b'data: [DONE]\n\n',
             b''
         ]))
         return response
@@ -176,10 +176,10 @@ class TestSSEParser:
 
     def test_parse_sse_stream_ignore_empty_lines(self, mock_response):
         """测试忽略空行"""
-        mock_response.iter_lines = Mock(return_value=iter([
-            b'',
-            b'data: {"choices":[{"delta":{"content":"Test"}}]}',
-            b''
+        mock_response.iter_content = Mock(return_value=iter([
+            b'\n',
+            b'data: {"choices":[{"delta":{"content":"Test"}}]}\n',
+            b'\n'
         ]))
 
         llm = LLMWrapper()
@@ -190,9 +190,9 @@ class TestSSEParser:
     def test_parse_sse_stream_invalid_json(self):
         """测试无效 JSON 处理"""
         mock_response = Mock()
-        mock_response.iter_lines = Mock(return_value=iter([
-            b'data: invalid json',
-            b'data: {"choices":[{"delta":{"content":"Valid"}}]}',
+        mock_response.iter_content = Mock(return_value=iter([
+            b'data: invalid json\n',
+            b'data: {"choices":[{"delta":{"content":"Valid"}}]}\n',
         ]))
 
         llm = LLMWrapper()
@@ -0,0 +1,197 @@
+"""日志管道测试
+
+测试 log_pipeline 模块，包括：
+- 按日志器名称前缀的确定性采样，WARNING 及以上总是保留
+- 队列满时丢弃而不阻塞，处理器阻塞时调用线程不等待
+- 后台线程写文件、JSON 格式与按大小轮转
+- 环境变量配置、app.py 安装的根日志管道与 /api/stats/logging 接口
+"""
+
+import json
+import time
+import logging
+from logging.handlers import QueueHandler, TimedRotatingFileHandler
+import threading
+import pytest
+from web_chat.log_pipeline import (
+    LogPipeline,
+    SamplingFilter,
+    build_formatter,
+    file_handler,
+    log_settings_from_env
+)
+
+
+def _record(name, level=logging.INFO, msg="hello"):
+    return logging.LogRecord(name, level, __file__, 1, msg, None, None)
+
+
+class _BlockingHandler(logging.Handler):
+    """在 gate 打开之前阻塞的处理器"""
+
+    def __init__(self):
+        super().__init__()
+        self.gate = threading.Event()
+        self.records = []
+
+    def emit(self, record):
+        self.gate.wait(5)
+        self.records.append(record.getMessage())
+
+
+@pytest.mark.unit
+class TestSamplingFilter:
+    """测试采样过滤器"""
+
+    def test_keeps_fraction(self):
+        """测试按比例保留（保留第 1 条），其他日志器不采样"""
+        sampler = SamplingFilter({"werkzeug": 0.25})
+        kept = [i for i in range(12) if sampler.filter(_record("werkzeug"))]
+        assert kept == [0, 4, 8]
+        assert sampler.sampled_out == 9
+        assert all(sampler.filter(_record("llm_wrapper")) for _ in range(5))
+
+    def test_warnings_always_kept(self):
+        """测试 WARNING 及以上级别不采样"""
+        sampler = SamplingFilter({"app": 0})
+        assert not sampler.filter(_record("app"))
+        assert sampler.filter(_record("app", logging.WARNING))
+        assert sampler.filter(_record("app", logging.ERROR))
+
+    def test_longest_prefix(self):
+        """测试最长前缀优先，前缀只匹配完整的名称段"""
+        sampler = SamplingFilter({"web_chat": 0.5, "web_chat.llm_wrapper": 0, "app": 0})
+        assert sampler.rate_for("web_chat.llm_wrapper") == 0
+        assert sampler.rate_for("web_chat.app") == 0.5
+        assert sampler.rate_for("application") == 1.0
+
+
+@pytest.mark.unit
+class TestLogPipeline:
+    """测试队列与后台写线程"""
+
+    def test_does_not_block_caller(self):
+        """测试处理器阻塞时调用线程不等待，写出顺序不变"""
+        handler = _BlockingHandler()
+        pipeline = LogPipeline([handler]).start()
+        log = logging.getLogger("test_pipeline_block")
+        log.propagate = False
+        log.addHandler(pipeline.handler)
+        try:
+            start = time.perf_counter()
+            for i in range(100):
+                log.warning("line %d", i)
+            assert time.perf_counter() - start < 0.5
+            assert handler.records == []
+
+            handler.gate.set()
+            assert pipeline.flush()
+            assert handler.records == [f"line {i}" for i in range(100)]
+        finally:
+            log.removeHandler(pipeline.handler)
+            pipeline.stop()
+
+    def test_drops_when_full(self):
+        """测试队列满时丢弃并计数"""
+        pipeline = LogPipeline([logging.NullHandler()], queue_size=2)
+        for _ in range(5):
+            pipeline.handler.handle(_record("x"))
+        stats = pipeline.stats()
+        assert stats["queued"] == 2 and stats["dropped"] == 3
+
+    def test_writes_file(self, tmp_path):
+        """测试后台线程写入日志文件，stop() 后写完所有记录"""
+        path = tmp_path / "app.log"
+        handler = file_handler(str(path))
+        handler.setFormatter(build_formatter("text"))
+        pipeline = LogPipeline([handler], sampling={"test_pipeline_file": 0.5}).start()
+        log = logging.getLogger("test_pipeline_file")
+        log.propagate = False
+        log.setLevel(logging.INFO)
+        log.addHandler(pipeline.handler)
+        try:
+            for i in range(10):
+                log.info(f"info {i}")
+            log.error("boom")
+        finally:
+            log.removeHandler(pipeline.handler)
+            pipeline.stop()
+
+        lines = path.read_text(encoding="utf-8").splitlines()
+        assert len(lines) == 6
+        assert lines[0].endswith("test_pipeline_file - INFO - info 0")
+        assert lines[-1].endswith("ERROR - boom")
+        assert pipeline.stats()["sampled_out"] == 5
+
+    def test_json_format(self, tmp_path):
+        """测试 JSON 格式包含标准字段和 extra 字段"""
+        path = tmp_path / "app.json.log"
+        handler = file_handler(str(path))
+        handler.setFormatter(build_formatter("json"))
+        pipeline = LogPipeline([handler]).start()
+        log = logging.getLogger("test_pipeline_json")
+        log.propagate = False
+        log.addHandler(pipeline.handler)
+        try:
+            log.warning("模型 %s 超时", "qwen", extra={"trace_id": "t1"})
+            assert pipeline.flush()
+        finally:
+            log.removeHandler(pipeline.handler)
+            pipeline.stop()
+
+        entry = json.loads(path.read_text(encoding="utf-8"))
+        assert entry["message"] == "模型 qwen 超时"
+        assert entry["name"] == "test_pipeline_json" and entry["levelname"] == "WARNING"
+        assert entry["trace_id"] == "t1" and "asctime" in entry
+
+    def test_rotation(self, tmp_path):
+        """测试按大小轮转并保留指定数量的历史文件"""
+        path = tmp_path / "rotate.log"
+        handler = file_handler(str(path), max_bytes=200, backup_count=2)
+        pipeline = LogPipeline([handler]).start()
+        log = logging.getLogger("test_pipeline_rotate")
+        log.propagate = False
+        log.addHandler(pipeline.handler)
+        try:
+            for i in range(50):
+                log.warning("x" * 50)
+        finally:
+            log.removeHandler(pipeline.handler)
+            pipeline.stop()
+
+        files = sorted(p.name for p in tmp_path.iterdir())
+        assert files == ["rotate.log", "rotate.log.1", "rotate.log.2"]
+        assert path.stat().st_size <= 200
+
+
+@pytest.mark.unit
+class TestSettings:
+    """测试环境变量配置"""
+
+    def test_settings_from_env(self, monkeypatch):
+        """测试采样比例、格式与轮转配置的解析"""
+        monkeypatch.setenv("LLM_LOG_SAMPLING", "werkzeug=0.1, llm_wrapper=0.5,")
+        monkeypatch.setenv("LLM_LOG_FORMAT", "JSON")
+        monkeypatch.setenv("LLM_LOG_ROTATE_WHEN", "midnight")
+        settings = log_settings_from_env()
+        assert settings["sampling"] == {"werkzeug": 0.1, "llm_wrapper": 0.5}
+        assert settings["fmt"] == "json" and settings["rotate_when"] == "midnight"
+
+    def test_time_rotation(self, tmp_path):
+        """测试设置轮转周期时按时间轮转"""
+        handler = file_handler(str(tmp_path / "t.log"), rotate_when="midnight")
+        assert isinstance(handler, TimedRotatingFileHandler)
+        handler.close()
+
+
+@pytest.mark.integration
+class TestAppLogging:
+    """测试 app.py 安装的根日志管道"""
+
+    def test_root_pipeline(self, client):
+        """测试根日志器经由队列写入，统计接口可用"""
+        assert any(isinstance(h, QueueHandler) for h in logging.getLogger().handlers)
+
+        response = client.get('/api/stats/logging')
+        assert response.status_code == 200
+        assert {'queued', 'dropped', 'sampled_out'} <= set(response.get_json())
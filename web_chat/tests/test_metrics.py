@@ -0,0 +1,174 @@
+"""Prometheus 指标测试
+
+测试 metrics 模块，包括：
+- 流的请求数、首字时间、片段间隔、输出速度与进行中数量
+- 按异常类型计数的错误，提前关闭不计为错误
+- 上游重试计数、多线程分片汇总与线程退出后的合并
+- 文本格式输出、LLMWrapper 接入与 /metrics 接口
+"""
+
+import gc
+import re
+import time
+import asyncio
+import threading
+import pytest
+import requests
+from web_chat import llm_wrapper
+from web_chat.metrics import MetricsRegistry
+from web_chat.stream_retry import StreamRetryPolicy, retrying_stream
+
+
+def _sample(text, name, **labels):
+    """读取一个样本的值（标签按给定顺序匹配）"""
+    label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    match = re.search(rf"^{re.escape(name)}{{{re.escape(label_text)}}} (\S+)$", text, re.M)
+    return float(match.group(1)) if match else None
+
+
+def _slow(chunks, delay=0.01):
+    for chunk in chunks:
+        time.sleep(delay)
+        yield chunk
+
+
+@pytest.mark.unit
+class TestInstrument:
+    """测试流的计时与计数"""
+
+    def test_stream_metrics(self):
+        """测试请求数、首字时间、片段间隔与输出速度"""
+        registry = MetricsRegistry()
+        assert list(registry.instrument("chat", "m", "openai", _slow(["ab", "cd", "ef"]))) == ["ab", "cd", "ef"]
+        text = registry.render()
+        labels = dict(model="m", provider="openai")
+        assert _sample(text, "llm_chat_requests_total", **labels) == 1
+        assert _sample(text, "llm_chat_streams_in_flight", **labels) == 0
+        assert _sample(text, "llm_chat_ttft_seconds_count", **labels) == 1
+        assert _sample(text, "llm_chat_inter_chunk_gap_seconds_count", **labels) == 2
+        assert _sample(text, "llm_chat_output_chars_per_second_count", **labels) == 1
+        assert 0.02 < _sample(text, "llm_chat_duration_seconds_sum", **labels) < 1
+
+    def test_in_flight_and_close(self):
+        """测试进行中的流计入仪表，提前关闭不计为错误"""
+        registry = MetricsRegistry()
+        stream = registry.instrument("chat", "m", "openai", _slow(["a", "b"]))
+        next(stream)
+        assert _sample(registry.render(), "llm_chat_streams_in_flight", model="m", provider="openai") == 1
+        stream.close()
+        text = registry.render()
+        assert _sample(text, "llm_chat_streams_in_flight", model="m", provider="openai") == 0
+        assert "llm_chat_errors_total{" not in text
+
+    def test_errors_by_class(self):
+        """测试错误按异常类型计数并继续抛出"""
+        def failing():
+            yield "x"
+            raise ConnectionError("down")
+
+        registry = MetricsRegistry()
+        with pytest.raises(ConnectionError):
+            list(registry.instrument("upstream", "m", "zhipu", failing()))
+        text = registry.render()
+        assert _sample(text, "llm_upstream_errors_total", model="m", provider="zhipu", error="ConnectionError") == 1
+
+    def test_async_stream(self):
+        """测试异步流"""
+        async def chunks():
+            for chunk in ("a", "b"):
+                await asyncio.sleep(0.01)
+                yield chunk
+
+        async def run():
+            return [c async for c in registry.ainstrument("chat", "m", "openai", chunks())]
+
+        registry = MetricsRegistry()
+        assert asyncio.run(run()) == ["a", "b"]
+        assert _sample(registry.render(), "llm_chat_inter_chunk_gap_seconds_count", model="m", provider="openai") == 1
+
+    def test_disabled_passes_through(self):
+        """测试关闭时直接转发"""
+        registry = MetricsRegistry(enabled=False)
+        assert list(registry.instrument("chat", "m", "openai", iter(["a"]))) == ["a"]
+        assert "llm_chat_requests_total{" not in registry.render()
+
+    def test_retries_counted(self):
+        """测试上游流内部的重试计入当前模型"""
+        attempts = []
+
+        def open_stream(prefix):
+            attempts.append(prefix)
+            if len(attempts) == 1:
+                raise requests.exceptions.ConnectionError("reset")
+            yield "ok"
+
+        policy = StreamRetryPolicy(backoff_min=0, backoff_max=0, backoff_multiplier=0)
+        registry = llm_wrapper.metrics
+        before = _sample(registry.render(), "llm_upstream_retries_total", model="retry-model", provider="openai") or 0
+        stream = retrying_stream(open_stream, policy)
+        assert list(registry.instrument("upstream", "retry-model", "openai", stream)) == ["ok"]
+        after = _sample(registry.render(), "llm_upstream_retries_total", model="retry-model", provider="openai")
+        assert after == before + 1
+
+
+@pytest.mark.unit
+class TestRegistry:
+    """测试分片汇总与文本格式"""
+
+    def test_threads_merge(self):
+        """测试多线程的观测被汇总，线程退出后分片合并且数值保留"""
+        registry = MetricsRegistry()
+
+        def work():
+            for _ in range(100):
+                registry.add("llm_chat_requests_total", ("m", "openai"))
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        del threads, thread
+        gc.collect()
+
+        assert registry._shards == []
+        assert _sample(registry.render(), "llm_chat_requests_total", model="m", provider="openai") == 400
+
+    def test_histogram_format(self):
+        """测试桶为累计计数，+Inf 桶等于总数，标签值被转义"""
+        registry = MetricsRegistry()
+        for value in (0.05, 0.3, 100):
+            registry.observe("llm_chat_ttft_seconds", ('m"1', "openai"), value)
+        text = registry.render()
+        labels = 'model="m\\"1",provider="openai"'
+        assert f'llm_chat_ttft_seconds_bucket{{{labels},le="0.1"}} 1' in text
+        assert f'llm_chat_ttft_seconds_bucket{{{labels},le="0.5"}} 2' in text
+        assert f'llm_chat_ttft_seconds_bucket{{{labels},le="+Inf"}} 3' in text
+        assert f"llm_chat_ttft_seconds_count{{{labels}}} 3" in text
+        assert "# TYPE llm_chat_ttft_seconds histogram" in text
+
+
+@pytest.mark.integration
+class TestMetricsIntegration:
+    """测试 LLMWrapper 接入与 /metrics 接口"""
+
+    def test_wrapper_records_chat_and_upstream(self, fake_sse_server, sample_messages):
+        """测试一次对话同时记录整个响应和上游调用"""
+        llm = llm_wrapper.LLMWrapper()
+        llm.metrics = MetricsRegistry()
+        llm._resolve_config = lambda model_id: {
+            "type": "requests_sse", "url": fake_sse_server.url, "api_key": "k", "model": "m"
+        }
+        assert "".join(llm.chat_stream("qwen", sample_messages)) == "Hello World"
+
+        text = llm.metrics.render()
+        for stage in ("chat", "upstream"):
+            assert _sample(text, f"llm_{stage}_requests_total", model="qwen", provider="requests_sse") == 1
+            assert _sample(text, f"llm_{stage}_ttft_seconds_count", model="qwen", provider="requests_sse") == 1
+
+    def test_endpoint(self, client):
+        """测试 /metrics 输出 Prometheus 文本格式"""
+        response = client.get('/metrics')
+        assert response.status_code == 200
+        assert response.content_type.startswith('text/plain; version=0.0.4')
+        assert b'# TYPE llm_upstream_retries_total counter' in response.data
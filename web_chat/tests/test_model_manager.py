@@ -138,6 +138,21 @@ class TestSaveModels:
         finally:
             model_manager.MODELS_FILE = original_file
 
+    def test_save_models_notifies_listeners(self, temp_models_file):
+        """测试保存成功后调用变更回调"""
+        listener = Mock()
+        model_manager.add_change_listener(listener)
+
+        original_file = model_manager.MODELS_FILE
+        model_manager.MODELS_FILE = temp_models_file
+
+        try:
+            assert model_manager.save_models({"models": []}) is True
+            listener.assert_called_once()
+        finally:
+            model_manager.MODELS_FILE = original_file
+            model_manager._change_listeners.remove(listener)
+
     def test_save_models_io_error(self):
         """测试保存时发生 IO 错误"""
         # 使用无效路径
@@ -315,6 +330,39 @@ class TestAddModel:
         finally:
             model_manager.MODELS_FILE = original_file
 
+    def test_add_model_context_fields(self, temp_models_file, app_context):
+        """测试上下文预算字段的保存与校验"""
+        with open(temp_models_file, 'w', encoding='utf-8') as f:
+            json.dump({"version": "1.0.0", "models": [], "api_types": {}}, f)
+
+        original_file = model_manager.MODELS_FILE
+        model_manager.MODELS_FILE = temp_models_file
+
+        new_model = {
+            "id": "long-context",
+            "name": "Long Context",
+            "type": "openai",
+            "model": "gpt-4o",
+            "api_key_name": "test_key",
+            "context_length": 128000,
+            "max_output_tokens": 16384
+        }
+
+        try:
+            with app_context.test_request_context(json={**new_model, "context_length": "128k"}):
+                data, status_code = model_manager.add_model()
+            assert status_code == 400
+            assert "context_length" in data.get_json()["message"]
+
+            with app_context.test_request_context(json=new_model):
+                response = model_manager.add_model()
+            saved = response.get_json()["model"]
+            assert saved["context_length"] == 128000
+            assert saved["max_output_tokens"] == 16384
+            assert "reserved_output_tokens" not in saved
+        finally:
+            model_manager.MODELS_FILE = original_file
+
 
 @pytest.mark.integration
 class TestDeleteModel:
@@ -0,0 +1,111 @@
+"""ModelRegistry 单元测试
+
+测试编译后的内存模型注册表，包括：
+- 内置模型与自定义模型的合并
+- API 密钥延迟解析
+- 文件变化时原子替换快照
+- 热路径不做文件 I/O
+"""
+
+import json
+import pytest
+from unittest.mock import patch
+from web_chat.model_registry import ModelRegistry, compile_models_data
+
+
+def _write_models(path, models):
+    """写入 models.json"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"version": "1.0.0", "models": models, "api_types": {}}, f)
+
+
+CUSTOM_MODEL = {
+    "id": "custom",
+    "name": "Custom",
+    "type": "openai",
+    "model": "gpt-x",
+    "api_key_name": "CUSTOM_API_KEY",
+    "base_url": "https://example.com/v1",
+    "icon": "x.svg"
+}
+
+
+@pytest.mark.unit
+class TestCompileModels:
+    """测试模型编译"""
+
+    def test_compile_skips_disabled_and_invalid(self):
+        """测试跳过禁用和格式错误的模型"""
+        specs = compile_models_data({"models": [
+            CUSTOM_MODEL,
+            {**CUSTOM_MODEL, "id": "off", "enabled": False},
+            {"id": "broken", "type": "openai"}
+        ]})
+
+        assert list(specs) == ["custom"]
+        assert specs["custom"].options == {"base_url": "https://example.com/v1"}
+
+    def test_spec_is_immutable(self):
+        """测试编译结果不可修改"""
+        spec = compile_models_data({"models": [CUSTOM_MODEL]})["custom"]
+        with pytest.raises(TypeError):
+            spec.options["base_url"] = "https://evil"
+
+
+@pytest.mark.unit
+class TestModelRegistry:
+    """测试模型注册表"""
+
+    def test_builtin_and_custom_models(self, temp_models_file):
+        """测试合并内置模型和自定义模型"""
+        _write_models(temp_models_file, [CUSTOM_MODEL])
+        registry = ModelRegistry(temp_models_file)
+
+        ids = registry.model_ids()
+        assert ids[:5] == ['google', 'deepseek', 'moonshot', 'qwen', 'spark']
+        assert 'custom' in ids
+        assert 'custom' in registry
+        assert registry.get('missing') is None
+
+    def test_late_api_key_resolution(self, temp_models_file, monkeypatch):
+        """测试自定义密钥优先于环境变量"""
+        _write_models(temp_models_file, [CUSTOM_MODEL])
+        monkeypatch.setenv('CUSTOM_API_KEY', 'env-key')
+        spec = ModelRegistry(temp_models_file).get('custom')
+
+        assert spec.resolve()['api_key'] == 'env-key'
+        assert spec.resolve({'CUSTOM_API_KEY': 'user-key'})['api_key'] == 'user-key'
+        assert spec.resolve()['base_url'] == 'https://example.com/v1'
+
+    def test_reload_on_invalidate(self, temp_models_file):
+        """测试失效后重新加载并更新版本号"""
+        _write_models(temp_models_file, [])
+        registry = ModelRegistry(temp_models_file, check_interval=60)
+        old_version = registry.version
+        assert 'custom' not in registry
+
+        _write_models(temp_models_file, [CUSTOM_MODEL])
+        assert 'custom' not in registry  # 检查间隔内不读取文件
+        registry.invalidate()
+
+        assert 'custom' in registry
+        assert registry.version != old_version
+
+    def test_hot_path_no_file_io(self, temp_models_file):
+        """测试加载后查询不再访问文件"""
+        _write_models(temp_models_file, [CUSTOM_MODEL])
+        registry = ModelRegistry(temp_models_file, check_interval=60)
+        registry.get('custom')
+
+        with patch('builtins.open') as mock_open, patch('os.stat') as mock_stat:
+            for _ in range(100):
+                assert registry.get('custom') is not None
+                registry.model_ids()
+
+        mock_open.assert_not_called()
+        mock_stat.assert_not_called()
+
+    def test_missing_file_only_builtin(self, temp_dir):
+        """测试文件不存在时只包含内置模型"""
+        registry = ModelRegistry(f"{temp_dir}/missing.json")
+        assert registry.model_ids() == ['google', 'deepseek', 'moonshot', 'qwen', 'spark']
@@ -0,0 +1,172 @@
+"""请求耗时分解测试
+
+测试 request_timing 模块，包括：
+- 阶段累加、首末字节时间与 Server-Timing 响应头
+- 读取流时底层通过 timed() 记录阶段，没有正在计时的请求时不记录
+- 慢请求日志的阈值与 JSON 格式
+- /api/chat（Flask 与 ASGI）的响应头、统计帧与慢请求日志
+"""
+
+import json
+import time
+import asyncio
+import pytest
+import httpx
+from unittest.mock import patch
+from web_chat.request_timing import (
+    STATS_FRAME_SEPARATOR,
+    RequestTiming,
+    SlowRequestLog,
+    record_phase,
+    timed
+)
+
+
+def _split_stats(text):
+    """拆分回复文本与统计帧"""
+    reply, frame = text.split(STATS_FRAME_SEPARATOR)
+    return reply, json.loads(frame)
+
+
+@pytest.mark.unit
+class TestRequestTiming:
+    """测试耗时分解"""
+
+    def test_phase_accumulates(self):
+        """测试同名阶段的耗时累加"""
+        timing = RequestTiming()
+        for _ in range(2):
+            with timing.phase("connect"):
+                time.sleep(0.01)
+        assert timing.phases["connect"] >= 20
+
+    def test_wrap_sets_current_timing(self):
+        """测试读取流时底层记录的阶段计入当前请求，流外不记录"""
+        def stream():
+            with timed("client"):
+                time.sleep(0.01)
+            record_phase("connect", 0.005)
+            yield "a"
+            time.sleep(0.01)
+            yield "b"
+
+        timing = RequestTiming()
+        assert list(timing.wrap(stream())) == ["a", "b"]
+        with timed("client"):
+            pass
+        phases = timing.phases
+        assert phases["client"] >= 10 and phases["connect"] == pytest.approx(5)
+        assert phases["first_byte"] < phases["last_byte"]
+
+    def test_awrap(self):
+        """测试异步流"""
+        async def stream():
+            with timed("connect"):
+                await asyncio.sleep(0.01)
+            yield "a"
+
+        async def run():
+            return [chunk async for chunk in timing.awrap(stream())]
+
+        timing = RequestTiming()
+        assert asyncio.run(run()) == ["a"]
+        assert timing.phases["connect"] >= 10 and "first_byte" in timing.phases
+
+    def test_headers_and_stats_frame(self):
+        """测试 Server-Timing 格式与统计帧"""
+        timing = RequestTiming(trace_id="abc")
+        timing.add("parse", 0.0012)
+        timing.add("validate", 0.003)
+        headers = timing.headers()
+        assert headers == {"X-Trace-Id": "abc", "Server-Timing": "parse;dur=1.20, validate;dur=3.00"}
+
+        frame = timing.stats_frame()
+        assert frame.startswith(STATS_FRAME_SEPARATOR) and frame.endswith("\n")
+        stats = json.loads(frame[1:])
+        assert stats["trace_id"] == "abc" and stats["phases"] == {"parse": 1.2, "validate": 3.0}
+        assert stats["total"] >= 0
+
+
+@pytest.mark.unit
+class TestSlowRequestLog:
+    """测试慢请求日志"""
+
+    def test_threshold(self, tmp_path):
+        """测试只记录超过阈值的请求，阈值为 0 时关闭"""
+        path = tmp_path / "slow.log"
+        timing = RequestTiming()
+        time.sleep(0.01)
+
+        assert not SlowRequestLog(threshold_ms=60000, path=str(path), logger_name="test_slow_a").record(timing)
+        assert not SlowRequestLog(threshold_ms=0, path=str(path), logger_name="test_slow_b").record(timing)
+        assert not path.exists()
+
+    def test_writes_json_line(self, tmp_path):
+        """测试写入包含追踪 ID、阶段与附加字段的一行 JSON"""
+        path = tmp_path / "slow.log"
+        slow_log = SlowRequestLog(threshold_ms=1, path=str(path), logger_name="test_slow_c")
+        timing = RequestTiming(trace_id="t1")
+        timing.add("connect", 0.002)
+        time.sleep(0.01)
+
+        assert slow_log.record(timing, model="qwen", chars=3)
+        slow_log.flush()
+        line = path.read_text(encoding="utf-8").strip()
+        entry = json.loads(line[line.index("{"):])
+        assert entry["trace_id"] == "t1" and entry["model"] == "qwen" and entry["chars"] == 3
+        assert entry["phases"]["connect"] == 2.0 and entry["total"] >= 10
+        assert slow_log.recorded == 1
+
+
+@pytest.mark.integration
+class TestChatTiming:
+    """测试 /api/chat 的耗时分解"""
+
+    def test_flask_chat(self, client, monkeypatch, tmp_path, fake_sse_server, sample_messages):
+        """测试 Server-Timing 响应头、统计帧与慢请求日志"""
+        import web_chat.app as app_module
+        config = {"type": "requests_sse", "url": fake_sse_server.url, "api_key": "k", "model": "m"}
+        monkeypatch.setattr(app_module.LLMWrapper, "_resolve_config", lambda self, model_id: config)
+        slow_log = SlowRequestLog(threshold_ms=0.001, path=str(tmp_path / "slow.log"), logger_name="test_slow_flask")
+        monkeypatch.setattr(app_module, "slow_request_log", slow_log)
+
+        response = client.post('/api/chat', json={'model': 'qwen', 'messages': sample_messages, 'stats': True})
+        server_timing = response.headers['Server-Timing']
+        assert server_timing.startswith('parse;dur=') and 'validate;dur=' in server_timing
+
+        reply, stats = _split_stats(response.data.decode())
+        assert reply == 'Hello World'
+        assert stats['trace_id'] == response.headers['X-Trace-Id']
+        phases = stats['phases']
+        for name in ('parse', 'validate', 'config', 'client', 'connect', 'first_byte', 'last_byte'):
+            assert name in phases
+        assert phases['first_byte'] <= phases['last_byte'] <= stats['total']
+        assert slow_log.recorded == 1
+
+    def test_stats_frame_opt_in(self, client, monkeypatch, fake_sse_server, sample_messages):
+        """测试不请求 stats 时只返回回复文本"""
+        import web_chat.app as app_module
+        config = {"type": "requests_sse", "url": fake_sse_server.url, "api_key": "k", "model": "m"}
+        monkeypatch.setattr(app_module.LLMWrapper, "_resolve_config", lambda self, model_id: config)
+
+        response = client.post('/api/chat', json={'model': 'qwen', 'messages': sample_messages})
+        assert response.data.decode() == 'Hello World'
+        assert 'X-Trace-Id' in response.headers
+
+    def test_asgi_chat(self, fake_sse_server, sample_messages):
+        """测试 ASGI 路径的响应头与统计帧"""
+        from web_chat import asgi
+        config = {"type": "requests_sse", "url": fake_sse_server.url, "api_key": "k", "model": "m"}
+
+        async def run():
+            transport = httpx.ASGITransport(app=asgi.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+                return await http.post("/api/chat", json={'model': 'qwen', 'messages': sample_messages, 'stats': True})
+
+        with patch.object(asgi.AsyncLLMWrapper, '_resolve_config', return_value=config):
+            response = asyncio.run(run())
+
+        assert 'validate;dur=' in response.headers['server-timing']
+        reply, stats = _split_stats(response.text)
+        assert reply == 'Hello World'
+        assert {'config', 'connect', 'first_byte', 'last_byte'} <= set(stats['phases'])
@@ -0,0 +1,183 @@
+"""分层响应缓存测试
+
+测试 response_cache 模块，包括：
+- 规范化缓存键（排除 API 密钥，区分生成参数）
+- 按字节数限制的内存 LRU、TTL、SQLite 持久化与提升
+- 命中时流式回放，只缓存正常结束的回答
+- 按模型启用，以及 LLMWrapper / AsyncLLMWrapper 的接入
+"""
+
+import time
+import asyncio
+import pytest
+from web_chat import llm_wrapper
+from web_chat.async_llm import AsyncLLMWrapper, AsyncClients
+from web_chat.response_cache import ResponseCache, ResponseCachePolicy, _MemoryLRU, cache_key
+
+
+def _qwen_config(url):
+    return {"type": "requests_sse", "url": url, "api_key": "k", "model": "m"}
+
+
+def _memory_cache(**kwargs):
+    return ResponseCache(ResponseCachePolicy(enabled=True, db_path=None, **kwargs))
+
+
+@pytest.mark.unit
+class TestCacheKey:
+    """测试缓存键计算"""
+
+    def test_key_ignores_api_key_and_field_order(self, sample_messages):
+        """测试 API 密钥和字段顺序不影响缓存键"""
+        a = cache_key("qwen", {"type": "requests_sse", "model": "m", "api_key": "k1"}, sample_messages, {"temperature": 0.7})
+        b = cache_key("qwen", {"api_key": "k2", "model": "m", "type": "requests_sse"}, sample_messages, {"temperature": 0.7})
+        assert a == b
+
+    def test_key_depends_on_request(self, sample_messages):
+        """测试模型、消息和生成参数都参与计算"""
+        config = {"type": "openai", "model": "m"}
+        base = cache_key("deepseek", config, sample_messages, {"temperature": 0.7})
+        assert base != cache_key("moonshot", config, sample_messages, {"temperature": 0.7})
+        assert base != cache_key("deepseek", config, sample_messages[:1], {"temperature": 0.7})
+        assert base != cache_key("deepseek", config, sample_messages, {"temperature": 0.2})
+        assert base != cache_key("deepseek", {**config, "system": "x"}, sample_messages, {"temperature": 0.7})
+
+
+@pytest.mark.unit
+class TestResponseCache:
+    """测试缓存读写与统计"""
+
+    def test_lru_bounded_by_bytes(self):
+        """测试内存层按字节数淘汰最久未使用的条目"""
+        lru = _MemoryLRU(max_bytes=10)
+        expires = time.time() + 60
+        lru.put("a", "aaaa", 4, expires)
+        lru.put("b", "bbbb", 4, expires)
+        assert lru.get("a", time.time()) == "aaaa"
+        lru.put("c", "cccc", 4, expires)
+        assert lru.get("b", time.time()) is None
+        assert lru.bytes == 8
+        lru.put("d", "x" * 11, 11, expires)
+        assert lru.get("d", time.time()) is None
+
+    def test_ttl_expiry(self):
+        """测试过期条目不再命中"""
+        cache = _memory_cache(ttl=0.05)
+        cache.put("k", "m", "hello")
+        assert cache.get("k") == "hello"
+        time.sleep(0.06)
+        assert cache.get("k") is None
+
+    def test_disk_tier_survives_restart(self, tmp_path):
+        """测试磁盘层在重启后命中并提升到内存"""
+        policy = ResponseCachePolicy(enabled=True, db_path=str(tmp_path / "cache.db"))
+        first = ResponseCache(policy)
+        first.put("k", "qwen", "持久化的回答")
+        first.close()
+
+        second = ResponseCache(policy)
+        assert second.get("k") == "持久化的回答"
+        stats = second.stats()
+        assert stats["hits"] == 1 and stats["memory_hits"] == 0
+        assert stats["memory_entries"] == 1
+        assert second.purge(model_id="qwen") == 1
+        assert second.get("k") is None
+        second.close()
+
+    def test_stream_replays_hit_and_counts_bytes(self):
+        """测试命中时分片回放，并统计命中率和节省的字节数"""
+        cache = _memory_cache(replay_chunk_chars=2)
+        calls = []
+
+        def upstream():
+            calls.append(1)
+            yield "你好"
+            yield "世界!"
+
+        assert list(cache.stream("k", "m", upstream)) == ["你好", "世界!"]
+        assert list(cache.stream("k", "m", upstream)) == ["你好", "世界", "!"]
+        assert len(calls) == 1
+
+        stats = cache.stats()
+        assert stats["hits"] == 1 and stats["misses"] == 1
+        assert stats["hit_ratio"] == 0.5
+        assert stats["bytes_saved"] == len("你好世界!".encode("utf-8"))
+
+    def test_incomplete_stream_not_cached(self):
+        """测试上游出错或调用方放弃时不写入缓存"""
+        cache = _memory_cache()
+
+        def failing():
+            yield "part"
+            raise ConnectionError("dropped")
+
+        with pytest.raises(ConnectionError):
+            list(cache.stream("k", "m", failing))
+
+        abandoned = cache.stream("k", "m", lambda: iter(["a", "b"]))
+        next(abandoned)
+        abandoned.close()
+
+        assert cache.stats()["stores"] == 0
+
+    def test_enabled_for_is_opt_in(self):
+        """测试按模型启用"""
+        cache = _memory_cache(models=("qwen",))
+        assert cache.enabled_for("qwen", {})
+        assert cache.enabled_for("custom", {"cache": True})
+        assert not cache.enabled_for("deepseek", {})
+        assert not ResponseCache().enabled_for("qwen", {"cache": True})
+
+
+@pytest.mark.integration
+class TestWrapperIntegration:
+    """测试 LLMWrapper 与 AsyncLLMWrapper 接入响应缓存"""
+
+    @pytest.fixture
+    def cached_llm(self, monkeypatch, fake_sse_server):
+        cache = _memory_cache(models=("qwen",))
+        monkeypatch.setattr(llm_wrapper, "response_cache", cache)
+        return cache
+
+    def test_sync_repeat_served_from_cache(self, cached_llm, fake_sse_server, sample_messages):
+        """测试重复请求不再访问上游"""
+        llm = llm_wrapper.LLMWrapper()
+        llm._resolve_config = lambda model_id: _qwen_config(fake_sse_server.url)
+
+        first = "".join(llm.chat_stream("qwen", sample_messages))
+        second = "".join(llm.chat_stream("qwen", sample_messages))
+        assert first == second == "Hello World"
+        assert len(fake_sse_server.requests) == 1
+
+        llm.config.temperature = 0.1
+        "".join(llm.chat_stream("qwen", sample_messages))
+        assert len(fake_sse_server.requests) == 2
+
+    def test_sync_error_not_cached(self, cached_llm, fake_sse_server, sample_messages):
+        """测试上游错误不会被缓存"""
+        fake_sse_server.scenarios = [{"status": 401}]
+        llm = llm_wrapper.LLMWrapper()
+        llm._resolve_config = lambda model_id: _qwen_config(fake_sse_server.url)
+
+        assert "".join(llm.chat_stream("qwen", sample_messages)).startswith("Error:")
+        assert "".join(llm.chat_stream("qwen", sample_messages)) == "Hello World"
+        assert cached_llm.stats()["stores"] == 1
+
+    def test_async_shares_cache(self, cached_llm, fake_sse_server, sample_messages):
+        """测试异步路径与同步路径共用同一份缓存"""
+        sync_llm = llm_wrapper.LLMWrapper()
+        sync_llm._resolve_config = lambda model_id: _qwen_config(fake_sse_server.url)
+        "".join(sync_llm.chat_stream("qwen", sample_messages))
+
+        async def run():
+            clients = AsyncClients()
+            llm = AsyncLLMWrapper(clients=clients)
+            llm.response_cache = cached_llm
+            llm._resolve_config = lambda model_id: _qwen_config(fake_sse_server.url)
+            try:
+                return "".join([c async for c in llm.achat_stream("qwen", sample_messages)])
+            finally:
+                await clients.aclose()
+
+        assert asyncio.run(run()) == "Hello World"
+        assert len(fake_sse_server.requests) == 1
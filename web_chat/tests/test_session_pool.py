@@ -0,0 +1,101 @@
+"""SessionPool 单元测试
+
+使用本地 SSE 假服务器测试 HTTP Keep-Alive 会话池，包括：
+- 同一主机的连接复用与复用率统计
+- 流被中途放弃时连接的释放
+- 空闲超时重建会话
+- LLMWrapper 的 requests 类适配器使用会话池
+"""
+
+import time
+import pytest
+from web_chat import llm_wrapper
+from web_chat.session_pool import SessionPool
+from web_chat.llm_wrapper import LLMWrapper
+
+
+def _consume(pool, url):
+    """完整读取一次流式响应"""
+    with pool.stream(url, json={"stream": True}, timeout=5) as response:
+        return b"".join(response.iter_content(chunk_size=None))
+
+
+@pytest.mark.unit
+class TestSessionPoolReuse:
+    """测试连接复用"""
+
+    def test_connection_reused_for_same_host(self, fake_sse_server):
+        """测试同一主机的连续请求复用同一个连接"""
+        pool = SessionPool()
+        for _ in range(3):
+            assert b"[DONE]" in _consume(pool, fake_sse_server.url)
+
+        stats = pool.stats()
+        assert fake_sse_server.connections == 1
+        assert stats["hosts"] == 1
+        assert stats["requests"] == 3
+        assert stats["connections"] == 1
+        assert stats["reuse_ratio"] == pytest.approx(2 / 3)
+        pool.close()
+
+    def test_stats_endpoint(self, client, fake_sse_server, monkeypatch):
+        """测试 /api/stats/http-pool 返回应用所用会话池的连接复用率"""
+        import web_chat.app as app_module
+        pool = SessionPool()
+        monkeypatch.setattr(app_module, "session_pool", pool)
+        for _ in range(4):
+            _consume(pool, fake_sse_server.url)
+        stats = client.get("/api/stats/http-pool").get_json()
+        assert stats["requests"] == 4 and stats["connections"] == 1
+        assert stats["reuse_ratio"] == pytest.approx(0.75)
+        pool.close()
+
+    def test_abandoned_stream_releases_connection(self, fake_sse_server):
+        """测试中途放弃的流关闭连接并归还槽位"""
+        pool = SessionPool(max_connections_per_host=1)
+        fake_sse_server.default_scenario = {"chunks": ["a"] * 50, "chunk_delay": 0.01}
+
+        def read_first_chunk():
+            with pool.stream(fake_sse_server.url, json={}, timeout=5) as response:
+                for chunk in response.iter_content(chunk_size=16):
+                    yield chunk
+
+        stream = read_first_chunk()
+        next(stream)
+        stream.close()
+
+        fake_sse_server.default_scenario = {"chunks": ["ok"]}
+        assert b"ok" in _consume(pool, fake_sse_server.url)
+        assert pool.stats()["abandoned_streams"] == 1
+        pool.close()
+
+    def test_idle_session_rebuilt(self, fake_sse_server):
+        """测试空闲超时后重建会话，统计保持累计"""
+        pool = SessionPool(idle_timeout=0.01)
+        _consume(pool, fake_sse_server.url)
+        time.sleep(0.02)
+        _consume(pool, fake_sse_server.url)
+
+        stats = pool.stats()
+        assert stats["requests"] == 2
+        assert stats["connections"] == 2
+        pool.close()
+
+
+@pytest.mark.unit
+class TestLLMWrapperUsesSessionPool:
+    """测试 requests 类适配器通过会话池发送请求"""
+
+    def test_qwen_stream_via_session_pool(self, fake_sse_server, sample_messages, monkeypatch):
+        """测试 Qwen 适配器复用会话池连接"""
+        pool = SessionPool()
+        monkeypatch.setattr(llm_wrapper, 'session_pool', pool)
+        config = {"type": "requests_sse", "url": fake_sse_server.url, "api_key": "k", "model": "m"}
+
+        llm = LLMWrapper()
+        for _ in range(2):
+            assert list(llm._chat_qwen(config, sample_messages)) == ["Hello", " World"]
+
+        assert fake_sse_server.requests[0]["headers"]["Authorization"] == "Bearer k"
+        assert pool.stats()["reuse_ratio"] == pytest.approx(0.5)
+        pool.close()
@@ -0,0 +1,202 @@
+"""近似重复问题缓存测试
+
+测试 similarity_cache 模块，包括：
+- 问题规范化与字符 shingle
+- MinHash 签名对相似度的估计
+- LSH 查找、阈值、按 (模型, 系统提示词) 隔离、淘汰与 TTL
+- 只处理单轮请求，LLMWrapper 接入与管理接口
+"""
+
+import json
+import time
+import asyncio
+import threading
+import pytest
+from web_chat import llm_wrapper
+from web_chat.similarity_cache import (
+    MinHasher,
+    SimilarityCache,
+    SimilarityCachePolicy,
+    estimate_jaccard,
+    normalize_prompt,
+    shingles
+)
+
+QUESTION = "How do I reverse a list in Python?"
+
+
+def _cache(**kwargs):
+    return SimilarityCache(SimilarityCachePolicy(enabled=True, **kwargs))
+
+
+@pytest.mark.unit
+class TestSignatures:
+    """测试规范化与签名"""
+
+    def test_normalize_prompt(self):
+        """测试只规范化大小写、空白和末尾标点，数字与符号保持不变"""
+        assert normalize_prompt("  How   do I\nreverse a LIST in Python??  ") == "how do i reverse a list in python"
+        assert normalize_prompt("Python　怎么反转列表？") == "python 怎么反转列表"
+        assert normalize_prompt("What is 2+3?") == "what is 2+3"
+        assert normalize_prompt("What is 2+3?") != normalize_prompt("What is 2-3?")
+        assert normalize_prompt("Explain C# templates") != normalize_prompt("Explain C++ templates")
+
+    def test_shingles(self):
+        """测试字符 n-gram"""
+        assert shingles("abcd", 3) == {"abc", "bcd"}
+        assert shingles("ab", 3) == {"ab"}
+
+    def test_signature_estimates_jaccard(self):
+        """测试签名估计值接近真实 Jaccard 相似度"""
+        hasher = MinHasher(128)
+        a = shingles(normalize_prompt("the quick brown fox jumps over the lazy dog"), 3)
+        b = shingles(normalize_prompt("the quick brown fox jumped over the lazy dog"), 3)
+        exact = len(a & b) / len(a | b)
+        estimate = estimate_jaccard(hasher.signature(a), hasher.signature(b))
+        assert abs(estimate - exact) < 0.15
+        assert hasher.signature(a) == MinHasher(128).signature(a)
+
+
+@pytest.mark.unit
+class TestSimilarityCache:
+    """测试查找、隔离与淘汰"""
+
+    def test_near_duplicate_hit(self):
+        """测试只有空白、大小写和标点不同的问题命中"""
+        cache = _cache()
+        cache.store("deepseek", "sys", QUESTION, "Use reversed() or list.reverse().")
+        assert cache.lookup("deepseek", "sys", "how do i reverse a list in python") == "Use reversed() or list.reverse()."
+        assert cache.lookup("deepseek", "sys", "How do I sort a dict by value in Python?") is None
+        assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+    def test_operators_and_symbols_do_not_collide(self):
+        """测试只差一个运算符、数字或符号的问题不会命中彼此的回答"""
+        cache = _cache()
+        cache.store("m", "", "What is 12+30?", "42")
+        cache.store("m", "", "Explain C++ templates", "C++ answer")
+        cache.store("m", "", "Could you please tell me exactly what the result of 1234+5678 is", "6912")
+        assert cache.lookup("m", "", "What is 12-30?") is None
+        assert cache.lookup("m", "", "Explain C# templates") is None
+        assert cache.lookup("m", "", "Could you please tell me exactly what the result of 1234-5678 is") is None
+        assert cache.lookup("m", "", "Could you please tell me exactly what the result of 1234+5679 is") is None
+        assert cache.lookup("m", "", "what is 12+30") == "42"
+        assert cache.lookup("m", "", "explain c++ templates.") == "C++ answer"
+
+    def test_scoped_by_model_and_system_prompt(self):
+        """测试不同模型或不同系统提示词不会混用回答"""
+        cache = _cache()
+        cache.store("deepseek", "sys", QUESTION, "answer")
+        assert cache.lookup("moonshot", "sys", QUESTION) is None
+        assert cache.lookup("deepseek", "other persona", QUESTION) is None
+
+    def test_threshold(self):
+        """测试阈值为 1 时只有规范化后相同的问题命中"""
+        cache = _cache(threshold=1.0)
+        cache.store("m", "", QUESTION, "answer")
+        assert cache.lookup("m", "", QUESTION.upper()) == "answer"
+        assert cache.lookup("m", "", "How do I reverse a list in Python 3?") is None
+
+    def test_eviction_and_purge(self):
+        """测试容量淘汰、索引清理与按模型清理"""
+        cache = _cache(max_entries=2)
+        cache.store("a", "", "first question about lists", "1")
+        cache.store("a", "", "second question about dicts", "2")
+        cache.store("b", "", "third question about sets", "3")
+        assert cache.lookup("a", "", "first question about lists") is None
+        assert cache.stats()["evictions"] == 1
+
+        assert cache.purge(model_id="a") == 1
+        assert [e["model"] for e in cache.entries()] == ["b"]
+        assert cache.purge() == 1
+        assert cache._buckets == {}
+
+    def test_ttl(self):
+        """测试过期条目不再命中"""
+        cache = _cache(ttl=0.05)
+        cache.store("m", "", QUESTION, "answer")
+        time.sleep(0.06)
+        assert cache.lookup("m", "", QUESTION) is None
+        assert cache.entries() == []
+
+    def test_single_turn_only(self):
+        """测试只提取单轮请求，系统提示词优先取消息中的"""
+        cache = _cache()
+        config = {"system": "config persona"}
+        assert cache.single_turn_prompt(config, [{"role": "user", "content": "q"}]) == ("config persona", "q")
+        assert cache.single_turn_prompt(config, [
+            {"role": "system", "content": "custom"}, {"role": "user", "content": "q"}
+        ]) == ("custom", "q")
+        assert cache.single_turn_prompt(config, [
+            {"role": "user", "content": "q"}, {"role": "assistant", "content": "a"}, {"role": "user", "content": "q2"}
+        ]) is None
+
+    def test_invalid_bands(self):
+        """测试 num_perm 不能被 bands 整除时报错"""
+        with pytest.raises(ValueError):
+            SimilarityCache(SimilarityCachePolicy(num_perm=10, bands=3))
+
+
+@pytest.mark.integration
+class TestSimilarityIntegration:
+    """测试 LLMWrapper 接入与管理接口"""
+
+    def test_wrapper_serves_reworded_question(self, monkeypatch, fake_sse_server):
+        """测试措辞略有不同的单轮问题不再访问上游"""
+        cache = _cache(models=("qwen",))
+        monkeypatch.setattr(llm_wrapper, "similarity_cache", cache)
+        llm = llm_wrapper.LLMWrapper()
+        llm._resolve_config = lambda model_id: {
+            "type": "requests_sse", "url": fake_sse_server.url, "api_key": "k", "model": "m"
+        }
+
+        first = "".join(llm.chat_stream("qwen", [{"role": "user", "content": QUESTION}]))
+        second = "".join(llm.chat_stream("qwen", [{"role": "user", "content": "  how do I reverse a list in python "}]))
+        assert first == second == "Hello World"
+        assert len(fake_sse_server.requests) == 1
+
+    def test_astream_off_event_loop(self):
+        """测试异步版本在线程中查找和保存，不阻塞事件循环"""
+        cache = _cache()
+        threads = []
+        for name in ("lookup", "store"):
+            original = getattr(cache, name)
+
+            def recorded(*args, _original=original, **kwargs):
+                threads.append(threading.current_thread())
+                return _original(*args, **kwargs)
+            setattr(cache, name, recorded)
+
+        async def upstream():
+            yield "Hello"
+            yield " World"
+
+        async def run():
+            first = [c async for c in cache.astream("m", "", QUESTION, upstream)]
+            second = [c async for c in cache.astream("m", "", QUESTION.lower(), upstream)]
+            return "".join(first), "".join(second)
+
+        assert asyncio.run(run()) == ("Hello World", "Hello World")
+        assert len(threads) == 3 and threading.main_thread() not in threads
+
+    def test_admin_endpoint(self, client, monkeypatch):
+        """测试管理接口查看和清理条目，以及管理令牌校验"""
+        import web_chat.app as app_module
+        cache = _cache()
+        cache.store("deepseek", "", QUESTION, "answer")
+        monkeypatch.setattr(app_module, "similarity_cache", cache)
+        admin = {'X-Admin-Token': 'secret'}
+
+        # 未设置 ADMIN_TOKEN 时管理接口关闭
+        monkeypatch.delenv('ADMIN_TOKEN', raising=False)
+        assert client.get('/api/admin/similarity-cache', headers=admin).status_code == 403
+        assert client.delete('/api/admin/similarity-cache', headers=admin).status_code == 403
+
+        monkeypatch.setenv('ADMIN_TOKEN', 'secret')
+        data = json.loads(client.get('/api/admin/similarity-cache?model=deepseek', headers=admin).data)
+        assert data['stats']['entries'] == 1
+        assert data['entries'][0]['prompt'] == normalize_prompt(QUESTION)
+
+        assert client.get('/api/admin/similarity-cache').status_code == 403
+        assert client.delete('/api/admin/similarity-cache').status_code == 403
+        response = client.delete('/api/admin/similarity-cache', headers={'X-Admin-Token': 'secret'})
+        assert json.loads(response.data) == {'success': True, 'purged': 1}
@@ -0,0 +1,158 @@
+"""相同请求合并测试
+
+测试 single_flight 模块，包括：
+- 后加入的订阅者收到已输出的前缀和实时片段，上游只请求一次
+- 只有最后一个订阅者离开时才取消上游
+- 上游异常传给所有订阅者
+- 对冲请求响应外层取消，以及 LLMWrapper 并发请求合并
+"""
+
+import threading
+import pytest
+from web_chat import llm_wrapper
+from web_chat.llm_wrapper import on_cancel
+from web_chat.single_flight import SingleFlight
+
+
+class _Gate:
+    """由测试逐个放行片段的上游"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.release = threading.Semaphore(0)
+        self.calls = 0
+        self.cancelled = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        unregister = on_cancel(self._cancel)
+        try:
+            for chunk in self.chunks:
+                self.release.acquire()
+                if self.cancelled.is_set():
+                    return
+                yield chunk
+        finally:
+            unregister()
+
+    def _cancel(self):
+        # 模拟适配器中止连接：让阻塞中的读取立即返回
+        self.cancelled.set()
+        self.release.release()
+
+
+@pytest.mark.unit
+class TestSingleFlight:
+    """测试订阅、取消与异常传递"""
+
+    def test_follower_gets_prefix_and_live_chunks(self):
+        """测试后加入的订阅者先收到已输出的前缀"""
+        flights = SingleFlight(enabled=True)
+        gate = _Gate(["a", "b", "c"])
+
+        first = flights.stream("k", gate)
+        gate.release.release()
+        assert next(first) == "a"
+
+        second = flights.stream("k", gate)
+        assert next(second) == "a"
+        gate.release.release()
+        gate.release.release()
+        assert list(first) == ["b", "c"]
+        assert list(second) == ["b", "c"]
+
+        assert gate.calls == 1
+        assert flights.stats() == {"leaders": 1, "followers": 1, "cancelled": 0, "in_flight": 0}
+
+    def test_cancel_only_when_last_subscriber_leaves(self):
+        """测试一个订阅者离开不影响其他订阅者，最后一个离开时取消上游"""
+        flights = SingleFlight(enabled=True)
+        gate = _Gate(["a", "b", "c"])
+
+        first = flights.stream("k", gate)
+        gate.release.release()
+        next(first)
+        second = flights.stream("k", gate)
+        next(second)
+
+        first.close()
+        assert not gate.cancelled.is_set()
+        gate.release.release()
+        assert next(second) == "b"
+
+        second.close()
+        assert gate.cancelled.wait(1)
+        assert flights.stats()["cancelled"] == 1
+        assert flights.stats()["in_flight"] == 0
+
+    def test_error_reaches_all_subscribers(self):
+        """测试上游异常传给所有订阅者"""
+        flights = SingleFlight(enabled=True)
+        started = threading.Event()
+        proceed = threading.Event()
+
+        def failing():
+            yield "partial"
+            started.set()
+            proceed.wait(1)
+            raise ConnectionError("dropped")
+
+        first = flights.stream("k", failing)
+        assert next(first) == "partial"
+        started.wait(1)
+        second = flights.stream("k", failing)
+        proceed.set()
+
+        with pytest.raises(ConnectionError):
+            list(first)
+        received = []
+        with pytest.raises(ConnectionError):
+            for chunk in second:
+                received.append(chunk)
+        assert received == ["partial"]
+
+    def test_disabled_passes_through(self):
+        """测试关闭时直接转发上游"""
+        flights = SingleFlight(enabled=False)
+        assert list(flights.stream("k", lambda: iter(["x"]))) == ["x"]
+        assert flights.stats()["leaders"] == 0
+
+
+@pytest.mark.integration
+class TestSingleFlightIntegration:
+    """测试与对冲请求和 LLMWrapper 的接入"""
+
+    def test_hedged_stream_honours_outer_cancel(self):
+        """测试最后一个订阅者离开时，对冲请求中胜出的一路也被中止"""
+        hedger = llm_wrapper.Hedger(llm_wrapper.HedgePolicy(enabled=True, default_delay=0.01, min_delay=0.01))
+        flights = SingleFlight(enabled=True)
+        primary, backup = _Gate(["p1", "p2"]), _Gate(["b1"])
+
+        stream = flights.stream("k", lambda: hedger.stream("m", primary, ("backup", backup)))
+        primary.release.release()
+        assert next(stream) == "p1"
+        stream.close()
+
+        # 胜出的主上游还在阻塞读取，只能由外层取消中止
+        assert primary.cancelled.wait(1)
+
+    def test_concurrent_identical_requests_share_upstream(self, monkeypatch, fake_sse_server, sample_messages):
+        """测试并发的相同请求只访问一次上游"""
+        fake_sse_server.scenarios = [{"chunks": ["A", "B", "C"], "chunk_delay": 0.1}]
+        monkeypatch.setattr(llm_wrapper, "single_flight", SingleFlight(enabled=True))
+        config = {"type": "requests_sse", "url": fake_sse_server.url, "api_key": "k", "model": "m"}
+        results = []
+
+        def run():
+            llm = llm_wrapper.LLMWrapper()
+            llm._resolve_config = lambda model_id: config
+            results.append("".join(llm.chat_stream("qwen", sample_messages)))
+
+        threads = [threading.Thread(target=run) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        assert results == ["ABC"] * 3
+        assert len(fake_sse_server.requests) == 1
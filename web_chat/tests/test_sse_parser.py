@@ -0,0 +1,94 @@
+"""SSE 增量解析器单元测试
+
+测试 sse_parser 模块，包括：
+- 任意字节边界的增量解析
+- LF / CRLF / CR 换行（含跨块的 CRLF）
+- 多行 data、event / id 字段与注释行
+- 跳过不含 delta.content 的事件
+"""
+
+import json
+import pytest
+from unittest.mock import patch
+from web_chat import sse_parser
+from web_chat.sse_parser import SSEParser, SSEEvent, iter_sse_events, iter_delta_content
+
+
+def _event(content):
+    return f'data: {json.dumps({"choices": [{"delta": {"content": content}}]})}\n\n'.encode()
+
+
+STREAM = (
+    b'data: {"choices":[{"delta":{"role":"assistant","content":""}}]}\n\n'
+    + _event("你好")
+    + _event("，世界")
+    + b'data: {"choices":[{"delta":{}}],"usage":{"total_tokens":9}}\n\n'
+    + b'data: [DONE]\n\n'
+)
+
+
+@pytest.mark.unit
+class TestSSEParser:
+    """测试事件解析"""
+
+    def test_byte_by_byte_feed(self):
+        """测试逐字节输入与一次性输入结果一致"""
+        whole = list(iter_sse_events([STREAM]))
+        split = list(iter_sse_events([STREAM[i:i + 1] for i in range(len(STREAM))]))
+        assert whole == split
+        assert len(whole) == 5
+
+    @pytest.mark.parametrize("newline", [b"\r\n", b"\r"])
+    def test_crlf_and_cr(self, newline):
+        """测试 CRLF 与 CR 换行"""
+        stream = STREAM.replace(b"\n", newline)
+        chunks = [stream[i:i + 7] for i in range(0, len(stream), 7)]
+        assert list(iter_delta_content(chunks)) == ["你好", "，世界"]
+
+    def test_crlf_split_across_chunks(self):
+        """测试 CR 与 LF 落在不同字节块时不产生多余空行"""
+        parser = SSEParser()
+        assert parser.feed(b"data: a\r") == []
+        assert parser.feed(b"\ndata: b\r\n\r\n") == [SSEEvent("message", b"a\nb", None)]
+
+    def test_multiline_data_event_and_id(self):
+        """测试多行 data、event、id 与注释"""
+        stream = b": keep-alive\nevent: update\nid: 42\ndata: line1\ndata:line2\n\ndata: x\n\n"
+        events = list(iter_sse_events([stream]))
+        assert events == [
+            SSEEvent("update", b"line1\nline2", "42"),
+            SSEEvent("message", b"x", "42")
+        ]
+
+    def test_feed_data_matches_feed(self):
+        """测试 feed_data 与 feed 输出相同的 data，并记录 id"""
+        stream = b"id: 7\ndata: a\n\ndata: b\ndata: c\n\n" + STREAM
+        parser, data_parser = SSEParser(), SSEParser()
+        events = parser.feed(stream)
+        assert data_parser.feed_data(stream) == [event.data for event in events]
+        assert data_parser.last_event_id == "7"
+
+    def test_flush_last_event_without_blank_line(self):
+        """测试流结束时输出未以空行结尾的事件"""
+        assert list(iter_delta_content([_event("end").rstrip(b"\n")])) == ["end"]
+
+
+@pytest.mark.unit
+class TestDeltaContent:
+    """测试 delta.content 提取"""
+
+    def test_stops_at_done(self):
+        """测试遇到 [DONE] 后停止"""
+        assert list(iter_delta_content([STREAM + _event("after")])) == ["你好", "，世界"]
+
+    def test_skips_decoding_frames_without_content(self):
+        """测试 role-only 帧和 usage 帧不做 JSON 解码"""
+        with patch.object(sse_parser, '_json_loads', wraps=sse_parser._json_loads) as loads:
+            assert list(iter_delta_content([STREAM])) == ["你好", "，世界"]
+        assert loads.call_count == 2
+
+    def test_stdlib_json_fallback(self):
+        """测试没有 orjson 时使用标准库 json"""
+        with patch.object(sse_parser, '_json_loads', json.loads), \
+                patch.object(sse_parser, 'JSON_DECODE_ERRORS', (json.JSONDecodeError, UnicodeDecodeError)):
+            assert list(iter_delta_content([STREAM, b'data: {bad "content": 1\n\n'])) == ["你好", "，世界"]
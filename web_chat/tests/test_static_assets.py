@@ -0,0 +1,234 @@
+"""静态资源构建测试
+
+测试 static_assets 模块，包括：
+- JS / CSS 压缩只删除注释与空白，字符串、模板字符串和正则表达式保持不变
+- 构建生成带内容哈希的文件、.gz 预压缩文件与 manifest，重新构建保留上一次的文件
+- manifest 缺失、关闭或源文件已修改时回退到源文件地址
+- 带哈希的文件按 Accept-Encoding 发送预压缩版本，并设置 immutable 缓存
+"""
+
+import os
+import re
+import gzip
+import json
+import shutil
+import subprocess
+import pytest
+from flask import Flask
+from web_chat.static_assets import (
+    BUNDLES,
+    IMMUTABLE_CACHE_CONTROL,
+    STATIC_DIR,
+    AssetManifest,
+    build_assets,
+    minify_css,
+    minify_js
+)
+
+TRICKY_JS = r"""
+// comment
+const a = 10 / 2 / /x/.source.length; /* block */
+let s = 'it\'s // not a comment', t = "/* nor this */";
+const re = /[/\]]+\/(?:a|b)/gi;
+function f(x) { return /^\d+$/.test(x) ? x + +1 : x - -1; }
+const tpl = `line1
+   ${ s.length /* kept */ + `${a}` } // kept
+end`;
+let i = 1; i ++
+i
+++
+i
+const r = a
+/ 2
+console.log(JSON.stringify([a, s, t, re.source, re.flags, f('12'), f('x'), tpl, i, r]))
+"""
+
+SMALL_BUNDLES = {'site.js': ['js/a.js', 'js/b.js'], 'site.css': ['css/site.css']}
+
+
+@pytest.fixture
+def static_dir(tmp_path):
+    """带两个 JS 文件和一个 CSS 文件的静态目录"""
+    (tmp_path / 'js').mkdir()
+    (tmp_path / 'css').mkdir()
+    (tmp_path / 'js' / 'a.js').write_text('// a\nconst greeting = "hello";\n', encoding='utf-8')
+    (tmp_path / 'js' / 'b.js').write_text('function greet() {\n    return greeting;\n}\n', encoding='utf-8')
+    (tmp_path / 'css' / 'site.css').write_text('/* site */\nbody {\n    color: red;\n}\n' * 50, encoding='utf-8')
+    return tmp_path
+
+
+def _node():
+    node = shutil.which('node')
+    if node is None:
+        pytest.skip('node is not installed')
+    return node
+
+
+def _serving_app(manifest):
+    app = Flask(__name__, static_folder=manifest.static_dir, static_url_path='/static')
+
+    @app.route('/static/dist/<path:filename>')
+    def serve_bundle(filename):
+        return manifest.send(filename)
+
+    return app
+
+
+@pytest.mark.unit
+class TestMinify:
+    """测试压缩"""
+
+    def test_minify_js(self):
+        """测试删除注释与缩进，保留字符串、正则表达式和必要的空格与换行"""
+        result = minify_js(TRICKY_JS)
+        assert '// comment' not in result and '/* block */' not in result
+        assert "'it\\'s // not a comment'" in result and '"/* nor this */"' in result
+        assert 'const re=/[/\\]]+\\/(?:a|b)/gi;' in result
+        assert 'return/^\\d+$/.test(x)?x+ +1:x- -1;' in result
+        assert '10/2/ /x/' in result
+        assert '${ s.length /* kept */ + `${a}` } // kept' in result
+        assert '\n\n' not in result
+
+    def test_minify_js_semantics(self, tmp_path):
+        """测试压缩前后的执行结果相同"""
+        node = _node()
+        original, minified = tmp_path / 'original.js', tmp_path / 'minified.js'
+        original.write_text(TRICKY_JS, encoding='utf-8')
+        minified.write_text(minify_js(TRICKY_JS), encoding='utf-8')
+        outputs = [subprocess.run([node, str(path)], capture_output=True, text=True, check=True).stdout
+                   for path in (original, minified)]
+        assert outputs[0] == outputs[1]
+
+    def test_minify_css(self):
+        """测试删除注释与空白，保留字符串、后代选择器和 and ( 之间的空格"""
+        source = '''
+        /* header */
+        .a :hover , .b > .c {
+            content: "a  /* b */  c";
+            color: red !important;
+        }
+        @media screen and (max-width: 768px) { .d { margin: 0 auto; } }
+        '''
+        assert minify_css(source) == (
+            '.a :hover,.b>.c{content:"a  /* b */  c";color:red!important}'
+            '@media screen and (max-width:768px){.d{margin:0 auto}}\n'
+        )
+
+
+@pytest.mark.unit
+class TestBuild:
+    """测试构建"""
+
+    def test_build(self, static_dir):
+        """测试生成带哈希的文件、.gz 文件与 manifest，构建结果可复现"""
+        manifest = build_assets(str(static_dir), SMALL_BUNDLES, use_brotli=False)
+        entry = manifest['bundles']['site.js']
+        assert re.fullmatch(r'site\.[0-9a-f]{12}\.js', entry['file'])
+        dist = static_dir / 'dist'
+        body = (dist / entry['file']).read_bytes()
+        assert body == b'const greeting="hello";\n;\nfunction greet(){\nreturn greeting;\n}\n'
+        assert gzip.decompress((dist / f"{entry['file']}.gz").read_bytes()) == body
+        assert json.loads((dist / 'manifest.json').read_text()) == manifest
+
+        css = manifest['bundles']['site.css']
+        assert css['sizes']['gzip'] < css['sizes']['identity'] < css['sizes']['source']
+        assert build_assets(str(static_dir), SMALL_BUNDLES, use_brotli=False) == manifest
+
+    def test_rebuild_keeps_previous(self, static_dir):
+        """测试重新构建保留上一次的文件，删除更早的文件"""
+        first = build_assets(str(static_dir), SMALL_BUNDLES, use_brotli=False)['bundles']['site.js']['file']
+        (static_dir / 'js' / 'b.js').write_text('function greet() { return 1; }\n', encoding='utf-8')
+        second = build_assets(str(static_dir), SMALL_BUNDLES, use_brotli=False)['bundles']['site.js']['file']
+        (static_dir / 'js' / 'b.js').write_text('function greet() { return 2; }\n', encoding='utf-8')
+        third = build_assets(str(static_dir), SMALL_BUNDLES, use_brotli=False)['bundles']['site.js']['file']
+
+        files = os.listdir(static_dir / 'dist')
+        assert len({first, second, third}) == 3
+        assert second in files and third in files and first not in files
+        assert f'{first}.gz' not in files
+
+    def test_project_bundles(self, tmp_path):
+        """测试项目自身的 JS bundle 可以通过语法检查"""
+        node = _node()
+        static_dir = tmp_path / 'static'
+        shutil.copytree(STATIC_DIR, static_dir, ignore=shutil.ignore_patterns('dist'))
+        manifest = build_assets(str(static_dir), use_brotli=False)
+        assert set(manifest['bundles']) == set(BUNDLES)
+        for name, entry in manifest['bundles'].items():
+            assert entry['sizes']['identity'] < entry['sizes']['source']
+            if name.endswith('.js'):
+                subprocess.run([node, '--check', str(static_dir / 'dist' / entry['file'])], check=True)
+
+
+@pytest.mark.unit
+class TestAssetManifest:
+    """测试运行时 manifest"""
+
+    def _urls(self, manifest, bundle):
+        with _serving_app(manifest).test_request_context():
+            return manifest.urls(bundle)
+
+    def test_fallback_to_sources(self, static_dir, monkeypatch):
+        """测试未构建、关闭或源文件已修改时返回源文件地址"""
+        monkeypatch.setitem(BUNDLES, 'site.js', SMALL_BUNDLES['site.js'])
+        manifest = AssetManifest(str(static_dir))
+        manifest.load()
+        assert self._urls(manifest, 'site.js') == ['/static/js/a.js', '/static/js/b.js']
+
+        built = build_assets(str(static_dir), SMALL_BUNDLES, use_brotli=False)['bundles']['site.js']['file']
+        manifest.load()
+        assert self._urls(manifest, 'site.js') == [f'/static/dist/{built}']
+
+        disabled = AssetManifest(str(static_dir), enabled=False)
+        disabled.load()
+        assert self._urls(disabled, 'site.js') == ['/static/js/a.js', '/static/js/b.js']
+
+        (static_dir / 'js' / 'a.js').write_text('const greeting = "hi";\n', encoding='utf-8')
+        manifest.load()
+        assert self._urls(manifest, 'site.js') == ['/static/js/a.js', '/static/js/b.js']
+
+    def test_send(self, static_dir):
+        """测试发送预压缩版本与 immutable 缓存头，manifest 与未知文件返回 404"""
+        filename = build_assets(str(static_dir), SMALL_BUNDLES, use_brotli=False)['bundles']['site.css']['file']
+        manifest = AssetManifest(str(static_dir))
+        manifest.load()
+        client = _serving_app(manifest).test_client()
+
+        plain = client.get(f'/static/dist/{filename}', headers={'Accept-Encoding': 'identity'})
+        compressed = client.get(f'/static/dist/{filename}', headers={'Accept-Encoding': 'gzip, deflate, br'})
+        assert plain.status_code == 200 and plain.mimetype == 'text/css'
+        assert 'Content-Encoding' not in plain.headers
+        assert compressed.headers['Content-Encoding'] == 'gzip'
+        assert compressed.mimetype == 'text/css'
+        assert gzip.decompress(compressed.data) == plain.data
+        for response in (plain, compressed):
+            assert response.headers['Cache-Control'] == IMMUTABLE_CACHE_CONTROL
+            assert response.headers['Vary'] == 'Accept-Encoding'
+            assert 'Content-Disposition' not in response.headers
+
+        for path in ('manifest.json', f'{filename}.gz', 'missing.css', '../css/site.css'):
+            assert client.get(f'/static/dist/{path}').status_code == 404
+        assert manifest.stats()['compressed'] == 1
+
+
+@pytest.mark.integration
+class TestPages:
+    """测试页面中的资源地址"""
+
+    def test_bundles_not_rate_limited(self):
+        """测试 bundle 路由与 Flask 的 static 路由一样不受默认速率限制"""
+        import web_chat.app as app_module
+        from flask_limiter import ExemptionScope
+        scope = app_module.limiter.limit_manager.exemption_scope(app_module.app, 'serve_bundle', None)
+        assert scope & ExemptionScope.DEFAULT
+
+    @pytest.mark.parametrize('page', ['/', '/model_manager'])
+    def test_page_assets(self, client, page):
+        """测试页面引用的本地 JS / CSS 都可以加载"""
+        html = client.get(page).get_data(as_text=True)
+        urls = re.findall(r'(?:src|href)="(/static/[^"]+)"', html)
+        assert any(url.endswith('.js') for url in urls) and any(url.endswith('.css') for url in urls)
+        for url in urls:
+            response = client.get(url)
+            assert response.status_code == 200
+            response.close()
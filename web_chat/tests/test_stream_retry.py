@@ -0,0 +1,233 @@
+"""流式重试与续写测试
+
+使用本地 SSE 假服务器测试 stream_retry 模块，包括：
+- 首个 token 之前的失败重试（5xx、连接失败），以及不可重试的错误
+- 中途断流后带 assistant 前缀续写，并去掉重复输出的前缀
+- 无法续写时抛出 StreamInterruptedError
+- 首字时间预算（同步与异步路径）
+"""
+
+import socket
+import asyncio
+import pytest
+import requests
+from web_chat.llm_wrapper import LLMWrapper, StreamInterruptedError
+from web_chat.async_llm import AsyncLLMWrapper, AsyncClients
+from web_chat.stream_retry import (
+    StreamRetryPolicy,
+    _ResumeState,
+    is_retryable_error,
+    retrying_stream,
+    with_assistant_prefix
+)
+
+FAST = dict(backoff_min=0, backoff_max=0, backoff_multiplier=0)
+
+
+def _qwen_config(url):
+    return {"type": "requests_sse", "url": url, "api_key": "k", "model": "m"}
+
+
+def _spark_config(url):
+    return {"type": "spark_requests", "url": url, "api_key": "k", "model": "m"}
+
+
+def _unused_url():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}/v1/chat/completions"
+
+
+@pytest.mark.unit
+class TestResumeState:
+    """测试续写时的前缀去重"""
+
+    def _feed(self, state, chunks):
+        return "".join(state.accept(c) for c in chunks) + state.finish()
+
+    def test_continuation_passes_through(self):
+        """测试上游接着前缀续写时原样输出"""
+        state = _ResumeState()
+        state.start_attempt()
+        assert self._feed(state, ["你好", "，"]) == "你好，"
+        assert state.start_attempt() == "你好，"
+        assert self._feed(state, ["世界"]) == "世界"
+
+    def test_repeated_prefix_is_dropped(self):
+        """测试上游从头重新回答时丢弃重复部分"""
+        state = _ResumeState()
+        state.start_attempt()
+        self._feed(state, ["Hello", " Wor"])
+        state.start_attempt()
+        assert self._feed(state, ["Hel", "lo W", "orld", "!"]) == "ld!"
+        assert state.emitted == "Hello World!"
+
+    def test_with_assistant_prefix(self):
+        """测试 assistant 前缀追加"""
+        messages = [{"role": "user", "content": "hi"}]
+        assert with_assistant_prefix(messages, "") is messages
+        assert with_assistant_prefix(messages, "AB")[-1] == {"role": "assistant", "content": "AB"}
+        assert len(messages) == 1
+
+    def test_retryable_errors(self):
+        """测试错误分类"""
+        def http_error(status):
+            response = requests.Response()
+            response.status_code = status
+            return requests.exceptions.HTTPError(response=response)
+
+        assert is_retryable_error(http_error(429))
+        assert is_retryable_error(http_error(503))
+        assert not is_retryable_error(http_error(401))
+        assert is_retryable_error(requests.exceptions.ConnectionError())
+        assert not is_retryable_error(ValueError())
+
+
+@pytest.mark.integration
+class TestSyncRetry:
+    """测试 requests 类适配器的重试与续写"""
+
+    def test_retry_before_first_token(self, fake_sse_server, sample_messages):
+        """测试首个 token 之前的 5xx 被重试"""
+        fake_sse_server.scenarios = [{"status": 503}, {"status": 502}]
+        llm = LLMWrapper()
+        assert list(llm._chat_qwen(_qwen_config(fake_sse_server.url), sample_messages)) == ["Hello", " World"]
+        assert len(fake_sse_server.requests) == 3
+
+    def test_client_error_not_retried(self, fake_sse_server, sample_messages):
+        """测试 4xx 错误不重试"""
+        fake_sse_server.scenarios = [{"status": 401}]
+        llm = LLMWrapper()
+        with pytest.raises(requests.exceptions.HTTPError):
+            list(llm._chat_qwen(_qwen_config(fake_sse_server.url), sample_messages))
+        assert len(fake_sse_server.requests) == 1
+
+    def test_connection_failure_exhausts_attempts(self, sample_messages):
+        """测试连接失败在重试耗尽后抛出原始异常"""
+        calls = []
+        llm = LLMWrapper(retry_policy=StreamRetryPolicy(max_attempts=2, **FAST))
+        original = llm._stream_sse
+
+        def counting(*args):
+            calls.append(args[0])
+            return original(*args)
+
+        llm._stream_sse = counting
+        with pytest.raises(requests.exceptions.ConnectionError):
+            list(llm._chat_qwen(_qwen_config(_unused_url()), sample_messages))
+        assert len(calls) == 2
+
+    def test_resume_after_drop(self, fake_sse_server, sample_messages):
+        """测试中途断流后带已输出内容续写"""
+        fake_sse_server.scenarios = [
+            {"chunks": ["A", "B", "C"], "drop_after": 2},
+            {"chunks": ["C", "D"]}
+        ]
+        llm = LLMWrapper()
+        output = "".join(llm._chat_qwen(_qwen_config(fake_sse_server.url), sample_messages))
+
+        assert output == "ABCD"
+        resumed = fake_sse_server.requests[1]["json"]["messages"]
+        assert resumed[:-1] == sample_messages
+        assert resumed[-1] == {"role": "assistant", "content": "AB"}
+
+    def test_resume_drops_restarted_answer(self, fake_sse_server, sample_messages):
+        """测试上游从头重新回答时不重复输出"""
+        fake_sse_server.scenarios = [
+            {"chunks": ["A", "B", "C"], "drop_after": 2},
+            {"chunks": ["A", "B", "C"]}
+        ]
+        llm = LLMWrapper()
+        assert "".join(llm._chat_qwen(_qwen_config(fake_sse_server.url), sample_messages)) == "ABC"
+
+    def test_resume_disabled_raises_typed_error(self, fake_sse_server, sample_messages):
+        """测试关闭续写时中途断流抛出 StreamInterruptedError"""
+        fake_sse_server.scenarios = [{"chunks": ["A", "B", "C"], "drop_after": 2}]
+        llm = LLMWrapper(retry_policy=StreamRetryPolicy(resume=False, **FAST))
+        output = []
+        with pytest.raises(StreamInterruptedError) as exc_info:
+            for chunk in llm._chat_qwen(_qwen_config(fake_sse_server.url), sample_messages):
+                output.append(chunk)
+
+        assert output == ["A", "B"]
+        assert exc_info.value.partial == "AB"
+        assert len(fake_sse_server.requests) == 1
+
+    def test_spark_cannot_resume(self, fake_sse_server, sample_messages):
+        """测试 Spark（无对话历史）中途断流时不续写"""
+        fake_sse_server.scenarios = [{"chunks": ["A", "B", "C"], "drop_after": 1}]
+        llm = LLMWrapper()
+        with pytest.raises(StreamInterruptedError) as exc_info:
+            list(llm._chat_spark(_spark_config(fake_sse_server.url), sample_messages))
+        assert exc_info.value.partial == "A"
+
+    def test_chat_stream_reports_interruption(self, fake_sse_server, sample_messages):
+        """测试 chat_stream 把中断错误以 Error 文本返回"""
+        fake_sse_server.scenarios = [{"chunks": ["A", "B"], "drop_after": 1}]
+        llm = LLMWrapper(retry_policy=StreamRetryPolicy(resume=False, **FAST))
+        llm._resolve_config = lambda model_id: _qwen_config(fake_sse_server.url)
+        chunks = list(llm.chat_stream('qwen', sample_messages))
+        assert chunks[0] == "A"
+        assert chunks[-1].startswith("Error: Stream interrupted after 1 characters")
+
+    def test_first_token_timeout_retried(self, fake_sse_server, sample_messages):
+        """测试首字超时后重试，收到首个 token 后恢复正常读超时"""
+        fake_sse_server.scenarios = [
+            {"delay": 1.0},
+            {"chunks": ["slow", " but", " fine"], "chunk_delay": 0.4}
+        ]
+        llm = LLMWrapper(retry_policy=StreamRetryPolicy(first_token_timeout=0.3, **FAST))
+        assert "".join(llm._chat_qwen(_qwen_config(fake_sse_server.url), sample_messages)) == "slow but fine"
+        assert len(fake_sse_server.requests) == 2
+
+    def test_generic_iterator_closed_on_abandon(self):
+        """测试调用方放弃时关闭底层流"""
+        closed = []
+
+        def open_stream(prefix):
+            try:
+                yield "a"
+                yield "b"
+            finally:
+                closed.append(True)
+
+        stream = retrying_stream(open_stream, StreamRetryPolicy(**FAST))
+        assert next(stream) == "a"
+        stream.close()
+        assert closed == [True]
+
+
+@pytest.mark.integration
+class TestAsyncRetry:
+    """测试异步适配器的重试与续写"""
+
+    def _run(self, llm_kwargs, config, messages):
+        async def run():
+            clients = AsyncClients()
+            llm = AsyncLLMWrapper(clients=clients, **llm_kwargs)
+            try:
+                return [c async for c in llm._achat_qwen(config, messages)]
+            finally:
+                await clients.aclose()
+        return asyncio.run(run())
+
+    def test_async_resume_after_drop(self, fake_sse_server, sample_messages):
+        """测试异步路径中途断流后续写"""
+        fake_sse_server.scenarios = [
+            {"status": 503},
+            {"chunks": ["A", "B", "C"], "drop_after": 2},
+            {"chunks": ["C"]}
+        ]
+        policy = StreamRetryPolicy(**FAST)
+        output = self._run({"retry_policy": policy}, _qwen_config(fake_sse_server.url), sample_messages)
+        assert "".join(output) == "ABC"
+        assert fake_sse_server.requests[2]["json"]["messages"][-1]["content"] == "AB"
+
+    def test_async_first_token_timeout(self, fake_sse_server, sample_messages):
+        """测试异步路径的首字时间预算"""
+        fake_sse_server.scenarios = [{"delay": 1.0}, {"chunks": ["ok"], "chunk_delay": 0.4}]
+        policy = StreamRetryPolicy(first_token_timeout=0.3, **FAST)
+        output = self._run({"retry_policy": policy}, _qwen_config(fake_sse_server.url), sample_messages)
+        assert output == ["ok"]
+        assert len(fake_sse_server.requests) == 2
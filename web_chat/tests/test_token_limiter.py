@@ -0,0 +1,232 @@
+"""按 token 计费的速率限制测试
+
+测试 token_limiter 模块，包括：
+- GCRA 的突发、平滑恢复与精确的等待时间
+- 一次请求的多个额度原子地检查与扣减，超过上限的请求按上限扣减
+- 按实际输出多退少补
+- 多个进程共享同一 SQLite 文件时不会超发
+- /api/chat 与 /api/chat/compare 的 429 响应与 Retry-After 响应头
+- 启用后聊天接口不再使用每个进程单独计数的请求限制
+"""
+
+import asyncio
+import multiprocessing
+import pytest
+import httpx
+from unittest.mock import patch
+from limits import parse as parse_limit
+from web_chat.token_limiter import (
+    GcraStore,
+    Quota,
+    RateLimitExceeded,
+    TokenLimitPolicy,
+    TokenRateLimiter,
+    token_limit_settings_from_env
+)
+
+NOW = 1_000_000.0
+
+
+def _hammer(path, attempts):
+    """子进程：在同一时刻尝试扣减 attempts 次，返回通过的次数"""
+    store = GcraStore(path)
+    quota = Quota(100)
+    return sum(store.acquire([("shared", 1, quota, "client_requests")], NOW) is None for _ in range(attempts))
+
+
+@pytest.mark.unit
+class TestGcraStore:
+    """测试 GCRA 存储"""
+
+    def test_burst_and_retry_after(self):
+        """测试一次可用完整个周期的额度，之后按速率恢复并给出精确的等待时间"""
+        store = GcraStore(None)
+        quota = Quota(100, 60)  # 每 0.6 秒恢复 1 个
+        assert store.acquire([("k", 60, quota, "client_tokens")], NOW) is None
+        retry_after, scope, key = store.acquire([("k", 60, quota, "client_tokens")], NOW)
+        assert retry_after == pytest.approx(12) and scope == "client_tokens" and key == "k"
+
+        assert store.acquire([("k", 60, quota, "client_tokens")], NOW + 11.9) is not None
+        assert store.acquire([("k", 60, quota, "client_tokens")], NOW + 12) is None
+        assert store.remaining("k", quota, NOW + 12) == pytest.approx(0)
+        assert store.remaining("k", quota, NOW + 72) == pytest.approx(100)
+
+    def test_all_or_nothing(self):
+        """测试任一额度未通过时其他额度也不扣减，返回等待最久的额度"""
+        store = GcraStore(None)
+        client, model = Quota(1000), Quota(100)
+        assert store.acquire([("model", 100, model, "model_tokens")], NOW) is None
+
+        denied = store.acquire([("client", 50, client, "client_tokens"), ("model", 50, model, "model_tokens")], NOW)
+        assert denied[1] == "model_tokens" and denied[0] == pytest.approx(30)
+        assert store.remaining("client", client, NOW) == 1000
+
+    def test_oversized_charge_capped(self):
+        """测试超过额度上限的请求在额度满时按上限扣减，不会永远被拒绝"""
+        store = GcraStore(None)
+        quota = Quota(100)
+        assert store.acquire([("k", 5000, quota, "client_tokens")], NOW) is None
+        assert store.remaining("k", quota, NOW) == pytest.approx(0)
+
+    def test_adjust(self):
+        """测试追加扣减与退还，退还不超过满额"""
+        store = GcraStore(None)
+        quota = Quota(100)
+        charge = lambda amount: [("k", amount, quota, "client_tokens")]
+        store.acquire(charge(50), NOW)
+        store.adjust(charge(-20), NOW)
+        assert store.remaining("k", quota, NOW) == pytest.approx(70)
+        store.adjust(charge(30), NOW)
+        assert store.remaining("k", quota, NOW) == pytest.approx(40)
+        store.adjust(charge(-500), NOW)
+        assert store.remaining("k", quota, NOW) == pytest.approx(100)
+
+    def test_shared_across_processes(self, tmp_path):
+        """测试多个进程同时扣减同一个键时总共只放行额度内的次数"""
+        path = str(tmp_path / "limits.db")
+        GcraStore(path).close()
+        with multiprocessing.get_context("fork").Pool(4) as pool:
+            allowed = pool.starmap(_hammer, [(path, 50)] * 4)
+        assert sum(allowed) == 100
+
+
+@pytest.mark.unit
+class TestTokenRateLimiter:
+    """测试速率限制器"""
+
+    def test_disabled(self):
+        """测试未启用时不预扣"""
+        limiter = TokenRateLimiter()
+        assert not limiter.enabled
+        assert limiter.reserve("c", ["m"], [{"role": "user", "content": "hi"}]) is None
+
+    def test_reserve_and_settle(self, tmp_path):
+        """测试按输入 + 预估输出预扣，结束后按实际输出退还"""
+        limiter = TokenRateLimiter(TokenLimitPolicy(
+            enabled=True, db_path=str(tmp_path / "l.db"), client_tokens_per_minute=1000,
+            client_requests_per_minute=0, output_estimate=200
+        ))
+        messages = [{"role": "user", "content": "a" * 400}]  # 100 + 4 tokens
+        reservation = limiter.reserve("c", ["m"], messages)
+        assert limiter.remaining("c")["client_tokens"] == pytest.approx(1000 - 304, abs=0.5)
+
+        reservation.settle("m", "b" * 40)  # 10 tokens，退还 190
+        reservation.settle("m", "b" * 40)  # 重复调用无效
+        assert limiter.remaining("c")["client_tokens"] == pytest.approx(1000 - 114, abs=0.5)
+        assert limiter.stats()["tokens_charged"] == 114
+
+    def test_track(self):
+        """测试透传流并在流结束时调整"""
+        limiter = TokenRateLimiter(TokenLimitPolicy(enabled=True, db_path=None, output_estimate=0))
+        reservation = limiter.reserve("c", ["m"], [])
+        assert list(reservation.track("m", iter(["ab", "cd"]))) == ["ab", "cd"]
+        assert limiter.stats()["tokens_charged"] == 1
+
+    def test_per_model_quota(self):
+        """测试模型额度按模型单独计算，compare 请求每个模型各计一份"""
+        limiter = TokenRateLimiter(TokenLimitPolicy(
+            enabled=True, db_path=None, client_tokens_per_minute=0, model_limits={"qwen": 1000},
+            client_requests_per_minute=0, output_estimate=600
+        ))
+        limiter.reserve("a", ["qwen", "deepseek"], [])
+        with pytest.raises(RateLimitExceeded) as exc:
+            limiter.reserve("b", ["deepseek", "qwen"], [])
+        assert exc.value.scope == "model_tokens" and exc.value.key == "model:qwen:tokens"
+        assert exc.value.retry_after_header == 12
+        assert limiter.reserve("b", ["deepseek"], []) is not None
+
+    def test_settings_from_env(self, monkeypatch):
+        """测试环境变量解析"""
+        monkeypatch.setenv("LLM_TOKEN_LIMIT_ENABLED", "true")
+        monkeypatch.setenv("LLM_TOKEN_LIMIT_MODELS", "qwen=5000, deepseek=8000")
+        monkeypatch.setenv("LLM_TOKEN_LIMIT_DB", "")
+        settings = token_limit_settings_from_env()
+        assert settings["enabled"] and settings["db_path"] is None
+        assert settings["model_limits"] == {"qwen": 5000, "deepseek": 8000}
+
+
+@pytest.mark.integration
+class TestChatRateLimit:
+    """测试聊天接口的速率限制"""
+
+    @pytest.fixture
+    def limited(self, monkeypatch, fake_sse_server):
+        """每个客户端每分钟只允许 1 个请求"""
+        import web_chat.app as app_module
+        # 使用 app 导入的模块（与测试导入的 web_chat.token_limiter 是不同的模块对象）
+        limiter = app_module.TokenRateLimiter(
+            app_module.TokenLimitPolicy(enabled=True, db_path=None, client_requests_per_minute=1)
+        )
+        monkeypatch.setattr(app_module, "token_limiter", limiter)
+        config = {"type": "requests_sse", "url": fake_sse_server.url, "api_key": "k", "model": "m"}
+        monkeypatch.setattr(app_module.LLMWrapper, "_resolve_config", lambda self, model_id: config)
+        return limiter
+
+    def test_flask_chat(self, client, limited, sample_messages):
+        """测试超出额度时返回 429 与 Retry-After，并按实际输出结算"""
+        payload = {'model': 'qwen', 'messages': sample_messages}
+        assert client.post('/api/chat', json=payload).data.decode() == 'Hello World'
+
+        response = client.post('/api/chat', json=payload)
+        assert response.status_code == 429
+        assert response.headers['Retry-After'] == '60'
+        body = response.get_json()
+        assert body['scope'] == 'client_requests' and body['retry_after'] == 60
+
+        stats = client.get('/api/stats/rate-limit').get_json()
+        assert stats['allowed'] == 1 and stats['limited'] == 1
+        assert stats['tokens_charged'] < 1024  # 预扣的输出已按实际输出（"Hello World"）退还
+        assert stats['remaining']['client_requests'] < 1
+
+    def test_compare(self, client, limited, sample_messages):
+        """测试对比接口同样受限"""
+        payload = {'models': ['qwen', 'deepseek'], 'messages': sample_messages}
+        assert client.post('/api/chat/compare', json=payload).status_code == 200
+        response = client.post('/api/chat/compare', json=payload)
+        assert response.status_code == 429 and 'Retry-After' in response.headers
+
+    def test_asgi_chat(self, sample_messages, fake_sse_server):
+        """测试 ASGI 路径返回 429 与 Retry-After"""
+        from web_chat import asgi
+        import app as flat_app
+        limiter = flat_app.TokenRateLimiter(flat_app.TokenLimitPolicy(enabled=True, db_path=None, client_requests_per_minute=1))
+        config = {"type": "requests_sse", "url": fake_sse_server.url, "api_key": "k", "model": "m"}
+
+        async def run():
+            transport = httpx.ASGITransport(app=asgi.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+                payload = {'model': 'qwen', 'messages': sample_messages}
+                return [await http.post("/api/chat", json=payload) for _ in range(2)]
+
+        with patch.object(asgi.AsyncLLMWrapper, '_resolve_config', return_value=config), \
+                patch.object(flat_app, 'token_limiter', limiter):
+            first, second = asyncio.run(run())
+
+        assert first.status_code == 200 and first.text == 'Hello World'
+        assert second.status_code == 429 and second.headers['retry-after'] == '60'
+        assert limiter.stats()['tokens_charged'] < 1024
+
+    @pytest.mark.parametrize("enabled", [True, False])
+    def test_process_limit_replaced(self, sample_messages, fake_sse_server, enabled):
+        """测试启用 token 限制时聊天接口跳过每个进程单独计数的请求限制"""
+        from web_chat import asgi
+        import app as flat_app
+        limiter = flat_app.TokenRateLimiter(flat_app.TokenLimitPolicy(enabled=enabled, db_path=None))
+        config = {"type": "requests_sse", "url": fake_sse_server.url, "api_key": "k", "model": "m"}
+
+        async def run():
+            transport = httpx.ASGITransport(app=asgi.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+                payload = {'model': 'qwen', 'messages': sample_messages}
+                return [(await http.post("/api/chat", json=payload)).status_code for _ in range(2)]
+
+        with patch.object(asgi.AsyncLLMWrapper, '_resolve_config', return_value=config), \
+                patch.object(flat_app, 'token_limiter', limiter), \
+                patch.object(asgi, 'CHAT_RATE_LIMIT', parse_limit("1 per minute")):
+            try:
+                statuses = asyncio.run(run())
+            finally:
+                flat_app.limiter.reset()
+
+        assert flat_app.chat_limit_exempt() is False
+        assert statuses == ([200, 200] if enabled else [200, 429])
@@ -0,0 +1,392 @@
+"""按 token 计费、多进程共享的速率限制
+
+Flask-Limiter 的 memory:// 存储按进程计数：多个工作进程时每个进程各自执行
+"10 per minute"，而且按请求数计数无法区分一条 100 条消息的请求和一条简短的
+请求。本模块：
+
+- 按估算的输入 + 输出 token 数计费，分别对客户端和模型设置每分钟额度；
+  另外按客户端限制每分钟请求数（所有进程合计）
+- 使用 GCRA（通用信元速率算法）：每个键只保存一个“理论到达时间”（TAT），
+  额度平滑恢复（等价于滑动窗口），允许一次用完一分钟的额度作为突发
+- 状态保存在 SQLite（WAL）中，同一台机器上的所有工作进程共享，不需要外部服务；
+  一次请求涉及的所有键在同一个 BEGIN IMMEDIATE 事务中检查并扣减
+- 超出额度时给出精确的 Retry-After（秒）
+- 请求开始时按预估的输出 token 数预扣，流结束后按实际输出多退少补
+
+Example:
+    >>> limiter = TokenRateLimiter(TokenLimitPolicy(enabled=True, client_tokens_per_minute=60000))
+    >>> try:
+    ...     reservation = limiter.reserve("127.0.0.1", ["deepseek"], messages)
+    ... except RateLimitExceeded as e:
+    ...     return 429, {"Retry-After": str(e.retry_after_header)}
+    >>> ...  # 输出回答
+    >>> reservation.settle("deepseek", reply_text)
+"""
+
+import os
+import math
+import time
+import sqlite3
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, Generator, Iterator, List, Optional, Sequence, Tuple
+
+from context_window import estimate_tokens, token_counter
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 默认的 SQLite 文件路径
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(__file__), "rate_limits.db")
+
+# 每执行多少次扣减清理一次已经恢复满额的键
+_PURGE_EVERY = 1000
+
+
+@dataclass(frozen=True)
+class Quota:
+    """一个额度：每 period 秒 limit 个单位（token 或请求），突发上限为 limit
+
+    Attributes:
+        limit: 每个周期的额度
+        period: 周期（秒）
+    """
+    limit: int
+    period: float = 60.0
+
+    @property
+    def emission_interval(self) -> float:
+        """恢复一个单位所需的秒数"""
+        return self.period / self.limit
+
+
+@dataclass(frozen=True)
+class TokenLimitPolicy:
+    """速率限制策略
+
+    Attributes:
+        enabled: 是否启用
+        db_path: SQLite 文件路径（同一台机器上的工作进程共享），为空时只在进程内计数
+        client_tokens_per_minute: 每个客户端每分钟的 token 额度，0 表示不限制
+        model_tokens_per_minute: 每个模型每分钟的 token 额度（所有客户端合计），0 表示不限制
+        model_limits: 按模型覆盖的每分钟 token 额度
+        client_requests_per_minute: 每个客户端每分钟的请求数，0 表示不限制
+        output_estimate: 请求开始时预扣的输出 token 数（流结束后按实际输出调整）
+    """
+    enabled: bool = False
+    db_path: Optional[str] = DEFAULT_DB_PATH
+    client_tokens_per_minute: int = 60000
+    model_tokens_per_minute: int = 0
+    model_limits: Dict[str, int] = field(default_factory=dict)
+    client_requests_per_minute: int = 10
+    output_estimate: int = 1024
+
+    def client_quota(self) -> Optional[Quota]:
+        return Quota(self.client_tokens_per_minute) if self.client_tokens_per_minute > 0 else None
+
+    def model_quota(self, model_id: str) -> Optional[Quota]:
+        limit = self.model_limits.get(model_id, self.model_tokens_per_minute)
+        return Quota(limit) if limit > 0 else None
+
+    def request_quota(self) -> Optional[Quota]:
+        return Quota(self.client_requests_per_minute) if self.client_requests_per_minute > 0 else None
+
+
+def token_limit_settings_from_env() -> Dict[str, Any]:
+    """从环境变量读取速率限制配置
+
+    Returns:
+        Dict[str, Any]: TokenLimitPolicy 的构造参数
+    """
+    limits = os.environ.get("LLM_TOKEN_LIMIT_MODELS", "")
+    model_limits = {}
+    for entry in limits.split(","):
+        model_id, _, limit = entry.partition("=")
+        if model_id.strip() and limit.strip():
+            model_limits[model_id.strip()] = int(limit)
+    return {
+        "enabled": os.environ.get("LLM_TOKEN_LIMIT_ENABLED", "false").lower() == "true",
+        "db_path": os.environ.get("LLM_TOKEN_LIMIT_DB", DEFAULT_DB_PATH) or None,
+        "client_tokens_per_minute": int(os.environ.get("LLM_TOKEN_LIMIT_CLIENT_TPM", 60000)),
+        "model_tokens_per_minute": int(os.environ.get("LLM_TOKEN_LIMIT_MODEL_TPM", 0)),
+        "model_limits": model_limits,
+        "client_requests_per_minute": int(os.environ.get("LLM_TOKEN_LIMIT_CLIENT_RPM", 10)),
+        "output_estimate": int(os.environ.get("LLM_TOKEN_LIMIT_OUTPUT_ESTIMATE", 1024))
+    }
+
+
+class RateLimitExceeded(Exception):
+    """超出额度
+
+    Attributes:
+        retry_after: 多少秒后重试可以通过
+        scope: 超出的额度（"client_tokens"、"client_requests" 或 "model_tokens"）
+        key: 超出额度的键
+    """
+
+    def __init__(self, retry_after: float, scope: str, key: str) -> None:
+        self.retry_after = retry_after
+        self.scope = scope
+        self.key = key
+        super().__init__(f"Rate limit exceeded ({scope}), retry after {self.retry_after_header}s")
+
+    @property
+    def retry_after_header(self) -> int:
+        """Retry-After 响应头的值（向上取整的秒数，至少 1）"""
+        return max(1, math.ceil(self.retry_after))
+
+
+# 一次扣减：(键, 数量, 额度, 范围)
+Charge = Tuple[str, float, Quota, str]
+
+
+class GcraStore:
+    """GCRA 状态的 SQLite 存储（每个进程一个连接，连接内加锁；进程间由 SQLite 事务互斥）"""
+
+    def __init__(self, path: Optional[str] = DEFAULT_DB_PATH) -> None:
+        """打开存储
+
+        Args:
+            path: SQLite 文件路径，为空时使用进程内的内存数据库
+        """
+        self._conn = sqlite3.connect(path or ":memory:", check_same_thread=False, isolation_level=None, timeout=5.0)
+        if path:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS gcra (key TEXT PRIMARY KEY, tat REAL NOT NULL)")
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _tat(self, key: str) -> Optional[float]:
+        row = self._conn.execute("SELECT tat FROM gcra WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set(self, key: str, tat: float) -> None:
+        self._conn.execute(
+            "INSERT INTO gcra (key, tat) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET tat = excluded.tat",
+            (key, tat)
+        )
+
+    def _maybe_purge(self, now: float) -> None:
+        """定期删除 TAT 已经过去的键（这些键的额度已恢复满额，与不存在等价）"""
+        self._writes += 1
+        if self._writes % _PURGE_EVERY == 0:
+            self._conn.execute("DELETE FROM gcra WHERE tat <= ?", (now,))
+
+    def acquire(self, charges: Sequence[Charge], now: float) -> Optional[Tuple[float, str, str]]:
+        """检查并扣减一组额度：全部通过时一起扣减，否则都不扣减
+
+        Args:
+            charges: (键, 数量, 额度, 范围) 列表；数量超过额度上限时按上限扣减
+            now: 当前时间（time.time()，各进程一致）
+
+        Returns:
+            Optional[Tuple[float, str, str]]: 未通过时为 (需要等待的秒数, 范围, 键)，
+                取所有未通过的额度中等待最久的一个；通过时为 None
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                updates: List[Tuple[str, float]] = []
+                denied: Optional[Tuple[float, str, str]] = None
+                for key, amount, quota, scope in charges:
+                    tat = max(self._tat(key) or now, now)
+                    new_tat = tat + min(amount, quota.limit) * quota.emission_interval
+                    allow_at = new_tat - quota.period
+                    if allow_at > now:
+                        if denied is None or allow_at - now > denied[0]:
+                            denied = (allow_at - now, scope, key)
+                    else:
+                        updates.append((key, new_tat))
+                if denied is None:
+                    for key, new_tat in updates:
+                        self._set(key, new_tat)
+                    self._maybe_purge(now)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return denied
+
+    def adjust(self, charges: Sequence[Charge], now: float) -> None:
+        """不检查额度地追加扣减（数量为正）或退还（数量为负）
+
+        退还不会让额度超过满额（TAT 不早于当前时间）。
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for key, amount, quota, _ in charges:
+                    tat = self._tat(key)
+                    if amount >= 0:
+                        self._set(key, max(tat or now, now) + amount * quota.emission_interval)
+                    elif tat is not None and tat > now:
+                        self._set(key, max(tat + amount * quota.emission_interval, now))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def remaining(self, key: str, quota: Quota, now: float) -> float:
+        """键当前可用的额度"""
+        with self._lock:
+            tat = self._tat(key)
+        if tat is None or tat <= now:
+            return float(quota.limit)
+        return max(0.0, quota.limit - (tat - now) / quota.emission_interval)
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class Reservation:
+    """一次请求的预扣，流结束后调用 settle() 按实际输出调整"""
+
+    def __init__(self, limiter: "TokenRateLimiter", client: str, reserved_output: int) -> None:
+        self._limiter = limiter
+        self.client = client
+        self.reserved_output = reserved_output
+        self._settled: set = set()
+
+    def settle(self, model_id: str, output: str) -> None:
+        """按模型的实际输出调整扣减（每个模型只调整一次）
+
+        Args:
+            model_id: 模型 ID
+            output: 模型输出的完整文本
+        """
+        if model_id in self._settled:
+            return
+        self._settled.add(model_id)
+        delta = estimate_tokens(output) - self.reserved_output
+        if delta:
+            self._limiter._adjust(self.client, model_id, delta)
+
+    def track(self, model_id: str, chunks: Iterator[str]) -> Generator[str, None, None]:
+        """透传流，流结束（包括出错和提前关闭）时按已输出的文本调用 settle()"""
+        parts: List[str] = []
+        try:
+            for chunk in chunks:
+                parts.append(chunk)
+                yield chunk
+        finally:
+            self.settle(model_id, "".join(parts))
+
+
+class TokenRateLimiter:
+    """按 token 计费的速率限制器（线程安全；同一 SQLite 文件的多个进程共享额度）"""
+
+    def __init__(self, policy: Optional[TokenLimitPolicy] = None) -> None:
+        """初始化速率限制器
+
+        Args:
+            policy: 速率限制策略，默认不启用
+        """
+        self.policy = policy or TokenLimitPolicy()
+        self._store: Optional[GcraStore] = None
+        self._counters = {"allowed": 0, "limited": 0, "errors": 0, "tokens_charged": 0}
+        self._counter_lock = threading.Lock()
+        if self.policy.enabled:
+            try:
+                self._store = GcraStore(self.policy.db_path)
+            except sqlite3.Error as e:
+                logger.warning(f"Rate limit database unavailable, counting per process: {e}")
+                self._store = GcraStore(None)
+
+    @property
+    def enabled(self) -> bool:
+        return self._store is not None
+
+    def _count(self, name: str, value: int = 1) -> None:
+        with self._counter_lock:
+            self._counters[name] += value
+
+    def _token_charges(self, client: str, model_ids: Sequence[str], per_model: float) -> List[Charge]:
+        """客户端（所有模型合计）与各模型的 token 扣减"""
+        charges: List[Charge] = []
+        client_quota = self.policy.client_quota()
+        if client_quota is not None:
+            charges.append((f"client:{client}:tokens", per_model * len(model_ids), client_quota, "client_tokens"))
+        for model_id in model_ids:
+            model_quota = self.policy.model_quota(model_id)
+            if model_quota is not None:
+                charges.append((f"model:{model_id}:tokens", per_model, model_quota, "model_tokens"))
+        return charges
+
+    def reserve(
+        self,
+        client: str,
+        model_ids: Sequence[str],
+        messages: List[Dict[str, str]]
+    ) -> Optional[Reservation]:
+        """检查并预扣一次请求的额度
+
+        同一组消息发给多个模型（/api/chat/compare）时每个模型各计一份。
+
+        Args:
+            client: 客户端标识（远端地址）
+            model_ids: 本次请求的模型 ID
+            messages: 发送给模型的消息
+
+        Returns:
+            Optional[Reservation]: 预扣记录；未启用时为 None
+
+        Raises:
+            RateLimitExceeded: 超出任一额度
+        """
+        if self._store is None:
+            return None
+        input_tokens = sum(token_counter.message_tokens(m) for m in messages)
+        per_model = input_tokens + self.policy.output_estimate
+        charges = self._token_charges(client, model_ids, per_model)
+        request_quota = self.policy.request_quota()
+        if request_quota is not None:
+            charges.append((f"client:{client}:requests", 1, request_quota, "client_requests"))
+
+        try:
+            denied = self._store.acquire(charges, time.time())
+        except sqlite3.Error as e:
+            # 存储不可用时放行，速率限制不应让服务不可用
+            logger.warning(f"Rate limit check failed, allowing request: {e}")
+            self._count("errors")
+            return None
+        if denied is not None:
+            self._count("limited")
+            retry_after, scope, key = denied
+            logger.info(f"Rate limit exceeded for {key}, retry after {retry_after:.1f}s")
+            raise RateLimitExceeded(retry_after, scope, key)
+        self._count("allowed")
+        self._count("tokens_charged", per_model * len(model_ids))
+        return Reservation(self, client, self.policy.output_estimate)
+
+    def _adjust(self, client: str, model_id: str, delta: int) -> None:
+        """按实际输出调整预扣"""
+        if self._store is None:
+            return
+        try:
+            self._store.adjust(self._token_charges(client, [model_id], delta), time.time())
+        except sqlite3.Error as e:
+            logger.warning(f"Rate limit adjustment failed: {e}")
+            self._count("errors")
+            return
+        self._count("tokens_charged", delta)
+
+    def remaining(self, client: str) -> Dict[str, float]:
+        """客户端当前可用的 token 与请求额度（未限制的额度不出现）"""
+        result: Dict[str, float] = {}
+        if self._store is None:
+            return result
+        now = time.time()
+        for key, quota, scope in (
+            (f"client:{client}:tokens", self.policy.client_quota(), "client_tokens"),
+            (f"client:{client}:requests", self.policy.request_quota(), "client_requests")
+        ):
+            if quota is not None:
+                result[scope] = round(self._store.remaining(key, quota, now), 1)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """放行、限流与存储错误次数，以及已扣减的 token 总数（本进程）"""
+        with self._counter_lock:
+            return {"enabled": self.enabled, **self._counters}